@@ -0,0 +1,1211 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for ark_session.py (source copy).
+
+Runs against a throwaway HOME so the real ~/.claude/sessions registry is
+never touched. Usage:
+
+    python bench_full.py              # run every benchmark
+    python bench_full.py contention   # run selected benchmarks by name
+"""
+
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Isolate HOME before ark_session computes its paths. Worker processes
+# inherit ARK_BENCH_HOME so they share the same sandbox.
+BENCH_HOME = os.environ.setdefault(
+    "ARK_BENCH_HOME", tempfile.mkdtemp(prefix="ark-bench-")
+)
+os.environ["HOME"] = BENCH_HOME
+os.environ["USERPROFILE"] = BENCH_HOME
+# Maintenance runs inline, as in test_full.py: a detached worker left over
+# from one benchmark would prune or crash-check the registry under the next.
+# MAINTENANCE_MODE is read at import, so this must precede it.
+os.environ["ARK_MAINTENANCE"] = "inline"
+
+sys.path.insert(0, str(Path(__file__).resolve().parent / "src"))
+import ark_session as ark  # noqa: E402
+
+_spawn_maintenance = ark._spawn_maintenance
+_workers = []
+
+
+def _track_maintenance():
+    """Record every worker spawned, so a benchmark can wait for them."""
+    worker = _spawn_maintenance()
+    if worker is not None:
+        _workers.append(worker)
+    return worker
+
+
+def reap_workers():
+    """Wait for every detached maintenance worker spawned so far."""
+    while _workers:
+        worker = _workers.pop()
+        try:
+            worker.wait(timeout=60)
+        except Exception:
+            worker.kill()
+            worker.wait()
+
+
+ark._spawn_maintenance = _track_maintenance
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    idx = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[idx]
+
+
+def fmt_ms(seconds):
+    return f"{seconds * 1000:.2f} ms"
+
+
+# -- Registry contention ---------------------------------------------------
+
+CONTENTION_WRITERS = 32
+CONTENTION_ROUNDS = 25
+CONTENTION_KEY = "bench-contention"
+
+
+def _contention_worker(args):
+    """Increment a shared counter and record own key; returns acquire waits."""
+    worker_id, rounds = args
+    waits = []
+    for i in range(rounds):
+        t0 = time.perf_counter()
+        with ark.registry_transaction() as active:
+            waits.append(time.perf_counter() - t0)
+            shared = active.setdefault(CONTENTION_KEY, {"status": "bench", "n": 0})
+            shared["n"] += 1
+            active[f"{CONTENTION_KEY}-{worker_id:02d}"] = {
+                "status": "bench", "round": i,
+            }
+    return waits
+
+
+def bench_contention():
+    """32 parallel writers doing read-modify-write on active.json."""
+    import multiprocessing
+
+    with ark.registry_transaction() as active:
+        for key in [k for k in active if k.startswith(CONTENTION_KEY)]:
+            del active[key]
+
+    jobs = [(w, CONTENTION_ROUNDS) for w in range(CONTENTION_WRITERS)]
+    t0 = time.perf_counter()
+    with multiprocessing.Pool(CONTENTION_WRITERS) as pool:
+        results = pool.map(_contention_worker, jobs)
+    elapsed = time.perf_counter() - t0
+
+    waits = [w for r in results for w in r]
+    active = ark._read_active()
+    expected = CONTENTION_WRITERS * CONTENTION_ROUNDS
+    got = active.get(CONTENTION_KEY, {}).get("n", 0)
+    keys = sum(1 for k in active if k.startswith(f"{CONTENTION_KEY}-"))
+
+    print(f"  writers={CONTENTION_WRITERS} rounds={CONTENTION_ROUNDS} "
+          f"total={expected} elapsed={elapsed:.2f}s")
+    print(f"  counter={got} (expected {expected}), "
+          f"writer keys={keys} (expected {CONTENTION_WRITERS})")
+    print(f"  acquire wait p50={fmt_ms(percentile(waits, 50))} "
+          f"p99={fmt_ms(percentile(waits, 99))} max={fmt_ms(max(waits))}")
+    ok = got == expected and keys == CONTENTION_WRITERS
+    print(f"  [{'PASS' if ok else 'FAIL'}] no lost updates")
+    return ok
+
+
+# -- Heartbeat fast path ---------------------------------------------------
+
+HEARTBEAT_CALLS = 2000
+
+
+class _CallCounter:
+    """Wrap a module attribute and count calls to it."""
+
+    def __init__(self, module, name):
+        self.module, self.name = module, name
+        self.original = getattr(module, name)
+        self.calls = 0
+
+    def __enter__(self):
+        def wrapper(*args, **kwargs):
+            self.calls += 1
+            return self.original(*args, **kwargs)
+        setattr(self.module, self.name, wrapper)
+        return self
+
+    def __exit__(self, *exc):
+        setattr(self.module, self.name, self.original)
+
+
+def bench_heartbeat():
+    """Throttled heartbeat: one stat() of the stamp, no registry read or JSON parse."""
+    import builtins
+    import json
+
+    data = {
+        "session_id": "bench-heartbeat-0001",
+        "cwd": os.path.join(BENCH_HOME, "07-Bench-Work-Space"),
+        "model": {"display_name": "Bench"},
+    }
+    ark.session_start(data)
+    hb = ark.session_heartbeat(data)
+
+    # Count the call as a new hook process would make it: no cached short
+    # codes, from a subdirectory the session did not start in
+    ark._ws_short_cache.clear()
+    sub = dict(data, cwd=os.path.join(data["cwd"], "src"))
+    with _CallCounter(os, "stat") as stats, \
+            _CallCounter(os, "fstat") as fstats, \
+            _CallCounter(os, "open") as fds, \
+            _CallCounter(builtins, "open") as opens, \
+            _CallCounter(json, "loads") as loads:
+        ark.session_heartbeat(sub)
+    print(f"  throttled call: stat={stats.calls + fstats.calls} "
+          f"open={opens.calls + fds.calls} json.loads={loads.calls}")
+
+    t0 = time.perf_counter()
+    for _ in range(HEARTBEAT_CALLS):
+        ark.session_heartbeat(data)
+    throttled = (time.perf_counter() - t0) / HEARTBEAT_CALLS
+
+    stamp = ark._heartbeat_stamp(data["session_id"])
+    t0 = time.perf_counter()
+    for _ in range(HEARTBEAT_CALLS):
+        os.stat(stamp)
+    bare_stat = (time.perf_counter() - t0) / HEARTBEAT_CALLS
+
+    old = time.time() - ark.HEARTBEAT_THROTTLE_SECONDS - 1
+    samples = []
+    for _ in range(200):
+        os.utime(stamp, (old, old))
+        t0 = time.perf_counter()
+        ark.session_heartbeat(data)
+        samples.append(time.perf_counter() - t0)
+    full = sum(samples) / len(samples)
+
+    ark.session_stop(data)
+
+    print(f"  throttled heartbeat: {throttled * 1e6:.1f} us/call "
+          f"(bare os.stat: {bare_stat * 1e6:.1f} us)")
+    print(f"  full heartbeat:      {full * 1e6:.1f} us/call")
+    ok = (hb is not None and hb.get("throttled")
+          and stats.calls + fstats.calls == 1 and fds.calls == 1
+          and opens.calls == 0 and loads.calls == 0)
+    print(f"  [{'PASS' if ok else 'FAIL'}] throttled path is a single stat() of the stamp")
+    return ok
+
+
+# -- Crash detection ---------------------------------------------------------
+
+CRASH_HISTORY = 5000          # stopped/crashed sessions in the registry
+CRASH_ACTIVE = 200            # live sessions heartbeating normally
+CRASH_STALE = 20              # sessions that died without a stop hook
+CRASH_CALLS = 200
+
+
+def _legacy_detect_crashes():
+    """The pre-deadline detector: parse every record, os.kill(pid, 0)."""
+    from datetime import datetime, timedelta
+
+    now = datetime.now()
+    threshold = timedelta(minutes=ark.CRASH_THRESHOLD_MINUTES)
+    crashed = []
+    for sid, session in ark._read_active().items():
+        if session.get("status") != "active":
+            continue
+        last_hb = datetime.fromisoformat(session.get("last_heartbeat", "2000-01-01"))
+        if now - last_hb <= threshold:
+            continue
+        try:
+            os.kill(int(session.get("pid")), 0)
+        except OSError:
+            crashed.append(sid)
+    return crashed
+
+
+def bench_crashes():
+    """detect_crashes() over thousands of historical sessions."""
+    from datetime import datetime, timedelta
+
+    now = datetime.now()
+    fresh = now.isoformat()
+    stale = (now - timedelta(minutes=30)).isoformat()
+    own = ark._process_fingerprint(os.getpid())
+    registry = {}
+    for i in range(CRASH_HISTORY):
+        registry[f"bench-crash-old-{i:05d}"] = {
+            "status": "stopped", "callsign": "BCH-old", "last_heartbeat": stale,
+            "stopped": stale, "pid": 1, "intent": "x" * 40,
+        }
+    for i in range(CRASH_ACTIVE):
+        registry[f"bench-crash-live-{i:04d}"] = {
+            "status": "active", "callsign": "BCH-live", "last_heartbeat": fresh,
+            "pid": os.getpid(), "pid_start": own,
+        }
+    for i in range(CRASH_STALE):
+        # Our own PID with another start time: a recycled PID
+        registry[f"bench-crash-dead-{i:03d}"] = {
+            "status": "active", "callsign": "BCH-dead", "last_heartbeat": stale,
+            "pid": os.getpid(), "pid_start": "0",
+        }
+
+    # A worker still running would prune or crash-check this registry.
+    reap_workers()
+    saved_mode, ark.MAINTENANCE_MODE = ark.MAINTENANCE_MODE, "inline"
+    try:
+        ark._write_active(registry)
+        legacy = _time_calls(_legacy_detect_crashes, 20)
+        legacy_found = _legacy_detect_crashes()
+
+        t0 = time.perf_counter()
+        crashes = ark.detect_crashes()
+        t_first = time.perf_counter() - t0
+        steady = _time_calls(ark.detect_crashes, CRASH_CALLS)
+    finally:
+        ark.MAINTENANCE_MODE = saved_mode
+        with ark.registry_transaction() as active:
+            for key in [k for k in active if k.startswith("bench-crash-")]:
+                del active[key]
+        # Detected crashes wait for the next session_start; drop ours.
+        ark._take_pending_crashes()
+
+    found = sorted(c["session_id"] for c in crashes)
+    expected = sorted(k for k in registry if k.startswith("bench-crash-dead-"))
+    print(f"  registry: {CRASH_HISTORY} historical, {CRASH_ACTIVE} live, "
+          f"{CRASH_STALE} dead (recycled PIDs)")
+    print(f"  legacy full scan:       p50={fmt_ms(percentile(legacy, 50))} "
+          f"crashes found={len(legacy_found)}")
+    print(f"  first check (rebuild):  {fmt_ms(t_first)} crashes found={len(found)}")
+    print(f"  steady state:           p50={fmt_ms(percentile(steady, 50))} "
+          f"p99={fmt_ms(percentile(steady, 99))}")
+    ok = found == expected and percentile(steady, 50) * 10 < percentile(legacy, 50)
+    print(f"  [{'PASS' if ok else 'FAIL'}] recycled PIDs detected, steady state >10x faster")
+    return ok
+
+
+# -- session_start latency ---------------------------------------------------
+
+START_CALLS = 30
+START_OVERDUE = 2             # dead sessions awaiting detection per round
+START_OLD_LOGS = 3            # raw logs past JSONL_MAX_DAYS per round
+START_LOG_EVENTS = 2000
+
+
+def bench_start():
+    """session_start() with retention inline vs. in a detached worker."""
+    import json
+    from datetime import date, datetime, timedelta
+
+    stale = (datetime.now() - timedelta(minutes=30)).isoformat()
+    cwd = os.path.join(BENCH_HOME, "07-Bench-Work-Space")
+    line = json.dumps({"event": "heartbeat", "session_id": "bench-old", "pad": "x" * 80})
+    old_day = [date.today() - timedelta(days=ark.JSONL_MAX_DAYS + 5)]
+    saved_mode = ark.MAINTENANCE_MODE
+    dead = []
+
+    def run(mode, label, retention_due):
+        ark.MAINTENANCE_MODE = mode
+        samples, reported = [], []
+        for r in range(START_CALLS):
+            with ark.registry_transaction() as active:
+                for i in range(START_OVERDUE):
+                    dead.append(f"bench-start-dead-{label}-{r}-{i}")
+                    active[dead[-1]] = {"status": "active", "last_heartbeat": stale, "pid": 0}
+            ark._invalidate_deadlines()
+            for claim in ark.SESSIONS_DIR.glob(ark.MAINTENANCE_STAMP.name + "*"):
+                claim.unlink(missing_ok=True)
+            if retention_due:
+                ark.LOG_DIR.mkdir(parents=True, exist_ok=True)
+                for _ in range(START_OLD_LOGS):
+                    old_day[0] -= timedelta(days=1)
+                    (ark.LOG_DIR / f"{old_day[0].isoformat()}.jsonl").write_text(
+                        (line + "\n") * START_LOG_EVENTS, encoding="utf-8")
+                ark.RETENTION_STAMP.unlink(missing_ok=True)
+            data = {"session_id": f"bench-start-{label}-{r}", "cwd": cwd}
+            t0 = time.perf_counter()
+            result = ark.session_start(data)
+            samples.append(time.perf_counter() - t0)
+            reported += [c["session_id"] for c in result["crash_info"]]
+            ark.session_stop(data)
+            reap_workers()  # the worker's round ends before the next one
+        return samples, reported
+
+    try:
+        inline, reported = run("inline", "inline", True)
+        background, more = run("background", "bg", True)
+        reported += more
+        crash_only, more = run("background", "crash", False)
+        reported += more
+    finally:
+        reap_workers()
+        ark.MAINTENANCE_MODE = saved_mode
+        with ark.registry_transaction() as active:
+            for key in [k for k in active if k.startswith("bench-start-")]:
+                del active[key]
+
+    print(f"  per start: {START_OVERDUE} dead sessions; retention rounds add "
+          f"{START_OLD_LOGS} expired logs of {START_LOG_EVENTS} events")
+    print(f"  retention inline (old):    p50={fmt_ms(percentile(inline, 50))} "
+          f"p90={fmt_ms(percentile(inline, 90))}")
+    print(f"  retention in worker:       p50={fmt_ms(percentile(background, 50))} "
+          f"p90={fmt_ms(percentile(background, 90))}")
+    print(f"  crash check only (gate):   p50={fmt_ms(percentile(crash_only, 50))} "
+          f"p90={fmt_ms(percentile(crash_only, 90))}")
+    print(f"  crash reports: {len(reported)} for {len(dead)} dead sessions "
+          f"({len(set(reported))} distinct)")
+    ok = (sorted(reported) == sorted(dead)
+          and percentile(background, 50) < percentile(inline, 50))
+    print(f"  [{'PASS' if ok else 'FAIL'}] every crash reported once, start faster than inline")
+    return ok
+
+
+# -- Broker round trip -------------------------------------------------------
+
+BROKER_CALLS = 500
+
+
+def _time_calls(fn, calls):
+    samples = []
+    for _ in range(calls):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return samples
+
+
+def bench_broker():
+    """Per-event latency: direct file path vs. the session broker."""
+    import socket
+    import subprocess
+
+    if not hasattr(socket, "AF_UNIX"):
+        print("  [SKIP] Unix domain sockets not available")
+        return True
+
+    import itertools
+
+    data = {"session_id": "bench-broker-0001", "cwd": BENCH_HOME, "model": "Bench"}
+    seq = itertools.count()
+
+    def intent():
+        ark.set_intent(data["session_id"], f"intent {next(seq)}")
+
+    ark.session_start(data)
+    direct_compact = _time_calls(lambda: ark.session_compact(data), BROKER_CALLS)
+    direct_intent = _time_calls(intent, BROKER_CALLS)
+    ark.session_stop(data)
+
+    proc = subprocess.Popen(
+        [sys.executable, str(Path(ark.__file__)), "serve"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        deadline = time.time() + 10
+        while ark._broker_call("ping", {}) is ark._NO_BROKER:
+            if time.time() > deadline:
+                print("  [FAIL] broker did not start")
+                return False
+            time.sleep(0.05)
+        ark.session_start(data)
+        broker_compact = _time_calls(lambda: ark.session_compact(data), BROKER_CALLS)
+        broker_intent = _time_calls(intent, BROKER_CALLS)
+        ark.session_stop(data)
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+
+    for label, samples in (
+        ("compact direct", direct_compact), ("compact broker", broker_compact),
+        ("intent  direct", direct_intent), ("intent  broker", broker_intent),
+    ):
+        print(f"  {label}: p50={fmt_ms(percentile(samples, 50))} "
+              f"p99={fmt_ms(percentile(samples, 99))}")
+    count = ark._read_active().get(data["session_id"], {}).get("compact_count")
+    ok = count == BROKER_CALLS
+    print(f"  [{'PASS' if ok else 'FAIL'}] broker state flushed "
+          f"(compact_count={count}, expected {BROKER_CALLS})")
+    return ok
+
+
+# -- Event writer throughput -------------------------------------------------
+
+EVENT_COUNT = 20000
+
+
+def _legacy_write_event(log_dir, event):
+    """The pre-EventWriter path: mkdirs + date + open/append/close per event."""
+    import json
+    from datetime import datetime
+
+    ark.SESSIONS_DIR.mkdir(parents=True, exist_ok=True)
+    log_dir.mkdir(parents=True, exist_ok=True)
+    today = datetime.now().strftime("%Y-%m-%d")
+    with open(log_dir / f"{today}.jsonl", "a", encoding="utf-8") as f:
+        f.write(json.dumps(event, default=str) + "\n")
+
+
+def bench_events():
+    """JSONL append throughput: per-event open/close vs. group commit."""
+    import shutil
+
+    event = {"event": "bench", "session_id": "bench-events", "callsign": "BEN-0000",
+             "ts": "2026-01-01T00:00:00"}
+    root = Path(BENCH_HOME) / "event-bench"
+    results = {}
+
+    log_dir = root / "legacy"
+    t0 = time.perf_counter()
+    for _ in range(EVENT_COUNT):
+        _legacy_write_event(log_dir, event)
+    results["per-event open/close"] = time.perf_counter() - t0
+
+    for fsync in ("none", "batch", "event"):
+        log_dir = root / f"writer-{fsync}"
+        calls = EVENT_COUNT if fsync != "event" else EVENT_COUNT // 20
+        writer = ark.EventWriter(log_dir=log_dir, fsync=fsync)
+        t0 = time.perf_counter()
+        for _ in range(calls):
+            writer.append(event)
+        writer.close()
+        elapsed = time.perf_counter() - t0
+        results[f"EventWriter fsync={fsync}"] = elapsed * EVENT_COUNT / calls
+
+    written = sum(1 for _ in open(next((root / "writer-none").glob("*.jsonl"))))
+    shutil.rmtree(root, ignore_errors=True)
+
+    base = results["per-event open/close"]
+    for label, elapsed in results.items():
+        print(f"  {label:<26} {EVENT_COUNT / elapsed:>10,.0f} events/s "
+              f"({base / elapsed:.1f}x)")
+    ok = written == EVENT_COUNT
+    print(f"  [{'PASS' if ok else 'FAIL'}] all {EVENT_COUNT} events written "
+          f"(fsync=event extrapolated from {EVENT_COUNT // 20})")
+    return ok
+
+
+# -- Event query engine ----------------------------------------------------
+
+QUERY_DAYS = 10
+QUERY_EVENTS_PER_DAY = 20000
+
+
+def bench_query():
+    """Session / crash / tail queries: linear scan vs. postings indexes."""
+    import json
+    import shutil
+
+    import ark_events
+
+    root = Path(BENCH_HOME) / "query-bench"
+    saved = {k: getattr(ark, k) for k in ("LOG_DIR", "LOG_ARCHIVE_DIR", "LOG_INDEX_DIR")}
+    ark.LOG_DIR, ark.LOG_ARCHIVE_DIR, ark.LOG_INDEX_DIR = (
+        root, root / "archive", root / "index")
+    root.mkdir(parents=True, exist_ok=True)
+    try:
+        for d in range(QUERY_DAYS):
+            day = f"2026-01-{d + 1:02d}"
+            with open(root / f"{day}.jsonl", "w", encoding="utf-8") as f:
+                for i in range(QUERY_EVENTS_PER_DAY):
+                    f.write(json.dumps({
+                        "event": "crash" if i % 500 == 0 else "heartbeat",
+                        "session_id": f"bench-{d}-{i % 200}",
+                        "callsign": f"BEN-{i % 200:04x}",
+                        "workspace": f"{i % 40:02d}-Bench-Space",
+                        "ts": f"{day}T{i // 3600 % 24:02d}:{i // 60 % 60:02d}:{i % 60:02d}",
+                    }) + "\n")
+        size = sum(p.stat().st_size for p in root.glob("*.jsonl"))
+        target = "bench-7-42"
+
+        t0 = time.perf_counter()
+        linear = [e for e in ark.iter_events() if e.get("session_id") == target]
+        t_linear = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        cold = list(ark_events.query_events(session=target))
+        t_cold = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        ark_events.update_indexes()
+        t_build = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        warm = list(ark_events.query_events(session=target))
+        t_warm = time.perf_counter() - t0
+        expected_crashes = [e for e in ark.iter_events()
+                            if e["event"] == "crash" and e["workspace"] == "00-Bench-Space"]
+        t0 = time.perf_counter()
+        crashes = list(ark_events.query_events(event="crash", workspace="00-Bench-Space"))
+        t_crash = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        tail = ark_events.tail_events(20)
+        t_tail = time.perf_counter() - t0
+    finally:
+        for k, v in saved.items():
+            setattr(ark, k, v)
+        shutil.rmtree(root, ignore_errors=True)
+
+    print(f"  log: {QUERY_DAYS} days x {QUERY_EVENTS_PER_DAY} events "
+          f"({size / 1e6:.0f} MB)")
+    print(f"  session, linear scan:    {fmt_ms(t_linear)}")
+    print(f"  session, not indexed:    {fmt_ms(t_cold)} (query writes nothing)")
+    print(f"  index build (retention): {fmt_ms(t_build)}")
+    print(f"  session, indexed:        {fmt_ms(t_warm)} "
+          f"({t_linear / t_warm:.0f}x vs scan)")
+    print(f"  crash+workspace indexed: {fmt_ms(t_crash)}")
+    print(f"  tail 20:                 {fmt_ms(t_tail)}")
+    ok = linear == cold == warm and len(tail) == 20 and crashes == expected_crashes
+    print(f"  [{'PASS' if ok else 'FAIL'}] indexed results match linear scan")
+    return ok
+
+
+# -- Session analytics -------------------------------------------------------
+
+STATS_DAYS = 365
+STATS_SESSIONS_PER_DAY = 40
+
+
+def bench_stats():
+    """A year of sessions: full aggregation vs. an incremental day."""
+    import json
+    import shutil
+    from datetime import date, timedelta
+
+    import ark_stats
+
+    root = Path(BENCH_HOME) / "stats-bench"
+    saved = {k: getattr(ark, k) for k in
+             ("LOG_DIR", "LOG_ARCHIVE_DIR", "LOG_INDEX_DIR", "STATS_FILE")}
+    ark.LOG_DIR, ark.LOG_ARCHIVE_DIR, ark.LOG_INDEX_DIR, ark.STATS_FILE = (
+        root / "log", root / "log" / "archive", root / "log" / "index",
+        root / "stats.json")
+    ark.LOG_DIR.mkdir(parents=True, exist_ok=True)
+
+    def write_day(day):
+        with open(ark.LOG_DIR / f"{day}.jsonl", "w", encoding="utf-8") as f:
+            for i in range(STATS_SESSIONS_PER_DAY):
+                sid = f"{day}-{i}"
+                f.write(json.dumps({"event": "start", "session_id": sid,
+                                    "workspace": f"{i % 12:02d}-Bench", "model": f"M{i % 3}",
+                                    "ts": f"{day}T08:{i:02d}:00"}) + "\n")
+                if i % 10 == 0:
+                    f.write(json.dumps({"event": "crash", "session_id": sid,
+                                        "ts": f"{day}T09:{i:02d}:00"}) + "\n")
+                else:
+                    f.write(json.dumps({"event": "stop", "session_id": sid,
+                                        "duration_min": i * 7, "compact_count": i % 4,
+                                        "ts": f"{day}T10:{i:02d}:00"}) + "\n")
+
+    first = date(2025, 1, 1)
+    try:
+        for n in range(STATS_DAYS):
+            write_day((first + timedelta(days=n)).isoformat())
+        t0 = time.perf_counter()
+        stats = ark_stats.update(rebuild=True)
+        t_full = time.perf_counter() - t0
+        write_day((first + timedelta(days=STATS_DAYS)).isoformat())
+        t0 = time.perf_counter()
+        stats = ark_stats.update()
+        t_incr = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        rows = ark_stats.report(stats, by="workspace", period="week")
+        t_report = time.perf_counter() - t0
+        state_kb = ark.STATS_FILE.stat().st_size / 1024
+    finally:
+        for k, v in saved.items():
+            setattr(ark, k, v)
+        shutil.rmtree(root, ignore_errors=True)
+
+    sessions = sum(r["sessions"] for r in rows)
+    expected = (STATS_DAYS + 1) * STATS_SESSIONS_PER_DAY
+    print(f"  {STATS_DAYS + 1} days x {STATS_SESSIONS_PER_DAY} sessions "
+          f"-> {len(stats.buckets)} buckets, state {state_kb:.0f} KB")
+    print(f"  full aggregation:  {fmt_ms(t_full)}")
+    print(f"  incremental day:   {fmt_ms(t_incr)}")
+    print(f"  weekly report:     {fmt_ms(t_report)}")
+    ok = sessions == expected
+    print(f"  [{'PASS' if ok else 'FAIL'}] {sessions} sessions aggregated "
+          f"(expected {expected})")
+    return ok
+
+
+# -- Memory search -----------------------------------------------------------
+
+SEARCH_DAILY_FILES = 365
+SEARCH_LINES_PER_FILE = 40
+
+
+def bench_search():
+    """Memory search: index build, warm query, one-file incremental update."""
+    import random
+    import shutil
+
+    import ark_search
+
+    rng = random.Random(13)
+    vocab = [f"term{i}" for i in range(3000)] + ["postgres", "ledger", "deploy", "kafka"]
+    ws = Path(BENCH_HOME) / "search-ws"
+    daily = ws / "memory" / "daily"
+    daily.mkdir(parents=True, exist_ok=True)
+    (ws / "memory" / "registers").mkdir(parents=True, exist_ok=True)
+    for n in range(SEARCH_DAILY_FILES):
+        lines = [" ".join(rng.choices(vocab, k=12)) for _ in range(SEARCH_LINES_PER_FILE)]
+        (daily / f"2025-{n // 28 % 12 + 1:02d}-{n % 28 + 1:02d}-{n}.md").write_text(
+            "# Daily\n" + "\n".join(f"- {line}" for line in lines) + "\n", encoding="utf-8")
+    (ws / "CLAUDE.local.md").write_text(
+        "- ledger runs on postgres ^a1b2c3d4\n", encoding="utf-8")
+
+    try:
+        t0 = time.perf_counter()
+        ark_search.update_index(ws, rebuild=True)
+        t_build = time.perf_counter() - t0
+        samples = _time_calls(lambda: ark_search.search("postgres ledger", workspace=ws), 20)
+        with open(daily / "2025-01-01-0.md", "a", encoding="utf-8") as f:
+            f.write("- kafka offset reset after deploy\n")
+        t0 = time.perf_counter()
+        hits = ark_search.search("kafka offset", workspace=ws)
+        t_incr = time.perf_counter() - t0
+    finally:
+        shutil.rmtree(ws, ignore_errors=True)
+        shutil.rmtree(ark.MEMORY_INDEX_DIR, ignore_errors=True)
+
+    lines = SEARCH_DAILY_FILES * SEARCH_LINES_PER_FILE
+    print(f"  corpus: {SEARCH_DAILY_FILES + 1} files, {lines} lines")
+    print(f"  full index build:        {fmt_ms(t_build)}")
+    print(f"  warm query (stat+load):  p50={fmt_ms(percentile(samples, 50))} "
+          f"p99={fmt_ms(percentile(samples, 99))}")
+    print(f"  query after 1-file edit: {fmt_ms(t_incr)}")
+    ok = bool(hits) and "kafka offset" in hits[0]["text"]
+    print(f"  [{'PASS' if ok else 'FAIL'}] edited line found first")
+    return ok
+
+
+# -- Entry ID index ----------------------------------------------------------
+
+ID_FILES = 200
+IDS_PER_FILE = 50
+
+
+def bench_ids():
+    """new_id(): Bloom-filter path vs. scanning every memory file."""
+    import re
+    import secrets
+    import shutil
+
+    import ark_ids
+    import ark_memory
+
+    ws = Path(BENCH_HOME) / "ids-ws"
+    (ws / "memory" / "archive").mkdir(parents=True, exist_ok=True)
+    for n in range(ID_FILES):
+        (ws / "memory" / "archive" / f"a{n:03d}.md").write_text("".join(
+            f"- archived fact {n}-{i} ^{secrets.token_hex(4)}\n" for i in range(IDS_PER_FILE)
+        ), encoding="utf-8")
+
+    def scan_new_id():
+        used = set()
+        for _, _, path in ark_memory.memory_files(ws):
+            used.update(re.findall(r"\^([0-9a-f]{8})", path.read_text(encoding="utf-8")))
+        while True:
+            candidate = secrets.token_hex(4)
+            if candidate not in used:
+                return candidate
+
+    try:
+        t0 = time.perf_counter()
+        ark_ids.update_index(ws, rebuild=True)
+        t_build = time.perf_counter() - t0
+        scan = _time_calls(scan_new_id, 20)
+        bloom = _time_calls(lambda: ark_ids.new_id(ws), 200)
+        report = ark_ids.check_integrity(ws)
+    finally:
+        shutil.rmtree(ws, ignore_errors=True)
+        shutil.rmtree(ark.MEMORY_INDEX_DIR, ignore_errors=True)
+
+    print(f"  {ID_FILES} files, {ID_FILES * IDS_PER_FILE} IDs; index build {fmt_ms(t_build)}")
+    print(f"  new_id, scan all files: p50={fmt_ms(percentile(scan, 50))}")
+    print(f"  new_id, Bloom filter:   p50={fmt_ms(percentile(bloom, 50))} "
+          f"p99={fmt_ms(percentile(bloom, 99))}")
+    ok = not report["duplicates"]
+    print(f"  [{'PASS' if ok else 'FAIL'}] no duplicate IDs")
+    return ok
+
+
+# -- Demotion scoring --------------------------------------------------------
+
+DEMOTE_WORKSPACES = 40
+DEMOTE_ENTRIES = 100          # ~2000 words of working memory each
+DEMOTE_DAILY_FILES = 60
+DEMOTE_LINES_PER_DAILY = 30
+
+
+def bench_demote():
+    """Maintain pass over many workspaces: cold parse vs. mtime cache."""
+    import random
+    import shutil
+
+    import ark_demote
+
+    rng = random.Random(15)
+    vocab = [f"topic{i}" for i in range(2000)]
+    root = Path(BENCH_HOME) / "demote-root"
+    workspaces = []
+    for w in range(DEMOTE_WORKSPACES):
+        ws = root / f"{w:02d}-Bench-Workspace"
+        daily = ws / "memory" / "daily"
+        daily.mkdir(parents=True, exist_ok=True)
+        entries = [" ".join(rng.choices(vocab, k=18)) for _ in range(DEMOTE_ENTRIES)]
+        (ws / "CLAUDE.local.md").write_text(
+            "# Working Memory\n" + "".join(f"- {e}\n" for e in entries), encoding="utf-8")
+        for n in range(DEMOTE_DAILY_FILES):
+            lines = [" ".join(rng.choices(vocab, k=10)) for _ in range(DEMOTE_LINES_PER_DAILY)]
+            (daily / f"2026-{n // 28 % 12 + 1:02d}-{n % 28 + 1:02d}.md").write_text(
+                "# Daily\n" + "".join(f"- {line}\n" for line in lines), encoding="utf-8")
+        workspaces.append(ws)
+
+    def maintain_pass():
+        return [ark_demote.score_workspace(ws, today="2026-10-18") for ws in workspaces]
+
+    try:
+        t0 = time.perf_counter()
+        cold_reports = maintain_pass()
+        t_cold = time.perf_counter() - t0
+        warm = []
+        for _ in range(5):
+            t0 = time.perf_counter()
+            warm_reports = maintain_pass()
+            warm.append(time.perf_counter() - t0)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+        shutil.rmtree(ark.MEMORY_INDEX_DIR, ignore_errors=True)
+
+    t_warm = percentile(warm, 50)
+    print(f"  {DEMOTE_WORKSPACES} workspaces x ({DEMOTE_ENTRIES} entries, "
+          f"{DEMOTE_DAILY_FILES} daily logs)")
+    print(f"  cold pass (parse + index): {fmt_ms(t_cold)}")
+    print(f"  warm pass (mtime cache):   {fmt_ms(t_warm)} "
+          f"({fmt_ms(t_warm / DEMOTE_WORKSPACES)} per workspace)")
+    ok = warm_reports == cold_reports and cold_reports[0]["over"] > 0 and t_warm * 10 < t_cold
+    print(f"  [{'PASS' if ok else 'FAIL'}] cached pass identical and >10x faster")
+    return ok
+
+
+# -- Federation ---------------------------------------------------------------
+
+FED_MACHINES = 4
+FED_DAYS = 30
+FED_EVENTS_PER_DAY = 400
+
+
+def bench_federate():
+    """Merge of several machines' exports: first sync vs. incremental."""
+    import shutil
+
+    import ark_federate
+
+    root = Path(BENCH_HOME) / "federate"
+    saved = {k: getattr(ark, k) for k in ("LOG_DIR", "LOG_ARCHIVE_DIR", "LOG_INDEX_DIR",
+                                          "FEDERATION_DIR", "get_machine_id")}
+    machines = [f"bench-{m}" for m in range(FED_MACHINES)]
+
+    def as_machine(name):
+        ark.LOG_DIR = root / name / "log"
+        ark.LOG_ARCHIVE_DIR = ark.LOG_DIR / "archive"
+        ark.LOG_INDEX_DIR = ark.LOG_DIR / "index"
+        ark.FEDERATION_DIR = root / name / "federation"
+        ark.get_machine_id = lambda: name
+
+    try:
+        for name in machines:
+            log_dir = root / name / "log"
+            log_dir.mkdir(parents=True)
+            for d in range(FED_DAYS):
+                day = f"2026-09-{d + 1:02d}"
+                (log_dir / f"{day}.jsonl").write_text("".join(
+                    json.dumps({"event": "heartbeat", "session_id": f"{name}-{i // 20}",
+                                "ts": f"{day}T{i // 60 % 24:02d}:{i % 60:02d}:00.{i:06d}"}) + "\n"
+                    for i in range(FED_EVENTS_PER_DAY)), encoding="utf-8")
+            as_machine(name)
+            ark_federate.export(root / "shared")
+        as_machine(machines[0])
+        t0 = time.perf_counter()
+        first = ark_federate.merge(root / "shared")
+        t_first = time.perf_counter() - t0
+        idle = _time_calls(lambda: ark_federate.merge(root / "shared"), 20)
+
+        with open(ark.LOG_DIR / f"2026-09-{FED_DAYS:02d}.jsonl", "a", encoding="utf-8") as f:
+            f.write(json.dumps({"event": "stop", "session_id": "late", "ts": "2026-09-30T23:59:59"}) + "\n")
+        t0 = time.perf_counter()
+        delta = ark_federate.sync(root / "shared")
+        t_delta = time.perf_counter() - t0
+    finally:
+        for key, value in saved.items():
+            setattr(ark, key, value)
+        shutil.rmtree(root, ignore_errors=True)
+
+    total = FED_MACHINES * FED_DAYS * FED_EVENTS_PER_DAY
+    print(f"  {FED_MACHINES} machines x {FED_DAYS} days x {FED_EVENTS_PER_DAY} events")
+    print(f"  first merge:          {fmt_ms(t_first)} ({first['events']} events)")
+    print(f"  merge, nothing new:   p50={fmt_ms(percentile(idle, 50))}")
+    print(f"  sync, one new event:  {fmt_ms(t_delta)}")
+    ok = (first["events"] == total and delta["merge"]["events"] == 1
+          and percentile(idle, 50) * 10 < t_first)
+    print(f"  [{'PASS' if ok else 'FAIL'}] every event merged once, idle merge >10x cheaper")
+    return ok
+
+
+# -- Bulk installer ----------------------------------------------------------
+
+INSTALL_WORKSPACES = 120
+
+
+def bench_install():
+    """install_all.py: serial vs. parallel first run, manifest re-run."""
+    import shutil
+
+    sys.path.insert(0, str(Path(__file__).resolve().parent))
+    import install_all
+
+    def make_root(name):
+        root = Path(BENCH_HOME) / name
+        for w in range(INSTALL_WORKSPACES):
+            (root / f"{w:03d}-Bench-Workspace" / ".git").mkdir(parents=True, exist_ok=True)
+        return install_all.discover_workspaces(root)
+
+    def timed(workspaces, jobs):
+        t0 = time.perf_counter()
+        results, _ = install_all.install_all(workspaces, jobs=jobs)
+        return time.perf_counter() - t0, results
+
+    try:
+        t_serial, _ = timed(make_root("install-serial"), 1)
+        workspaces = make_root("install-parallel")
+        t_parallel, first = timed(workspaces, install_all.DEFAULT_JOBS)
+        reruns = [timed(workspaces, install_all.DEFAULT_JOBS) for _ in range(5)]
+    finally:
+        for name in ("install-serial", "install-parallel"):
+            shutil.rmtree(Path(BENCH_HOME) / name, ignore_errors=True)
+
+    t_rerun = percentile([t for t, _ in reruns], 50)
+    created = sum(len(r["created"]) for r in first)
+    rewritten = sum(len(r["created"]) + len(r["updated"]) for _, results in reruns for r in results)
+    print(f"  {INSTALL_WORKSPACES} workspaces, {created} files on first run")
+    print(f"  first run, serial:          {fmt_ms(t_serial)}")
+    print(f"  first run, {install_all.DEFAULT_JOBS:>2} workers:      {fmt_ms(t_parallel)}")
+    print(f"  re-run (manifest):          {fmt_ms(t_rerun)} "
+          f"({fmt_ms(t_rerun / INSTALL_WORKSPACES)} per workspace)")
+    ok = rewritten == 0 and t_rerun < t_parallel
+    print(f"  [{'PASS' if ok else 'FAIL'}] re-run writes nothing and beats a first run")
+    return ok
+
+
+# -- WAL registry ------------------------------------------------------------
+
+WAL_SESSIONS = 5000
+WAL_UPDATES = 300
+
+
+def bench_wal():
+    """Heartbeat-style updates: rewriting active.json vs. appending to the WAL."""
+    import shutil
+    from datetime import datetime
+
+    saved = {k: getattr(ark, k) for k in ("ACTIVE_FILE", "LOCK_FILE", "REGISTRY_WAL")}
+    root = Path(BENCH_HOME) / "wal-bench"
+    stamp = datetime.now().isoformat()
+    registry = {
+        f"bench-wal-{i:05d}": {
+            "status": "stopped" if i % 10 else "active", "callsign": "BWL-0000",
+            "workspace": "07-Bench-Work-Space", "started": stamp,
+            "last_heartbeat": stamp, "context_pct": 0, "intent": "x" * 40,
+        }
+        for i in range(WAL_SESSIONS)
+    }
+    live = [sid for sid, r in registry.items() if r["status"] == "active"]
+
+    def run(layout):
+        shutil.rmtree(root, ignore_errors=True)
+        root.mkdir(parents=True)
+        ark.ACTIVE_FILE = root / "active.json"
+        ark.LOCK_FILE = root / "active.json.lock"
+        ark.REGISTRY_WAL = root / "active.wal"
+        ark.ACTIVE_FILE.write_text(json.dumps(registry), encoding="utf-8")
+        if layout == "wal":
+            ark.migrate_registry_to_wal()
+        samples = []
+        io_start = ark._io_counters()  # (read, written), None off Linux/Windows
+        for i in range(WAL_UPDATES):
+            t0 = time.perf_counter()
+            with ark.session_transaction(live[i % len(live)]) as record:
+                record["last_heartbeat"] = f"{stamp}-{i}"
+                record["context_pct"] = i % 100
+            samples.append(time.perf_counter() - t0)
+        io_end = ark._io_counters()
+        written = (io_end[1] - io_start[1]) / WAL_UPDATES if io_start and io_end else None
+        return samples, written, ark._read_active()
+
+    try:
+        mono, mono_bytes, mono_state = run("monolithic")
+        wal, wal_bytes, wal_state = run("wal")
+        ark.ACTIVE_FILE.unlink()
+        rebuilt = ark._read_active() == wal_state
+    finally:
+        for k, v in saved.items():
+            setattr(ark, k, v)
+        shutil.rmtree(root, ignore_errors=True)
+
+    print(f"  {WAL_SESSIONS} sessions, {WAL_UPDATES} heartbeat updates "
+          f"(snapshot every {ark.WAL_SNAPSHOT_RECORDS})")
+    def kb(n):
+        return "?" if n is None else f"{n / 1024:.1f} KB"
+
+    print(f"  monolithic rewrite: p50={fmt_ms(percentile(mono, 50))} "
+          f"p99={fmt_ms(percentile(mono, 99))} {kb(mono_bytes)} written/update")
+    print(f"  WAL append:         p50={fmt_ms(percentile(wal, 50))} "
+          f"p99={fmt_ms(percentile(wal, 99))} {kb(wal_bytes)} written/update "
+          f"(snapshots amortized)")
+    ok = (mono_state == wal_state and rebuilt and percentile(wal, 50) < percentile(mono, 50)
+          and (mono_bytes is None or wal_bytes * 10 < mono_bytes))
+    print(f"  [{'PASS' if ok else 'FAIL'}] same registry, snapshot rebuilt from the WAL, "
+          f"faster and >10x fewer bytes")
+    return ok
+
+
+# -- Storage backends --------------------------------------------------------
+
+STORAGE_DAYS = 90
+STORAGE_EVENTS_PER_DAY = 2000
+STORAGE_SESSIONS = 5000
+STORAGE_UPDATES = 200
+
+
+def bench_storage():
+    """File vs. SQLite backend: heartbeat updates, event queries, cursor reads."""
+    import shutil
+
+    try:
+        import ark_sqlite
+    except ImportError:
+        print("  [SKIP] sqlite3 not available")
+        return True
+    import ark_events
+
+    root = Path(BENCH_HOME) / "storage-bench"
+    saved = {k: getattr(ark, k) for k in (
+        "ACTIVE_FILE", "LOCK_FILE", "LOG_DIR", "LOG_ARCHIVE_DIR", "LOG_INDEX_DIR")}
+    shutil.rmtree(root, ignore_errors=True)
+    root.mkdir(parents=True)
+    ark.ACTIVE_FILE, ark.LOCK_FILE = root / "active.json", root / "active.json.lock"
+    ark.LOG_DIR, ark.LOG_ARCHIVE_DIR, ark.LOG_INDEX_DIR = (
+        root / "log", root / "log" / "archive", root / "log" / "index")
+    ark.LOG_DIR.mkdir()
+    registry = {
+        f"bench-store-{i:05d}": {
+            "status": "stopped" if i % 10 else "active", "callsign": f"BST-{i % 500:04x}",
+            "workspace": f"{i % 40:02d}-Bench-Space", "last_heartbeat": "2026-01-01T00:00:00",
+            "context_pct": 0, "intent": "x" * 40,
+        }
+        for i in range(STORAGE_SESSIONS)
+    }
+    ark.ACTIVE_FILE.write_text(json.dumps(registry), encoding="utf-8")
+    live = [sid for sid, r in registry.items() if r["status"] == "active"]
+    events = []
+    for d in range(STORAGE_DAYS):
+        day = time.strftime("%Y-%m-%d", time.localtime(time.time() - (STORAGE_DAYS - d) * 86400))
+        for i in range(STORAGE_EVENTS_PER_DAY):
+            events.append({
+                "event": "crash" if i % 500 == 0 else "start",
+                "session_id": f"bench-{d}-{i % 200}", "callsign": f"BEN-{i % 200:04x}",
+                "workspace": f"{i % 40:02d}-Bench-Space",
+                "ts": f"{day}T{i // 3600 % 24:02d}:{i // 60 % 60:02d}:{i % 60:02d}",
+            })
+    by_day = {}
+    for ev in events:
+        by_day.setdefault(ev["ts"][:10], []).append(json.dumps(ev) + "\n")
+    for day, lines in by_day.items():
+        (ark.LOG_DIR / f"{day}.jsonl").write_text("".join(lines), encoding="utf-8")
+    ark_events.update_indexes()  # as log retention does for files written earlier
+
+    def updates(backend):
+        samples = []
+        for i in range(STORAGE_UPDATES):
+            t0 = time.perf_counter()
+            with backend.session_transaction(live[i % len(live)]) as record:
+                record["last_heartbeat"] = f"2026-01-02T00:00:{i % 60:02d}"
+                record["context_pct"] = i % 100
+            samples.append(time.perf_counter() - t0)
+        return percentile(samples, 50)
+
+    def queries(backend):
+        timings, results = [], []
+        for filters in ({"session": "bench-40-7"}, {"event": "crash", "workspace": "00-Bench-Space"},
+                        {"callsign": "BEN-002a", "since": "30d"}):
+            list(backend.query_events(**filters))  # warm caches
+            t0 = time.perf_counter()
+            results.append(list(backend.query_events(**filters)))
+            timings.append(time.perf_counter() - t0)
+        return timings, results
+
+    def cursor_reads(backend):
+        """events_since() from scratch, then resumed with nothing new."""
+        cursor = {}
+        t0 = time.perf_counter()
+        full = sum(1 for _ in backend.events_since(cursor))
+        t_full = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        again = sum(1 for _ in backend.events_since(json.loads(json.dumps(cursor))))
+        return full, again, t_full, time.perf_counter() - t0
+
+    try:
+        sqlite = ark_sqlite.SQLiteBackend(root / "ark.db")
+        sqlite.insert_events(events)
+        file_update = updates(ark._FILE_BACKEND)
+        sqlite_update = updates(sqlite)
+        file_q, file_results = queries(ark._FILE_BACKEND)
+        sqlite_q, sqlite_results = queries(sqlite)
+        file_cursor, sqlite_cursor = cursor_reads(ark._FILE_BACKEND), cursor_reads(sqlite)
+        same = (file_results == sqlite_results
+                and ark._FILE_BACKEND.read_registry() == sqlite.read_registry())
+        sqlite.close()
+    finally:
+        for k, v in saved.items():
+            setattr(ark, k, v)
+        shutil.rmtree(root, ignore_errors=True)
+
+    print(f"  registry: {STORAGE_SESSIONS} sessions; log: {STORAGE_DAYS} days x "
+          f"{STORAGE_EVENTS_PER_DAY} events")
+    print(f"  heartbeat update p50:  file {fmt_ms(file_update)}  sqlite {fmt_ms(sqlite_update)}")
+    for name, f_t, s_t in zip(("session", "crash+workspace", "callsign, 30d"), file_q, sqlite_q):
+        print(f"  query {name:<16} file {fmt_ms(f_t)}  sqlite {fmt_ms(s_t)}")
+    for name, (full, again, t_full, t_again) in (("file", file_cursor), ("sqlite", sqlite_cursor)):
+        print(f"  events_since {name:<7} {full} events in {fmt_ms(t_full)}, "
+              f"resumed: {again} in {fmt_ms(t_again)}")
+    cursors_ok = all(c[:2] == (len(events), 0) for c in (file_cursor, sqlite_cursor))
+    ok = same and cursors_ok and sqlite_update * 5 < file_update and sum(sqlite_q) < sum(file_q)
+    print(f"  [{'PASS' if ok else 'FAIL'}] same results, SQLite updates >5x faster, "
+          f"queries faster, cursors resume")
+    return ok
+
+
+# -- Tracing -----------------------------------------------------------------
+
+TRACE_CALLS = 20000
+TRACE_ROUNDS = 10
+TRACE_STOPS = 100
+
+
+def bench_trace():
+    """ARK_TRACE off: wrapper overhead on the throttled heartbeat; on: cost."""
+    data = {
+        "session_id": "bench-trace-0001",
+        "cwd": os.path.join(BENCH_HOME, "07-Bench-Work-Space"),
+        "model": {"display_name": "Bench"},
+    }
+    ark.TRACE_SAMPLE = ""
+    ark.session_start(data)
+    ark.session_heartbeat(data)
+
+    def per_call(fn):
+        t0 = time.perf_counter()
+        for _ in range(TRACE_CALLS):
+            fn(data)
+        return (time.perf_counter() - t0) / TRACE_CALLS
+
+    # Alternate rounds so drift (CPU frequency, page cache) hits both alike
+    def best_of(*fns):
+        best = [float("inf")] * len(fns)
+        for _ in range(TRACE_ROUNDS):
+            best = [min(b, per_call(fn)) for b, fn in zip(best, fns)]
+        return best
+
+    bare, wrapped = best_of(ark.session_heartbeat.__wrapped__, ark.session_heartbeat)
+    # The heartbeat's syscalls jitter by more than the wrapper costs, so
+    # the pass criterion times the same decorator around a no-op
+    def noop(data):
+        return data
+
+    noop_bare, noop_wrapped = best_of(noop, ark._traced("bench")(noop))
+    ark.session_stop(data)
+
+    # Alternate off/on so both see the same diary and daily-log sizes
+    samples = {"": [], "1": []}
+    try:
+        for i in range(TRACE_STOPS):
+            for sample in samples:
+                ark.TRACE_SAMPLE = sample
+                run = dict(data, session_id=f"bench-trace-{sample or 'off'}-{i:04d}")
+                ark.session_start(run)
+                t0 = time.perf_counter()
+                ark.session_stop(run)
+                samples[sample].append(time.perf_counter() - t0)
+    finally:
+        ark.TRACE_SAMPLE = ""
+    stop_off, stop_on = percentile(samples[""], 50), percentile(samples["1"], 50)
+    traced = sum(1 for line in open(ark.TRACE_FILE, encoding="utf-8")
+                 if '"hook":"stop"' in line)
+
+    overhead = noop_wrapped - noop_bare
+    print(f"  throttled heartbeat, unwrapped:   {bare * 1e6:.2f} us/call")
+    print(f"  throttled heartbeat, tracing off: {wrapped * 1e6:.2f} us/call "
+          f"({(wrapped - bare) * 1e9:+.0f} ns)")
+    print(f"  wrapper alone, tracing off:       {overhead * 1e9:+.0f} ns/call")
+    print(f"  session_stop p50, tracing off:    {fmt_ms(stop_off)}")
+    print(f"  session_stop p50, tracing on:     {fmt_ms(stop_on)} ({traced} records)")
+    ok = traced == TRACE_STOPS and overhead < max(0.5e-6, bare * 0.05)
+    print(f"  [{'PASS' if ok else 'FAIL'}] disabled tracing adds <0.5 us or <5% per call")
+    return ok
+
+
+BENCHMARKS = {
+    "contention": bench_contention,
+    "heartbeat": bench_heartbeat,
+    "crashes": bench_crashes,
+    "start": bench_start,
+    "broker": bench_broker,
+    "events": bench_events,
+    "query": bench_query,
+    "stats": bench_stats,
+    "search": bench_search,
+    "ids": bench_ids,
+    "demote": bench_demote,
+    "federate": bench_federate,
+    "install": bench_install,
+    "trace": bench_trace,
+    "wal": bench_wal,
+    "storage": bench_storage,
+}
+
+
+def main(argv):
+    names = argv or list(BENCHMARKS)
+    unknown = [n for n in names if n not in BENCHMARKS]
+    if unknown:
+        print(f"Unknown benchmark(s): {', '.join(unknown)}")
+        print(f"Available: {', '.join(BENCHMARKS)}")
+        return 2
+
+    print("=" * 50)
+    print("  ARK SESSION MANAGER -- BENCHMARKS")
+    print(f"  HOME: {BENCH_HOME}")
+    print("=" * 50)
+    failed = 0
+    for name in names:
+        print()
+        print(f"--- {name} ---")
+        if not BENCHMARKS[name]():
+            failed += 1
+        reap_workers()
+    print()
+    print("=" * 50)
+    print(f"  {len(names) - failed} ok, {failed} failed")
+    print("=" * 50)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks for the public hook functions (source copy).
+
+Every hook-facing function is timed across the data sizes that drive its
+cost: registry size (1 to 5,000 sessions), diary and daily-log size (1 KB
+to 50 MB) and event-log volume. Runs against a throwaway HOME, like
+bench_full.py. Results are written as JSON and compared with a stored
+baseline; a case whose p50 is slower than the baseline by more than the
+tolerance (and by more than NOISE_FLOOR_MS) is a regression.
+
+Usage:
+    python bench_hooks.py                  # full matrix, compare with bench_baseline.json
+    python bench_hooks.py --quick          # small matrix
+    python bench_hooks.py --out run.json   # also keep the results
+    python bench_hooks.py --save-baseline  # record these results as the baseline
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from bench_full import BENCH_HOME, ark, percentile
+
+BASELINE_FILE = Path(__file__).resolve().parent / "bench_baseline.json"
+RESULTS_VERSION = 1
+
+REGISTRY_SIZES = (1, 100, 1000, 5000)
+DIARY_SIZES_KB = (1, 1024, 10 * 1024, 50 * 1024)
+LOG_EVENTS = (0, 10_000, 100_000)
+QUICK = {"registry": (1, 1000), "diary": (1, 1024), "log": (0, 10_000)}
+CALLS = 40
+QUICK_CALLS = 15
+
+DEFAULT_TOLERANCE = 0.5       # 50% slower than baseline p50
+NOISE_FLOOR_MS = 0.05         # differences below this are never regressions
+
+
+# -- Fixtures -----------------------------------------------------------------
+
+def _workspace(name):
+    ws = Path(BENCH_HOME) / name
+    (ws / "memory" / "daily").mkdir(parents=True, exist_ok=True)
+    return ws
+
+
+def _fill_registry(count):
+    """Registry of `count` sessions: mostly history, a few live."""
+    stale = (datetime.now() - timedelta(hours=3)).isoformat()
+    live = max(1, count // 50)
+    registry = {}
+    for i in range(count):
+        if i < live:
+            registry[f"bench-live-{i:05d}"] = {
+                "status": "active", "callsign": "BH-live", "last_heartbeat": datetime.now().isoformat(),
+                "started": stale, "pid": os.getpid(),
+                "pid_start": ark._process_fingerprint(os.getpid()),
+            }
+        else:
+            registry[f"bench-old-{i:05d}"] = {
+                "status": "stopped", "callsign": "BH-old", "started": stale, "stopped": stale,
+                "last_heartbeat": stale, "intent": "x" * 40, "duration_min": 30,
+            }
+    ark._write_active(registry)
+
+
+def _fill_text(path, kilobytes, header, block, sections=()):
+    """
+    Grow a markdown file to `kilobytes` with repeated blocks. `sections`
+    are headers spread evenly through it, the last one near the end --
+    the shape of a month of diary days.
+    """
+    target = kilobytes * 1024
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(header)
+        written = len(header)
+        pending = list(sections)
+        while written < target:
+            if pending and written >= target * (len(sections) - len(pending)) / len(sections):
+                f.write(pending[0])
+                written += len(pending.pop(0))
+            f.write(block)
+            written += len(block)
+
+
+def _fill_log(events):
+    """Today's JSONL log with `events` lines, plus a week of older days."""
+    ark.flush_events()
+    for path in ark.LOG_DIR.glob("*.jsonl"):
+        path.unlink()
+    if not events:
+        return
+    line = json.dumps({"event": "heartbeat", "session_id": "bench-log", "callsign": "BH-log",
+                       "workspace": "07-Bench-Hooks", "ts": datetime.now().isoformat()}) + "\n"
+    per_day = events // 8
+    for back in range(8):
+        day = (datetime.now() - timedelta(days=back)).strftime("%Y-%m-%d")
+        with open(ark.LOG_DIR / f"{day}.jsonl", "w", encoding="utf-8") as f:
+            f.write(line * per_day)
+
+
+# -- Measurement --------------------------------------------------------------
+
+def _summary(samples):
+    return {
+        "p50_ms": round(percentile(samples, 50) * 1000, 4),
+        "p95_ms": round(percentile(samples, 95) * 1000, 4),
+        "calls": len(samples),
+    }
+
+
+def _lifecycle(results, label, calls, cwd):
+    """Time start, heartbeats, compact and stop over `calls` sessions."""
+    timings = {k: [] for k in ("session_start", "session_heartbeat[unthrottled]",
+                               "session_heartbeat[throttled]", "session_compact", "session_stop")}
+
+    def timed(name, fn, *args):
+        t0 = time.perf_counter()
+        fn(*args)
+        timings[name].append(time.perf_counter() - t0)
+
+    for i in range(calls):
+        sid = f"bench-hook-{label}-{i:04d}"
+        data = {"session_id": sid, "cwd": str(cwd), "context_window": {"used_percentage": 40}}
+        timed("session_start", ark.session_start, data)
+        ark._clear_heartbeat_stamp(sid)
+        timed("session_heartbeat[unthrottled]", ark.session_heartbeat, data)
+        timed("session_heartbeat[throttled]", ark.session_heartbeat, data)
+        timed("session_compact", ark.session_compact, data)
+        timed("session_stop", ark.session_stop, data)
+        with ark.registry_transaction() as active:
+            active.pop(sid, None)
+    for name, samples in timings.items():
+        results[f"{name}[{label}]"] = _summary(samples)
+
+
+def bench_registry(results, sizes, calls):
+    cwd = _workspace("07-Bench-Hooks")
+    for size in sizes:
+        _fill_registry(size)
+        ark._invalidate_deadlines()
+        ark.detect_crashes()  # first call rebuilds the deadline heap
+        samples = []
+        for _ in range(calls):
+            t0 = time.perf_counter()
+            ark.detect_crashes()
+            samples.append(time.perf_counter() - t0)
+        results[f"detect_crashes[registry={size}]"] = _summary(samples)
+        _lifecycle(results, f"registry={size}", calls, cwd)
+        print(f"  registry={size}: start p50={results[f'session_start[registry={size}]']['p50_ms']:.3f} ms, "
+              f"stop p50={results[f'session_stop[registry={size}]']['p50_ms']:.3f} ms")
+    _fill_registry(1)
+
+
+def bench_diary(results, sizes, calls):
+    month = datetime.now().strftime("%Y-%m")
+    today = datetime.now().strftime("%Y-%m-%d")
+    entry = ("\n### BH-0000 | 09:00-09:30 | main | Claude\n**Duration**: 30 min\n"
+             "**Intent**: benchmark filler entry for a large diary month\n")
+    for kb in sizes:
+        ws = _workspace(f"Bench-Diary-{kb}k")
+        diary_dir = ark._diary_dir(str(ws))
+        diary_dir.mkdir(parents=True, exist_ok=True)
+        days = [f"\n## {month}-{d:02d}\n" for d in range(1, 31)] + [f"\n## {today}\n"]
+        _fill_text(ark._diary_month_file(diary_dir, month), kb,
+                   f"# Session Log {month}\n", entry, days)
+        _fill_text(ws / "memory" / "daily" / f"{today}.md", kb,
+                   f"# {today}\n\n## Notes\n", "- [09:30] [session-end] BH-0000 | 30 min\n")
+
+        diary, sweep = [], []
+        for i in range(calls):
+            t0 = time.perf_counter()
+            ark.write_diary_entry(str(ws), "BH-0001", f"bench-{i}", "09:00-09:30", "main",
+                                  "Claude", intent="benchmark", duration_min=30)
+            diary.append(time.perf_counter() - t0)
+            t0 = time.perf_counter()
+            ark.sweep_session(str(ws), "BH-0001", 30, intent="benchmark")
+            sweep.append(time.perf_counter() - t0)
+        results[f"write_diary_entry[diary={kb}KB]"] = _summary(diary)
+        results[f"sweep_session[daily={kb}KB]"] = _summary(sweep)
+        shutil.rmtree(ws, ignore_errors=True)
+        print(f"  diary={kb}KB: write_diary_entry p50={results[f'write_diary_entry[diary={kb}KB]']['p50_ms']:.3f} ms, "
+              f"sweep_session p50={results[f'sweep_session[daily={kb}KB]']['p50_ms']:.3f} ms")
+
+
+def bench_log(results, volumes, calls):
+    cwd = _workspace("07-Bench-Hooks")
+    for events in volumes:
+        _fill_log(events)
+        _lifecycle(results, f"log={events}", calls, cwd)
+        print(f"  log={events} events: start p50={results[f'session_start[log={events}]']['p50_ms']:.3f} ms")
+    _fill_log(0)
+
+
+# -- Baseline comparison ------------------------------------------------------
+
+def compare(current, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Compare p50s case by case.
+
+    Returns:
+        list of (case, current_ms, baseline_ms or None, status) where status
+        is "ok", "faster", "REGRESSION" or "new"
+    """
+    rows = []
+    for case, result in sorted(current.items()):
+        base = baseline.get(case)
+        now = result["p50_ms"]
+        if base is None:
+            rows.append((case, now, None, "new"))
+            continue
+        limit = max(base["p50_ms"] * (1 + tolerance), base["p50_ms"] + NOISE_FLOOR_MS)
+        if now > limit:
+            status = "REGRESSION"
+        elif now < base["p50_ms"] / (1 + tolerance):
+            status = "faster"
+        else:
+            status = "ok"
+        rows.append((case, now, base["p50_ms"], status))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Hook function micro-benchmarks.")
+    parser.add_argument("--quick", action="store_true", help="small size matrix")
+    parser.add_argument("--out", help="write results JSON here")
+    parser.add_argument("--baseline", default=str(BASELINE_FILE), help="baseline JSON")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="store these results as the baseline instead of comparing")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="allowed p50 slowdown as a fraction (default 0.5)")
+    args = parser.parse_args(argv)
+
+    sizes = QUICK if args.quick else {"registry": REGISTRY_SIZES, "diary": DIARY_SIZES_KB,
+                                      "log": LOG_EVENTS}
+    calls = QUICK_CALLS if args.quick else CALLS
+
+    print("=" * 50)
+    print("  ARK SESSION MANAGER -- HOOK MICRO-BENCHMARKS")
+    print(f"  HOME: {BENCH_HOME}")
+    print("=" * 50)
+
+    # Keep each size fixed for the whole run: no registry pruning or
+    # detached workers in the middle of a measurement
+    ark.MAINTENANCE_MODE = "inline"
+    ark._prune_inactive = lambda active: 0
+    ark._ensure_dirs()
+    results = {}
+    for section, fn in (("registry", bench_registry), ("diary", bench_diary), ("log", bench_log)):
+        print()
+        print(f"--- {section} ---")
+        fn(results, sizes[section], calls)
+    ark.flush_events()
+
+    doc = {
+        "v": RESULTS_VERSION,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "quick": args.quick,
+        "results": results,
+    }
+    if args.out:
+        Path(args.out).write_text(json.dumps(doc, indent=1, sort_keys=True), encoding="utf-8")
+        print(f"\nResults written to {args.out}")
+    if args.save_baseline:
+        Path(args.baseline).write_text(json.dumps(doc, indent=1, sort_keys=True), encoding="utf-8")
+        print(f"\nBaseline saved to {args.baseline}")
+        return 0
+
+    try:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        print(f"\nNo baseline at {args.baseline}; run with --save-baseline to create one.")
+        return 0
+    if baseline.get("v") != RESULTS_VERSION:
+        print(f"\nBaseline {args.baseline} has another format version; not compared.")
+        return 0
+
+    rows = compare(results, baseline["results"], args.tolerance)
+    print()
+    print(f"--- vs. baseline ({baseline['created']}, {baseline['platform']}) ---")
+    print(f"  {'CASE':<52} {'P50':>10} {'BASELINE':>10}  STATUS")
+    for case, now, base, status in rows:
+        base_text = "-" if base is None else f"{base:.3f}"
+        print(f"  {case:<52} {now:>10.3f} {base_text:>10}  {status}")
+    regressions = [r for r in rows if r[3] == "REGRESSION"]
+    print()
+    print("=" * 50)
+    print(f"  {len(rows)} cases, {len(regressions)} regression(s) "
+          f"(tolerance {args.tolerance:.0%})")
+    print("=" * 50)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,32 @@
 #!/usr/bin/env python3
-"""Bulk installer -- scaffolds Ark Session memory system in all major workspaces."""
+"""
+Bulk installer -- scaffolds Ark Session memory system in every workspace
+under WORKSPACE_ROOT.
+
+Workspaces are discovered (any directory holding .git, CLAUDE.md,
+CLAUDE.local.md, memory/ or .claude/) and scaffolded in parallel. Each
+workspace keeps a manifest, .claude/ark-install.json, recording for every
+installed template the hash of the template it came from, the hash of what
+was written, and the file's last seen (mtime, size) with its hash then. On a
+re-run a file whose stat is unchanged is settled without reading it; only
+files whose stat changed are re-hashed.
+
+A template that changed upstream is reported as stale where the installed
+copy is untouched, and replaced with --update. Copies the user has edited
+are never overwritten; if their template changed too they are reported as
+conflicts.
+
+Usage:
+    python install_all.py [--root DIR] [--workspace NAME ...] [--jobs N]
+                          [--update] [--dry-run]
+"""
 
+import difflib
+import hashlib
+import json
 import os
-import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
 
@@ -10,23 +34,12 @@ WORKSPACE_ROOT = Path(os.environ.get("WORKSPACE_ROOT", "D:/My-Applications"))
 TEMPLATE_DIR = Path(__file__).parent / "templates"
 RULES_SRC = Path(__file__).parent / ".claude" / "rules" / "ark-session.md"
 
-WORKSPACES = [
-    "01-CineCrafter-Portal",
-    "07-Carbon-Meth-Hub",
-    "38-Legal-Matters",
-    "40-Office-Team",
-    "42-IT-Adviser",
-    "52-Win-Claude",
-    "54-Business-DevCon",
-    "55-Bid-Tender-Contracts",
-    "64-CORTEX-GUI",
-    "65-ark-codewrap",
-    "70-GIS-Command-Center",
-    "80-Green-Sciences-Command-Center",
-    "90-Programme-Command-Centre",
-    "95-Mandan-Operations-Hub",
-    "100-Aarksee-Component-Repository",
-]
+# A directory under WORKSPACE_ROOT is a workspace if it has any of these
+WORKSPACE_MARKERS = (".git", "CLAUDE.md", "CLAUDE.local.md", "memory", ".claude")
+
+MANIFEST = ".claude/ark-install.json"
+MANIFEST_VERSION = 1
+DEFAULT_JOBS = min(16, (os.cpu_count() or 2) * 2)
 
 TODAY = datetime.now().strftime("%Y-%m-%d")
 
@@ -64,127 +77,311 @@ TEMPLATE_MAP = {
     "registers/open-loops.md": "memory/registers/open-loops.md",
 }
 
-GITIGNORE_LINE = "CLAUDE.local.md"
+# CLAUDE.local.md is personal working memory; the manifest holds
+# machine-local mtimes. Neither belongs in git.
+GITIGNORE_LINES = ["CLAUDE.local.md", MANIFEST]
 
 
-def install_workspace(ws_path: Path) -> dict:
-    """Scaffold memory system in a single workspace. Returns stats."""
-    stats = {"name": ws_path.name, "created": [], "skipped": [], "errors": []}
+# -- Templates and manifest ---------------------------------------------------
 
-    # 1. Create directories
-    for d in DIRS:
-        target = ws_path / d
+def _hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _signature(path):
+    """[mtime_ns, size] or None if missing."""
+    try:
+        st = os.stat(path)
+        return [st.st_mtime_ns, st.st_size]
+    except OSError:
+        return None
+
+
+def load_templates():
+    """
+    Read every template once.
+
+    Returns:
+        (templates, missing): templates maps destination relpath to
+        (content bytes, sha256); missing lists template sources not found
+    """
+    sources = {dst: TEMPLATE_DIR / src for src, dst in TEMPLATE_MAP.items()}
+    sources[".claude/rules/ark-session.md"] = RULES_SRC
+    templates, missing = {}, []
+    for dst_rel, src in sources.items():
         try:
-            target.mkdir(parents=True, exist_ok=True)
-        except Exception as e:
-            stats["errors"].append(f"mkdir {d}: {e}")
+            data = src.read_bytes()
+        except OSError:
+            missing.append(str(src))
+            continue
+        templates[dst_rel] = (data, _hash(data))
+    return templates, missing
 
-    # 2. Copy template files (skip existing)
-    for src_rel, dst_rel in TEMPLATE_MAP.items():
-        src = TEMPLATE_DIR / src_rel
-        dst = ws_path / dst_rel
-        if dst.exists():
-            stats["skipped"].append(dst_rel)
+
+def _load_manifest(ws_path):
+    try:
+        manifest = json.loads((ws_path / MANIFEST).read_text(encoding="utf-8"))
+        if manifest.get("v") == MANIFEST_VERSION:
+            return manifest
+    except Exception:
+        pass
+    return {"v": MANIFEST_VERSION, "files": {}}
+
+
+def discover_workspaces(root=None, names=None):
+    """Sorted workspace directories under root (optionally only `names`)."""
+    root = Path(root or WORKSPACE_ROOT)
+    try:
+        candidates = [root / n for n in names] if names else list(root.iterdir())
+    except OSError:
+        return []
+    return sorted(
+        p for p in candidates
+        if p.is_dir() and not p.name.startswith(".")
+        and any((p / marker).exists() for marker in WORKSPACE_MARKERS)
+    )
+
+
+# -- Install ------------------------------------------------------------------
+
+def _classify(ws_path, dst_rel, template_hash, entry):
+    """
+    Decide what to do with one template in one workspace.
+
+    Returns:
+        (action, current_hash, signature) where action is create,
+        unchanged, stale (untouched copy of an older template), customized
+        (user-edited, template unchanged) or conflict (user-edited, template
+        changed too)
+    """
+    dst = ws_path / dst_rel
+    sig = _signature(dst)
+    if sig is None:
+        return "create", None, None
+    if entry and entry.get("sig") == sig:
+        current = entry["current"]  # same stat as last run: no read
+    else:
+        try:
+            current = _hash(dst.read_bytes())
+        except OSError:
+            return "create", None, None
+    if current == template_hash:
+        return "unchanged", current, sig
+    if entry is None:
+        return "customized", current, sig  # predates the manifest
+    if current == entry["installed"]:
+        return "stale", current, sig
+    if entry["template"] == template_hash:
+        return "customized", current, sig
+    return "conflict", current, sig
+
+
+def _diff(ws_path, dst_rel, new_data):
+    try:
+        old = (ws_path / dst_rel).read_text(encoding="utf-8").splitlines(keepends=True)
+    except OSError:
+        old = []
+    new = new_data.decode("utf-8", errors="replace").splitlines(keepends=True)
+    return "".join(difflib.unified_diff(
+        old, new, fromfile=f"{ws_path.name}/{dst_rel}", tofile=f"template/{dst_rel}"))
+
+
+def install_workspace(ws_path, templates=None, update=False, dry_run=False):
+    """
+    Scaffold memory system in a single workspace.
+
+    Args:
+        ws_path: workspace directory
+        templates: from load_templates() (default: read them now)
+        update: replace stale (untouched, outdated) template copies
+        dry_run: change nothing; collect diffs of what would change
+
+    Returns:
+        stats dict: name, created, updated, skipped, stale, conflicts and
+        errors (lists of relpaths/messages), diffs (relpath -> unified
+        diff, dry run only) and seconds
+    """
+    t0 = time.perf_counter()
+    ws_path = Path(ws_path)
+    if templates is None:
+        templates = load_templates()[0]
+    stats = {"name": ws_path.name, "created": [], "updated": [], "skipped": [],
+             "stale": [], "conflicts": [], "errors": [], "diffs": {}}
+
+    # 1. Create directories
+    if not dry_run:
+        for d in DIRS:
+            try:
+                (ws_path / d).mkdir(parents=True, exist_ok=True)
+            except Exception as e:
+                stats["errors"].append(f"mkdir {d}: {e}")
+
+    # 2. Templates, against the manifest
+    manifest = _load_manifest(ws_path)
+    files = manifest["files"]
+    before = json.dumps(files, sort_keys=True)
+    for dst_rel, (data, template_hash) in sorted(templates.items()):
+        entry = files.get(dst_rel)
+        action, current, sig = _classify(ws_path, dst_rel, template_hash, entry)
+
+        if action in ("unchanged", "customized", "conflict"):
+            stats["conflicts" if action == "conflict" else "skipped"].append(dst_rel)
+            if action == "unchanged":
+                files[dst_rel] = {"template": template_hash, "installed": current,
+                                  "current": current, "sig": sig}
+            elif entry is not None:
+                entry["sig"] = sig
+                entry["current"] = current
+            continue
+        if action == "stale" and not update:
+            stats["stale"].append(dst_rel)
+            if dry_run:
+                stats["diffs"][dst_rel] = _diff(ws_path, dst_rel, data)
             continue
+
+        stats["created" if action == "create" else "updated"].append(dst_rel)
+        if dry_run:
+            stats["diffs"][dst_rel] = _diff(ws_path, dst_rel, data)
+            continue
+        dst = ws_path / dst_rel
         try:
             dst.parent.mkdir(parents=True, exist_ok=True)
-            shutil.copy2(src, dst)
-            stats["created"].append(dst_rel)
+            tmp = dst.with_name(f"{dst.name}.{os.getpid()}.tmp")
+            tmp.write_bytes(data)
+            os.replace(tmp, dst)
+            files[dst_rel] = {"template": template_hash, "installed": template_hash,
+                              "current": template_hash, "sig": _signature(dst)}
         except Exception as e:
             stats["errors"].append(f"copy {dst_rel}: {e}")
 
-    # 3. Create today's daily log (skip if exists)
-    daily_file = ws_path / "memory" / "daily" / f"{TODAY}.md"
-    if daily_file.exists():
-        stats["skipped"].append(f"memory/daily/{TODAY}.md")
-    else:
+    if not dry_run and json.dumps(files, sort_keys=True) != before:
         try:
-            daily_file.write_text(DAILY_TEMPLATE, encoding="utf-8")
-            stats["created"].append(f"memory/daily/{TODAY}.md")
+            path = ws_path / MANIFEST
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(json.dumps(manifest, indent=1, sort_keys=True), encoding="utf-8")
         except Exception as e:
-            stats["errors"].append(f"daily log: {e}")
+            stats["errors"].append(f"manifest: {e}")
 
-    # 4. Copy protocol rules file (skip if exists)
-    rules_dst = ws_path / ".claude" / "rules" / "ark-session.md"
-    if rules_dst.exists():
-        stats["skipped"].append(".claude/rules/ark-session.md")
+    # 3. Create today's daily log (skip if exists)
+    daily_rel = f"memory/daily/{TODAY}.md"
+    if (ws_path / daily_rel).exists():
+        stats["skipped"].append(daily_rel)
+    elif dry_run:
+        stats["created"].append(daily_rel)
     else:
         try:
-            rules_dst.parent.mkdir(parents=True, exist_ok=True)
-            shutil.copy2(RULES_SRC, rules_dst)
-            stats["created"].append(".claude/rules/ark-session.md")
+            (ws_path / daily_rel).write_text(DAILY_TEMPLATE, encoding="utf-8")
+            stats["created"].append(daily_rel)
         except Exception as e:
-            stats["errors"].append(f"rules: {e}")
+            stats["errors"].append(f"daily log: {e}")
 
-    # 5. Update .gitignore
+    # 4. Update .gitignore
     gitignore = ws_path / ".gitignore"
     try:
-        existing = ""
-        if gitignore.exists():
-            existing = gitignore.read_text(encoding="utf-8")
-        if GITIGNORE_LINE not in existing:
-            with open(gitignore, "a", encoding="utf-8") as f:
-                if existing and not existing.endswith("\n"):
-                    f.write("\n")
-                f.write(f"{GITIGNORE_LINE}\n")
+        existing = gitignore.read_text(encoding="utf-8") if gitignore.exists() else ""
+        present = set(existing.splitlines())
+        missing = [line for line in GITIGNORE_LINES if line not in present]
+        if missing:
+            if not dry_run:
+                with open(gitignore, "a", encoding="utf-8") as f:
+                    if existing and not existing.endswith("\n"):
+                        f.write("\n")
+                    f.write("".join(f"{line}\n" for line in missing))
             stats["created"].append(".gitignore (updated)")
         else:
-            stats["skipped"].append(".gitignore (already has entry)")
+            stats["skipped"].append(".gitignore (already has entries)")
     except Exception as e:
         stats["errors"].append(f".gitignore: {e}")
 
+    stats["seconds"] = time.perf_counter() - t0
     return stats
 
 
-def main():
+def install_all(workspaces, update=False, dry_run=False, jobs=DEFAULT_JOBS):
+    """Scaffold workspaces in parallel. Returns (stats list, templates missing)."""
+    templates, missing = load_templates()
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        results = list(pool.map(
+            lambda ws: install_workspace(ws, templates, update, dry_run), workspaces))
+    return results, missing
+
+
+# -- CLI ----------------------------------------------------------------------
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Scaffold Ark memory in every workspace.")
+    parser.add_argument("--root", default=str(WORKSPACE_ROOT), help="workspace root")
+    parser.add_argument("--workspace", action="append", metavar="NAME",
+                        help="only this workspace (repeatable)")
+    parser.add_argument("--jobs", type=int, default=DEFAULT_JOBS, help="parallel workers")
+    parser.add_argument("--update", action="store_true",
+                        help="replace untouched copies of changed templates")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="change nothing; print a diff of what would change")
+    args = parser.parse_args(argv)
+
+    t0 = time.perf_counter()
+    workspaces = discover_workspaces(args.root, args.workspace)
+    t_discover = time.perf_counter() - t0
+
     print("=" * 60)
     print("  ARK SESSION -- BULK MEMORY SYSTEM INSTALLER")
-    print(f"  Workspace root: {WORKSPACE_ROOT}")
-    print(f"  Date: {TODAY}")
+    print(f"  Workspace root: {args.root}")
+    print(f"  Date: {TODAY}{'  (dry run)' if args.dry_run else ''}")
     print("=" * 60)
     print()
 
-    total_created = 0
-    total_skipped = 0
-    total_errors = 0
-    installed = []
-    not_found = []
+    results, missing = install_all(workspaces, args.update, args.dry_run, args.jobs)
+    for path in missing:
+        print(f"  WARNING: template not found, skipped: {path}")
+    if missing:
+        print()
 
-    for ws_name in WORKSPACES:
-        ws_path = WORKSPACE_ROOT / ws_name
-        if not ws_path.is_dir():
-            not_found.append(ws_name)
-            continue
+    totals = {key: 0 for key in ("created", "updated", "skipped", "stale", "conflicts", "errors")}
+    for stats in results:
+        for key in totals:
+            totals[key] += len(stats[key])
+        status = "OK" if not stats["errors"] else "ERRORS"
+        print(f"  [{status}] {stats['name']}: {len(stats['created'])} created, "
+              f"{len(stats['updated'])} updated, {len(stats['skipped'])} skipped, "
+              f"{len(stats['stale'])} stale, {len(stats['conflicts'])} conflicts "
+              f"({stats['seconds'] * 1000:.1f} ms)")
+        for rel in stats["stale"]:
+            print(f"        STALE: {rel} (template changed; --update to replace)")
+        for rel in stats["conflicts"]:
+            print(f"        CONFLICT: {rel} (edited locally and template changed)")
+        for err in stats["errors"]:
+            print(f"        ERROR: {err}")
+        for rel, diff in stats["diffs"].items():
+            print(diff if diff else f"        (new file {rel})")
 
-        stats = install_workspace(ws_path)
-        nc = len(stats["created"])
-        ns = len(stats["skipped"])
-        ne = len(stats["errors"])
-        total_created += nc
-        total_skipped += ns
-        total_errors += ne
-
-        status = "OK" if ne == 0 else "ERRORS"
-        print(f"  [{status}] {ws_name}: {nc} created, {ns} skipped, {ne} errors")
-        if ne > 0:
-            for err in stats["errors"]:
-                print(f"        ERROR: {err}")
-        installed.append(ws_name)
-
-    if not_found:
-        print()
-        print("  NOT FOUND:")
-        for nf in not_found:
-            print(f"    - {nf}")
+    if args.workspace:
+        found = {p.name for p in workspaces}
+        not_found = [n for n in args.workspace if n not in found]
+        if not_found:
+            print()
+            print("  NOT FOUND:")
+            for nf in not_found:
+                print(f"    - {nf}")
 
+    elapsed = time.perf_counter() - t0
+    slowest = max(results, key=lambda s: s["seconds"], default=None)
     print()
     print("=" * 60)
-    print(f"  RESULTS: {len(installed)} workspaces scaffolded")
-    print(f"  Files created: {total_created}")
-    print(f"  Files skipped: {total_skipped}")
-    print(f"  Errors: {total_errors}")
+    print(f"  RESULTS: {len(results)} workspaces "
+          f"{'checked' if args.dry_run else 'scaffolded'}")
+    print(f"  Files created: {totals['created']}, updated: {totals['updated']}, "
+          f"skipped: {totals['skipped']}")
+    print(f"  Stale: {totals['stale']}, conflicts: {totals['conflicts']}, "
+          f"errors: {totals['errors']}")
+    print(f"  Time: {elapsed * 1000:.0f} ms total, {t_discover * 1000:.1f} ms discovery, "
+          f"{args.jobs} workers"
+          + (f", slowest {slowest['name']} {slowest['seconds'] * 1000:.1f} ms" if slowest else ""))
     print("=" * 60)
+    return 1 if totals["errors"] else 0
 
 
 if __name__ == "__main__":
-    main()
+    raise SystemExit(main())
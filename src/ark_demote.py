@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+"""
+Ark Session Manager -- Demotion Scoring
+========================================
+Ranks CLAUDE.local.md entries for pressure-based demotion (SCHEMA.md).
+Working memory is capped at ~1500 words; once it is over, /ark:maintain
+needs the entries that cost the most words for the least recent use.
+
+An entry is a list item with its indented continuation lines (or a
+paragraph). Each is scored
+
+    score = words * (1 + stale_days / STALE_DAYS)
+
+where stale_days counts from the entry's last sign of life: its newest
+last_verified date, the newest date written in it (a future deadline
+keeps it fresh until it passes) or the newest daily log that references
+it -- by entry ID, or by at least two of its rarest terms on one line.
+Daily log references come from the memory search index.
+
+Entries marked [pinned], or under a heading containing "pinned", are
+never candidates. Superseded entries always are, suggested for archive.
+
+Per workspace, the parsed entries and their daily-log last-seen dates
+are cached in demote.json next to the other memory indexes, keyed by the
+(mtime, size) of CLAUDE.local.md and of every daily log. An unchanged
+workspace is scored from the cache after a few stat() calls.
+
+CLI:
+    python ark_session.py demote [workspace ...] [--all] [--json]
+"""
+
+import json
+import re
+import sys
+from pathlib import Path
+
+import ark_memory
+import ark_search
+import ark_session
+
+CACHE_VERSION = 1
+CACHE_NAME = "demote.json"
+
+WORD_LIMIT = 1500
+STALE_DAYS = 14               # "not relevant in 2+ weeks, demote or archive"
+UNDATED_STALE_DAYS = 30       # entries with no date and no daily reference
+KEY_TERMS = 4                 # rarest terms of an entry used to find references
+REFERENCE_MIN_TERMS = 2       # key terms that must share a daily log line
+
+WORD_RE = re.compile(r"\w")
+LIST_ITEM_RE = re.compile(r"^(?:[-*+]|\d+[.)])\s")
+LAST_VERIFIED_RE = re.compile(r"last_verified\W*(\d{4}-\d{2}-\d{2})")
+PINNED_RE = re.compile(r"\[pinned\]", re.IGNORECASE)
+# Register metadata words carry no topic and would match every entry
+METADATA_TERMS = frozenset(
+    "claim confidence evidence last_verified verified high medium low "
+    "superseded pinned".split()
+)
+
+
+# -- Entry parsing ----------------------------------------------------------
+
+def _words(text):
+    """Word count, ignoring list markers and a trailing entry ID."""
+    return sum(1 for w in ark_memory.ENTRY_ID_RE.sub("", text).split() if WORD_RE.search(w))
+
+
+def _key_terms(text):
+    return sorted({
+        t for t in ark_search.tokenize(ark_memory.ENTRY_REF_RE.sub(" ", text))
+        if not t.isdigit() and t not in METADATA_TERMS
+    })
+
+
+def parse_entries(path):
+    """
+    Group CLAUDE.local.md lines into entries.
+
+    Returns:
+        (total_words, entries): total_words counts every line outside HTML
+        comments, headings included; each entry is a dict with line, text
+        (first line), words, id, refs, dated (newest date or
+        last_verified in it), superseded, pinned, heading and terms
+    """
+    try:
+        raw = Path(path).read_text(encoding="utf-8", errors="replace").splitlines()
+    except OSError:
+        return 0, []
+
+    total = 0
+    entries = []
+    current = None
+    prev_line = 0
+    for line in ark_memory.parse_memory_file(path, "working"):
+        total += _words(line["text"])
+        text = line["text"]
+        if text.startswith("#"):
+            current = None
+        else:
+            indented = raw[line["line"] - 1][:1].isspace()
+            is_item = LIST_ITEM_RE.match(text) is not None
+            continues = current is not None and (
+                indented or (not is_item and not current["_item"]
+                             and line["line"] == prev_line + 1)
+            )
+            if continues:
+                current["_lines"].append(line)
+            else:
+                current = {"_item": is_item, "_lines": [line]}
+                entries.append(current)
+        prev_line = line["line"]
+
+    parsed = []
+    for entry in entries:
+        lines = entry["_lines"]
+        body = " ".join(line["text"] for line in lines)
+        first = lines[0]
+        dates = ark_memory.DATE_RE.findall(body) + LAST_VERIFIED_RE.findall(body)
+        entry_id = next((line["id"] for line in lines if line["id"]), "")
+        parsed.append({
+            "line": first["line"],
+            "text": first["text"],
+            "words": sum(_words(line["text"]) for line in lines),
+            "id": entry_id,
+            "refs": sorted({r for line in lines for r in line["refs"]}),
+            "dated": max(dates) if dates else "",
+            "superseded": any(line["superseded"] for line in lines),
+            "pinned": bool(PINNED_RE.search(body) or "pinned" in first["heading"].lower()),
+            "heading": first["heading"],
+            "terms": _key_terms(body),
+        })
+    return total, parsed
+
+
+# -- Daily log references ---------------------------------------------------
+
+def _daily_last_seen(entries, index):
+    """
+    Newest daily log date referencing each entry ("" if none).
+
+    An entry is referenced by a daily line that mentions its ID, or that
+    contains REFERENCE_MIN_TERMS of its KEY_TERMS rarest terms -- rarest
+    among daily log lines, since a term no daily line uses cannot match.
+    """
+    files, lines, postings = index["files"], index["lines"], index["postings"]
+    daily_nos = {meta["no"] for meta in files.values() if meta["tier"] == "daily"}
+    daily_gids = {}
+
+    def gids_of(term):
+        found = daily_gids.get(term)
+        if found is None:
+            found = set()
+            for gid in map(int, postings.get(term, "").split()):
+                record = lines[gid]
+                if record is not None and int(record.split("\t", 1)[0]) in daily_nos:
+                    found.add(gid)
+            daily_gids[term] = found
+        return found
+
+    def line_date(gid):
+        return lines[gid].split("\t", 4)[3]
+
+    seen = []
+    for entry in entries:
+        dates = [line_date(gid) for gid in gids_of(entry["id"])] if entry["id"] else []
+        ranked = sorted((len(gids_of(t)), t) for t in entry["terms"])
+        key = [t for df, t in ranked if df][:KEY_TERMS]
+        if key:
+            need = min(REFERENCE_MIN_TERMS, len(key))
+            hits = {}
+            for term in key:
+                for gid in gids_of(term):
+                    hits[gid] = hits.get(gid, 0) + 1
+            dates.extend(line_date(gid) for gid, n in hits.items() if n >= need)
+        seen.append(max((d for d in dates if d), default=""))
+    return seen
+
+
+# -- Cache ------------------------------------------------------------------
+
+def _load_cache(path):
+    try:
+        cache = json.loads(path.read_text(encoding="utf-8"))
+        if cache.get("v") == CACHE_VERSION:
+            return cache
+    except Exception:
+        pass
+    return {"v": CACHE_VERSION}
+
+
+def _refresh(ws, rebuild=False):
+    """
+    Return the workspace's cache, re-parsing CLAUDE.local.md and
+    re-matching daily references only when their signatures changed.
+    """
+    working = ws / "CLAUDE.local.md"
+    sig = ark_memory.file_signature(working)
+    if sig is None:
+        return None
+    daily = {
+        rel: ark_memory.file_signature(path)
+        for rel, tier, path in ark_memory.memory_files(ws) if tier == "daily"
+    }
+
+    out_dir = ark_memory.index_dir(ws)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    path = out_dir / CACHE_NAME
+    with ark_session._file_lock(out_dir / (CACHE_NAME + ".lock")):
+        cache = {"v": CACHE_VERSION} if rebuild else _load_cache(path)
+        parsed = cache.get("sig") == sig
+        if parsed and cache.get("daily") == daily:
+            return cache
+        if not parsed:
+            cache["sig"] = sig
+            cache["words"], cache["entries"] = parse_entries(working)
+        cache["daily"] = daily
+        cache["last_seen"] = _daily_last_seen(cache["entries"], ark_search.update_index(ws))
+        ark_session._atomic_write_text(path, json.dumps(cache, separators=(",", ":")))
+    return cache
+
+
+# -- Scoring ----------------------------------------------------------------
+
+def _stale_days(last_seen, today):
+    from datetime import date
+
+    if not last_seen:
+        return UNDATED_STALE_DAYS
+    try:
+        return max(0, (date.fromisoformat(today) - date.fromisoformat(last_seen)).days)
+    except ValueError:
+        return UNDATED_STALE_DAYS
+
+
+def score_workspace(workspace=None, today=None, limit=WORD_LIMIT, rebuild=False):
+    """
+    Rank a workspace's working-memory entries for demotion.
+
+    Args:
+        workspace: workspace root (default: cwd)
+        today: YYYY-MM-DD staleness is measured to (default: today)
+        limit: working-memory word budget
+        rebuild: ignore the cache
+
+    Returns:
+        dict with workspace, words, limit, over (words above the limit)
+        and candidates, best first. Candidates are superseded entries and
+        entries stale for STALE_DAYS or more; while over the limit, fresher
+        entries follow until their words would cover the excess. Each
+        candidate has line, text, id, words, last_seen, stale_days, score,
+        action ("archive" or "demote") and freed (running word total).
+        None if the workspace has no CLAUDE.local.md.
+    """
+    from datetime import date
+
+    ws = ark_memory.workspace_root(workspace)
+    cache = _refresh(ws, rebuild)
+    if cache is None:
+        return None
+    today = today or date.today().isoformat()
+
+    scored = []
+    for entry, daily_seen in zip(cache["entries"], cache["last_seen"]):
+        if entry["pinned"]:
+            continue
+        last_seen = max(entry["dated"], daily_seen)
+        stale = _stale_days(last_seen, today)
+        score = entry["words"] * (1 + stale / STALE_DAYS)
+        scored.append({
+            "line": entry["line"], "text": entry["text"], "id": entry["id"],
+            "words": entry["words"], "last_seen": last_seen, "stale_days": stale,
+            "score": round(score, 1),
+            "action": "archive" if entry["superseded"] else "demote",
+            "_rank": (entry["superseded"], score, -entry["line"]),
+        })
+    scored.sort(key=lambda c: c["_rank"], reverse=True)
+
+    over = max(0, cache["words"] - limit)
+    candidates, freed = [], 0
+    for cand in scored:
+        due = cand["action"] == "archive" or cand["stale_days"] >= STALE_DAYS
+        if not due and freed >= over:
+            continue
+        freed += cand["words"]
+        cand["freed"] = freed
+        del cand["_rank"]
+        candidates.append(cand)
+    return {"workspace": str(ws), "words": cache["words"], "limit": limit,
+            "over": over, "candidates": candidates}
+
+
+# -- CLI --------------------------------------------------------------------
+
+def main(argv=None):
+    """`ark_session demote` command."""
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog="ark_session demote",
+        description="Rank CLAUDE.local.md entries for demotion.",
+    )
+    parser.add_argument("workspaces", nargs="*", help="workspace roots (default: cwd)")
+    parser.add_argument("--all", action="store_true",
+                        help="every workspace under the machine's workspace_root")
+    parser.add_argument("--limit", type=int, default=WORD_LIMIT, help="word budget")
+    parser.add_argument("--rebuild", action="store_true", help="ignore cached parses")
+    parser.add_argument("--json", action="store_true", help="JSON reports")
+    args = parser.parse_args(argv)
+
+    targets = list(args.workspaces)
+    if args.all:
+        targets.extend(ark_memory.discover_workspaces())
+    reports = [r for r in (score_workspace(ws, limit=args.limit, rebuild=args.rebuild)
+                           for ws in targets or [None]) if r]
+    if args.json:
+        print(json.dumps(reports, indent=2))
+        return 0
+    if not reports:
+        print("No CLAUDE.local.md found.")
+        return 1
+
+    for report in reports:
+        state = f"{report['over']} over" if report["over"] else "within budget"
+        print(f"{report['workspace']}: {report['words']}/{report['limit']} words ({state})")
+        relieved = not report["over"]
+        for cand in report["candidates"]:
+            entry_id = f" ^{cand['id']}" if cand["id"] else ""
+            seen = cand["last_seen"] or "never"
+            print(f"  {cand['score']:>7.1f}  {cand['action']:<7} L{cand['line']:<4} "
+                  f"{cand['words']:>4}w  seen {seen}{entry_id}")
+            print(f"           {cand['text'][:100]}")
+            if not relieved and cand["freed"] >= report["over"]:
+                print("  -- back within budget above this line --")
+                relieved = True
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,498 @@
+#!/usr/bin/env python3
+"""
+Ark Session Manager -- Event Log Query Engine
+==============================================
+Indexed queries over the JSONL event log (~/.claude/sessions/log/).
+
+Each raw daily log has an append-only postings file per indexed field,
+log/index/YYYY-MM-DD.<field>.idx: one "<offset>\t<value>" line per event
+carrying session_id, callsign, event, workspace or machine, plus a record
+of the log byte range each batch covers (format in ark_session). The event
+writer appends a batch with every commit; update_indexes(), run by log
+retention, fills any range no batch covers. Queries never write: they
+stream the postings of the fields they filter on, keeping only matching
+offsets, and scan just the uncovered ranges of the log. Gzip monthly
+bundles (see cleanup_old_logs) are streamed, and retention deletes the
+postings of days it bundles away.
+
+Nothing is loaded whole: postings and raw files are streamed or read by
+offset, and "tail" reads blocks backwards from the end of the newest files.
+
+--federated queries the merged multi-machine store (ark_federate) instead
+of the local log; its day files keep their postings in their own index/.
+With the SQLite storage backend (ark_sqlite) local queries go to its
+indexed events table instead.
+
+CLI:
+    python ark_session.py events --session <id> --callsign CMH-a3f7 \\
+        --event crash --workspace 07-Carbon-Meth-Hub --since 7d --tail 20
+    python ark_session.py events --federated --machine buildbox-2 --event crash
+"""
+
+import json
+import os
+import sys
+import time
+from collections import deque
+from pathlib import Path
+
+import ark_session
+
+INDEXED_FIELDS = ark_session.LOG_INDEX_FIELDS
+TAIL_BLOCK_BYTES = 64 * 1024
+POSTINGS_BLOCK_BYTES = 1024 * 1024
+POSTINGS_BATCH = 4096   # postings per batch written by update_index()
+
+
+# -- Postings indexes -------------------------------------------------------
+
+def _scan_batches(data, target, offsets, ranges):
+    """
+    Collect the intact batches in `data` (see read_postings). A batch is
+    intact when its "+" marker is followed by exactly <count> posting lines
+    and then its "@" record; torn lines sit outside any such span.
+    """
+    pos = 0
+    while True:
+        marker = data.find(b"\n+\n", pos)
+        if marker < 0:
+            return
+        record = data.find(b"\n@", marker + 2)
+        if record < 0:
+            return
+        restart = data.find(b"\n+\n", marker + 2, record)
+        if restart >= 0:
+            pos = restart  # a batch torn before its record
+            continue
+        line_end = data.find(b"\n", record + 1)
+        if line_end < 0:
+            return
+        pos = line_end
+        body = data[marker + 3:record + 1]
+        try:
+            start, end, count = (int(x) for x in data[record + 2:line_end].split())
+        except ValueError:
+            continue
+        if body.count(b"\n") != count:
+            continue
+        ranges.append((start, end))
+        if target is None:
+            continue
+        hit = body.find(target)
+        while hit >= 0:
+            offsets.add(int(body[body.rfind(b"\n", 0, hit) + 1:hit]))
+            hit = body.find(target, hit + len(target))
+
+
+def read_postings(log_file, field, value=None):
+    """
+    Stream one field's postings file in POSTINGS_BLOCK_BYTES blocks.
+
+    Args:
+        log_file: raw daily log
+        field: one of INDEXED_FIELDS
+        value: collect the offsets of events with this value (None: only
+            read the covered ranges)
+
+    Returns:
+        (offsets, ranges): set of matching line offsets, and the log byte
+        ranges [(start, end)] covered by intact batches. A batch left
+        incomplete by a crash covers nothing.
+    """
+    target = None if value is None else ("\t" + json.dumps(str(value)) + "\n").encode("utf-8")
+    offsets, ranges = set(), []
+    try:
+        f = open(ark_session._log_index_path(log_file, field), "rb")
+    except OSError:
+        return offsets, ranges
+    with f:
+        pending = b""
+        while True:
+            block = f.read(POSTINGS_BLOCK_BYTES)
+            if not block:
+                return offsets, ranges  # what is left has no record yet
+            data = pending + block
+            # Hand over everything up to the last complete "@" record
+            cut = len(data)
+            while True:
+                record = data.rfind(b"\n@", 0, cut)
+                line_end = data.find(b"\n", record + 1) if record >= 0 else -1
+                if record < 0 or line_end >= 0:
+                    break
+                cut = record
+            if line_end < 0:
+                pending = data
+                continue
+            _scan_batches(data[:line_end + 1], target, offsets, ranges)
+            pending = data[line_end:]
+
+
+def _gaps(ranges, size):
+    """Sorted byte ranges of [0, size) not covered by `ranges`."""
+    gaps, pos = [], 0
+    for start, end in sorted(ranges):
+        if start > pos:
+            gaps.append((pos, min(start, size)))
+        pos = max(pos, end)
+        if pos >= size:
+            break
+    if pos < size:
+        gaps.append((pos, size))
+    return [(start, end) for start, end in gaps if start < end]
+
+
+def _union(ranges):
+    """Merge byte ranges into sorted, disjoint ones."""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _scan_range(log_file, start, end):
+    """
+    Yield (offset, raw line) for each complete line that starts in log
+    bytes [start, end). A trailing partial line is skipped.
+    """
+    with open(log_file, "rb") as f:
+        f.seek(start)
+        offset = start
+        for raw in f:
+            if offset >= end or not raw.endswith(b"\n"):
+                return
+            yield offset, raw
+            offset += len(raw)
+
+
+def _parse(raw):
+    try:
+        event = json.loads(raw)
+    except ValueError:
+        return None
+    return event if isinstance(event, dict) else None
+
+
+def _append_batches(log_file, field, start, end, entries):
+    """Append postings for log bytes [start, end) in POSTINGS_BATCH chunks."""
+    for i in range(0, max(len(entries), 1), POSTINGS_BATCH):
+        chunk = entries[i:i + POSTINGS_BATCH]
+        chunk_end = entries[i + POSTINGS_BATCH][0] if i + POSTINGS_BATCH < len(entries) else end
+        ark_session._append_postings(log_file, start, chunk_end, chunk, fields=(field,))
+        start = chunk_end
+
+
+def update_index(log_file):
+    """
+    Index every byte range of a raw log that no postings batch covers yet.
+    A log that shrank below its postings (rewritten or truncated) is
+    re-indexed from scratch.
+
+    Returns:
+        number of events indexed
+    """
+    log_file = Path(log_file)
+    try:
+        size = log_file.stat().st_size
+    except OSError:
+        return 0
+    field_gaps = {}
+    for field in INDEXED_FIELDS:
+        _, ranges = read_postings(log_file, field)
+        if any(end > size for _, end in ranges):
+            try:
+                ark_session._log_index_path(log_file, field).unlink()
+            except OSError:
+                pass
+            ranges = []
+        field_gaps[field] = _gaps(ranges, size)
+
+    indexed = 0
+    for start, end in _union(gap for gaps in field_gaps.values() for gap in gaps):
+        entries, reached = [], start
+        for offset, raw in _scan_range(log_file, start, end):
+            reached = offset + len(raw)
+            event = _parse(raw)
+            if event is not None:
+                entries.append((offset, ark_session._index_keys(event)))
+        for field, gaps in field_gaps.items():
+            for gap_start, gap_end in gaps:
+                lo, hi = max(gap_start, start), min(gap_end, reached)
+                if lo < hi:
+                    _append_batches(log_file, field, lo, hi, [
+                        entry for entry in entries if lo <= entry[0] < hi])
+        indexed += len(entries)
+    return indexed
+
+
+def update_indexes(log_dir=None, days=None):
+    """
+    update_index() for the raw daily logs of log_dir (default LOG_DIR),
+    or only for `days` (YYYY-MM-DD) when given. Returns events indexed.
+    """
+    log_dir = Path(log_dir) if log_dir else ark_session.LOG_DIR
+    if days is None:
+        files = sorted(log_dir.glob("????-??-??.jsonl"))
+    else:
+        files = [log_dir / f"{day}.jsonl" for day in sorted(days)]
+    return sum(update_index(path) for path in files)
+
+
+# -- Filters ----------------------------------------------------------------
+
+def parse_since(value, now=None):
+    """
+    Turn "7d", "24h", "30m", "2026-10-01" or a full ISO timestamp into an
+    ISO timestamp string comparable with event "ts" values.
+    """
+    if not value:
+        return None
+    now = time.time() if now is None else now
+    units = {"d": 86400, "h": 3600, "m": 60}
+    if value[-1] in units and value[:-1].isdigit():
+        seconds = int(value[:-1]) * units[value[-1]]
+        return time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(now - seconds))
+    return value
+
+
+def _filters(session=None, callsign=None, event=None, workspace=None, machine=None):
+    return {
+        field: value for field, value in (
+            ("session_id", session), ("callsign", callsign),
+            ("event", event), ("workspace", workspace), ("machine", machine),
+        ) if value
+    }
+
+
+def _matches(event, filters, since, until):
+    for field, value in filters.items():
+        if str(event.get(field, "")) != value:
+            return False
+    ts = str(event.get("ts", ""))
+    if since and ts < since:
+        return False
+    if until and ts >= until:
+        return False
+    return True
+
+
+def _file_day_range(path):
+    """(first_day, last_day) a log file can contain, from its name."""
+    name = Path(path).name
+    if name.endswith(".jsonl.gz"):
+        month = name[:7]
+        return f"{month}-01", f"{month}-31"
+    return name[:10], name[:10]
+
+
+def _candidate_files(since, until, log_files=None):
+    files = ark_session.iter_log_files() if log_files is None else log_files
+    result = []
+    for path in files:
+        first, last = _file_day_range(path)
+        if since and last < since[:10]:
+            continue
+        if until and first > until[:10]:
+            continue
+        result.append(path)
+    return result
+
+
+def _indexed_offsets(log_file, filters):
+    """
+    Sorted offsets matching every indexed filter, or None for 'all'.
+    Postings cover most of the log; the ranges they do not cover yet are
+    scanned here (nothing is written -- see update_index()).
+    """
+    if not filters:
+        return None
+    try:
+        size = os.stat(log_file).st_size
+    except OSError:
+        return []
+    hits, gaps = {}, []
+    for field, value in filters.items():
+        offsets, ranges = read_postings(log_file, field, value)
+        if any(end > size for _, end in ranges):
+            return None  # rewritten or truncated since it was indexed: scan
+        hits[field] = offsets
+        gaps.extend(_gaps(ranges, size))
+    needles = [json.dumps(value)[1:-1].encode("utf-8") for value in filters.values()]
+    for start, end in _union(gaps):
+        for offset, raw in _scan_range(log_file, start, end):
+            if any(needle not in raw for needle in needles):
+                continue  # cannot match any filter value: skip the parse
+            event = _parse(raw)
+            if event is None:
+                continue
+            keys = ark_session._index_keys(event)
+            for field, value in filters.items():
+                if keys.get(field) == value:
+                    hits[field].add(offset)
+    return sorted(set.intersection(*hits.values()))
+
+
+def _read_at(path, offsets):
+    """Yield the events starting at each byte offset, in the order given."""
+    with open(path, "rb") as f:
+        for offset in offsets:
+            f.seek(offset)
+            try:
+                yield json.loads(f.readline())
+            except ValueError:
+                continue
+
+
+def _scan(path):
+    """Stream every event in a raw or bundled log."""
+    with ark_session.open_log(path) as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
+
+
+def _reverse_lines(path, block=TAIL_BLOCK_BYTES):
+    """Yield the lines of a file last-to-first, reading fixed-size blocks."""
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        pos = f.tell()
+        tail = b""
+        while pos > 0:
+            step = min(block, pos)
+            pos -= step
+            f.seek(pos)
+            chunk = f.read(step) + tail
+            lines = chunk.split(b"\n")
+            tail = lines[0]
+            for line in reversed(lines[1:]):
+                if line.strip():
+                    yield line
+        if tail.strip():
+            yield tail
+
+
+def _scan_reverse(path):
+    """Stream every event in a raw log, newest first."""
+    for line in _reverse_lines(path):
+        try:
+            yield json.loads(line)
+        except ValueError:
+            continue
+
+
+# -- Public API -------------------------------------------------------------
+
+def query_events(session=None, callsign=None, event=None, workspace=None,
+                 since=None, until=None, limit=None, log_files=None, machine=None):
+    """
+    Yield matching events oldest first.
+
+    Args:
+        session, callsign, event, workspace, machine: exact-match filters
+        since, until: ISO timestamps or relative ("7d", "24h"); until is
+            exclusive
+        limit: stop after this many events
+        log_files: override the file list (default: all retention tiers)
+    """
+    since, until = parse_since(since), parse_since(until)
+    filters = _filters(session, callsign, event, workspace, machine)
+    count = 0
+    for path in _candidate_files(since, until, log_files):
+        if str(path).endswith(".gz"):
+            events = _scan(path)
+        else:
+            offsets = _indexed_offsets(path, filters)
+            events = _scan(path) if offsets is None else _read_at(path, offsets)
+        for ev in events:
+            if _matches(ev, filters, since, until):
+                yield ev
+                count += 1
+                if limit and count >= limit:
+                    return
+
+
+def tail_events(n, session=None, callsign=None, event=None, workspace=None,
+                since=None, until=None, log_files=None, machine=None):
+    """
+    Return the last n matching events, oldest first, reading newest files
+    first and stopping as soon as n are found.
+    """
+    since, until = parse_since(since), parse_since(until)
+    filters = _filters(session, callsign, event, workspace, machine)
+    found = []
+    for path in reversed(_candidate_files(since, until, log_files)):
+        if str(path).endswith(".gz"):
+            # Bundles are not seekable; keep a bounded window while streaming
+            window = deque(maxlen=n - len(found))
+            for ev in _scan(path):
+                if _matches(ev, filters, since, until):
+                    window.append(ev)
+            found.extend(reversed(window))
+        else:
+            offsets = _indexed_offsets(path, filters)
+            if offsets is None:
+                source = _scan_reverse(path)
+            else:
+                source = _read_at(path, reversed(offsets))
+            for ev in source:
+                if _matches(ev, filters, since, until):
+                    found.append(ev)
+                    if len(found) >= n:
+                        break
+        if len(found) >= n:
+            break
+    return list(reversed(found[:n]))
+
+
+# -- CLI --------------------------------------------------------------------
+
+def main(argv=None):
+    """`ark_session events` command. Prints matching events as JSON lines."""
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog="ark_session events",
+        description="Query the session event log.",
+    )
+    parser.add_argument("--session", help="session ID")
+    parser.add_argument("--callsign", help="callsign, e.g. CMH-a3f7")
+    parser.add_argument("--event", help="start, stop, compact, crash, ...")
+    parser.add_argument("--workspace", help="workspace directory name")
+    parser.add_argument("--machine", help="machine id (federated events)")
+    parser.add_argument("--federated", action="store_true",
+                        help="query the merged multi-machine store")
+    parser.add_argument("--since", help="ISO time or relative: 7d, 24h, 30m")
+    parser.add_argument("--until", help="ISO time or relative (exclusive)")
+    parser.add_argument("--tail", type=int, metavar="N",
+                        help="only the last N matching events")
+    parser.add_argument("--limit", type=int, help="stop after N events")
+    args = parser.parse_args(argv)
+
+    ark_session.flush_events()
+    filters = dict(session=args.session, callsign=args.callsign,
+                   event=args.event, workspace=args.workspace,
+                   since=args.since, until=args.until, machine=args.machine)
+    if args.federated:
+        import ark_federate
+        filters["log_files"] = ark_federate.combined_log_files()
+        source = sys.modules[__name__]
+    else:
+        source = ark_session.storage_backend()
+    if args.tail:
+        events = source.tail_events(args.tail, **filters)
+    else:
+        events = source.query_events(limit=args.limit, **filters)
+    try:
+        for ev in events:
+            print(json.dumps(ev, default=str))
+    except BrokenPipeError:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,437 @@
+#!/usr/bin/env python3
+"""
+Ark Session Manager -- Cross-Machine Federation
+================================================
+Combines the session registries and event logs of several machines that
+run the same workspaces. Any folder every machine can reach (a network
+share, a synced directory) is the transport; nothing else is required.
+
+Each machine exports only what changed since its last export into its
+own subdirectory of the shared folder, named by get_machine_id():
+
+    <shared>/<machine>/manifest.json   watermark: bytes exported per log
+                                       day, newest event ts, registry epoch
+    <shared>/<machine>/log/DAY.jsonl   appended event lines, each tagged
+                                       "machine"
+    <shared>/<machine>/registry.jsonl  changed session records and
+                                       tombstones; rewritten as a snapshot
+                                       (new epoch) once mostly superseded
+
+Only the exporting machine writes to its subdirectory, so no locking is
+needed across machines. Every machine merges all subdirectories -- its
+own included -- into a local combined store under FEDERATION_DIR that
+has the same layout as the local log:
+
+    log/DAY.jsonl       merged events, deduplicated by line hash
+    log/index/DAY.seen  hashes already merged for that day
+    log/index/DAY.*.idx postings indexes (ark_events), extended per merge
+    registry.json       {machine: {session_id: record}}
+    merge.json          per-machine read offsets
+
+Merging reads a manifest per machine and then only the bytes beyond its
+offsets, so a sync with nothing new costs a few small reads. Re-sent
+lines (an export interrupted before its watermark was saved, a local
+log rewritten) are dropped by the hash check.
+
+Export reads the local log through the configured storage backend's
+events_since() cursor, so it works the same over JSONL files and SQLite.
+`ark_session.py events --federated` and `stats --federated` read the
+combined store. The manifest lists only days exported in the last
+JSONL_MAX_DAYS, so sync at least that often; run_maintenance() syncs when
+ARK_FEDERATION_DIR is set.
+
+CLI:
+    python ark_session.py federate sync [--shared DIR]
+    python ark_session.py federate export | merge | sessions | status
+"""
+
+import hashlib
+import json
+import os
+import sys
+from pathlib import Path
+
+import ark_session
+
+STATE_VERSION = 1
+HASH_CHARS = 16
+REGISTRY_COMPACT_RATIO = 4    # rewrite registry.jsonl past 4x the live records
+EXPORT_BATCH = 10000          # event lines buffered per day before appending
+
+
+# -- Paths and state ----------------------------------------------------------
+
+def shared_dir(shared=None):
+    """The shared folder (argument, else ARK_FEDERATION_DIR), or None."""
+    value = shared or ark_session.FEDERATION_SHARED
+    return Path(value) if value else None
+
+
+def _store():
+    return ark_session.FEDERATION_DIR
+
+
+def _load_json(path, default):
+    try:
+        data = json.loads(Path(path).read_text(encoding="utf-8"))
+        if data.get("v") == STATE_VERSION:
+            return data
+    except Exception:
+        pass
+    return default
+
+
+def _dump(data):
+    return json.dumps(data, separators=(",", ":"), sort_keys=True, default=str)
+
+
+def _append(path, data):
+    """Append bytes with one O_APPEND write."""
+    fd = os.open(str(path), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        while data:
+            data = data[os.write(fd, data):]
+    finally:
+        os.close(fd)
+
+
+def _complete_lines(path, start, end=None):
+    """Bytes of whole lines from `start` (to `end`), and the offset reached."""
+    with open(path, "rb") as f:
+        f.seek(start)
+        data = f.read() if end is None else f.read(max(0, end - start))
+    cut = data.rfind(b"\n") + 1
+    return data[:cut], start + cut
+
+
+# -- Export -------------------------------------------------------------------
+
+def _export_events(out_dir, machine, cursor, days):
+    """
+    Append the backend's new events, tagged, to the shared day logs.
+
+    Args:
+        cursor: the backend's events_since() cursor, advanced in place
+        days: {day: last export date} of the shared day logs, updated
+    """
+    from datetime import date
+
+    log_dir = out_dir / "log"
+    exported, newest = 0, ""
+    pending = {}
+    today = date.today().isoformat()
+
+    def flush():
+        nonlocal exported
+        if pending:
+            log_dir.mkdir(parents=True, exist_ok=True)
+        for day, lines in pending.items():
+            _append(log_dir / f"{day}.jsonl", "".join(lines).encode("utf-8"))
+            exported += len(lines)
+            days[day] = today
+        pending.clear()
+
+    for event in ark_session.storage_backend().events_since(cursor):
+        event.setdefault("machine", machine)
+        ts = str(event.get("ts", ""))
+        newest = max(newest, ts)
+        day = ts[:10] if len(ts) >= 10 and ts[4] == "-" else today
+        pending.setdefault(day, []).append(json.dumps(event, default=str) + "\n")
+        if len(pending[day]) >= EXPORT_BATCH:
+            flush()
+    flush()
+    return exported, newest
+
+
+def _export_registry(out_dir, state):
+    """Append changed records and tombstones; compact when mostly stale."""
+    path = out_dir / "registry.jsonl"
+    digests = state.setdefault("registry", {})
+    active = ark_session._read_active()
+    current = {sid: hashlib.sha1(_dump(rec).encode("utf-8")).hexdigest()[:HASH_CHARS]
+               for sid, rec in active.items()}
+    changes = [{"sid": sid, "rec": active[sid]}
+               for sid, digest in sorted(current.items()) if digests.get(sid) != digest]
+    changes += [{"sid": sid, "rec": None} for sid in sorted(digests) if sid not in current]
+
+    lines = state.get("registry_lines", 0) + len(changes)
+    if ("epoch" not in state or not path.exists()
+            or lines > REGISTRY_COMPACT_RATIO * max(len(current), 16)):
+        # A fresh token, not a counter: reset state must never reuse one
+        state["epoch"] = os.urandom(4).hex()
+        changes = [{"sid": sid, "rec": rec} for sid, rec in sorted(active.items())]
+        ark_session._atomic_write_text(path, "".join(_dump(c) + "\n" for c in changes))
+        lines = len(changes)
+    elif changes:
+        _append(path, "".join(_dump(c) + "\n" for c in changes).encode("utf-8"))
+    state["registry"], state["registry_lines"] = current, lines
+    return len(changes)
+
+
+def export(shared=None):
+    """
+    Export this machine's new events and registry changes.
+
+    Returns:
+        dict with machine, events and sessions (counts exported)
+
+    Raises:
+        ValueError: no shared folder, or the machine has no id configured
+        (machines sharing "unknown" would write into one directory)
+    """
+    root = shared_dir(shared)
+    if root is None:
+        raise ValueError("no shared folder: pass --shared or set ARK_FEDERATION_DIR")
+    machine = ark_session.get_machine_id()
+    if machine == "unknown":
+        raise ValueError(f"set machine: id in {ark_session.MACHINE_CONFIG} before exporting")
+
+    from datetime import date, timedelta
+
+    ark_session.flush_events()
+    out_dir = root / ark_session._safe_name(machine)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    store = _store()
+    store.mkdir(parents=True, exist_ok=True)
+    state_path = store / "export.json"
+    with ark_session._file_lock(store / "export.lock"):
+        state = _load_json(state_path, {"v": STATE_VERSION})
+        if state.get("shared") != str(root) or "cursor" not in state:
+            # New folder, or state from before backend cursors: export all
+            # again; the merge drops lines it has already seen
+            state = {"v": STATE_VERSION, "shared": str(root)}
+        cursor = state.setdefault("cursor", {})
+        days = state.setdefault("days", {})
+        events, newest = _export_events(out_dir, machine, cursor, days)
+        sessions = _export_registry(out_dir, state)
+        if newest:
+            state["watermark"] = max(state.get("watermark", ""), newest)
+
+        # Days last written within the raw retention window stay listed
+        cutoff = (date.today() - timedelta(days=ark_session.JSONL_MAX_DAYS)).isoformat()
+        sizes = {}
+        for day in [d for d, written in days.items() if written < cutoff]:
+            del days[day]
+        for day in days:
+            try:
+                sizes[day] = (out_dir / "log" / f"{day}.jsonl").stat().st_size
+            except OSError:
+                pass
+        manifest = {
+            "v": STATE_VERSION, "machine": machine, "files": sizes,
+            "watermark": state.get("watermark", ""), "epoch": state["epoch"],
+            "registry_size": (out_dir / "registry.jsonl").stat().st_size,
+        }
+        # Data first, manifest second: a merge never reads past what exists
+        ark_session._atomic_write_text(out_dir / "manifest.json", _dump(manifest))
+        ark_session._atomic_write_text(state_path, _dump(state))
+    return {"machine": machine, "events": events, "sessions": sessions}
+
+
+# -- Merge --------------------------------------------------------------------
+
+def _merge_day(src, dst_dir, day, start, end):
+    """Append a day's unseen lines from one machine. Returns (new, dups, end)."""
+    data, end = _complete_lines(src, start, end)
+    if not data:
+        return 0, 0, end
+    seen_path = dst_dir / "index" / f"{day}.seen"
+    try:
+        seen = set(seen_path.read_text(encoding="ascii").split())
+    except OSError:
+        seen = set()
+    fresh, hashes = [], []
+    for line in data.splitlines(keepends=True):
+        digest = hashlib.sha1(line).hexdigest()[:HASH_CHARS]
+        if digest in seen or not line.strip():
+            continue
+        seen.add(digest)
+        fresh.append(line)
+        hashes.append(digest)
+    dups = len(data.splitlines()) - len(fresh)
+    if fresh:
+        seen_path.parent.mkdir(parents=True, exist_ok=True)
+        # Events before hashes: a crash in between re-sends, never loses
+        _append(dst_dir / f"{day}.jsonl", b"".join(fresh))
+        _append(seen_path, "".join(f"{h}\n" for h in hashes).encode("ascii"))
+    return len(fresh), dups, end
+
+
+def _merge_registry(src, machine, source, manifest, registry):
+    """Replay a machine's registry changes past our offset."""
+    if source.get("epoch") != manifest.get("epoch"):
+        source["epoch"], source["registry"] = manifest.get("epoch"), 0
+        registry[machine] = {}
+    records = registry.setdefault(machine, {})
+    start, end = source.get("registry", 0), manifest.get("registry_size", 0)
+    if end <= start:
+        return False
+    try:
+        data, source["registry"] = _complete_lines(src, start, end)
+    except OSError:
+        return False
+    for raw in data.splitlines():
+        try:
+            change = json.loads(raw)
+        except ValueError:
+            continue
+        if change.get("rec") is None:
+            records.pop(change.get("sid"), None)
+        else:
+            records[change["sid"]] = change["rec"]
+    return True
+
+
+def merge(shared=None):
+    """
+    Merge every machine's exports into the local combined store.
+
+    Returns:
+        dict with machines (names seen), events (new lines merged) and
+        duplicates (re-sent lines dropped)
+    """
+    root = shared_dir(shared)
+    if root is None:
+        raise ValueError("no shared folder: pass --shared or set ARK_FEDERATION_DIR")
+    store = _store()
+    log_dir = store / "log"
+    log_dir.mkdir(parents=True, exist_ok=True)
+    result = {"machines": [], "events": 0, "duplicates": 0}
+
+    with ark_session._file_lock(store / "merge.lock"):
+        state = _load_json(store / "merge.json", {"v": STATE_VERSION, "sources": {}})
+        registry = _load_json(store / "registry.json", {"v": STATE_VERSION, "machines": {}})
+        changed = False
+        merged_days = set()
+        try:
+            machine_dirs = sorted(p for p in root.iterdir() if p.is_dir())
+        except OSError:
+            machine_dirs = []
+        for mdir in machine_dirs:
+            manifest = _load_json(mdir / "manifest.json", None)
+            if manifest is None:
+                continue
+            machine = manifest["machine"]
+            result["machines"].append(machine)
+            source = state["sources"].setdefault(machine, {"files": {}})
+            offsets = source["files"]
+            for day, size in sorted(manifest["files"].items()):
+                start = offsets.get(day, 0)
+                if size < start:
+                    start = 0  # re-exported from scratch; hashes dedupe it
+                if size == start:
+                    continue
+                try:
+                    new, dups, offsets[day] = _merge_day(
+                        mdir / "log" / f"{day}.jsonl", log_dir, day, start, size)
+                except OSError:
+                    continue
+                result["events"] += new
+                result["duplicates"] += dups
+                changed = True
+                if new:
+                    merged_days.add(day)
+            source["watermark"] = manifest.get("watermark", "")
+            if _merge_registry(mdir / "registry.jsonl", machine, source,
+                               manifest, registry["machines"]):
+                changed = True
+        if changed:
+            ark_session._atomic_write_text(store / "registry.json", _dump(registry))
+            ark_session._atomic_write_text(store / "merge.json", _dump(state))
+        if merged_days:
+            import ark_events
+            ark_events.update_indexes(log_dir, days=merged_days)
+    return result
+
+
+def sync(shared=None):
+    """Export this machine, then merge all machines. Returns both results."""
+    return {"export": export(shared), "merge": merge(shared)}
+
+
+# -- Readers ------------------------------------------------------------------
+
+def combined_log_files():
+    """Merged daily logs, oldest first (pass as log_files to ark_events)."""
+    log_dir = _store() / "log"
+    if not log_dir.is_dir():
+        return []
+    return sorted(log_dir.glob("*.jsonl"))
+
+
+def federated_sessions(status=None, machine=None):
+    """
+    Session records from every merged machine.
+
+    Returns:
+        list of record dicts with machine and session_id added, sorted by
+        machine then session_id
+    """
+    registry = _load_json(_store() / "registry.json", {"machines": {}})
+    return [
+        {**rec, "machine": name, "session_id": sid}
+        for name, records in sorted(registry["machines"].items())
+        if machine in (None, name)
+        for sid, rec in sorted(records.items())
+        if status in (None, rec.get("status"))
+    ]
+
+
+def status():
+    """Per-machine merge offsets and watermarks."""
+    state = _load_json(_store() / "merge.json", {"sources": {}})
+    return {
+        name: {"watermark": src.get("watermark", ""), "days": len(src["files"]),
+               "bytes": sum(src["files"].values())}
+        for name, src in sorted(state["sources"].items())
+    }
+
+
+# -- CLI ----------------------------------------------------------------------
+
+def main(argv=None):
+    """`ark_session federate` command."""
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="ark_session federate",
+                                     description="Cross-machine session federation.")
+    parser.add_argument("--shared", help="shared folder (default: ARK_FEDERATION_DIR)")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("export", help="export this machine's changes")
+    sub.add_parser("merge", help="merge all machines into the combined store")
+    sub.add_parser("sync", help="export, then merge")
+    p_sessions = sub.add_parser("sessions", help="list merged sessions")
+    p_sessions.add_argument("--status", help="active, stopped, crashed")
+    p_sessions.add_argument("--machine")
+    sub.add_parser("status", help="merged machines and watermarks")
+    args = parser.parse_args(argv)
+
+    if args.cmd == "sessions":
+        for rec in federated_sessions(args.status, args.machine):
+            print(f"{rec['machine']:<16} {rec.get('callsign', '?'):<14} "
+                  f"{rec.get('status', '?'):<8} {rec.get('started', '')[:16]:<16} "
+                  f"{rec.get('intent', '')[:60]}")
+        return 0
+    if args.cmd == "status":
+        for name, info in status().items():
+            print(f"{name:<16} {info['days']:>4} days {info['bytes']:>10} bytes  "
+                  f"through {info['watermark'] or '-'}")
+        return 0
+
+    try:
+        if args.cmd in ("export", "sync"):
+            done = export(args.shared)
+            print(f"Exported {done['events']} events, {done['sessions']} session "
+                  f"changes as {done['machine']}")
+        if args.cmd in ("merge", "sync"):
+            done = merge(args.shared)
+            print(f"Merged {done['events']} events from {len(done['machines'])} "
+                  f"machine(s), {done['duplicates']} duplicates dropped")
+    except ValueError as e:
+        print(f"federate: {e}")
+        return 2
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
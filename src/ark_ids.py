@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+"""
+Ark Session Manager -- Entry ID Index
+======================================
+Maps durable entry IDs (^xxxxxxxx, legacy ^trxxxxxxxxxx) to where they
+live, and hands out new IDs that are guaranteed unused.
+
+Three machine-local files per workspace (see ark_memory.index_dir):
+
+    ids.json      per memory file: its signature, the IDs it defines (id,
+                  line, superseded) and the IDs it mentions
+    ids.reserved  IDs new_id() handed out that are not in a file yet
+    ids.bloom     a Bloom filter over every defined, mentioned and
+                  reserved ID, preceded by a one-line JSON header carrying
+                  the file signatures it was built from
+
+They are updated incrementally: only memory files whose (mtime, size)
+changed are re-read. new_id() reads just the Bloom file and appends to
+ids.reserved, so generating an ID never loads the full index or scans
+memory files. A candidate the filter has never seen is unused, because a
+Bloom filter has no false negatives. A false positive only costs another
+random draw.
+
+Definitions come from CLAUDE.local.md, registers and archive. Daily logs
+do not carry IDs (see SCHEMA.md), so IDs in them count as mentions.
+
+CLI:
+    python ark_session.py ids new [--count N]
+    python ark_session.py ids lookup a1b2c3d4
+    python ark_session.py ids check
+"""
+
+import json
+import os
+import secrets
+import sys
+
+import ark_memory
+import ark_session
+
+INDEX_VERSION = 1
+INDEX_NAME = "ids.json"
+RESERVED_NAME = "ids.reserved"
+BLOOM_NAME = "ids.bloom"
+
+BLOOM_HASHES = 7
+BLOOM_BITS_PER_ID = 10        # ~1% false positives at capacity
+BLOOM_MIN_BITS = 8192
+DEFINING_TIERS = ("working", "register", "archive")
+
+
+# -- Bloom filter -----------------------------------------------------------
+
+class BloomFilter:
+    """Fixed-size Bloom filter over short strings (double hashing)."""
+
+    def __init__(self, bits, hashes=BLOOM_HASHES, data=None):
+        self.bits = bits
+        self.hashes = hashes
+        self.data = bytearray(data) if data is not None else bytearray((bits + 7) // 8)
+
+    def _positions(self, item):
+        import hashlib
+
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    def add(self, item):
+        for pos in self._positions(item):
+            self.data[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, item):
+        return all(self.data[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+
+def _bloom_size(count):
+    """Bits for `count` IDs with 2x headroom before the filter is regrown."""
+    return max(BLOOM_MIN_BITS, count * BLOOM_BITS_PER_ID * 2)
+
+
+def _bloom_capacity(bloom):
+    return bloom.bits // BLOOM_BITS_PER_ID
+
+
+def _build_bloom(index, reserved, extra=0):
+    ids = _all_ids(index, reserved)
+    bloom = BloomFilter(_bloom_size(len(ids) + extra))
+    for entry_id in ids:
+        bloom.add(entry_id)
+    header = {
+        "v": INDEX_VERSION, "bits": bloom.bits, "hashes": bloom.hashes,
+        "count": len(ids),
+        "sigs": {rel: meta["sig"] for rel, meta in index["files"].items()},
+    }
+    return header, bloom
+
+
+def _write_bloom(out_dir, header, bloom):
+    tmp = out_dir / f"{BLOOM_NAME}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(json.dumps(header, separators=(",", ":")).encode("utf-8") + b"\n")
+        f.write(bloom.data)
+    os.replace(tmp, out_dir / BLOOM_NAME)
+
+
+def _read_bloom(out_dir):
+    try:
+        with open(out_dir / BLOOM_NAME, "rb") as f:
+            header = json.loads(f.readline())
+            if header.get("v") != INDEX_VERSION:
+                return None, None
+            return header, BloomFilter(header["bits"], header["hashes"], f.read())
+    except Exception:
+        return None, None
+
+
+# -- Index maintenance ------------------------------------------------------
+
+def _empty_index():
+    return {"v": INDEX_VERSION, "files": {}}
+
+
+def _all_ids(index, reserved):
+    ids = set(reserved)
+    for meta in index["files"].values():
+        ids.update(d[0] for d in meta["defs"])
+        ids.update(r[0] for r in meta["refs"])
+    return ids
+
+
+def _load(path):
+    try:
+        index = json.loads(path.read_text(encoding="utf-8"))
+        if index.get("v") == INDEX_VERSION:
+            return index
+    except Exception:
+        pass
+    return _empty_index()
+
+
+def _read_reserved(out_dir):
+    try:
+        text = (out_dir / RESERVED_NAME).read_text(encoding="utf-8")
+    except OSError:
+        return []
+    return [line.strip() for line in text.splitlines() if line.strip()]
+
+
+def _refresh(ws, out_dir, rebuild=False, regrow=0):
+    """
+    Update ids.json, ids.reserved and ids.bloom if any memory file changed.
+    regrow > 0 forces a new filter sized for that many more IDs. Caller
+    holds the lock.
+    """
+    path = out_dir / INDEX_NAME
+    index = _empty_index() if rebuild else _load(path)
+    files = index["files"]
+    known = {rel: meta["sig"] for rel, meta in files.items()}
+    changed, removed = ark_memory.changed_files(ws, known)
+    if not (changed or removed or rebuild or regrow) and (out_dir / BLOOM_NAME).exists():
+        return index
+
+    for rel in removed:
+        files.pop(rel, None)
+    for rel, tier, file_path, sig in changed:
+        defs, refs = [], []
+        for entry in ark_memory.parse_memory_file(file_path, tier):
+            if entry["id"] and tier in DEFINING_TIERS:
+                defs.append([entry["id"], entry["line"], int(entry["superseded"])])
+            elif entry["id"]:
+                refs.append([entry["id"], entry["line"]])
+            refs.extend([r, entry["line"]] for r in entry["refs"])
+        files[rel] = {"sig": sig, "tier": tier, "defs": defs, "refs": refs}
+
+    # A reservation is fulfilled once the ID shows up in a file
+    seen = {d[0] for meta in files.values() for d in meta["defs"]}
+    reserved = [r for r in _read_reserved(out_dir) if r not in seen]
+    ark_session._atomic_write_text(out_dir / RESERVED_NAME,
+                                   "".join(f"{r}\n" for r in reserved))
+    ark_session._atomic_write_text(path, json.dumps(index, separators=(",", ":")))
+    _write_bloom(out_dir, *_build_bloom(index, reserved, regrow))
+    return index
+
+
+def update_index(workspace=None, rebuild=False):
+    """Bring a workspace's ID index up to date and return it."""
+    ws = ark_memory.workspace_root(workspace)
+    out_dir = ark_memory.index_dir(ws)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    with ark_session._file_lock(out_dir / (INDEX_NAME + ".lock")):
+        return _refresh(ws, out_dir, rebuild)
+
+
+# -- Public API -------------------------------------------------------------
+
+def lookup(entry_id, workspace=None):
+    """
+    Find where an entry ID is defined.
+
+    Returns:
+        list of dicts (file, line, tier, superseded), empty if unknown
+    """
+    entry_id = entry_id.lstrip("^").lower()
+    index = update_index(workspace)
+    return [
+        {"file": rel, "line": line, "tier": meta["tier"], "superseded": bool(sup)}
+        for rel, meta in sorted(index["files"].items())
+        for defined, line, sup in meta["defs"] if defined == entry_id
+    ]
+
+
+def new_id(workspace=None, count=1):
+    """
+    Generate `count` new 8-hex entry IDs unused anywhere in the workspace.
+
+    Only ids.bloom is read. Its header's file signatures are compared with
+    a stat() of each memory file; the full index is refreshed only if a
+    file changed (or the filter is full and must be regrown). Each ID
+    handed out is reserved -- added to the filter and appended to
+    ids.reserved -- so later calls never repeat it before it has been
+    written to a file.
+
+    Returns:
+        a single ID string if count == 1, else a list
+    """
+    ws = ark_memory.workspace_root(workspace)
+    out_dir = ark_memory.index_dir(ws)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    with ark_session._file_lock(out_dir / (INDEX_NAME + ".lock")):
+        header, bloom = _read_bloom(out_dir)
+        if header is None or any(ark_memory.changed_files(ws, header["sigs"])):
+            _refresh(ws, out_dir)
+            header, bloom = _read_bloom(out_dir)
+        if header["count"] + count > _bloom_capacity(bloom):
+            _refresh(ws, out_dir, regrow=count)
+            header, bloom = _read_bloom(out_dir)
+
+        fresh = []
+        while len(fresh) < count:
+            candidate = secrets.token_hex(4)
+            if candidate in bloom or candidate in fresh:
+                continue
+            bloom.add(candidate)
+            fresh.append(candidate)
+
+        fd = os.open(str(out_dir / RESERVED_NAME), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        try:
+            os.write(fd, "".join(f"{c}\n" for c in fresh).encode("ascii"))
+        finally:
+            os.close(fd)
+        header["count"] += len(fresh)
+        _write_bloom(out_dir, header, bloom)
+    return fresh[0] if count == 1 else fresh
+
+
+def check_integrity(workspace=None):
+    """
+    Report ID problems.
+
+    Returns:
+        dict with "duplicates" ({id: [locations]} for IDs defined more than
+        once) and "dangling" ([{id, file, line}] for mentions of IDs that
+        are not defined anywhere)
+    """
+    index = update_index(workspace)
+    defined = {}
+    for rel, meta in sorted(index["files"].items()):
+        for entry_id, line, sup in meta["defs"]:
+            defined.setdefault(entry_id, []).append(
+                {"file": rel, "line": line, "tier": meta["tier"], "superseded": bool(sup)}
+            )
+    dangling = [
+        {"id": entry_id, "file": rel, "line": line}
+        for rel, meta in sorted(index["files"].items())
+        for entry_id, line in meta["refs"] if entry_id not in defined
+    ]
+    return {
+        "duplicates": {i: locs for i, locs in defined.items() if len(locs) > 1},
+        "dangling": dangling,
+    }
+
+
+# -- CLI --------------------------------------------------------------------
+
+def main(argv=None):
+    """`ark_session ids` command."""
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="ark_session ids",
+                                     description="Entry ID index.")
+    parser.add_argument("--workspace", help="workspace root (default: cwd)")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_new = sub.add_parser("new", help="generate unused IDs")
+    p_new.add_argument("--count", type=int, default=1)
+    p_lookup = sub.add_parser("lookup", help="where an ID is defined")
+    p_lookup.add_argument("id")
+    sub.add_parser("check", help="report duplicate and dangling IDs")
+    sub.add_parser("rebuild", help="re-read every memory file")
+    args = parser.parse_args(argv)
+
+    if args.cmd == "new":
+        ids = new_id(args.workspace, args.count)
+        for entry_id in ([ids] if isinstance(ids, str) else ids):
+            print(f"^{entry_id}")
+        return 0
+    if args.cmd == "lookup":
+        locations = lookup(args.id, args.workspace)
+        for loc in locations:
+            note = " (superseded)" if loc["superseded"] else ""
+            print(f"{loc['file']}:{loc['line']} [{loc['tier']}]{note}")
+        return 0 if locations else 1
+    if args.cmd == "rebuild":
+        index = update_index(args.workspace, rebuild=True)
+        print(f"Indexed {sum(len(m['defs']) for m in index['files'].values())} IDs "
+              f"in {len(index['files'])} files")
+        return 0
+
+    report = check_integrity(args.workspace)
+    for entry_id, locs in sorted(report["duplicates"].items()):
+        where = ", ".join(f"{loc['file']}:{loc['line']}" for loc in locs)
+        print(f"duplicate ^{entry_id}: {where}")
+    for ref in report["dangling"]:
+        print(f"dangling  ^{ref['id']}: {ref['file']}:{ref['line']}")
+    if not report["duplicates"] and not report["dangling"]:
+        print("OK: no duplicate or dangling IDs")
+        return 0
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Ark Session Manager -- Memory File Model
+=========================================
+Shared parsing for the four memory tiers of a workspace:
+
+    working    CLAUDE.local.md
+    register   memory/registers/*.md
+    archive    memory/archive/**/*.md
+    daily      memory/daily/YYYY-MM-DD.md
+
+Used by the search, ID and demotion tools. Derived indexes are
+machine-local (~/.claude/sessions/memory-index/<workspace>-<hash>/) so
+they never show up in the workspace's git tree.
+"""
+
+import os
+import re
+from pathlib import Path
+
+import ark_session
+
+TIERS = ("working", "register", "archive", "daily")
+
+# Durable entry IDs: ^ + 8 hex, or legacy ^tr + 10 hex, at end of line
+ENTRY_ID_RE = re.compile(r"\^(tr[0-9a-f]{10}|[0-9a-f]{8})\s*$")
+# Any ID mention, e.g. "replaces ^a1b2c3d4"
+ENTRY_REF_RE = re.compile(r"\^(tr[0-9a-f]{10}|[0-9a-f]{8})(?![0-9a-z])")
+DATE_RE = re.compile(r"\b(\d{4}-\d{2}-\d{2})\b")
+SUPERSEDED_RE = re.compile(r"\[superseded(?::\s*(\d{4}-\d{2}-\d{2}))?")
+
+
+def workspace_root(path=None):
+    """Normalize a workspace path (default: cwd)."""
+    return Path(str(path or os.getcwd()).replace("\\", "/"))
+
+
+def index_dir(workspace):
+    """Machine-local directory for a workspace's derived indexes."""
+    import hashlib
+
+    ws = workspace_root(workspace)
+    digest = hashlib.sha1(str(ws).encode("utf-8")).hexdigest()[:12]
+    return ark_session.MEMORY_INDEX_DIR / f"{ark_session._safe_name(ws.name)}-{digest}"
+
+
+def discover_workspaces(root=None):
+    """
+    Workspaces with a CLAUDE.local.md directly under `root` (default: the
+    machine config's workspace_root, plus any workspace it maps to a
+    `path:` elsewhere), sorted. Empty if there is neither.
+    """
+    extra = set()
+    if root is None:
+        config = ark_session._load_machine_config() or {}
+        root = config.get("workspace_root")
+        extra = {
+            Path(os.path.expanduser(str(entry["path"])))
+            for entry in config.get("_workspaces", {}).values() if entry.get("path")
+        }
+    found = {p for p in extra if (p / "CLAUDE.local.md").is_file()}
+    if root:
+        base = Path(os.path.expanduser(str(root)))
+        try:
+            found.update(p for p in base.iterdir() if (p / "CLAUDE.local.md").is_file())
+        except OSError:
+            pass
+    return sorted(found)
+
+
+def memory_files(workspace):
+    """
+    All memory files of a workspace as sorted [(relpath, tier, path)].
+    relpath uses forward slashes and is relative to the workspace root.
+    """
+    ws = workspace_root(workspace)
+    found = []
+    working = ws / "CLAUDE.local.md"
+    if working.is_file():
+        found.append(("CLAUDE.local.md", "working", working))
+    # relpaths stay "memory/..." even when the config moves the tree
+    memory = ark_session.memory_dir(ws)
+    for tier, sub, pattern in (
+        ("register", "registers", "*.md"),
+        ("archive", "archive", "**/*.md"),
+        ("daily", "daily", "*.md"),
+    ):
+        base = memory / sub
+        if base.is_dir():
+            for path in base.glob(pattern):
+                if path.is_file():
+                    found.append((f"memory/{path.relative_to(memory).as_posix()}", tier, path))
+    return sorted(found)
+
+
+def file_signature(path):
+    """(mtime_ns, size) used to detect changed files, or None if missing."""
+    try:
+        st = os.stat(path)
+        return [st.st_mtime_ns, st.st_size]
+    except OSError:
+        return None
+
+
+def changed_files(workspace, known):
+    """
+    Compare the workspace's memory files with a {relpath: signature} map.
+
+    Returns:
+        (changed, removed): changed is [(relpath, tier, path, signature)]
+        for new or modified files; removed is [relpath] no longer present
+    """
+    current = set()
+    changed = []
+    for rel, tier, path in memory_files(workspace):
+        current.add(rel)
+        sig = file_signature(path)
+        if sig is not None and known.get(rel) != sig:
+            changed.append((rel, tier, path, sig))
+    removed = [rel for rel in known if rel not in current]
+    return changed, removed
+
+
+def parse_memory_file(path, tier):
+    """
+    Parse a memory file into one dict per non-blank line outside HTML
+    comments (register templates keep their format examples in comments).
+
+    Each dict has: line (1-based), text, id (entry ID or ""), refs (other
+    IDs mentioned on the line), date (YYYY-MM-DD or ""), superseded
+    (bool), heading (nearest '#' heading).
+    A line's date is the first date on it, else its heading's date, else
+    the file's date for daily logs and date-named archives.
+    """
+    try:
+        text = Path(path).read_text(encoding="utf-8", errors="replace")
+    except OSError:
+        return []
+    stem = Path(path).stem
+    file_date = stem if DATE_RE.fullmatch(stem) else ""
+
+    entries = []
+    heading, heading_date = "", ""
+    in_comment = False
+    for lineno, line in enumerate(text.splitlines(), 1):
+        stripped = line.strip()
+        if in_comment:
+            in_comment = "-->" not in stripped
+            continue
+        if stripped.startswith("<!--"):
+            in_comment = "-->" not in stripped
+            continue
+        if not stripped:
+            continue
+        date_match = DATE_RE.search(stripped)
+        if stripped.startswith("#"):
+            heading = stripped.lstrip("#").strip()
+            heading_date = date_match.group(1) if date_match else ""
+        id_match = ENTRY_ID_RE.search(stripped)
+        refs = ENTRY_REF_RE.findall(stripped)
+        if id_match:
+            refs.pop()
+        entries.append({
+            "line": lineno,
+            "text": stripped,
+            "id": id_match.group(1) if id_match else "",
+            "refs": refs,
+            "date": (date_match.group(1) if date_match else heading_date) or file_date,
+            "superseded": bool(SUPERSEDED_RE.search(stripped)),
+            "heading": heading,
+        })
+    return entries
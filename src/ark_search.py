@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+Ark Session Manager -- Memory Search
+=====================================
+Ranked full-text search over all memory tiers of a workspace, backing
+/ark:search.
+
+An on-disk inverted index maps each term to the lines containing it
+(file, line number, entry ID, tier, date). Before every query the memory
+files are stat()ed; only new or modified files (by mtime and size) are
+re-read and re-tokenized, and deleted files are dropped. Lines are ranked
+with BM25, weighted by tier, with superseded entries pushed down.
+
+CLI:
+    python ark_session.py search "postgres migration" --tier register --limit 10
+"""
+
+import json
+import math
+import re
+import sys
+
+import ark_memory
+import ark_session
+
+INDEX_VERSION = 1
+INDEX_NAME = "search.json"
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has in is it of on or that the this "
+    "to was were will with".split()
+)
+
+TIER_WEIGHTS = {"working": 1.3, "register": 1.2, "archive": 1.0, "daily": 1.0}
+SUPERSEDED_WEIGHT = 0.5
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def tokenize(text):
+    """Lowercase alphanumeric terms, minus stopwords and single characters."""
+    return [t for t in TOKEN_RE.findall(text.lower())
+            if len(t) > 1 and t not in STOPWORDS]
+
+
+# -- Index maintenance ------------------------------------------------------
+#
+# Every indexed line gets a global id (gid): its position in "lines", a
+# list of "fileno\tline\tid\tdate\tsuperseded\ttext" strings. Postings map
+# a term to a space-separated string of gids. Both are plain JSON strings,
+# which load far faster than nested lists, and are only split for the
+# terms and lines a query touches. A changed file's old lines become None
+# (tombstones) and its new lines are appended; once half the lines are
+# dead the index is compacted from the stored text, without re-reading
+# any memory file.
+
+def _empty_index():
+    return {"v": INDEX_VERSION, "files": {}, "next_no": 0,
+            "lines": [], "postings": {}, "dead": 0}
+
+
+def _load(path):
+    try:
+        index = json.loads(path.read_text(encoding="utf-8"))
+        if index.get("v") == INDEX_VERSION:
+            return index
+    except Exception:
+        pass
+    return _empty_index()
+
+
+def _add_file(index, rel, tier, sig, entries, new_postings):
+    """Append a file's lines; collect their postings in new_postings."""
+    lines = index["lines"]
+    meta = {"no": index["next_no"], "sig": sig, "tier": tier,
+            "start": len(lines), "count": 0, "tokens": 0}
+    index["next_no"] += 1
+    for line_no, text, entry_id, date, superseded in entries:
+        gid = len(lines)
+        tokens = tokenize(text)
+        meta["tokens"] += len(tokens)
+        lines.append(f"{meta['no']}\t{line_no}\t{entry_id}\t{date}\t{int(superseded)}\t{text}")
+        for term in set(tokens):
+            new_postings.setdefault(term, []).append(str(gid))
+    meta["count"] = len(lines) - meta["start"]
+    index["files"][rel] = meta
+
+
+def _merge_postings(index, new_postings):
+    postings = index["postings"]
+    for term, gids in new_postings.items():
+        joined = " ".join(gids)
+        postings[term] = f"{postings[term]} {joined}" if term in postings else joined
+
+
+def _compact(index):
+    """Rebuild lines and postings from live stored lines."""
+    old_lines = index["lines"]
+    files = sorted(index["files"].items(), key=lambda kv: kv[1]["start"])
+    fresh = _empty_index()
+    new_postings = {}
+    for rel, meta in files:
+        entries = []
+        for record in old_lines[meta["start"]:meta["start"] + meta["count"]]:
+            _, line_no, entry_id, date, superseded, text = record.split("\t", 5)
+            entries.append((int(line_no), text, entry_id, date, superseded == "1"))
+        _add_file(fresh, rel, meta["tier"], meta["sig"], entries, new_postings)
+    _merge_postings(fresh, new_postings)
+    return fresh
+
+
+def update_index(workspace=None, rebuild=False):
+    """
+    Bring a workspace's search index up to date and return it.
+
+    Only files whose (mtime, size) changed since the last update are
+    re-read. The index is rewritten only if something changed.
+    """
+    ws = ark_memory.workspace_root(workspace)
+    out_dir = ark_memory.index_dir(ws)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    path = out_dir / INDEX_NAME
+
+    with ark_session._file_lock(out_dir / (INDEX_NAME + ".lock")):
+        index = _empty_index() if rebuild else _load(path)
+        files, lines = index["files"], index["lines"]
+        known = {rel: meta["sig"] for rel, meta in files.items()}
+        changed, removed = ark_memory.changed_files(ws, known)
+        if not changed and not removed and not rebuild:
+            return index
+
+        for rel in removed + [c[0] for c in changed]:
+            meta = files.pop(rel, None)
+            if meta:
+                for gid in range(meta["start"], meta["start"] + meta["count"]):
+                    lines[gid] = None
+                index["dead"] += meta["count"]
+
+        new_postings = {}
+        for rel, tier, file_path, sig in changed:
+            entries = [
+                (e["line"], e["text"], e["id"], e["date"], e["superseded"])
+                for e in ark_memory.parse_memory_file(file_path, tier)
+            ]
+            _add_file(index, rel, tier, sig, entries, new_postings)
+        _merge_postings(index, new_postings)
+
+        if index["dead"] * 2 > len(index["lines"]):
+            index = _compact(index)
+        ark_session._atomic_write_text(path, json.dumps(index, separators=(",", ":")))
+    return index
+
+
+# -- Queries ----------------------------------------------------------------
+
+def _expand(term, postings):
+    """A trailing '*' matches every indexed term with that prefix."""
+    if term.endswith("*") and len(term) > 2:
+        prefix = term[:-1]
+        return [t for t in postings if t.startswith(prefix)]
+    return [term] if term in postings else []
+
+
+def search(query, workspace=None, tier=None, since=None, limit=20, index=None):
+    """
+    Ranked search over a workspace's memory.
+
+    Args:
+        query: free text; a trailing '*' on a word matches by prefix
+        workspace: workspace root (default: cwd)
+        tier: restrict to working | register | archive | daily
+        since: only lines dated on or after YYYY-MM-DD
+        limit: maximum results
+        index: a loaded index (default: update_index(workspace))
+
+    Returns:
+        list of dicts (file, line, tier, id, date, text, score), best
+        first. Lines matching more distinct query words always rank above
+        lines matching fewer.
+    """
+    index = index if index is not None else update_index(workspace)
+    files, lines, postings = index["files"], index["lines"], index["postings"]
+    terms = []
+    for word in query.lower().split():
+        if word.endswith("*"):
+            terms.append(_expand(word, postings))
+        else:
+            terms.append([t for t in tokenize(word) if t in postings])
+    terms = [group for group in terms if group]
+    if not terms:
+        return []
+
+    by_no = {meta["no"]: (rel, meta["tier"]) for rel, meta in files.items()}
+    live_lines = (len(lines) - index["dead"]) or 1
+    avg_len = max(1.0, sum(meta["tokens"] for meta in files.values()) / live_lines)
+
+    hits = {}  # gid -> [matched_groups, score, fields, tokens]
+    for group_no, group in enumerate(terms):
+        for term in group:
+            gids = [gid for gid in map(int, postings[term].split()) if lines[gid] is not None]
+            if not gids:
+                continue
+            idf = math.log(1 + (live_lines - len(gids) + 0.5) / (len(gids) + 0.5))
+            for gid in gids:
+                hit = hits.get(gid)
+                if hit is None:
+                    fields = lines[gid].split("\t", 5)
+                    rel_tier = by_no.get(int(fields[0]))
+                    if (rel_tier is None or (tier and rel_tier[1] != tier)
+                            or (since and (not fields[3] or fields[3] < since))):
+                        hits[gid] = None
+                        continue
+                    hit = hits[gid] = [set(), 0.0, fields, tokenize(fields[5])]
+                tokens = hit[3]
+                tf = tokens.count(term)
+                norm = tf * (BM25_K1 + 1) / (
+                    tf + BM25_K1 * (1 - BM25_B + BM25_B * len(tokens) / avg_len))
+                hit[0].add(group_no)
+                hit[1] += idf * norm
+
+    results = []
+    for hit in hits.values():
+        if hit is None:
+            continue
+        groups, score, fields, _ = hit
+        rel, file_tier = by_no[int(fields[0])]
+        score *= TIER_WEIGHTS.get(file_tier, 1.0)
+        if fields[4] == "1":
+            score *= SUPERSEDED_WEIGHT
+        results.append({
+            "file": rel, "line": int(fields[1]), "tier": file_tier, "id": fields[2],
+            "date": fields[3], "text": fields[5], "score": round(score, 3),
+            "_rank": (len(groups), score, fields[3]),
+        })
+    results.sort(key=lambda r: r["_rank"], reverse=True)
+    for r in results:
+        del r["_rank"]
+    return results[:limit]
+
+
+# -- CLI --------------------------------------------------------------------
+
+def main(argv=None):
+    """`ark_session search` command."""
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog="ark_session search",
+        description="Search memory tiers of a workspace.",
+    )
+    parser.add_argument("query", nargs="+", help="words; 'word*' matches a prefix")
+    parser.add_argument("--workspace", help="workspace root (default: cwd)")
+    parser.add_argument("--tier", choices=ark_memory.TIERS)
+    parser.add_argument("--since", help="only lines dated on/after YYYY-MM-DD")
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--rebuild", action="store_true", help="re-index every file")
+    parser.add_argument("--json", action="store_true", help="JSON results")
+    args = parser.parse_args(argv)
+
+    index = update_index(args.workspace, rebuild=args.rebuild)
+    results = search(" ".join(args.query), tier=args.tier, since=args.since,
+                     limit=args.limit, index=index)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 0
+    if not results:
+        print("No matches.")
+        return 1
+    for r in results:
+        ref = f"{r['file']}:{r['line']}"
+        entry_id = f" ^{r['id']}" if r["id"] else ""
+        print(f"{r['score']:>6.2f}  {r['tier']:<8} {ref}{entry_id}")
+        print(f"        {r['text'][:160]}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,7 +5,7 @@ Ark Session Manager -- Core Module
 Unified session lifecycle + memory bridge for Claude Code.
 
 Machine-local storage: ~/.claude/sessions/
-Portable diary: {workspace}/.claude/tracker/sessions/SESSION-LOG.md
+Portable diary: {workspace}/.claude/tracker/sessions/SESSION-LOG-YYYY-MM.md
 Memory bridge: {workspace}/memory/daily/ (append on session close)
 
 Refactored from session-diary.py (v1). Removes hardcoded workspace map,
@@ -20,7 +20,9 @@ import json
 import os
 import sys
 import time
-from datetime import datetime, timedelta
+from abc import ABC, abstractmethod
+from contextlib import contextmanager, nullcontext
+from functools import wraps
 from pathlib import Path
 
 # -- Configuration ----------------------------------------------------------
@@ -28,15 +30,81 @@ from pathlib import Path
 SESSIONS_DIR = Path(os.path.expanduser("~/.claude/sessions"))
 LOG_DIR = SESSIONS_DIR / "log"
 ACTIVE_FILE = SESSIONS_DIR / "active.json"
+LOCK_FILE = SESSIONS_DIR / "active.json.lock"
+SHARD_DIR = SESSIONS_DIR / "active"
+SHARD_INDEX = SHARD_DIR / "_index.json"
+REGISTRY_WAL = SESSIONS_DIR / "active.wal"  # write-ahead log layout
+HEARTBEAT_DIR = SESSIONS_DIR / "hb"
+LOG_ARCHIVE_DIR = LOG_DIR / "archive"
+LOG_INDEX_DIR = LOG_DIR / "index"  # postings indexes (ark_events)
+RETENTION_STAMP = LOG_DIR / ".retention"
+BROKER_SOCKET = SESSIONS_DIR / "broker.sock"
+STATS_FILE = SESSIONS_DIR / "stats.json"  # aggregates + checkpoint (ark_stats)
+LOCKS_DIR = SESSIONS_DIR / "locks"  # per-workspace lock files
+MEMORY_INDEX_DIR = SESSIONS_DIR / "memory-index"  # search/ID/demotion caches
+DEADLINES_FILE = SESSIONS_DIR / "deadlines.json"  # crash-check heap (detect_crashes)
+PENDING_CRASHES = SESSIONS_DIR / "crashes.pending"  # crashes not yet reported
+MAINTENANCE_STAMP = SESSIONS_DIR / ".maintenance"
+FEDERATION_DIR = SESSIONS_DIR / "federation"  # merged multi-machine store (ark_federate)
+SHORTCODES_FILE = SESSIONS_DIR / "shortcodes.json"  # workspace path -> short code
+TRACE_FILE = SESSIONS_DIR / "trace.jsonl"  # sampled hook timings (ark_trace)
 MACHINE_CONFIG = Path(os.path.expanduser("~/.claude/machine.local.yaml"))
 
 HEARTBEAT_THROTTLE_SECONDS = 60
+WAL_SNAPSHOT_RECORDS = 256            # WAL records between active.json snapshots
+WAL_COMPACT_BYTES = 4 * 1024 * 1024   # rewrite active.wal as a base image past this
 CRASH_THRESHOLD_MINUTES = 10
-JSONL_MAX_DAYS = 30
+LIVENESS_RECHECK_SECONDS = 60  # silent session whose process is still alive
+JSONL_MAX_DAYS = 30            # raw daily logs kept uncompressed
+LOG_ARCHIVE_MONTHS = 12        # gzip monthly bundles kept after that
+LOG_MAX_BYTES = 256 * 1024 * 1024  # cap on raw logs + bundles together
+RETENTION_INTERVAL_SECONDS = 6 * 3600
+MAINTENANCE_INTERVAL_SECONDS = 60
+# "background" (detached worker) or "inline" (run inside session_start)
+MAINTENANCE_MODE = os.environ.get("ARK_MAINTENANCE", "background")
+# Folder shared by every machine for federation (ark_federate); "" = off
+FEDERATION_SHARED = os.environ.get("ARK_FEDERATION_DIR", "")
+LOCK_TIMEOUT_SECONDS = 5.0
+BROKER_TIMEOUT_SECONDS = 0.5
+BROKER_FLUSH_SECONDS = 2.0
+BROKER_FLUSH_EVENTS = 100
+EVENT_BATCH_MAX = 64
+EVENT_BATCH_SECONDS = 1.0
+# fsync policy for the JSONL log: "none", "batch" (once per group commit)
+# or "event" (commit and fsync every event)
+EVENT_FSYNC = os.environ.get("ARK_EVENT_FSYNC", "none")
+# Hook latency tracing: "" or "0" = off, "1" = every call, or a sample
+# rate such as "0.1"; see _traced()
+TRACE_SAMPLE = os.environ.get("ARK_TRACE", "")
+TRACE_MAX_BYTES = 2 * 1024 * 1024  # trace.jsonl rolls to trace.jsonl.1 past this
 
 # Cache for workspace short codes (resolved once per process)
 _ws_short_cache = {}
 
+# Machine config: (signature, config or ConfigError), see load_config();
+# the last parse error reported on stderr
+_config_cache = None
+_config_warned = None
+
+# Storage backend of this process, resolved from the machine config on
+# first use (storage_backend())
+_storage_backend = None
+
+# Broker state, set only inside serve(): the in-memory registry and the
+# session IDs changed since the last flush.
+_broker_registry = None
+_broker_dirty = set()
+
+# Process-wide event writer and lifecycle call nesting depth (events are
+# group-committed when the outermost lifecycle call returns).
+_event_writer = None
+_event_batch_depth = 0
+
+# Trace of the lifecycle call in progress ({"phases": [...], "stack": [...]})
+# while tracing, else None; bytes this process read from /proc/self/io
+_trace = None
+_trace_io_self = 0
+
 
 # -- Internal helpers -------------------------------------------------------
 
@@ -46,9 +114,452 @@ def _ensure_dirs():
     LOG_DIR.mkdir(parents=True, exist_ok=True)
 
 
+def _atomic_write_text(path, text):
+    """
+    Write text via a sibling temp file + rename, so readers never observe
+    a partially written file. Raises on failure.
+    """
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(text)
+            f.flush()
+        for attempt in range(5):
+            try:
+                os.replace(tmp, path)
+                return
+            except PermissionError:
+                # Windows refuses to replace a file another process has open
+                if attempt == 4:
+                    raise
+                time.sleep(0.01 * (attempt + 1))
+    finally:
+        try:
+            tmp.unlink()
+        except OSError:
+            pass
+
+
+def _workspace_lock_path(workspace_path, purpose):
+    """Machine-local lock file for a workspace (kept out of the git tree)."""
+    import hashlib
+
+    digest = hashlib.sha1(str(workspace_path).encode("utf-8")).hexdigest()[:12]
+    LOCKS_DIR.mkdir(parents=True, exist_ok=True)
+    return LOCKS_DIR / f"{purpose}-{digest}.lock"
+
+
+def _is_section_header(line):
+    return line.startswith("## ")
+
+
+def _last_line_matching(path, predicate, block=4096):
+    """
+    The last line of a text file satisfying predicate, read backwards in
+    blocks so the cost is bounded by the distance from the end.
+    """
+    try:
+        with open(path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            pos = f.tell()
+            buf = b""
+            while pos > 0:
+                step = min(block, pos)
+                pos -= step
+                f.seek(pos)
+                buf = f.read(step) + buf
+                lines = buf.split(b"\n")
+                # lines[0] may be cut mid-line unless we reached the start
+                for raw in reversed(lines if pos == 0 else lines[1:]):
+                    line = raw.decode("utf-8", "replace")
+                    if predicate(line):
+                        return line
+                buf = lines[0]
+    except OSError:
+        pass
+    return None
+
+
+# -- Heartbeat stamps -------------------------------------------------------
+#
+# Each active session has a file hb/<session_id> whose mtime is the time of
+# its last full heartbeat and whose content is the session's callsign. The
+# StatusLine hook decides throttling from a single stat() of that file and
+# answers with the stored callsign, without touching the registry.
+
+def _heartbeat_stamp(session_id):
+    return HEARTBEAT_DIR / _safe_name(session_id)
+
+
+def _touch_heartbeat_stamp(session_id, ts=None, callsign=None):
+    """
+    Create or refresh a session's heartbeat stamp (fail-open). The callsign,
+    when given, replaces the stamp's content; otherwise it is kept.
+    """
+    ts = time.time() if ts is None else ts
+    path = _heartbeat_stamp(session_id)
+    for _ in range(2):
+        try:
+            with open(path, "a" if callsign is None else "w", encoding="utf-8") as f:
+                if callsign is not None:
+                    f.write(callsign)
+            os.utime(path, (ts, ts))
+            return
+        except FileNotFoundError:
+            try:
+                HEARTBEAT_DIR.mkdir(parents=True, exist_ok=True)
+            except OSError:
+                return
+        except OSError:
+            return
+
+
+def _read_heartbeat_stamp(session_id):
+    """
+    (mtime, callsign) of a session's stamp with one fstat() and one small
+    read; callsign is "" for a stamp written before it stored one.
+
+    Raises:
+        OSError: the stamp does not exist
+    """
+    fd = os.open(_heartbeat_stamp(session_id), os.O_RDONLY)
+    try:
+        mtime = os.fstat(fd).st_mtime
+        return mtime, os.read(fd, 64).decode("utf-8", "replace").strip()
+    finally:
+        os.close(fd)
+
+
+def _clear_heartbeat_stamp(session_id):
+    try:
+        _heartbeat_stamp(session_id).unlink()
+    except OSError:
+        pass
+
+
+# -- Registry storage -------------------------------------------------------
+#
+# Three on-disk layouts share one API:
+#   monolithic  ~/.claude/sessions/active.json            (default)
+#   sharded     ~/.claude/sessions/active/<session_id>.json + _index.json
+#   wal         ~/.claude/sessions/active.wal + active.json snapshot
+# The sharded layout is opt-in: it is active once the active/ directory
+# exists, which migrate_registry_to_shards() creates. Likewise the WAL
+# layout is active once active.wal exists (migrate_registry_to_wal()).
+
+def _registry_sharded():
+    """True when the per-session sharded layout is in use."""
+    return SHARD_DIR.is_dir()
+
+
+def _safe_name(session_id):
+    """Filesystem-safe form of a session ID; unsafe characters become '_'."""
+    safe = "".join(
+        c if c.isalnum() or c in "-_." else "_" for c in str(session_id)
+    )
+    return safe.lstrip(".") or "_"
+
+
+def _shard_path(session_id):
+    """Shard file for a session."""
+    return SHARD_DIR / f"{_safe_name(session_id)}.json"
+
+
+def _dump_shard(session_id, record):
+    """
+    Shard text for a record. The session ID is stored alongside the fields
+    because the file name is only its _safe_name() form.
+    """
+    return json.dumps({**record, "session_id": session_id},
+                      separators=(",", ":"), default=str)
+
+
+def _load_shard(text):
+    """Parse shard text. Returns (session_id or None, record)."""
+    record = json.loads(text)
+    return record.pop("session_id", None), record
+
+
+def _read_shard_index():
+    """
+    Read the shard index (session_id -> status). Rebuilt from the shard
+    files if missing or unreadable.
+    """
+    try:
+        index = json.loads(SHARD_INDEX.read_text(encoding="utf-8"))
+        if isinstance(index, dict):
+            return index
+    except Exception:
+        pass
+    index = {}
+    try:
+        for shard in SHARD_DIR.glob("*.json"):
+            if shard == SHARD_INDEX:
+                continue
+            try:
+                sid, record = _load_shard(shard.read_text(encoding="utf-8"))
+                index[sid or shard.stem] = record.get("status", "")
+            except Exception:
+                continue
+    except Exception:
+        pass
+    return index
+
+
+def _read_shards(session_ids=None):
+    """
+    Load shard records. Returns (records, raw) where raw maps session_id to
+    the exact text read, for change detection on commit.
+    """
+    if session_ids is None:
+        session_ids = list(_read_shard_index())
+    records = {}
+    raw = {}
+    for sid in session_ids:
+        try:
+            text = _shard_path(sid).read_text(encoding="utf-8")
+            records[sid] = _load_shard(text)[1]
+            raw[sid] = text
+        except Exception:
+            continue
+    return records, raw
+
+
+def _commit_shards(active, raw_before, index_before):
+    """Write changed shards, delete removed ones, refresh the index."""
+    for sid, record in active.items():
+        text = _dump_shard(sid, record)
+        if text != raw_before.get(sid):
+            try:
+                _atomic_write_text(_shard_path(sid), text)
+            except Exception:
+                pass
+    for sid in raw_before:
+        if sid not in active:
+            try:
+                _shard_path(sid).unlink()
+            except OSError:
+                pass
+    index = {sid: r.get("status", "") for sid, r in active.items()}
+    if index != index_before:
+        try:
+            _atomic_write_text(SHARD_INDEX, json.dumps(index))
+        except Exception:
+            pass
+
+
+def _update_shard_index(session_id, status):
+    """Record one session's status in the index if it changed."""
+    index = _read_shard_index()
+    if index.get(session_id) == status:
+        return
+    index[session_id] = status
+    try:
+        _atomic_write_text(SHARD_INDEX, json.dumps(index))
+    except Exception:
+        pass
+
+
+# -- Write-ahead log layout --
+#
+# active.wal starts with a header line {"wal", "gen", "seq"} followed by one
+# record per registry mutation, each with a sequence number:
+#   {"seq": 8, "op": "put", "sid": ..., "record": {...}}   new/replaced session
+#   {"seq": 9, "op": "set", "sid": ..., "set": {...}, "unset": [...]}
+#   {"seq": 10, "op": "del", "sid": ...}
+# A committed transaction appends its records with a single O_APPEND write.
+# active.json is a snapshot {"wal": {"gen", "seq", "offset"}, "sessions"}:
+# readers load it and replay the records past `offset`. The snapshot is
+# refreshed every WAL_SNAPSHOT_RECORDS records; past WAL_COMPACT_BYTES the
+# WAL is first rewritten as a new generation that starts with one "put"
+# per session. The WAL on its own therefore always holds the full registry,
+# and a missing, corrupt or out-of-date snapshot is rebuilt from it.
+
+WAL_VERSION = 1
+
+
+def _registry_wal():
+    """True when the write-ahead log layout is in use."""
+    return REGISTRY_WAL.exists()
+
+
+def _wal_apply(active, record):
+    """Apply one WAL record to a registry dict in place."""
+    op, sid = record.get("op"), record.get("sid")
+    if op == "put":
+        active[sid] = dict(record.get("record") or {})
+    elif op == "set":
+        current = active.setdefault(sid, {})
+        current.update(record.get("set") or {})
+        for key in record.get("unset") or ():
+            current.pop(key, None)
+    elif op == "del":
+        active.pop(sid, None)
+
+
+def _wal_diff(session_id, before, after):
+    """The WAL record turning `before` into `after` (None if unchanged)."""
+    if not after:
+        return {"op": "del", "sid": session_id} if before else None
+    if not before:
+        return {"op": "put", "sid": session_id, "record": after}
+    changed = {k: v for k, v in after.items() if k not in before or before[k] != v}
+    removed = [k for k in before if k not in after]
+    if not changed and not removed:
+        return None
+    record = {"op": "set", "sid": session_id}
+    if changed:
+        record["set"] = changed
+    if removed:
+        record["unset"] = removed
+    return record
+
+
+def _wal_read(offset=None):
+    """
+    Read active.wal from byte `offset` (default: just past the header).
+
+    Returns:
+        (header, records, end): end is the offset after the last complete
+        line -- a line torn by a crash mid-append is not returned
+    """
+    with open(REGISTRY_WAL, "rb") as f:
+        header = json.loads(f.readline())
+        if offset is not None:
+            f.seek(offset)
+        start = f.tell()
+        data = f.read()
+    complete = data.rfind(b"\n") + 1
+    records = []
+    for line in data[:complete].splitlines():
+        try:
+            records.append(json.loads(line))
+        except ValueError:
+            continue
+    return header, records, start + complete
+
+
+def _wal_load():
+    """
+    Registry state from the snapshot plus the WAL records after it.
+
+    Falls back to replaying the whole WAL when the snapshot is missing,
+    unreadable or belongs to an older WAL generation.
+
+    Returns:
+        (active, state): state holds the WAL generation, last sequence
+        number, end offset, records replayed and whether the snapshot was
+        usable -- the position _wal_commit() appends from
+    """
+    try:
+        snapshot = json.loads(ACTIVE_FILE.read_text(encoding="utf-8"))
+        mark, active = snapshot["wal"], snapshot["sessions"]
+        header, records, end = _wal_read(mark["offset"])
+        if (header.get("gen") == mark["gen"] and isinstance(active, dict)
+                and (not records or records[0].get("seq") == mark["seq"] + 1)):
+            for record in records:
+                _wal_apply(active, record)
+            seq = records[-1]["seq"] if records else mark["seq"]
+            return active, {"gen": mark["gen"], "seq": seq, "offset": end,
+                            "tail": len(records), "snapshot": True}
+    except Exception:
+        pass
+    header, records, end = _wal_read()
+    active = {}
+    for record in records:
+        _wal_apply(active, record)
+    seq = records[-1].get("seq", 0) if records else header.get("seq", 0)
+    return active, {"gen": header.get("gen"), "seq": seq, "offset": end,
+                    "tail": len(records), "snapshot": False}
+
+
+def _wal_snapshot(active, state):
+    """Write active.json as a snapshot at the state's WAL position."""
+    mark = {"gen": state["gen"], "seq": state["seq"], "offset": state["offset"]}
+    _atomic_write_text(ACTIVE_FILE, json.dumps(
+        {"wal": mark, "sessions": active}, separators=(",", ":"), default=str
+    ))
+    state.update(tail=0, snapshot=True)
+
+
+def _wal_rewrite(active, seq=0):
+    """
+    Start a new WAL generation holding one "put" per session, then
+    snapshot it. Returns the new state.
+    """
+    gen = os.urandom(4).hex()
+    lines = [json.dumps({"wal": WAL_VERSION, "gen": gen, "seq": seq})]
+    for sid, record in active.items():
+        seq += 1
+        lines.append(json.dumps({"seq": seq, "op": "put", "sid": sid, "record": record},
+                                separators=(",", ":"), default=str))
+    text = "\n".join(lines) + "\n"
+    _atomic_write_text(REGISTRY_WAL, text)
+    state = {"gen": gen, "seq": seq, "offset": len(text.encode("utf-8")),
+             "tail": 0, "snapshot": False}
+    _wal_snapshot(active, state)
+    return state
+
+
+def _wal_commit(records, active, state):
+    """
+    Append WAL records in one write; caller holds LOCK_FILE.
+
+    `active` is the registry after the records. It is snapshotted when
+    WAL_SNAPSHOT_RECORDS have accumulated or the snapshot was unusable,
+    and the WAL is compacted first once it passes WAL_COMPACT_BYTES.
+    """
+    records = [r for r in records if r]
+    if records:
+        lines = []
+        for record in records:
+            state["seq"] += 1
+            lines.append(json.dumps({"seq": state["seq"], **record},
+                                    separators=(",", ":"), default=str))
+        data = ("\n".join(lines) + "\n").encode("utf-8")
+        fd = os.open(str(REGISTRY_WAL), os.O_WRONLY | os.O_APPEND)
+        try:
+            if os.fstat(fd).st_size > state["offset"]:
+                os.ftruncate(fd, state["offset"])  # drop a torn final line
+            view = memoryview(data)
+            while view:
+                view = view[os.write(fd, view):]
+        finally:
+            os.close(fd)
+        state["offset"] += len(data)
+        state["tail"] += len(records)
+    if state["tail"] >= WAL_SNAPSHOT_RECORDS or not state["snapshot"]:
+        if state["offset"] > WAL_COMPACT_BYTES:
+            _wal_rewrite(active, state["seq"])
+        else:
+            _wal_snapshot(active, state)
+
+
+def _wal_write(active):
+    """Locked replacement of the whole registry as WAL records."""
+    with _file_lock(LOCK_FILE):
+        current, state = _wal_load()
+        _wal_commit(
+            [_wal_diff(sid, current.get(sid), active.get(sid))
+             for sid in {**current, **active}],
+            active, state,
+        )
+
+
 def _read_active():
     """Read active sessions registry. Returns dict."""
+    if _broker_registry is not None:
+        return dict(_broker_registry)
+    return storage_backend().read_registry()
+
+
+def _read_registry_files():
+    """_read_active() for the file layouts."""
     try:
+        if _registry_sharded():
+            return _read_shards()[0]
+        if _registry_wal():
+            return _wal_load()[0]
         if ACTIVE_FILE.exists():
             return json.loads(ACTIVE_FILE.read_text(encoding="utf-8"))
     except Exception:
@@ -56,122 +567,1836 @@ def _read_active():
     return {}
 
 
+def _read_session(session_id):
+    """Lock-free read of one session record. Returns dict or None."""
+    if _broker_registry is not None:
+        return _broker_registry.get(session_id)
+    return storage_backend().read_session(session_id)
+
+
+def _read_session_files(session_id):
+    """_read_session() for the file layouts."""
+    try:
+        if _registry_sharded():
+            path = _shard_path(session_id)
+            return _load_shard(path.read_text(encoding="utf-8"))[1]
+    except Exception:
+        return None
+    return _read_registry_files().get(session_id)
+
+
 def _write_active(data):
     """Write active sessions registry with fail-open semantics."""
     _ensure_dirs()
+    _invalidate_deadlines()
     try:
-        ACTIVE_FILE.write_text(
-            json.dumps(data, indent=2, default=str), encoding="utf-8"
-        )
+        storage_backend().write_registry(data)
     except Exception:
         pass
 
 
-def _write_jsonl_event(event):
-    """Append event to daily JSONL log."""
-    _ensure_dirs()
-    today = datetime.now().strftime("%Y-%m-%d")
-    log_file = LOG_DIR / f"{today}.jsonl"
+def _write_registry_files(data):
+    """_write_active() for the file layouts. Raises on failure."""
+    if _registry_sharded():
+        _, raw = _read_shards()
+        _commit_shards(data, raw, None)
+        return
+    if _registry_wal():
+        _wal_write(data)
+        return
+    _atomic_write_text(
+        ACTIVE_FILE, json.dumps(data, indent=2, default=str)
+    )
+
+
+def _flock_wait(fd, timeout):
+    """
+    Blocking flock() on fd, given up after `timeout` seconds. Returns True
+    if the lock is held.
+
+    Waiters stay in the kernel's FIFO queue; polling would let newcomers
+    overtake them. In the main thread with no alarm in use (every hook) a
+    one-shot SIGALRM interrupts the wait. Elsewhere the wait runs in a
+    daemon thread on a dup of fd (same open file, same lock); if the
+    caller gives up, that thread releases the lock as soon as it gets it.
+    """
+    import fcntl
+    import signal
+    import threading
+
+    if (threading.current_thread() is threading.main_thread()
+            and hasattr(signal, "setitimer")
+            and signal.getsignal(signal.SIGALRM) == signal.SIG_DFL
+            and signal.getitimer(signal.ITIMER_REAL) == (0.0, 0.0)):
+        def expire(signum, frame):
+            raise TimeoutError
+
+        signal.signal(signal.SIGALRM, expire)
+        try:
+            signal.setitimer(signal.ITIMER_REAL, timeout)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                return True
+            except TimeoutError:
+                return False
+            finally:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+        finally:
+            signal.signal(signal.SIGALRM, signal.SIG_DFL)
+
+    wait_fd = os.dup(fd)
+    acquired = threading.Event()
+    guard = threading.Lock()
+    abandoned = []
+
+    def wait():
+        try:
+            fcntl.flock(wait_fd, fcntl.LOCK_EX)
+            with guard:
+                if abandoned:
+                    fcntl.flock(wait_fd, fcntl.LOCK_UN)
+                else:
+                    acquired.set()
+        except OSError:
+            pass
+        finally:
+            os.close(wait_fd)
+
+    threading.Thread(target=wait, name="ark-flock", daemon=True).start()
+    if acquired.wait(timeout):
+        return True
+    with guard:
+        if acquired.is_set():
+            return True
+        abandoned.append(True)
+    return False
+
+
+@contextmanager
+def _file_lock(lock_path, timeout=LOCK_TIMEOUT_SECONDS):
+    """
+    Hold an advisory exclusive lock on lock_path for the duration of the block.
+
+    POSIX uses flock(): waiters are queued by the kernel (fair under
+    contention) and the lock dies with its holder. An uncontended lock is
+    one non-blocking call; otherwise _flock_wait() waits for up to
+    `timeout` seconds. Windows polls msvcrt.locking() with backoff for as
+    long. timeout=0 tries once. If the lock cannot be taken -- a holder
+    stopped in a debugger, a lock server gone on NFS -- the block still
+    runs unlocked: a hook must never hang or fail on session bookkeeping.
+
+    Yields:
+        True if the lock is held, False if the block runs unlocked
+    """
+    fd = None
+    locked = False
     try:
-        with open(log_file, "a", encoding="utf-8") as f:
-            f.write(json.dumps(event, default=str) + "\n")
+        fd = os.open(str(lock_path), os.O_RDWR | os.O_CREAT, 0o644)
+        if os.name == "nt":
+            import msvcrt
+            deadline = time.monotonic() + timeout
+            delay = 0.001
+            while True:
+                try:
+                    msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+                    locked = True
+                    break
+                except OSError:
+                    if time.monotonic() >= deadline:
+                        break
+                    time.sleep(delay)
+                    delay = min(delay * 2, 0.025)
+        else:
+            import fcntl
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                locked = True
+            except BlockingIOError:
+                locked = timeout > 0 and _flock_wait(fd, timeout)
     except Exception:
         pass
 
+    try:
+        yield locked
+    finally:
+        if fd is not None:
+            try:
+                if locked:
+                    if os.name == "nt":
+                        import msvcrt
+                        os.lseek(fd, 0, os.SEEK_SET)
+                        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+                    else:
+                        import fcntl
+                        fcntl.flock(fd, fcntl.LOCK_UN)
+            except Exception:
+                pass
+            os.close(fd)
+
+
+@contextmanager
+def _monolithic_transaction():
+    """registry_transaction() body for active.json; caller holds the lock."""
+    raw = ""
+    active = {}
+    try:
+        raw = ACTIVE_FILE.read_text(encoding="utf-8")
+        active = json.loads(raw)
+        if not isinstance(active, dict):
+            raise ValueError("registry is not a JSON object")
+    except FileNotFoundError:
+        raw = ""
+    except Exception:
+        try:
+            _atomic_write_text(
+                ACTIVE_FILE.with_name(ACTIVE_FILE.name + ".corrupt"), raw
+            )
+        except Exception:
+            pass
+        raw = ""
+        active = {}
+
+    yield active
 
-def _load_machine_config():
-    """Load machine.local.yaml for workspace root. Returns dict or None."""
-    if not MACHINE_CONFIG.exists():
+    text = json.dumps(active, indent=2, default=str)
+    if text != raw and (raw or active):
+        try:
+            _atomic_write_text(ACTIVE_FILE, text)
+        except Exception:
+            pass
+
+
+@contextmanager
+def registry_transaction():
+    """
+    Locked read-modify-write cycle over the active sessions registry.
+
+    Usage:
+        with registry_transaction() as active:
+            active[session_id]["intent"] = "..."
+
+    The registry is written back atomically (temp file + rename) when the
+    block exits normally and the data actually changed. An exception inside
+    the block discards the changes. A registry that exists but cannot be
+    parsed is preserved as active.json.corrupt instead of being silently
+    replaced.
+
+    In the sharded layout this loads every shard; lifecycle functions that
+    touch a single session should use session_transaction() instead. With
+    a non-file storage backend the backend provides the transaction.
+    """
+    if _broker_registry is not None:
+        work = {sid: dict(rec) for sid, rec in _broker_registry.items()}
+        yield work
+        _broker_dirty.update(
+            sid for sid in set(work) | set(_broker_registry)
+            if work.get(sid) != _broker_registry.get(sid)
+        )
+        _broker_registry.clear()
+        _broker_registry.update(work)
+        return
+    with _disk_registry_transaction() as active:
+        yield active
+
+
+@contextmanager
+def _disk_registry_transaction():
+    """registry_transaction() against the storage backend."""
+    with storage_backend().registry_transaction() as active:
+        yield active
+
+
+@contextmanager
+def _file_registry_transaction():
+    """registry_transaction() against the on-disk file layout."""
+    _ensure_dirs()
+    with _file_lock(LOCK_FILE):
+        if _registry_wal() and not _registry_sharded():
+            active, state = _wal_load()
+            before = {sid: dict(record) for sid, record in active.items()}
+            yield active
+            try:
+                _wal_commit(
+                    [_wal_diff(sid, before.get(sid), active.get(sid))
+                     for sid in {**before, **active}],
+                    active, state,
+                )
+            except Exception:
+                pass
+            return
+        if not _registry_sharded():
+            with _monolithic_transaction() as active:
+                yield active
+            return
+
+        index = _read_shard_index()
+        active, raw_shards = _read_shards(list(index))
+        yield active
+        _commit_shards(active, raw_shards, index)
+
+
+@contextmanager
+def session_transaction(session_id):
+    """
+    Locked read-modify-write of a single session record.
+
+    Yields the record dict, empty if the session is unknown. A non-empty
+    record is written back on normal exit; leaving an unknown session's
+    record empty writes nothing. In the sharded layout only that session's
+    shard (and, on a status change, the small index) is rewritten; in the
+    WAL layout only the changed fields are appended.
+    """
+    if _broker_registry is not None:
+        record = dict(_broker_registry.get(session_id, {}))
+        yield record
+        if record:
+            _broker_registry[session_id] = record
+            _broker_dirty.add(session_id)
+        return
+    with storage_backend().session_transaction(session_id) as record:
+        yield record
+
+
+@contextmanager
+def _file_session_transaction(session_id):
+    """session_transaction() against the on-disk file layout."""
+    _ensure_dirs()
+    with _file_lock(LOCK_FILE):
+        if _registry_wal() and not _registry_sharded():
+            active, state = _wal_load()
+            before = active.get(session_id)
+            record = dict(before or {})
+            yield record
+            if record:
+                active[session_id] = record
+                try:
+                    _wal_commit([_wal_diff(session_id, before, record)], active, state)
+                except Exception:
+                    pass
+            return
+        if not _registry_sharded():
+            with _monolithic_transaction() as active:
+                record = active.get(session_id, {})
+                yield record
+                if record:
+                    active[session_id] = record
+            return
+
+        path = _shard_path(session_id)
+        raw = None
+        record = {}
+        try:
+            raw = path.read_text(encoding="utf-8")
+            record = _load_shard(raw)[1]
+        except Exception:
+            record = {}
+        status_before = record.get("status")
+
+        yield record
+
+        if not record:
+            return
+        text = _dump_shard(session_id, record)
+        if text != raw:
+            try:
+                _atomic_write_text(path, text)
+            except Exception:
+                return
+        if record.get("status") != status_before or raw is None:
+            _update_shard_index(session_id, record.get("status", ""))
+
+
+def migrate_registry_to_shards():
+    """
+    One-shot migration from active.json to the sharded layout.
+
+    Shards are built in a staging directory and swapped in with a rename,
+    then active.json is kept as active.json.migrated (and a WAL-layout
+    registry's log as active.wal.migrated). Returns the number of sessions
+    migrated, or -1 if the registry is already sharded.
+    """
+    import shutil
+
+    _ensure_dirs()
+    with _file_lock(LOCK_FILE):
+        if _registry_sharded():
+            return -1
+        active = {}
+        try:
+            if _registry_wal():
+                active = _wal_load()[0]
+            else:
+                active = json.loads(ACTIVE_FILE.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            pass
+
+        staging = SESSIONS_DIR / "active.staging"
+        shutil.rmtree(staging, ignore_errors=True)
+        staging.mkdir()
+        index = {}
+        for sid, record in active.items():
+            name = _shard_path(sid).name
+            (staging / name).write_text(_dump_shard(sid, record), encoding="utf-8")
+            index[sid] = record.get("status", "")
+        (staging / SHARD_INDEX.name).write_text(
+            json.dumps(index), encoding="utf-8"
+        )
+        os.replace(staging, SHARD_DIR)
+        if ACTIVE_FILE.exists():
+            os.replace(
+                ACTIVE_FILE, ACTIVE_FILE.with_name(ACTIVE_FILE.name + ".migrated")
+            )
+        if _registry_wal():
+            os.replace(
+                REGISTRY_WAL, REGISTRY_WAL.with_name(REGISTRY_WAL.name + ".migrated")
+            )
+        return len(active)
+
+
+def migrate_registry_to_wal():
+    """
+    One-shot migration from active.json to the write-ahead log layout.
+
+    The original active.json is kept as active.json.migrated, then the WAL
+    is written (from then on it is the source of truth) and a snapshot
+    takes active.json's place. Returns the number of sessions migrated, or
+    -1 if the registry already uses the WAL or the sharded layout.
+    """
+    import shutil
+
+    _ensure_dirs()
+    with _file_lock(LOCK_FILE):
+        if _registry_sharded() or _registry_wal():
+            return -1
+        active = {}
+        try:
+            active = json.loads(ACTIVE_FILE.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            pass
+        if ACTIVE_FILE.exists():
+            shutil.copyfile(
+                ACTIVE_FILE, ACTIVE_FILE.with_name(ACTIVE_FILE.name + ".migrated")
+            )
+        _wal_rewrite(active)
+        return len(active)
+
+
+# -- Event log indexes ------------------------------------------------------
+#
+# Each raw daily log has one append-only postings file per indexed field,
+# index/YYYY-MM-DD.<field>.idx, made of batches:
+#     +                                   batch start (after a newline that
+#                                         ends any torn line before it)
+#     <offset>\t<value as JSON string>    an event with that value
+#     @<start> <end> <count>              the <count> postings above cover
+#                                         log bytes [start, end)
+# The EventWriter appends a batch per field for each commit, so indexes are
+# current as events land. ark_events.update_indexes(), run by retention,
+# fills ranges no batch covers (events from older writers, a crash between
+# the log write and the postings write). Queries only read the files,
+# streaming the postings of the fields they filter on.
+
+LOG_INDEX_FIELDS = ("session_id", "callsign", "event", "workspace", "machine")
+
+
+def _log_index_path(log_file, field):
+    """Postings file of one field for a raw daily log."""
+    log_file = Path(log_file)
+    index_dir = LOG_INDEX_DIR if log_file.parent == LOG_DIR else log_file.parent / "index"
+    return index_dir / f"{log_file.stem}.{field}.idx"
+
+
+def _index_keys(event):
+    """The indexed fields an event carries, as {field: str value}."""
+    return {field: str(event[field]) for field in LOG_INDEX_FIELDS
+            if event.get(field) not in (None, "")}
+
+
+def _append_postings(log_file, start, end, entries, fields=LOG_INDEX_FIELDS):
+    """
+    Append one postings batch per field for log bytes [start, end).
+
+    Args:
+        log_file: the raw daily log
+        start, end: byte range of the log the entries cover (every event
+            in it must be listed)
+        entries: [(offset, {field: value})] as from _index_keys()
+        fields: the postings files to extend
+    """
+    for field in fields:
+        lines = [f"{offset}\t{json.dumps(keys[field])}\n"
+                 for offset, keys in entries if field in keys]
+        lines.append(f"@{start} {end} {len(lines)}\n")
+        lines.insert(0, "\n+\n")
+        path = _log_index_path(log_file, field)
+        data = "".join(lines).encode("utf-8")
+        flags = os.O_WRONLY | os.O_APPEND | os.O_CREAT
+        try:
+            fd = os.open(str(path), flags, 0o644)
+        except FileNotFoundError:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            fd = os.open(str(path), flags, 0o644)
+        try:
+            os.write(fd, data)
+        finally:
+            os.close(fd)
+
+
+class EventWriter:
+    """
+    Buffered, group-committing appender for the daily JSONL logs.
+
+    Events are stamped with their day when appended, so a batch that spans
+    midnight still lands in the right files. The current day's file stays
+    open between commits. Each commit writes each day's lines with a single
+    O_APPEND write, so concurrent processes never interleave partial lines,
+    then appends the postings for those lines to the day's field indexes.
+
+    Args:
+        log_dir: Directory of YYYY-MM-DD.jsonl files (default LOG_DIR)
+        max_events: Commit once this many events are buffered
+        max_delay: Commit once the oldest buffered event is this old (s)
+        fsync: "none", "batch" (fsync per commit) or "event"
+        clock: time source, for tests
+    """
+
+    def __init__(self, log_dir=None, max_events=EVENT_BATCH_MAX,
+                 max_delay=EVENT_BATCH_SECONDS, fsync=None, clock=time.time):
+        self.log_dir = Path(log_dir) if log_dir else LOG_DIR
+        self.max_events = max_events
+        self.max_delay = max_delay
+        self.fsync = fsync or EVENT_FSYNC
+        self.clock = clock
+        self._buffer = []        # (day, line, index keys)
+        self._oldest = None      # monotonic time of the oldest buffered event
+        self._fd = None
+        self._fd_day = None
+
+    def __len__(self):
+        return len(self._buffer)
+
+    def append(self, event):
+        """Buffer one event; commits when a threshold or policy says so."""
+        day = time.strftime("%Y-%m-%d", time.localtime(self.clock()))
+        self._buffer.append((day, json.dumps(event, default=str) + "\n",
+                             _index_keys(event)))
+        if self._oldest is None:
+            self._oldest = time.monotonic()
+        if self.fsync == "event" or self.due():
+            self.commit()
+
+    def due(self):
+        """True when the buffer has hit its size or age threshold."""
+        if not self._buffer:
+            return False
+        return (len(self._buffer) >= self.max_events
+                or time.monotonic() - self._oldest >= self.max_delay)
+
+    def commit(self):
+        """Write all buffered events, one write (and fsync) per day file."""
+        if not self._buffer:
+            return
+        batches = {}
+        for day, line, keys in self._buffer:
+            batches.setdefault(day, []).append((line.encode("utf-8"), keys))
+        self._buffer = []
+        self._oldest = None
+        for day, lines in batches.items():
+            try:
+                fd = self._open(day)
+                data = b"".join(line for line, _ in lines)
+                written = os.write(fd, data)
+                rest = data[written:]
+                while rest:
+                    rest = rest[os.write(fd, rest):]
+                if self.fsync in ("batch", "event"):
+                    os.fsync(fd)
+            except Exception:
+                continue  # fail-open: logging must never break a hook
+            if written < len(data):
+                continue  # split write: offsets unknown, maintenance indexes it
+            try:
+                # O_APPEND left this descriptor's offset at the end of our write
+                offset = os.lseek(fd, 0, os.SEEK_CUR) - len(data)
+                entries = []
+                for line, keys in lines:
+                    entries.append((offset, keys))
+                    offset += len(line)
+                _append_postings(self.log_dir / f"{day}.jsonl",
+                                 offset - len(data), offset, entries)
+            except Exception:
+                pass
+
+    def _open(self, day):
+        if self._fd_day == day:
+            return self._fd
+        self.close_file()
+        path = self.log_dir / f"{day}.jsonl"
+        flags = os.O_WRONLY | os.O_APPEND | os.O_CREAT
+        try:
+            fd = os.open(str(path), flags, 0o644)
+        except FileNotFoundError:
+            self.log_dir.mkdir(parents=True, exist_ok=True)
+            fd = os.open(str(path), flags, 0o644)
+        self._fd, self._fd_day = fd, day
+        return fd
+
+    def close_file(self):
+        if self._fd is not None:
+            try:
+                os.close(self._fd)
+            except OSError:
+                pass
+        self._fd, self._fd_day = None, None
+
+    def close(self):
+        """Commit anything buffered and release the file handle."""
+        self.commit()
+        self.close_file()
+
+
+def _get_event_writer():
+    """
+    The process-wide event writer (an EventWriter for the file backend),
+    closed automatically at exit.
+    """
+    global _event_writer
+    if _event_writer is None:
+        import atexit
+        _event_writer = storage_backend().event_writer()
+        atexit.register(_event_writer.close)
+    return _event_writer
+
+
+def flush_events():
+    """Commit any buffered JSONL events now."""
+    if _event_writer is not None:
+        _event_writer.commit()
+
+
+def _write_jsonl_event(event):
+    """
+    Append event to daily JSONL log.
+
+    Inside a lifecycle call the event is buffered and group-committed when
+    the outermost call returns; the broker commits on size/time thresholds.
+    Anywhere else it is committed immediately.
+    """
+    writer = _get_event_writer()
+    writer.append(event)
+    if _event_batch_depth == 0 and _broker_registry is None:
+        writer.commit()
+
+
+def _group_commit(func):
+    """Decorator: group-commit events logged during a lifecycle call."""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        global _event_batch_depth
+        _event_batch_depth += 1
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _event_batch_depth -= 1
+            if _event_batch_depth == 0 and _broker_registry is None:
+                with _span("log"):
+                    flush_events()
+    return wrapper
+
+
+# -- Tracing ----------------------------------------------------------------
+#
+# With ARK_TRACE set, each sampled lifecycle call appends one JSON line to
+# trace.jsonl: total wall time plus one entry per internal phase (registry,
+# git, diary, sweep, log append, ...). Nested phases are named by path,
+# e.g. "maintenance/detect_crashes/registry". Bytes read and written come
+# from the per-process I/O counters (Linux /proc/self/io, Windows
+# GetProcessIoCounters) and are left out where neither exists. With
+# tracing off, _span() hands back a shared no-op context and _traced()
+# costs two global lookups. `ark_session trace --summary` reports
+# percentiles (ark_trace).
+
+_NO_SPAN = nullcontext()
+
+
+def _trace_rate():
+    """Sample rate from TRACE_SAMPLE: 0.0 (off) to 1.0 (every call)."""
+    value = str(TRACE_SAMPLE).strip().lower()
+    if value in ("", "0", "off", "false", "no"):
+        return 0.0
+    try:
+        return min(max(float(value), 0.0), 1.0)
+    except ValueError:
+        return 1.0  # "on", "yes", ...
+
+
+def _io_counters():
+    """
+    Bytes read and written by this process so far, or None if the platform
+    does not say. Reads of /proc/self/io itself are subtracted.
+    """
+    global _trace_io_self
+    if os.name == "nt":
+        return _windows_io_counters()
+    try:
+        with open("/proc/self/io", "rb") as f:
+            data = f.read()
+    except OSError:
         return None
+    counters = {}
+    for line in data.splitlines():
+        key, _, value = line.partition(b":")
+        counters[key] = value
     try:
-        # Minimal YAML parsing -- avoid external dependency
-        content = MACHINE_CONFIG.read_text(encoding="utf-8")
-        config = {}
-        for line in content.splitlines():
-            stripped = line.strip()
-            if stripped.startswith("workspace_root:"):
-                val = stripped.split(":", 1)[1].strip().strip('"').strip("'")
-                config["workspace_root"] = val
-            elif stripped.startswith("id:"):
-                val = stripped.split(":", 1)[1].strip().strip('"').strip("'")
-                config["machine_id"] = val
-        return config if config else None
+        result = (int(counters[b"rchar"]) - _trace_io_self,
+                  int(counters[b"wchar"]))
+    except (KeyError, ValueError):
+        return None
+    _trace_io_self += len(data)
+    return result
+
+
+def _windows_io_counters():
+    """(ReadTransferCount, WriteTransferCount) via GetProcessIoCounters."""
+    try:
+        import ctypes
+
+        counters = (ctypes.c_ulonglong * 6)()  # IO_COUNTERS
+        kernel32 = ctypes.windll.kernel32
+        if not kernel32.GetProcessIoCounters(
+                kernel32.GetCurrentProcess(), ctypes.byref(counters)):
+            return None
+        return counters[3], counters[4]
     except Exception:
         return None
 
 
-def _resolve_workspace_short(cwd):
+def _phase_record(name, start, io_start):
+    """Timing entry for a span that began at perf_counter() `start`."""
+    record = {"name": name, "ms": round((time.perf_counter() - start) * 1000, 3)}
+    io_end = _io_counters() if io_start is not None else None
+    if io_end is not None:
+        record["read"] = io_end[0] - io_start[0]
+        record["written"] = io_end[1] - io_start[1]
+    return record
+
+
+@contextmanager
+def _timed_span(name):
+    trace = _trace
+    trace["stack"].append(name)
+    io_start = _io_counters()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record = _phase_record("/".join(trace["stack"]), start, io_start)
+        trace["stack"].pop()
+        trace["phases"].append(record)
+
+
+def _span(name):
+    """Time one phase of the traced call in progress (no-op otherwise)."""
+    if _trace is None:
+        return _NO_SPAN
+    return _timed_span(name)
+
+
+def _append_trace(record):
+    """Append one trace line, rolling the file past TRACE_MAX_BYTES."""
+    try:
+        try:
+            if os.stat(TRACE_FILE).st_size > TRACE_MAX_BYTES:
+                os.replace(TRACE_FILE, TRACE_FILE.with_name(TRACE_FILE.name + ".1"))
+        except FileNotFoundError:
+            TRACE_FILE.parent.mkdir(parents=True, exist_ok=True)
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        fd = os.open(str(TRACE_FILE), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line.encode("utf-8"))
+        finally:
+            os.close(fd)
+    except Exception:
+        pass  # fail-open: tracing must never break a hook
+
+
+def _traced(hook):
+    """
+    Decorator: trace calls of a lifecycle function under the name `hook`.
+
+    A call made while another is being traced (maintenance running
+    detect_crashes inside session_start) becomes a phase of the outer one.
+    """
+    def decorate(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            global _trace
+            if _trace is not None:
+                with _timed_span(hook):
+                    return func(*args, **kwargs)
+            if not TRACE_SAMPLE:
+                return func(*args, **kwargs)
+            rate = _trace_rate()
+            if rate < 1.0:
+                import random
+                if rate <= 0.0 or random.random() >= rate:
+                    return func(*args, **kwargs)
+
+            _trace = {"phases": [], "stack": []}
+            io_start = _io_counters()
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                trace, _trace = _trace, None
+                record = _phase_record(hook, start, io_start)
+                record = {"ts": round(time.time(), 3), "hook": record.pop("name"),
+                          "pid": os.getpid(), **record, "phases": trace["phases"]}
+                _append_trace(record)
+        return wrapper
+    return decorate
+
+
+# -- Machine config ---------------------------------------------------------
+#
+# machine.local.yaml is parsed with a small YAML subset -- no external
+# dependency: nested block mappings and lists, "- key: value" list items,
+# flow [lists] and {maps} on one line, quoted and plain scalars, ints,
+# floats, true/false/null and # comments. Anchors, tags and multi-line
+# block scalars are rejected with a ConfigError naming the line.
+#
+#   machine:
+#     id: buildbox-2
+#   workspace_root: D:/My-Applications
+#   workspaces:
+#     07-Carbon-Meth-Hub:
+#       short: CARB            # callsign short code override
+#       aliases: [Carbon-Hub]  # other directory names for this workspace
+#       memory: D:/Memory/carbon   # memory/ tree lives elsewhere
+
+class ConfigError(ValueError):
+    """machine.local.yaml could not be parsed. Carries path and line."""
+
+    def __init__(self, message, path=None, line=None):
+        super().__init__(message)
+        self.message, self.path, self.line = message, path, line
+
+    def __str__(self):
+        where = f"{self.path}:{self.line}" if self.line else str(self.path or "<config>")
+        return f"{where}: {self.message}"
+
+
+def _strip_yaml_comment(text):
+    """Drop a trailing # comment that is outside quotes."""
+    quote = None
+    for i, c in enumerate(text):
+        if quote:
+            if c == quote:
+                quote = None
+        elif c in "\"'":
+            quote = c
+        elif c == "#" and (i == 0 or text[i - 1] in " \t"):
+            return text[:i].rstrip()
+    return text.rstrip()
+
+
+def _split_yaml_flow(text, err):
+    """Split the inside of [..] or {..} on top-level commas."""
+    parts, depth, quote, start = [], 0, None, 0
+    for i, c in enumerate(text):
+        if quote:
+            if c == quote:
+                quote = None
+        elif c in "\"'":
+            quote = c
+        elif c in "[{":
+            depth += 1
+        elif c in "]}":
+            depth -= 1
+        elif c == "," and depth == 0:
+            parts.append(text[start:i].strip())
+            start = i + 1
+    if quote or depth:
+        raise err("unbalanced brackets or quotes")
+    tail = text[start:].strip()
+    if tail or parts:
+        parts.append(tail)
+    return [p for p in parts if p]
+
+
+def _split_yaml_key(text):
+    """(key, rest) for "key: rest", or None if the text is not a mapping entry."""
+    if text[:1] in "\"'":
+        end = text.find(text[0], 1)
+        if end > 0 and text[end + 1:end + 2] == ":":
+            rest = text[end + 2:]
+            if not rest or rest[0] in " \t":
+                return text[1:end], rest.strip()
+        return None
+    for i, c in enumerate(text):
+        if c == ":" and (i + 1 == len(text) or text[i + 1] in " \t"):
+            return text[:i].strip(), text[i + 1:].strip()
+    return None
+
+
+def _yaml_scalar(text, err):
+    """Parse one inline value: flow collection, quoted or plain scalar."""
+    if not text:
+        return None
+    first = text[0]
+    if first in "[{":
+        if text[-1] != ("]" if first == "[" else "}"):
+            raise err(f"unclosed {first}")
+        items = _split_yaml_flow(text[1:-1], err)
+        if first == "[":
+            return [_yaml_scalar(item, err) for item in items]
+        result = {}
+        for item in items:
+            pair = _split_yaml_key(item)
+            if pair is None:
+                raise err(f"expected 'key: value' in {{...}}, got {item!r}")
+            result[pair[0]] = _yaml_scalar(pair[1], err)
+        return result
+    if first == '"':
+        if len(text) < 2 or text[-1] != '"':
+            raise err("unterminated double-quoted string")
+        try:
+            return json.loads(text)
+        except ValueError:
+            return text[1:-1]  # Windows paths: keep backslashes as written
+    if first == "'":
+        if len(text) < 2 or text[-1] != "'":
+            raise err("unterminated single-quoted string")
+        return text[1:-1].replace("''", "'")
+    if first in "&*!|>%@`":
+        raise err(f"unsupported YAML syntax {first!r}")
+    lowered = text.lower()
+    if lowered in ("true", "false"):
+        return lowered == "true"
+    if lowered in ("null", "~"):
+        return None
+    try:
+        return int(text)
+    except ValueError:
+        pass
+    try:
+        return float(text)
+    except ValueError:
+        return text
+
+
+def parse_config(text, path=None):
+    """
+    Parse the machine config YAML subset.
+
+    Returns:
+        dict (empty for an empty document)
+
+    Raises:
+        ConfigError: with the offending line number
+    """
+    lines = []
+    for lineno, raw in enumerate(text.splitlines(), 1):
+        body = raw.lstrip(" ")
+        if body.startswith("\t"):
+            raise ConfigError("tab used for indentation", path, lineno)
+        body = _strip_yaml_comment(body)
+        if body and body != "---":
+            lines.append([lineno, len(raw) - len(raw.lstrip(" ")), body])
+    pos = 0
+
+    def fail(message, lineno=None):
+        return ConfigError(message, path, lineno or lines[min(pos, len(lines) - 1)][0])
+
+    def block(indent):
+        if lines[pos][2] == "-" or lines[pos][2].startswith("- "):
+            return sequence(indent)
+        return mapping(indent)
+
+    def nested(indent, lineno, allow_sibling_list):
+        """Value of a key or item whose inline part is empty."""
+        if pos < len(lines):
+            child = lines[pos]
+            if child[1] > indent:
+                return block(child[1])
+            if allow_sibling_list and child[1] == indent and (
+                    child[2] == "-" or child[2].startswith("- ")):
+                return sequence(indent)
+        return None
+
+    def mapping(indent):
+        nonlocal pos
+        result = {}
+        while pos < len(lines) and lines[pos][1] == indent:
+            lineno, _, body = lines[pos]
+            if body == "-" or body.startswith("- "):
+                raise fail("list item where a 'key: value' was expected", lineno)
+            pair = _split_yaml_key(body)
+            if pair is None:
+                raise fail(f"expected 'key: value', got {body!r}", lineno)
+            key, rest = pair
+            if key in result:
+                raise fail(f"duplicate key {key!r}", lineno)
+            pos += 1
+            if rest:
+                result[key] = _yaml_scalar(rest, lambda m: fail(m, lineno))
+            else:
+                result[key] = nested(indent, lineno, True)
+        if pos < len(lines) and lines[pos][1] > indent:
+            raise fail("unexpected indentation")
+        return result
+
+    def sequence(indent):
+        nonlocal pos
+        result = []
+        while pos < len(lines) and lines[pos][1] == indent and (
+                lines[pos][2] == "-" or lines[pos][2].startswith("- ")):
+            lineno, _, body = lines[pos]
+            item = body[1:].lstrip(" ")
+            if not item:
+                pos += 1
+                result.append(nested(indent, lineno, False))
+            elif _split_yaml_key(item) is not None and item[:1] not in "[{":
+                # "- key: value" opens a mapping indented to the item text
+                lines[pos] = [lineno, indent + len(body) - len(item), item]
+                result.append(mapping(lines[pos][1]))
+            else:
+                pos += 1
+                result.append(_yaml_scalar(item, lambda m: fail(m, lineno)))
+        if pos < len(lines) and lines[pos][1] > indent:
+            raise fail("unexpected indentation")
+        return result
+
+    if not lines:
+        return {}
+    value = block(lines[0][1])
+    if pos < len(lines):
+        raise fail("unexpected dedent or mixed indentation")
+    if not isinstance(value, dict):
+        raise ConfigError("top level must be a mapping", path, lines[0][0])
+    return value
+
+
+def _normalize_config(raw):
+    """Add the derived keys every caller uses: machine_id, workspace_root, _workspaces."""
+    config = dict(raw)
+    machine = raw.get("machine")
+    machine_id = machine.get("id") if isinstance(machine, dict) else None
+    machine_id = machine_id or raw.get("machine_id") or raw.get("id")
+    if machine_id not in (None, ""):
+        config["machine_id"] = str(machine_id)
+    if raw.get("workspace_root") not in (None, ""):
+        config["workspace_root"] = str(raw["workspace_root"])
+
+    # Lookup by directory name, alias or full path
+    lookup = {}
+    workspaces = raw.get("workspaces")
+    for name, entry in (workspaces.items() if isinstance(workspaces, dict) else ()):
+        if not isinstance(entry, dict):
+            continue
+        entry = {**entry, "name": name}
+        aliases = entry.get("aliases") or []
+        for key in [name, *(aliases if isinstance(aliases, list) else [aliases])]:
+            lookup.setdefault(str(key).lower(), entry)
+        if entry.get("path"):
+            lookup.setdefault(str(entry["path"]).replace("\\", "/").rstrip("/").lower(), entry)
+    config["_workspaces"] = lookup
+    return config
+
+
+def load_config(path=None):
+    """
+    Parsed, normalized machine config, cached by the file's (mtime, size).
+
+    A repeated call costs one stat(). A missing file is an empty config.
+
+    Raises:
+        ConfigError: the file does not parse (the error is cached too,
+        so a broken file is not re-read until it changes)
+    """
+    global _config_cache
+    path = Path(path) if path else MACHINE_CONFIG
+    try:
+        st = os.stat(path)
+        sig = (str(path), st.st_mtime_ns, st.st_size)
+    except OSError:
+        sig = (str(path), None, None)
+    if _config_cache is not None and _config_cache[0] == sig:
+        if isinstance(_config_cache[1], ConfigError):
+            raise _config_cache[1]
+        return _config_cache[1]
+
+    _ws_short_cache.clear()  # short-code overrides may have changed
+    try:
+        if sig[1] is None:
+            config = {}
+        else:
+            config = _normalize_config(
+                parse_config(path.read_text(encoding="utf-8"), path))
+    except ConfigError as e:
+        _config_cache = (sig, e)
+        raise
+    except (OSError, UnicodeDecodeError) as e:
+        err = ConfigError(f"unreadable: {e}", path)
+        _config_cache = (sig, err)
+        raise err
+    _config_cache = (sig, config)
+    return config
+
+
+def _load_machine_config():
     """
-    Dynamic workspace short code from directory name.
-    No hardcoded map -- derives from directory basename.
+    Machine config dict, or None if there is none. Hooks stay fail-open: a
+    parse error is reported once on stderr (and by `ark_session.py config`)
+    and treated as no config.
+    """
+    global _config_warned
+    try:
+        config = load_config()
+    except ConfigError as e:
+        if _config_warned != str(e):
+            _config_warned = str(e)
+            print(f"ark_session: ignoring machine config: {e}", file=sys.stderr)
+        return None
+    return config or None
+
+
+def workspace_config(cwd):
+    """
+    Per-workspace overrides from the config's `workspaces:` map, matched
+    by directory name, an alias or the full path. Empty dict if none.
+    """
+    config = _load_machine_config()
+    if not config:
+        return {}
+    lookup = config["_workspaces"]
+    norm = str(cwd).replace("\\", "/").rstrip("/")
+    return lookup.get(norm.lower()) or lookup.get(os.path.basename(norm).lower()) or {}
+
+
+def memory_dir(workspace_path):
+    """A workspace's memory/ tree: the config's `memory:` override or <ws>/memory."""
+    ws = Path(str(workspace_path).replace("\\", "/"))
+    override = workspace_config(ws).get("memory")
+    if override:
+        return ws / os.path.expanduser(str(override))  # absolute overrides win
+    return ws / "memory"
+
+
+# -- Storage backends -------------------------------------------------------
+#
+# Registry and event-log persistence sit behind StorageBackend. FileBackend
+# (the default) is the layouts above plus the daily JSONL logs. The
+# machine config selects another backend:
+#
+#   storage: sqlite                 # or, with an explicit database path:
+#   storage: {backend: sqlite, path: ~/.claude/sessions/ark.db}
+#
+# Heartbeat stamps, the crash-deadline heap and the broker stay file-based
+# whatever the backend; they are caches in front of the registry.
+
+class StorageBackend(ABC):
+    """
+    Interface every storage backend implements. A subclass that leaves an
+    abstract method out cannot be instantiated.
+
+    Registry:
+        registry_transaction()        locked read-modify-write of all sessions
+        session_transaction(sid)      the same for one session record
+        read_registry(), read_session(sid), read_active_sessions()
+                                      lock-free reads (dict / dict or None)
+        write_registry(data)          replace the registry (raises on failure)
+        rewrites_whole_registry()     True if any write costs a full rewrite,
+                                      so batching updates pays off
+    Events:
+        event_writer()                EventWriter-compatible appender
+        iter_events()                 every event, oldest first
+        query_events(...), tail_events(n, ...)
+                                      filtered reads, as in ark_events
+        events_since(cursor)          events appended since the cursor was
+                                      last advanced (stats, federation)
+    Upkeep:
+        maintain()                    retention, run by maybe_run_retention()
+    """
+
+    name = ""
+
+    @abstractmethod
+    def registry_transaction(self):
+        """Context manager yielding {session_id: record}, saved on exit."""
+
+    @abstractmethod
+    def session_transaction(self, session_id):
+        """Context manager yielding one record (empty if new), saved on exit."""
+
+    @abstractmethod
+    def read_registry(self):
+        """All sessions, without locking."""
+
+    @abstractmethod
+    def read_session(self, session_id):
+        """One session record, or None, without locking."""
+
+    def read_active_sessions(self):
+        return {sid: record for sid, record in self.read_registry().items()
+                if record.get("status") == "active"}
+
+    @abstractmethod
+    def write_registry(self, data):
+        """Replace the whole registry."""
+
+    def rewrites_whole_registry(self):
+        return False
+
+    @abstractmethod
+    def event_writer(self):
+        """A new EventWriter-compatible appender."""
+
+    def iter_events(self):
+        return self.query_events()
+
+    @abstractmethod
+    def query_events(self, session=None, callsign=None, event=None, workspace=None,
+                     since=None, until=None, limit=None, machine=None):
+        """Yield matching events oldest first."""
+
+    @abstractmethod
+    def tail_events(self, n, session=None, callsign=None, event=None, workspace=None,
+                    since=None, until=None, machine=None):
+        """The last n matching events, oldest first."""
+
+    @abstractmethod
+    def events_since(self, cursor):
+        """
+        Yield events appended since `cursor` was last advanced.
+
+        Args:
+            cursor: dict the backend keeps its position in ({} to start
+                from the beginning). It is updated in place as events are
+                yielded; persist it (as JSON) once the generator is
+                exhausted. A cursor from another backend starts over.
+        """
+
+    def maintain(self):
+        pass
+
+
+class FileBackend(StorageBackend):
+    """active.json (monolithic, sharded or WAL layout) plus the JSONL logs."""
+
+    name = "file"
+
+    def registry_transaction(self):
+        return _file_registry_transaction()
+
+    def session_transaction(self, session_id):
+        return _file_session_transaction(session_id)
+
+    def read_registry(self):
+        return _read_registry_files()
+
+    def read_session(self, session_id):
+        return _read_session_files(session_id)
+
+    def read_active_sessions(self):
+        if not _registry_sharded():
+            return StorageBackend.read_active_sessions(self)
+        index = _read_shard_index()
+        return _read_shards([sid for sid, st in index.items() if st == "active"])[0]
+
+    def write_registry(self, data):
+        _write_registry_files(data)
+
+    def rewrites_whole_registry(self):
+        return not _registry_sharded()
+
+    def event_writer(self):
+        return EventWriter()
+
+    def iter_events(self):
+        return _iter_file_events()
+
+    def _events_module(self):
+        sys.modules.setdefault("ark_session", sys.modules[__name__])
+        import ark_events
+        return ark_events
+
+    def query_events(self, **filters):
+        return self._events_module().query_events(**filters)
+
+    def tail_events(self, n, **filters):
+        return self._events_module().tail_events(n, **filters)
+
+    def events_since(self, cursor):
+        return _file_events_since(cursor)
+
+    def maintain(self):
+        cleanup_old_logs()
+
+
+_FILE_BACKEND = FileBackend()
+
+
+def _configured_backend():
+    """The backend named by the machine config; FileBackend if none/unusable."""
+    storage = (_load_machine_config() or {}).get("storage") or "file"
+    if not isinstance(storage, dict):
+        storage = {"backend": storage}
+    name = str(storage.get("backend") or "file").lower()
+    if name == "file":
+        return _FILE_BACKEND
+    try:
+        if name != "sqlite":
+            raise ValueError(f"unknown storage backend {name!r}")
+        sys.modules.setdefault("ark_session", sys.modules[__name__])
+        import ark_sqlite
+        path = storage.get("path")
+        return ark_sqlite.SQLiteBackend(os.path.expanduser(str(path)) if path else None)
+    except Exception as e:
+        print(f"ark_session: using file storage: {e}", file=sys.stderr)
+        return _FILE_BACKEND
+
+
+def storage_backend():
+    """The process's StorageBackend, chosen from the machine config once."""
+    global _storage_backend
+    if _storage_backend is None:
+        _storage_backend = _configured_backend()
+    return _storage_backend
+
+
+# -- Workspace and git resolution -------------------------------------------
+
+SHORTCODES_VERSION = 1
+HOME_SHORT_CODE = "CMD"
+SHORT_CODE_MAX_EXTRA = 3   # letters added to resolve a collision before numbering
+
+
+def _derive_short_code(basename):
+    """
+    (code, extension letters) for a directory name.
 
     Rules:
     1. Strip leading number prefix (e.g., "07-" from "07-Carbon-Meth-Hub")
     2. Take initials of remaining hyphen-separated words (max 4 chars)
     3. Uppercase the result
-    4. Special case: home directory -> "CMD"
+    Extension letters continue the words the initials came from, last
+    word first ("Cloud-Mgmt-Hub": CMH, then U, B, G, ...).
     """
-    if cwd in _ws_short_cache:
-        return _ws_short_cache[cwd]
-
-    cwd_normalized = cwd.replace("\\", "/")
-    basename = os.path.basename(cwd_normalized.rstrip("/"))
-
-    # Home directory check
-    home_dir = os.path.expanduser("~")
-    if os.path.normpath(cwd) == os.path.normpath(home_dir):
-        _ws_short_cache[cwd] = "CMD"
-        return "CMD"
-
-    # Strip leading number prefix (e.g., "07-", "100-")
     parts = basename.split("-")
     if parts and parts[0].isdigit():
         parts = parts[1:]
+    words = [p for p in parts if p]
+    initials = "".join(p[0] for p in words)[:4].upper()
+    if len(initials) >= 2:
+        extra = "".join(w[1:] for w in reversed(words[:len(initials)]))
+        code = initials
+    else:
+        code = basename[:4].upper()
+        extra = basename[4:]
+    return code, "".join(c for c in extra if c.isalnum()).upper()
+
+
+def _short_code_candidates(basename):
+    """Codes to try in order: the derived code, extended, then numbered."""
+    code, extra = _derive_short_code(basename)
+    yield code
+    for i in range(1, min(len(extra), SHORT_CODE_MAX_EXTRA) + 1):
+        yield code + extra[:i]
+    n = 2
+    while True:
+        yield f"{code}{n}"
+        n += 1
 
-    if not parts:
-        short = basename[:4].upper()
+
+def _config_signature():
+    try:
+        st = os.stat(MACHINE_CONFIG)
+        return [str(MACHINE_CONFIG), st.st_mtime_ns, st.st_size]
+    except OSError:
+        return [str(MACHINE_CONFIG), None, None]
+
+
+def _load_shortcodes():
+    try:
+        table = json.loads(SHORTCODES_FILE.read_text(encoding="utf-8"))
+        if table.get("v") == SHORTCODES_VERSION:
+            return table
+    except Exception:
+        pass
+    return None
+
+
+def _assign_short_code(table, key, cwd):
+    """Give `key` a code no other live workspace holds. Mutates table."""
+    paths, codes = table["paths"], table["codes"]
+    source = "derived"
+    if os.path.normpath(cwd) == os.path.normpath(os.path.expanduser("~")):
+        code, source = HOME_SHORT_CODE, "home"
     else:
-        # Take first letter of each word, max 4
-        initials = "".join(p[0] for p in parts if p)[:4].upper()
-        short = initials if len(initials) >= 2 else basename[:4].upper()
+        override = workspace_config(cwd).get("short")
+        code, source = (str(override), "override") if override else (None, source)
+    if code is None:
+        basename = os.path.basename(key)
+        for candidate in _short_code_candidates(basename):
+            holder = codes.get(candidate)
+            if candidate == HOME_SHORT_CODE or candidate in table["reserved"]:
+                continue
+            if holder is None or holder == key:
+                code = candidate
+                break
+            if not os.path.isdir(holder) and os.path.isdir(cwd):
+                paths.pop(holder, None)  # workspace gone: release its code
+                codes[candidate] = key
+                code = candidate
+                break
+    try:
+        mtime = os.stat(cwd).st_mtime_ns
+    except OSError:
+        mtime = None
+    old = paths.get(key)
+    if old and codes.get(old["code"]) == key:
+        del codes[old["code"]]
+    seq = old["seq"] if old else table["seq"]
+    table["seq"] = max(table["seq"], seq + 1)
+    paths[key] = {"code": code, "mtime": mtime, "seq": seq, "source": source}
+    codes.setdefault(code, key)
+    return code
+
+
+def _rebuild_shortcodes(table, config_sig):
+    """
+    The table for a changed machine config: every code that is still
+    valid is kept; overridden paths are re-resolved first, then paths
+    whose code an override now claims.
+    """
+    known = sorted((table or {}).get("paths", {}).items(), key=lambda kv: kv[1]["seq"])
+    config = _load_machine_config() or {}
+    table = {"v": SHORTCODES_VERSION, "config": config_sig, "seq": 0,
+             "paths": {}, "codes": {},
+             # Overrides are claimed up front so derived codes avoid them
+             "reserved": sorted({str(e["short"]) for e in config.get("_workspaces", {}).values()
+                                 if e.get("short")})}
+    keep, redo = [], []
+    for path, entry in known:
+        code = entry["code"]
+        if (entry.get("source") == "override" or code in table["reserved"]
+                or workspace_config(path).get("short")):
+            redo.append(path)
+        else:
+            keep.append((path, entry))
+    for path, entry in keep:
+        table["paths"][path] = entry
+        table["codes"].setdefault(entry["code"], path)
+        table["seq"] = max(table["seq"], entry["seq"] + 1)
+    redo.sort(key=lambda path: not workspace_config(path).get("short"))
+    for path in redo:
+        _assign_short_code(table, path, path)
+    return table
+
+
+def _resolve_workspace_short(cwd, assign=True):
+    """
+    Workspace short code, e.g. "CMH" for 07-Carbon-Meth-Hub.
+
+    Codes come from a table in SHORTCODES_FILE shared by every hook
+    process: path -> code, with the workspace directory's mtime when the
+    code was assigned. A known path costs one dict lookup after reading
+    that small file (and a stat() of the machine config); nothing is
+    re-derived. A new path gets, under a lock:
+
+    1. the home directory: "CMD"
+    2. a config override (workspaces.<name>.short), used as written
+    3. otherwise the derived code (see _derive_short_code), unless another
+       existing workspace holds it -- then the code is extended with the
+       next letters of its words (CMH -> CMHU -> CMHUB), then numbered
+       (CMH2). The first workspace to claim a code keeps it, so issued
+       callsigns never change meaning.
+
+    When the machine config changes, codes it does not affect stay put;
+    paths with an override (new or removed), and paths whose code an
+    override now claims, are re-resolved.
 
+    Args:
+        cwd: Workspace directory
+        assign: Persist a code for a path the table does not know yet.
+            Only session_start claims codes; other callers (a stop for
+            a session that never started, a subdirectory) get the code
+            the path would receive, and the table is left untouched.
+    """
+    if cwd in _ws_short_cache:
+        return _ws_short_cache[cwd]
+
+    key = cwd.replace("\\", "/").rstrip("/") or "/"
+    config_sig = _config_signature()
+    table = _load_shortcodes()
+    if table is not None and table["config"] == config_sig and key in table["paths"]:
+        short = table["paths"][key]["code"]
+        _ws_short_cache[cwd] = short
+        return short
+    if not assign:
+        if table is None or table["config"] != config_sig:
+            table = _rebuild_shortcodes(table, config_sig)
+        return _assign_short_code(table, key, cwd)  # not cached: unclaimed
+
+    try:
+        SESSIONS_DIR.mkdir(parents=True, exist_ok=True)
+    except OSError:
+        pass
+    with _file_lock(SHORTCODES_FILE.with_name(SHORTCODES_FILE.name + ".lock")):
+        table = _load_shortcodes()
+        if table is None or table["config"] != config_sig:
+            table = _rebuild_shortcodes(table, config_sig)
+        short = table["paths"].get(key, {}).get("code") or _assign_short_code(table, key, cwd)
+        try:
+            _atomic_write_text(SHORTCODES_FILE, json.dumps(table, separators=(",", ":")))
+        except Exception:
+            pass  # fail-open: the code is still right for this process
     _ws_short_cache[cwd] = short
     return short
 
 
-def _get_git_branch(cwd):
-    """Get current git branch, returns '-' on failure."""
+def _find_git_dir(cwd):
+    """
+    Locate the git directory for cwd by walking up to the nearest `.git`.
+    Follows `gitdir:` files (worktrees, submodules). Returns
+    (git_dir, common_dir) or None when cwd is not inside a repository.
+    """
+    path = os.path.abspath(cwd)
+    while True:
+        dot_git = os.path.join(path, ".git")
+        if os.path.isdir(dot_git):
+            git_dir = dot_git
+            break
+        if os.path.isfile(dot_git):
+            with open(dot_git, encoding="utf-8") as f:
+                line = f.readline().strip()
+            if not line.startswith("gitdir:"):
+                return None
+            git_dir = os.path.normpath(
+                os.path.join(path, line[len("gitdir:"):].strip())
+            )
+            break
+        parent = os.path.dirname(path)
+        if parent == path:
+            return None
+        path = parent
+
+    # Linked worktrees keep HEAD locally but share refs via `commondir`
+    common_dir = git_dir
+    commondir_file = os.path.join(git_dir, "commondir")
+    if os.path.isfile(commondir_file):
+        with open(commondir_file, encoding="utf-8") as f:
+            common_dir = os.path.normpath(
+                os.path.join(git_dir, f.readline().strip())
+            )
+    return git_dir, common_dir
+
+
+def _resolve_git_ref(git_dir, common_dir, ref):
+    """
+    Resolve a ref name to (sha, sources) from loose refs or packed-refs.
+    sha is None if the ref cannot be found. sources lists (path, mtime_ns)
+    for every file the answer depends on, including loose ref paths that
+    were missing (mtime None): creating one later changes the answer.
+    """
+    sources = []
+    for _ in range(5):  # symbolic ref chains are short
+        for base in (git_dir, common_dir):
+            ref_path = os.path.join(base, *ref.split("/"))
+            try:
+                with open(ref_path, encoding="utf-8") as f:
+                    value = f.readline().strip()
+                mtime = os.stat(ref_path).st_mtime_ns
+            except OSError:
+                sources.append((ref_path, None))
+                continue
+            sources.append((ref_path, mtime))
+            if value.startswith("ref:"):
+                ref = value[4:].strip()
+                break
+            return value, sources
+        else:
+            packed = os.path.join(common_dir, "packed-refs")
+            try:
+                mtime = os.stat(packed).st_mtime_ns
+            except OSError:
+                sources.append((packed, None))
+                return None, sources
+            sources.append((packed, mtime))
+            try:
+                with open(packed, encoding="utf-8") as f:
+                    for line in f:
+                        if line.startswith(("#", "^")):
+                            continue
+                        sha, _, name = line.strip().partition(" ")
+                        if name == ref:
+                            return sha, sources
+            except OSError:
+                pass
+            return None, sources
+    return None, sources
+
+
+# Resolved git heads, keyed by HEAD path: (cache key, (branch, sha))
+_git_head_cache = {}
+
+
+def _get_git_head(cwd):
+    """
+    Get (branch, commit sha) for cwd without forking git.
+
+    Reads .git/HEAD directly, handling `gitdir:` files, linked worktrees,
+    detached HEADs (branch "HEAD", like `git rev-parse --abbrev-ref`) and
+    packed refs. Results are cached per process, keyed by the mtimes of
+    HEAD and of every ref file consulted -- including loose ref paths that
+    did not exist, so a ref written after `git pack-refs` (or the first
+    commit on an unborn branch) is picked up. Falls back to `git` when
+    the repository layout is not understood. Returns ("-", "") outside a
+    repository or on failure.
+    """
+    try:
+        found = _find_git_dir(cwd)
+        if found is None:
+            return "-", ""
+        git_dir, common_dir = found
+        head_path = os.path.join(git_dir, "HEAD")
+        head_mtime = os.stat(head_path).st_mtime_ns
+
+        cached = _git_head_cache.get(head_path)
+        if cached and cached[0][0] == head_mtime:
+            if all(_mtime_ns(path) == mtime for path, mtime in cached[0][1]):
+                return cached[1]
+
+        with open(head_path, encoding="utf-8") as f:
+            head = f.readline().strip()
+        if head.startswith("ref:"):
+            ref = head[4:].strip()
+            branch = ref[len("refs/heads/"):] if ref.startswith("refs/heads/") else ref
+            sha, sources = _resolve_git_ref(git_dir, common_dir, ref)
+            # sha None: unborn branch (no commits yet)
+            result = (branch, sha or "")
+        elif len(head) == 40 or len(head) == 64:
+            result, sources = ("HEAD", head), []
+        else:
+            return _get_git_head_subprocess(cwd)
+
+        _git_head_cache[head_path] = ((head_mtime, sources), result)
+        return result
+    except Exception:
+        return _get_git_head_subprocess(cwd)
+
+
+def _mtime_ns(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _get_git_head_subprocess(cwd):
+    """Fallback: ask git for (branch, sha). Returns ("-", "") on failure."""
     try:
         import subprocess
         result = subprocess.run(
-            ["git", "rev-parse", "--abbrev-ref", "HEAD"],
+            ["git", "rev-parse", "HEAD", "--abbrev-ref", "HEAD"],
             capture_output=True, text=True, timeout=2, cwd=cwd,
         )
         if result.returncode == 0:
-            return result.stdout.strip()
+            lines = result.stdout.split()
+            if len(lines) == 2:
+                return lines[1], lines[0]
+    except Exception:
+        pass
+    return "-", ""
+
+
+def _get_git_branch(cwd):
+    """Get current git branch, returns '-' on failure."""
+    return _get_git_head(cwd)[0]
+
+
+# -- Crash deadlines -------------------------------------------------------
+#
+# deadlines.json is a min-heap of [heartbeat_expiry, session_id] over the
+# active sessions, so detect_crashes() only visits sessions that are
+# overdue. Heartbeats do not touch it: an entry that comes due is
+# revalidated against the session's current record and pushed back if the
+# session has heartbeated since, or dropped if it has stopped. Only
+# session_start() adds entries. Anything that rewrites the registry
+# wholesale (_write_active) deletes the file; the next check rebuilds it
+# from one scan of the registry.
+
+DEADLINES_VERSION = 1
+
+
+def _deadlines_lock():
+    return DEADLINES_FILE.with_name(DEADLINES_FILE.name + ".lock")
+
+
+def _load_deadlines():
+    """The persisted heap, or None if missing or unreadable."""
+    try:
+        state = json.loads(DEADLINES_FILE.read_text(encoding="utf-8"))
+        if state.get("v") == DEADLINES_VERSION:
+            return state["heap"]
+    except Exception:
+        pass
+    return None
+
+
+def _save_deadlines(heap):
+    try:
+        _atomic_write_text(
+            DEADLINES_FILE,
+            json.dumps({"v": DEADLINES_VERSION, "heap": heap}, separators=(",", ":")),
+        )
+    except Exception:
+        pass
+
+
+def _invalidate_deadlines():
+    try:
+        with _file_lock(_deadlines_lock()):
+            DEADLINES_FILE.unlink()
+    except OSError:
+        pass
+
+
+def _heartbeat_deadline(session):
+    """Epoch seconds at which a session's last heartbeat goes stale."""
+    from datetime import datetime
+
+    try:
+        last_hb = datetime.fromisoformat(session.get("last_heartbeat", "2000-01-01"))
+        return last_hb.timestamp() + CRASH_THRESHOLD_MINUTES * 60
+    except Exception:
+        return 0.0
+
+
+def _rebuild_deadlines():
+    """Heap over every active session in the registry."""
+    import heapq
+
+    if _broker_registry is None:
+        records = storage_backend().read_active_sessions()
+    else:
+        records = _read_active()
+    heap = [
+        [_heartbeat_deadline(record), sid] for sid, record in records.items()
+        if record.get("status") == "active"
+    ]
+    heapq.heapify(heap)
+    return heap
+
+
+def _schedule_deadline(session_id, deadline):
+    """Add a newly started session to the heap (fail-open)."""
+    import heapq
+
+    try:
+        with _file_lock(_deadlines_lock()):
+            heap = _load_deadlines()
+            if heap is None or any(sid == session_id for _, sid in heap):
+                return  # rebuilt from the registry on the next check
+            heapq.heappush(heap, [deadline, session_id])
+            _save_deadlines(heap)
     except Exception:
         pass
-    return "-"
+
+
+def _process_fingerprint(pid):
+    """
+    Start time of a running process, which changes when its PID is reused.
+
+    Returns:
+        str fingerprint, "" if no such process, or None if this platform
+        has no cheap way to tell (no /proc, not Windows)
+    """
+    if os.path.isdir("/proc/self"):
+        try:
+            with open(f"/proc/{int(pid)}/stat", "rb") as f:
+                stat = f.read()
+        except (OSError, ValueError):
+            return ""
+        # Field 22 (starttime); fields after the ")" of comm start at 3
+        fields = stat[stat.rfind(b")") + 2:].split()
+        return fields[19].decode("ascii") if len(fields) > 19 else ""
+    if os.name == "nt":
+        return _windows_process_fingerprint(pid)
+    return None
+
+
+def _windows_process_fingerprint(pid):
+    """Creation time via GetProcessTimes; "" if the process is gone."""
+    try:
+        import ctypes
+        from ctypes import wintypes
+
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(0x1000, False, int(pid))  # QUERY_LIMITED_INFORMATION
+        if not handle:
+            return ""
+        try:
+            exit_code = wintypes.DWORD()
+            if (not kernel32.GetExitCodeProcess(handle, ctypes.byref(exit_code))
+                    or exit_code.value != 259):  # STILL_ACTIVE
+                return ""
+            times = [wintypes.FILETIME() for _ in range(4)]
+            if not kernel32.GetProcessTimes(handle, *map(ctypes.byref, times)):
+                return ""
+            return str((times[0].dwHighDateTime << 32) | times[0].dwLowDateTime)
+        finally:
+            kernel32.CloseHandle(handle)
+    except Exception:
+        return None
+
+
+def _process_alive(pid, fingerprint=None):
+    """
+    True if `pid` is running and, when a fingerprint was recorded at
+    session start, is still the same process.
+    """
+    try:
+        pid = int(pid)
+    except (TypeError, ValueError):
+        return False
+    if pid <= 0:
+        return False
+    current = _process_fingerprint(pid)
+    if current is None:
+        try:
+            os.kill(pid, 0)
+            return True
+        except PermissionError:
+            return True  # exists, owned by another user
+        except OSError:
+            return False
+    return bool(current) and (not fingerprint or current == fingerprint)
 
 
 # -- Public API: Session Lifecycle ------------------------------------------
 
-def get_callsign(session_id, cwd):
+def get_callsign(session_id, cwd, assign=False):
     """
     Generate callsign like CARB-a3f7 from session ID and workspace.
 
     Args:
         session_id: Claude Code session UUID
         cwd: Current working directory
+        assign: Claim the workspace's short code in SHORTCODES_FILE
+            (session_start only; see _resolve_workspace_short)
 
     Returns:
         str: Callsign e.g. "CMH-a3f7"
     """
-    short = _resolve_workspace_short(cwd)
+    short = _resolve_workspace_short(cwd, assign)
     sid_suffix = session_id[:4] if session_id else "0000"
     return f"{short}-{sid_suffix}"
 
 
+@_traced("start")
+@_group_commit
 def session_start(data):
     """
     Register a new session. Called by SessionStart hook.
@@ -180,31 +2405,44 @@ def session_start(data):
         data: Hook input data (session_id, cwd, model, etc.)
 
     Returns:
-        dict with callsign and crash_info (if any)
+        dict with callsign and crash_info: crashes detected since the
+        last session start (by this call if maintenance ran inline)
     """
+    from datetime import datetime
+
+    reply = _broker_call("start", data)
+    if reply is not _NO_BROKER:
+        return reply
+
     _ensure_dirs()
 
     session_id = data.get("session_id", "unknown")
     cwd = data.get("cwd", os.getcwd())
+    # The hook runs in a short-lived process; the session lives as long as
+    # the process that ran it (Claude Code), so that is the one recorded
+    pid = data.get("_owner_pid") or os.getppid()
     model = data.get("model", {})
-    branch = _get_git_branch(cwd)
+    with _span("git"):
+        branch, commit = _get_git_head(cwd)
 
     model_display = (
         model.get("display_name", "Claude")
         if isinstance(model, dict) else str(model)
     )
 
-    callsign = get_callsign(session_id, cwd)
+    with _span("callsign"):
+        callsign = get_callsign(session_id, cwd, assign=True)
     now = datetime.now()
 
-    active = _read_active()
-    active[session_id] = {
+    record = {
         "callsign": callsign,
         "workspace": os.path.basename(cwd.replace("\\", "/").rstrip("/")),
         "workspace_path": cwd.replace("\\", "/"),
         "branch": branch,
+        "commit": commit,
         "model": model_display,
-        "pid": os.getpid(),
+        "pid": pid,
+        "pid_start": _process_fingerprint(pid),
         "started": now.isoformat(),
         "last_heartbeat": now.isoformat(),
         "context_pct": 0,
@@ -212,7 +2450,13 @@ def session_start(data):
         "intent": "",
         "status": "active",
     }
-    _write_active(active)
+    with _span("registry"):
+        with session_transaction(session_id) as current:
+            current.clear()
+            current.update(record)
+    _touch_heartbeat_stamp(session_id, now.timestamp(), callsign)
+    with _span("deadlines"):
+        _schedule_deadline(session_id, _heartbeat_deadline(record))
 
     _write_jsonl_event({
         "event": "start",
@@ -220,13 +2464,15 @@ def session_start(data):
         "callsign": callsign,
         "workspace": os.path.basename(cwd.replace("\\", "/").rstrip("/")),
         "branch": branch,
+        "commit": commit,
         "model": model_display,
-        "pid": os.getpid(),
+        "pid": pid,
         "ts": now.isoformat(),
     })
 
-    crash_info = detect_crashes()
-    cleanup_old_logs()
+    with _span("maintenance"):
+        schedule_maintenance()
+    crash_info = _take_pending_crashes()
 
     return {
         "callsign": callsign,
@@ -235,11 +2481,13 @@ def session_start(data):
     }
 
 
+@_traced("stop")
+@_group_commit
 def session_stop(data):
     """
     Close a session. Called by Stop hook.
 
-    Writes diary entry to SESSION-LOG.md and triggers memory sweep.
+    Writes diary entry to the monthly SESSION-LOG and triggers memory sweep.
 
     Args:
         data: Hook input data
@@ -247,33 +2495,43 @@ def session_stop(data):
     Returns:
         dict with session summary
     """
+    from datetime import datetime
+
+    reply = _broker_call("stop", data)
+    if reply is not _NO_BROKER:
+        return reply
+
     session_id = data.get("session_id", "unknown")
     stop_reason = data.get("stop_reason", "completed")
     cwd = data.get("cwd", os.getcwd())
     now = datetime.now()
 
-    active = _read_active()
-    session = active.get(session_id, {})
+    with _span("registry"), session_transaction(session_id) as current:
+        session = dict(current)
 
-    started_str = session.get("started", now.isoformat())
-    try:
-        started = datetime.fromisoformat(started_str)
-        duration_min = int((now - started).total_seconds() / 60)
-    except Exception:
-        duration_min = 0
+        started_str = session.get("started", now.isoformat())
+        try:
+            started = datetime.fromisoformat(started_str)
+            duration_min = int((now - started).total_seconds() / 60)
+        except Exception:
+            duration_min = 0
 
-    callsign = session.get("callsign", get_callsign(session_id, cwd))
+        if current:
+            current["status"] = "stopped"
+            current["stopped"] = now.isoformat()
+            current["duration_min"] = duration_min
+            current["stop_reason"] = stop_reason
+    _clear_heartbeat_stamp(session_id)
+
+    callsign = session.get("callsign") or get_callsign(session_id, cwd)
     intent = session.get("intent", "")
     branch = session.get("branch", "-")
     model = session.get("model", "Claude")
     compact_count = session.get("compact_count", 0)
-
-    if session_id in active:
-        active[session_id]["status"] = "stopped"
-        active[session_id]["stopped"] = now.isoformat()
-        active[session_id]["duration_min"] = duration_min
-        active[session_id]["stop_reason"] = stop_reason
-        _write_active(active)
+    ws_path = session.get("workspace_path", cwd)
+    # Commit at stop time: where the session's work ended up
+    with _span("git"):
+        commit = _get_git_head(ws_path)[1] or session.get("commit", "")
 
     _write_jsonl_event({
         "event": "stop",
@@ -282,36 +2540,39 @@ def session_stop(data):
         "reason": stop_reason,
         "duration_min": duration_min,
         "compact_count": compact_count,
+        "commit": commit,
         "ts": now.isoformat(),
     })
 
-    # Write diary entry to workspace SESSION-LOG.md
+    # Write diary entry to the workspace's monthly SESSION-LOG
     try:
         start_dt = datetime.fromisoformat(started_str)
         time_range = f"{start_dt.strftime('%H:%M')}-{now.strftime('%H:%M')}"
     except Exception:
         time_range = f"?-{now.strftime('%H:%M')}"
 
-    ws_path = session.get("workspace_path", cwd)
-    write_diary_entry(
-        workspace_path=ws_path,
-        callsign=callsign,
-        session_id=session_id,
-        time_range=time_range,
-        branch=branch,
-        model=model,
-        intent=intent,
-        duration_min=duration_min,
-    )
+    with _span("diary"):
+        write_diary_entry(
+            workspace_path=ws_path,
+            callsign=callsign,
+            session_id=session_id,
+            time_range=time_range,
+            branch=branch,
+            model=model,
+            intent=intent,
+            duration_min=duration_min,
+            commit=commit,
+        )
 
     # Session-Memory Bridge: sweep session context into daily log
-    sweep_session(
-        workspace_path=ws_path,
-        callsign=callsign,
-        duration_min=duration_min,
-        intent=intent,
-        compact_count=compact_count,
-    )
+    with _span("sweep"):
+        sweep_session(
+            workspace_path=ws_path,
+            callsign=callsign,
+            duration_min=duration_min,
+            intent=intent,
+            compact_count=compact_count,
+        )
 
     return {
         "callsign": callsign,
@@ -320,6 +2581,7 @@ def session_stop(data):
     }
 
 
+@_traced("heartbeat")
 def session_heartbeat(data):
     """
     Update heartbeat and context percentage. Throttled to once per 60s.
@@ -335,9 +2597,27 @@ def session_heartbeat(data):
     if not session_id:
         return None
 
-    active = _read_active()
-    session = active.get(session_id)
+    # Fast path: one stat() of the heartbeat stamp, which also holds the
+    # callsign issued at start -- no registry read, no cwd lookup.
+    try:
+        mtime, callsign = _read_heartbeat_stamp(session_id)
+        if callsign and 0 <= time.time() - mtime < HEARTBEAT_THROTTLE_SECONDS:
+            return {"callsign": callsign, "throttled": True}
+    except OSError:
+        pass
+
+    reply = _broker_call("heartbeat", data)
+    if reply is not _NO_BROKER:
+        return reply
+
+    from datetime import datetime
+
+    # Lock-free read for the throttle decision; the registry is replaced
+    # atomically, so this never sees a torn file.
+    with _span("registry_read"):
+        session = _read_session(session_id)
     if not session or session.get("status") != "active":
+        _clear_heartbeat_stamp(session_id)
         return None
 
     now = datetime.now()
@@ -347,6 +2627,9 @@ def session_heartbeat(data):
             session.get("last_heartbeat", "2000-01-01")
         )
         if (now - last_hb).total_seconds() < HEARTBEAT_THROTTLE_SECONDS:
+            # Session predates its stamp: seed it so the next call is cheap.
+            _touch_heartbeat_stamp(session_id, last_hb.timestamp(),
+                                   session.get("callsign", ""))
             return {"callsign": session.get("callsign", ""), "throttled": True}
     except Exception:
         pass
@@ -363,15 +2646,19 @@ def session_heartbeat(data):
         )
         ctx_pct = int(tokens * 100 / size)
 
-    session["last_heartbeat"] = now.isoformat()
-    if ctx_pct >= 0:
-        session["context_pct"] = ctx_pct
-    active[session_id] = session
-    _write_active(active)
+    with _span("registry"), session_transaction(session_id) as session:
+        if session.get("status") != "active":
+            return None
+        session["last_heartbeat"] = now.isoformat()
+        if ctx_pct >= 0:
+            session["context_pct"] = ctx_pct
+    _touch_heartbeat_stamp(session_id, now.timestamp(), session.get("callsign", ""))
 
     return {"callsign": session.get("callsign", ""), "throttled": False}
 
 
+@_traced("compact")
+@_group_commit
 def session_compact(data):
     """
     Log compaction event. Called by PreCompact hook.
@@ -379,15 +2666,18 @@ def session_compact(data):
     Args:
         data: Hook input data
     """
+    from datetime import datetime
+
+    if _broker_call("compact", data) is not _NO_BROKER:
+        return
+
     session_id = data.get("session_id", "unknown")
 
-    active = _read_active()
-    session = active.get(session_id, {})
-    count = session.get("compact_count", 0) + 1
+    with _span("registry"), session_transaction(session_id) as session:
+        count = session.get("compact_count", 0) + 1
 
-    if session_id in active:
-        active[session_id]["compact_count"] = count
-        _write_active(active)
+        if session:
+            session["compact_count"] = count
 
     _write_jsonl_event({
         "event": "compact",
@@ -397,71 +2687,101 @@ def session_compact(data):
     })
 
 
+@_traced("detect_crashes")
+@_group_commit
 def detect_crashes():
     """
-    Find stale active sessions (>10min no heartbeat).
-    Cross-checks PID on Windows. Marks stale as crashed.
+    Find active sessions with no heartbeat for CRASH_THRESHOLD_MINUTES
+    whose process is gone, and mark them crashed.
+
+    Crashes found are also queued for the next session_start() to report.
+    Only sessions whose deadline in deadlines.json has passed are read.
+    The common case -- nothing overdue -- is one read of that small file.
+    A process counts as alive only if its PID exists and its start time
+    matches the one recorded at session start, so a recycled PID does not
+    keep a dead session active.
 
     Returns:
         list of crash info dicts, or empty list
     """
-    active = _read_active()
-    crashes = []
-    now = datetime.now()
-    threshold = timedelta(minutes=CRASH_THRESHOLD_MINUTES)
-
-    for sid, session in list(active.items()):
-        if session.get("status") != "active":
-            continue
+    import heapq
+    from datetime import datetime
 
-        try:
-            last_hb = datetime.fromisoformat(
-                session.get("last_heartbeat", "2000-01-01")
-            )
-            if (now - last_hb) <= threshold:
-                continue
+    now = time.time()
+    with _span("deadlines"):
+        heap = _load_deadlines()
+    if heap is not None and (not heap or heap[0][0] > now):
+        return []
 
-            pid = session.get("pid")
-            pid_alive = False
-            if pid:
+    crashes = []
+    events = []
+    with _span("registry"), _file_lock(_deadlines_lock()):
+        heap = _load_deadlines()
+        if heap is None:
+            heap = _rebuild_deadlines()
+        due = []
+        while heap and heap[0][0] <= now:
+            due.append(heapq.heappop(heap)[1])
+        pending = {sid for _, sid in heap}
+
+        due = [sid for sid in dict.fromkeys(due) if sid not in pending]
+
+        def check(sid, session):
+            if session.get("status") != "active":
+                return
+            deadline = _heartbeat_deadline(session)
+            if deadline > now:
+                heapq.heappush(heap, [deadline, sid])
+                return
+            if _process_alive(session.get("pid"), session.get("pid_start")):
+                heapq.heappush(heap, [now + LIVENESS_RECHECK_SECONDS, sid])
+                return
+
+            crashed_at = datetime.fromtimestamp(now).isoformat()
+            session["status"] = "crashed"
+            session["crashed_at"] = crashed_at
+            crashes.append({
+                "session_id": sid,
+                "callsign": session.get("callsign", ""),
+                "workspace": session.get("workspace", ""),
+                "branch": session.get("branch", ""),
+                "intent": session.get("intent", ""),
+                "last_heartbeat": session.get("last_heartbeat", ""),
+                "started": session.get("started", ""),
+            })
+            events.append({
+                "event": "crash",
+                "session_id": sid,
+                "callsign": session.get("callsign", ""),
+                "workspace": session.get("workspace", ""),
+                "last_heartbeat": session.get("last_heartbeat", ""),
+                "ts": crashed_at,
+            })
+
+        if (len(due) > 1 and _broker_registry is None
+                and storage_backend().rewrites_whole_registry()):
+            # One read-modify-write of active.json for the whole batch
+            with registry_transaction() as active:
+                for sid in due:
+                    try:
+                        check(sid, active.get(sid, {}))
+                    except Exception:
+                        continue
+        else:
+            for sid in due:
                 try:
-                    # Cross-platform PID check
-                    os.kill(int(pid), 0)
-                    pid_alive = True
-                except (OSError, ProcessLookupError, PermissionError):
-                    pid_alive = False
+                    with session_transaction(sid) as session:
+                        check(sid, session)
                 except Exception:
-                    pass  # Can't check, assume dead
-
-            if not pid_alive:
-                active[sid]["status"] = "crashed"
-                active[sid]["crashed_at"] = now.isoformat()
-
-                crashes.append({
-                    "session_id": sid,
-                    "callsign": session.get("callsign", ""),
-                    "workspace": session.get("workspace", ""),
-                    "branch": session.get("branch", ""),
-                    "intent": session.get("intent", ""),
-                    "last_heartbeat": session.get("last_heartbeat", ""),
-                    "started": session.get("started", ""),
-                })
-
-                _write_jsonl_event({
-                    "event": "crash",
-                    "session_id": sid,
-                    "callsign": session.get("callsign", ""),
-                    "workspace": session.get("workspace", ""),
-                    "last_heartbeat": session.get("last_heartbeat", ""),
-                    "ts": now.isoformat(),
-                })
-        except Exception:
-            continue
+                    continue
+        _save_deadlines(heap)
 
-    if crashes:
-        _write_active(active)
+    for crash in crashes:
+        _clear_heartbeat_stamp(crash["session_id"])
+    for event in events:
+        _write_jsonl_event(event)
+    _queue_crashes(crashes)
 
-    _purge_stale_sessions(active)
     return crashes
 
 
@@ -476,11 +2796,16 @@ def set_intent(session_id, intent_text):
     Returns:
         bool: True if session found and updated
     """
-    active = _read_active()
-    if session_id in active:
-        active[session_id]["intent"] = intent_text
-        _write_active(active)
-        return True
+    reply = _broker_call(
+        "intent", {"session_id": session_id, "intent": intent_text}
+    )
+    if reply is not _NO_BROKER:
+        return reply
+
+    with session_transaction(session_id) as session:
+        if session:
+            session["intent"] = intent_text
+            return True
     return False
 
 
@@ -491,7 +2816,14 @@ def get_active_sessions():
     Returns:
         list of active session dicts with session_id included
     """
-    active = _read_active()
+    reply = _broker_call("active", {})
+    if reply is not _NO_BROKER:
+        return reply
+
+    if _broker_registry is None:
+        active = storage_backend().read_active_sessions()
+    else:
+        active = _read_active()
     results = []
     for sid, session in active.items():
         if session.get("status") == "active":
@@ -505,6 +2837,310 @@ def get_machine_id():
     return config.get("machine_id", "unknown") if config else "unknown"
 
 
+# -- Maintenance ------------------------------------------------------------
+#
+# Housekeeping is kept off the common session_start() path. At most once
+# per MAINTENANCE_INTERVAL_SECONDS a start runs the crash check inline --
+# with the deadline heap it reads only overdue sessions, which is cheaper
+# than starting a process. Log retention and registry pruning, which can
+# gzip a month of logs, are handed to a detached `ark_session.py maintain`
+# worker when due. Crashes found by any detect_crashes() call are queued
+# in crashes.pending; each session_start() reports and clears the queue,
+# so every crash is reported exactly once.
+
+def _pending_lock():
+    return PENDING_CRASHES.with_name(PENDING_CRASHES.name + ".lock")
+
+
+def _queue_crashes(crashes):
+    """Append crash info dicts to the pending queue (fail-open)."""
+    if not crashes:
+        return
+    try:
+        with _file_lock(_pending_lock()):
+            with open(PENDING_CRASHES, "a", encoding="utf-8") as f:
+                f.write("".join(json.dumps(c, default=str) + "\n" for c in crashes))
+    except Exception:
+        pass
+
+
+def _take_pending_crashes():
+    """Return and clear queued crashes. An empty queue costs one stat()."""
+    try:
+        if os.stat(PENDING_CRASHES).st_size == 0:
+            return []
+    except OSError:
+        return []
+    crashes = []
+    try:
+        with _file_lock(_pending_lock()):
+            text = PENDING_CRASHES.read_text(encoding="utf-8")
+            PENDING_CRASHES.unlink()
+    except OSError:
+        return []
+    for line in text.splitlines():
+        try:
+            crashes.append(json.loads(line))
+        except ValueError:
+            continue
+    return crashes
+
+
+def run_maintenance():
+    """
+    Crash detection plus throttled log retention and registry pruning,
+    and a federation sync when ARK_FEDERATION_DIR is set. Run by the
+    `maintain` worker. Returns the crashes found.
+    """
+    crashes = detect_crashes()
+    maybe_run_retention()
+    if FEDERATION_SHARED:
+        try:
+            sys.modules.setdefault("ark_session", sys.modules[__name__])
+            import ark_federate
+            ark_federate.sync()
+        except Exception:
+            pass
+    return crashes
+
+
+def _spawn_maintenance():
+    """Start a detached `maintain` worker.
+
+    Returns:
+        The worker's Popen handle, or None if it could not be started.
+    """
+    import subprocess
+
+    kwargs = {}
+    if os.name == "nt":
+        # DETACHED_PROCESS | CREATE_NEW_PROCESS_GROUP
+        kwargs["creationflags"] = 0x00000008 | 0x00000200
+    else:
+        kwargs["start_new_session"] = True
+    try:
+        return subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "maintain"],
+            stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL, close_fds=True, **kwargs
+        )
+    except Exception:
+        return None
+
+
+def schedule_maintenance():
+    """
+    Crash check plus, when due, retention -- at most once per
+    MAINTENANCE_INTERVAL_SECONDS. The common case costs a single stat()
+    of .maintenance; once it is stale, concurrent hooks claim the interval
+    with an exclusive create of .maintenance.<interval>, so one of them
+    runs maintenance (and spawns at most one worker).
+
+    Returns:
+        "skipped", "spawned" (retention handed to a detached worker) or
+        "inline" (nothing else due; or broker, ARK_MAINTENANCE=inline, or
+        the worker could not be started)
+    """
+    now = time.time()
+    try:
+        age = now - os.stat(MAINTENANCE_STAMP).st_mtime
+        if 0 <= age < MAINTENANCE_INTERVAL_SECONDS:
+            return "skipped"
+    except OSError:
+        pass
+    # Hooks that all saw a stale stamp race to claim this interval; an
+    # O_EXCL create lets exactly one of them through
+    slot = int(now // MAINTENANCE_INTERVAL_SECONDS)
+    claim = MAINTENANCE_STAMP.with_name(f"{MAINTENANCE_STAMP.name}.{slot}")
+    try:
+        os.close(os.open(str(claim), os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644))
+    except FileExistsError:
+        return "skipped"
+    except OSError:
+        pass  # fail-open: maintenance still runs
+    try:
+        with open(MAINTENANCE_STAMP, "a"):
+            pass
+        os.utime(MAINTENANCE_STAMP, None)
+        for old in MAINTENANCE_STAMP.parent.glob(MAINTENANCE_STAMP.name + ".*"):
+            if old != claim:
+                old.unlink(missing_ok=True)
+    except OSError:
+        pass
+
+    detect_crashes()
+    if not _retention_due():
+        return "inline"
+    if MAINTENANCE_MODE != "inline" and _broker_registry is None and _spawn_maintenance():
+        return "spawned"
+    maybe_run_retention()
+    return "inline"
+
+
+# -- Session Broker (optional) ----------------------------------------------
+#
+# `python ark_session.py serve` keeps the registry in memory and answers
+# lifecycle requests over a Unix domain socket, flushing registry changes
+# and log events to disk in batches. Hook processes try the socket first
+# and fall back to the direct file path when no broker answers.
+
+_NO_BROKER = object()
+
+
+def _broker_call(op, data):
+    """
+    Send one request to the broker. Returns the broker's result, or
+    _NO_BROKER when none is reachable and the caller should run directly.
+    """
+    if _broker_registry is not None:
+        return _NO_BROKER
+    try:
+        if not os.path.exists(BROKER_SOCKET):
+            return _NO_BROKER
+        import socket
+        if not hasattr(socket, "AF_UNIX"):
+            return _NO_BROKER
+        payload = {"cwd": os.getcwd(), **data, "_owner_pid": os.getppid()}
+        request = json.dumps({"op": op, "data": payload}, default=str)
+        with _span("broker"), socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(BROKER_TIMEOUT_SECONDS)
+            sock.connect(str(BROKER_SOCKET))
+            sock.sendall(request.encode("utf-8") + b"\n")
+            buf = b""
+            while not buf.endswith(b"\n"):
+                chunk = sock.recv(65536)
+                if not chunk:
+                    break
+                buf += chunk
+        reply = json.loads(buf)
+        if reply.get("ok"):
+            return reply.get("result")
+    except Exception:
+        pass
+    return _NO_BROKER
+
+
+def _broker_dispatch(request):
+    """Run one broker request against the in-memory registry."""
+    op = request.get("op")
+    data = request.get("data") or {}
+    if op == "start":
+        return session_start(data)
+    if op == "stop":
+        return session_stop(data)
+    if op == "heartbeat":
+        return session_heartbeat(data)
+    if op == "compact":
+        return session_compact(data)
+    if op == "intent":
+        return set_intent(data.get("session_id", ""), data.get("intent", ""))
+    if op == "active":
+        return get_active_sessions()
+    if op == "flush":
+        _broker_flush()
+        return True
+    if op == "ping":
+        return {
+            "pid": os.getpid(),
+            "sessions": len(_broker_registry),
+            "pending": len(_broker_dirty) + len(_get_event_writer()),
+        }
+    raise ValueError(f"unknown op: {op}")
+
+
+def _broker_flush():
+    """Write dirty sessions and buffered events to disk in one batch."""
+    if _broker_dirty:
+        dirty = set(_broker_dirty)
+        _broker_dirty.clear()
+        with _disk_registry_transaction() as disk:
+            for sid in dirty:
+                if sid in _broker_registry:
+                    disk[sid] = _broker_registry[sid]
+                else:
+                    disk.pop(sid, None)
+            # Adopt anything written by direct-path fallbacks meanwhile
+            _broker_registry.clear()
+            _broker_registry.update(disk)
+
+    _get_event_writer().commit()
+
+
+def serve():
+    """
+    Run the session broker in the foreground until interrupted.
+
+    Returns a process exit code: 0 on clean shutdown, 1 if the platform
+    lacks Unix sockets or another broker already owns the socket.
+    """
+    global _broker_registry
+    import signal
+    import socket
+    import socketserver
+
+    if not hasattr(socket, "AF_UNIX"):
+        print("Unix domain sockets are not available on this platform.")
+        return 1
+
+    _ensure_dirs()
+    path = str(BROKER_SOCKET)
+    if os.path.exists(path):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+            try:
+                probe.connect(path)
+                print(f"Broker already running on {path}")
+                return 1
+            except OSError:
+                os.unlink(path)  # stale socket from a dead broker
+
+    last_flush = [time.monotonic()]
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            try:
+                request = json.loads(self.rfile.readline())
+                reply = {"ok": True, "result": _broker_dispatch(request)}
+            except Exception as exc:
+                reply = {"ok": False, "error": str(exc)}
+            self.wfile.write(
+                json.dumps(reply, default=str).encode("utf-8") + b"\n"
+            )
+
+    class Server(socketserver.UnixStreamServer):
+        def service_actions(self):
+            pending = len(_broker_dirty) + len(events)
+            due = time.monotonic() - last_flush[0] >= BROKER_FLUSH_SECONDS
+            if pending and (due or pending >= BROKER_FLUSH_EVENTS):
+                _broker_flush()
+                last_flush[0] = time.monotonic()
+
+    def _stop(signum, frame):
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGTERM, _stop)
+    events = _get_event_writer()
+    events.max_events = BROKER_FLUSH_EVENTS
+    events.max_delay = BROKER_FLUSH_SECONDS
+    _broker_registry = _read_active()
+    server = Server(path, Handler)
+    print(f"Ark session broker listening on {path}")
+    try:
+        server.serve_forever(poll_interval=0.25)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        try:
+            _broker_flush()
+        finally:
+            _broker_registry = None
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+    return 0
+
+
 # -- Public API: Memory Bridge ----------------------------------------------
 
 def sweep_session(workspace_path, callsign, duration_min, intent="",
@@ -522,8 +3158,10 @@ def sweep_session(workspace_path, callsign, duration_min, intent="",
         intent: Session intent text
         compact_count: Number of compactions during session
     """
+    from datetime import datetime
+
     ws_path = Path(workspace_path.replace("\\", "/"))
-    daily_dir = ws_path / "memory" / "daily"
+    daily_dir = memory_dir(ws_path) / "daily"
 
     # Only write if the memory system is initialized
     if not daily_dir.exists():
@@ -542,48 +3180,255 @@ def sweep_session(workspace_path, callsign, duration_min, intent="",
 
     entry = "\n".join(parts) + "\n"
 
+    # If daily file doesn't exist, skip -- don't create files during sweep
+    if not daily_file.exists():
+        return
+
     try:
-        if daily_file.exists():
-            existing = daily_file.read_text(encoding="utf-8")
-            # Append under Notes section, or at end
-            if "## Notes" in existing:
-                idx = existing.index("## Notes") + len("## Notes")
-                while idx < len(existing) and existing[idx] == "\n":
-                    idx += 1
-                content = existing[:idx] + "\n" + entry + existing[idx:]
+        with _file_lock(_workspace_lock_path(ws_path, "daily")):
+            last_header = _last_line_matching(daily_file, _is_section_header)
+            if last_header is None or last_header.rstrip() == "## Notes":
+                # Notes is the tail section (or absent): append in place
+                size = os.path.getsize(daily_file)
+                with open(daily_file, "rb") as f:
+                    f.seek(max(0, size - 2))
+                    tail = f.read()
+                last_line = _last_line_matching(daily_file, str.strip) or ""
+                text = "\n" if tail and not tail.endswith(b"\n") else ""
+                if last_header is None:
+                    text += "\n## Notes\n\n"
+                elif last_line.rstrip() == "## Notes" and not tail.endswith(b"\n\n"):
+                    text += "\n"
+                text += entry
+                fd = os.open(str(daily_file), os.O_WRONLY | os.O_APPEND)
+                try:
+                    os.write(fd, text.encode("utf-8"))
+                finally:
+                    os.close(fd)
             else:
-                content = existing.rstrip("\n") + "\n\n" + entry
-            daily_file.write_text(content, encoding="utf-8")
-        # If daily file doesn't exist, skip -- don't create files during sweep
+                # Another section follows Notes: splice at the end of Notes
+                existing = daily_file.read_text(encoding="utf-8")
+                lines = existing.splitlines(keepends=True)
+                notes = next((i for i, line in enumerate(lines)
+                              if line.rstrip() == "## Notes"), None)
+                if notes is None:
+                    content = existing.rstrip("\n") + "\n\n## Notes\n\n" + entry
+                else:
+                    end = next((i for i in range(notes + 1, len(lines))
+                                if _is_section_header(lines[i])), len(lines))
+                    while end > notes + 1 and not lines[end - 1].strip():
+                        end -= 1
+                    gap = "\n" if end == notes + 1 else ""
+                    content = "".join(lines[:end]) + gap + entry + "".join(lines[end:])
+                _atomic_write_text(daily_file, content)
     except Exception:
         pass
 
 
 # -- Internal: Diary + Cleanup ---------------------------------------------
 
+# Diary layout (per workspace, under .claude/tracker/sessions/):
+#   SESSION-LOG-YYYY-MM.md   entries for one month, oldest first, append-only
+#   SESSION-LOG.md           small index linking the monthly files
+# A stop appends one entry to the current month; the index is rewritten
+# only when a new month file appears.
+
+DIARY_INDEX_MARKER = "<!-- ark:diary-index -->"
+
+
+def _diary_dir(workspace_path):
+    return Path(workspace_path.replace("\\", "/")) / ".claude" / "tracker" / "sessions"
+
+
+def _diary_month_file(diary_dir, month):
+    return diary_dir / f"SESSION-LOG-{month}.md"
+
+
+def _is_day_header(line):
+    day = line[3:].strip()
+    return (line.startswith("## ") and len(day) == 10
+            and day[4] == "-" and day[7] == "-" and day.replace("-", "").isdigit())
+
+
+def _last_diary_day(path):
+    """The last '## YYYY-MM-DD' header in a diary file."""
+    line = _last_line_matching(path, _is_day_header)
+    return line[3:].strip() if line else None
+
+
+def _parse_diary(text):
+    """
+    Split diary markdown into (preamble, {day: [blocks]}).
+
+    A day's blocks are any lead text under its header followed by one block
+    per '### ' entry, each with trailing whitespace stripped, in file order.
+    The preamble is everything before the first day header except a
+    leading '# ' title line and the index marker.
+    """
+    preamble, days, day, block = [], {}, None, None
+    lines = text.splitlines()
+    if lines and lines[0].startswith("# "):
+        lines = lines[1:]
+
+    def close():
+        if day is not None and block is not None:
+            chunk = "\n".join(block).rstrip()
+            if chunk.strip():
+                days.setdefault(day, []).append(chunk)
+
+    for line in lines:
+        if _is_day_header(line):
+            close()
+            day, block = line[3:].strip(), []
+            days.setdefault(day, [])
+        elif day is None:
+            if line.strip() != DIARY_INDEX_MARKER:
+                preamble.append(line)
+        elif line.startswith("### "):
+            close()
+            block = [line]
+        else:
+            block.append(line)
+    close()
+    return "\n".join(preamble).strip(), days
+
+
+def _render_diary_month(month, days):
+    parts = [f"# Session Log {month}\n"]
+    for day in sorted(days):
+        parts.append(f"\n## {day}\n")
+        for chunk in days[day]:
+            parts.append(f"\n{chunk}\n")
+    return "".join(parts)
+
+
+def _write_diary_index(diary_dir, preamble=None):
+    """Rewrite SESSION-LOG.md as a list of monthly files, newest first."""
+    index_file = diary_dir / "SESSION-LOG.md"
+    if preamble is None:
+        try:
+            preamble = _parse_diary(index_file.read_text(encoding="utf-8"))[0]
+        except OSError:
+            preamble = ""
+        # Drop the generated month list; keep anything hand-written
+        preamble = "\n".join(
+            line for line in preamble.splitlines()
+            if not (line.startswith("- [") and "](SESSION-LOG-" in line)
+        ).strip()
+    months = sorted(
+        (p.name[len("SESSION-LOG-"):-len(".md")] for p in diary_dir.glob("SESSION-LOG-*.md")),
+        reverse=True,
+    )
+    text = f"# Session Log\n{DIARY_INDEX_MARKER}\n"
+    if preamble:
+        text += f"\n{preamble}\n"
+    text += "\n" + "".join(
+        f"- [{m}](SESSION-LOG-{m}.md)\n" for m in months
+    )
+    _atomic_write_text(index_file, text)
+
+
+def _is_legacy_diary(index_file):
+    """True if SESSION-LOG.md holds entries (pre-rolling layout)."""
+    try:
+        text = index_file.read_text(encoding="utf-8")
+    except OSError:
+        return False
+    return DIARY_INDEX_MARKER not in text and bool(_parse_diary(text)[1])
+
+
+def migrate_diary(workspace_path):
+    """
+    Convert a single-file SESSION-LOG.md into monthly files plus an index.
+
+    The legacy file kept the newest day and the newest entry on top; the
+    monthly files are chronological, so both orders are reversed. Entries
+    are merged into any monthly files that already exist. Before the index
+    replaces SESSION-LOG.md, the monthly files are re-read and every legacy
+    entry must be present verbatim; otherwise nothing is changed.
+
+    Returns:
+        number of entries migrated, 0 if there was nothing to migrate,
+        -1 if verification failed
+    """
+    diary_dir = _diary_dir(workspace_path)
+    index_file = diary_dir / "SESSION-LOG.md"
+    with _file_lock(_workspace_lock_path(diary_dir, "diary")):
+        if not _is_legacy_diary(index_file):
+            return 0
+        preamble, legacy = _parse_diary(index_file.read_text(encoding="utf-8"))
+
+        by_month = {}
+        for day, chunks in legacy.items():
+            by_month.setdefault(day[:7], {})[day] = list(reversed(chunks))
+
+        originals = {}
+        for month, days in by_month.items():
+            month_file = _diary_month_file(diary_dir, month)
+            try:
+                originals[month] = month_file.read_text(encoding="utf-8")
+            except OSError:
+                originals[month] = None
+            if originals[month] is not None:
+                for day, chunks in _parse_diary(originals[month])[1].items():
+                    days[day] = days.get(day, []) + chunks
+            _atomic_write_text(month_file, _render_diary_month(month, days))
+
+        # Verify: every legacy entry is in the month files, nothing dropped
+        migrated = {}
+        for month in by_month:
+            text = _diary_month_file(diary_dir, month).read_text(encoding="utf-8")
+            for day, chunks in _parse_diary(text)[1].items():
+                migrated.setdefault(day, []).extend(chunks)
+        total = 0
+        for day, chunks in legacy.items():
+            remaining = list(migrated.get(day, []))
+            for chunk in chunks:
+                if chunk not in remaining:
+                    for month, original in originals.items():
+                        month_file = _diary_month_file(diary_dir, month)
+                        if original is None:
+                            month_file.unlink()
+                        else:
+                            _atomic_write_text(month_file, original)
+                    return -1
+                remaining.remove(chunk)
+                total += 1
+
+        _write_diary_index(diary_dir, preamble)
+        return total
+
+
 def write_diary_entry(workspace_path, callsign, session_id, time_range,
                       branch, model, intent="", outcome="", key_files="",
-                      notes="", duration_min=0):
+                      notes="", duration_min=0, commit=""):
     """
-    Append entry to workspace SESSION-LOG.md (portable, git-tracked).
-    Branch name serves as cross-machine correlation key.
+    Append entry to the workspace's monthly SESSION-LOG-YYYY-MM.md
+    (portable, git-tracked). Branch name and commit SHA serve as
+    cross-machine correlation keys.
+
+    The entry (plus a day header if it is the first of the day) goes out
+    in one O_APPEND write; earlier history is never read or rewritten.
+    A legacy single-file SESSION-LOG.md is migrated on first use.
     """
-    ws_path = Path(workspace_path.replace("\\", "/"))
-    diary_dir = ws_path / ".claude" / "tracker" / "sessions"
-    diary_file = diary_dir / "SESSION-LOG.md"
+    from datetime import datetime
 
+    diary_dir = _diary_dir(workspace_path)
     try:
         diary_dir.mkdir(parents=True, exist_ok=True)
     except Exception:
         return
 
-    today = datetime.now().strftime("%Y-%m-%d")
-    sid_short = session_id[:8] if len(session_id) > 8 else session_id
+    now = datetime.now()
+    today = now.strftime("%Y-%m-%d")
+    month_file = _diary_month_file(diary_dir, today[:7])
 
     lines = []
     lines.append(f"### {callsign} | {time_range} | {branch} | {model}")
     if duration_min > 0:
         lines.append(f"**Duration**: {duration_min} min")
+    if commit:
+        lines.append(f"**Commit**: {commit[:12]}")
     if intent:
         lines.append(f"**Intent**: {intent}")
     if outcome:
@@ -592,58 +3437,448 @@ def write_diary_entry(workspace_path, callsign, session_id, time_range,
         lines.append(f"**Key files**: {key_files}")
     if notes:
         lines.append(f"**Notes**: {notes}")
-    lines.append("")
-    entry_text = "\n".join(lines)
+    entry_text = "\n".join(lines) + "\n"
 
     try:
-        existing = ""
-        if diary_file.exists():
-            existing = diary_file.read_text(encoding="utf-8")
+        if _is_legacy_diary(diary_dir / "SESSION-LOG.md"):
+            migrate_diary(workspace_path)
+
+        with _file_lock(_workspace_lock_path(diary_dir, "diary")):
+            new_month = not month_file.exists()
+            text = f"# Session Log {today[:7]}\n" if new_month else ""
+            if new_month or _last_diary_day(month_file) != today:
+                text += f"\n## {today}\n"
+            text += f"\n{entry_text}"
+
+            fd = os.open(str(month_file), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+            try:
+                os.write(fd, text.encode("utf-8"))
+            finally:
+                os.close(fd)
+            if new_month or not (diary_dir / "SESSION-LOG.md").exists():
+                _write_diary_index(diary_dir)
+    except Exception:
+        pass
+
+
+# Log retention tiers:
+#   raw        log/YYYY-MM-DD.jsonl          newer than JSONL_MAX_DAYS
+#   bundled    log/archive/YYYY-MM.jsonl.gz  newer than LOG_ARCHIVE_MONTHS
+#   deleted    anything older, or oldest-first beyond LOG_MAX_BYTES
+
+def _log_day_files():
+    """Raw daily logs as sorted [(day, path)]."""
+    days = []
+    for path in LOG_DIR.glob("*.jsonl"):
+        day = path.stem
+        if len(day) == 10 and day[4] == "-" and day[7] == "-":
+            days.append((day, path))
+    return sorted(days)
+
 
-        if not existing.strip():
-            content = f"# Session Log\n\n## {today}\n\n{entry_text}"
+def _log_bundles():
+    """Monthly bundles as sorted [(month, path)]."""
+    if not LOG_ARCHIVE_DIR.is_dir():
+        return []
+    return sorted(
+        (p.name[:7], p) for p in LOG_ARCHIVE_DIR.glob("*.jsonl.gz")
+    )
+
+
+def _month_shift(month, delta):
+    """'YYYY-MM' shifted by delta months."""
+    year, mon = int(month[:4]), int(month[5:7])
+    index = year * 12 + (mon - 1) + delta
+    return f"{index // 12:04d}-{index % 12 + 1:02d}"
+
+
+def _gzip_member_names(path):
+    """
+    Original file name (the gzip FNAME header) of each member of a gzip
+    file, "" for a member without one. Members are decompressed only to
+    find where the next one starts; the data is discarded.
+    """
+    return [name for name, _ in _gzip_members(path)]
+
+
+def _gzip_members(path, keep_data=False):
+    """
+    Yield (name, data) for each member of a gzip file: its FNAME header
+    ("" if none) and, with keep_data, its decompressed bytes (else None).
+    """
+    import zlib
+
+    with open(path, "rb") as f:
+        buf = b""
+
+        def fill(predicate):
+            nonlocal buf
+            while not predicate(buf):
+                chunk = f.read(65536)
+                if not chunk:
+                    raise EOFError(f"truncated gzip member in {path}")
+                buf += chunk
+
+        def take(n):
+            nonlocal buf
+            fill(lambda b: len(b) >= n)
+            out, buf = buf[:n], buf[n:]
+            return out
+
+        def take_zstring():
+            nonlocal buf
+            fill(lambda b: b"\0" in b)
+            out, _, buf = buf.partition(b"\0")
+            return out
+
+        while True:
+            if not buf:
+                buf = f.read(65536)
+            if not buf.strip(b"\0"):
+                return  # end of file (trailing zero padding is allowed)
+            header = take(10)
+            if header[:2] != b"\x1f\x8b":
+                raise ValueError(f"not a gzip member in {path}")
+            flags = header[3]
+            if flags & 4:  # FEXTRA
+                take(int.from_bytes(take(2), "little"))
+            name = take_zstring().decode("latin-1") if flags & 8 else ""
+            if flags & 16:  # FCOMMENT
+                take_zstring()
+            if flags & 2:  # FHCRC
+                take(2)
+            inflate = zlib.decompressobj(-zlib.MAX_WBITS)
+            chunks = []
+            while not inflate.eof:
+                if not buf:
+                    buf = f.read(65536)
+                    if not buf:
+                        raise EOFError(f"truncated gzip member in {path}")
+                chunk = inflate.decompress(buf, 1 << 20)
+                if keep_data:
+                    chunks.append(chunk)
+                buf = inflate.unconsumed_tail
+            buf = inflate.unused_data
+            take(8)  # CRC32 + ISIZE
+            yield name, b"".join(chunks) if keep_data else None
+
+
+def _bundle_days(month):
+    """
+    Days already folded into a month's bundle. Each day is a gzip member
+    named after its raw file (YYYY-MM-DD.jsonl), so the bundle itself is
+    the record. Bundles written before per-day members keep their day list
+    in archive/index.json, which is still consulted for them.
+    """
+    bundle = LOG_ARCHIVE_DIR / f"{month}.jsonl.gz"
+    if not bundle.exists():
+        return set()
+    days, legacy = set(), False
+    for name in _gzip_member_names(bundle):
+        day = name[:-len(".jsonl")] if name.endswith(".jsonl") else ""
+        if len(day) == 10 and day.startswith(month):
+            days.add(day)
         else:
-            date_header = f"## {today}"
-            if date_header in existing:
-                idx = existing.index(date_header) + len(date_header)
-                while idx < len(existing) and existing[idx] == "\n":
-                    idx += 1
-                content = existing[:idx] + "\n" + entry_text + existing[idx:]
-            else:
-                if "# Session Log" in existing:
-                    title_end = existing.index(
-                        "\n", existing.index("# Session Log")
-                    ) + 1
-                else:
-                    title_end = 0
-                content = (
-                    existing[:title_end]
-                    + f"\n## {today}\n\n{entry_text}"
-                    + existing[title_end:]
-                )
+            legacy = True
+    if legacy:
+        try:
+            index = json.loads(
+                (LOG_ARCHIVE_DIR / "index.json").read_text(encoding="utf-8")
+            )
+            days.update(index.get(month, []))
+        except Exception:
+            pass
+    return days
 
-        diary_file.write_text(content, encoding="utf-8")
-    except Exception:
-        pass
+
+def _bundle_month(month, day_files):
+    """
+    Fold raw day files into the month's gzip bundle, then delete them.
+
+    Each day is appended as its own gzip member named after the day file;
+    the existing members are copied without recompressing. The new bundle
+    is written to a temp file, flushed to disk and swapped in with one
+    rename, which publishes the data and the day list together -- before
+    any raw day is deleted. A crash at any point therefore either leaves
+    the old bundle (the days are bundled again next run) or the new one
+    (the days are recognised and only deleted), never a day twice.
+    """
+    import gzip
+    import shutil
+
+    LOG_ARCHIVE_DIR.mkdir(parents=True, exist_ok=True)
+    bundle = LOG_ARCHIVE_DIR / f"{month}.jsonl.gz"
+    done = _bundle_days(month)
+    todo = [(day, path) for day, path in day_files if day not in done]
+    if todo:
+        tmp = bundle.with_name(f"{bundle.name}.{os.getpid()}.tmp")
+        with open(tmp, "wb") as out:
+            if bundle.exists():
+                with open(bundle, "rb") as existing:
+                    shutil.copyfileobj(existing, out)
+            for day, path in todo:
+                with open(path, "rb") as f, \
+                        gzip.GzipFile(f"{day}.jsonl", "wb", fileobj=out) as member:
+                    shutil.copyfileobj(f, member)
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(tmp, bundle)
+    for _, path in day_files:
+        path.unlink(missing_ok=True)
 
 
 def cleanup_old_logs():
-    """Delete JSONL log files older than 30 days."""
+    """
+    Apply the log retention policy.
+
+    Raw daily logs older than JSONL_MAX_DAYS are folded into gzip monthly
+    bundles under log/archive/, bundles older than LOG_ARCHIVE_MONTHS are
+    deleted, and if raw logs plus bundles still exceed LOG_MAX_BYTES the
+    oldest bundles (then the oldest raw days, never today) go first.
+    Then the postings indexes of the remaining raw days are pruned and
+    brought up to date. Records the run in log/.retention for
+    maybe_run_retention().
+
+    One pass runs at a time: a run that finds log/archive/.retention.lock
+    held returns at once, as the holder is doing the same work.
+
+    Returns:
+        False if another pass was running, else True
+    """
     if not LOG_DIR.exists():
-        return
-    cutoff = datetime.now() - timedelta(days=JSONL_MAX_DAYS)
-    for log_file in LOG_DIR.glob("*.jsonl"):
+        return True
+    try:
+        LOG_ARCHIVE_DIR.mkdir(parents=True, exist_ok=True)
+    except OSError:
+        pass
+    with _file_lock(LOG_ARCHIVE_DIR / ".retention.lock", timeout=0) as locked:
+        if locked:
+            _cleanup_old_logs()
+    return locked
+
+
+def _cleanup_old_logs():
+    """cleanup_old_logs() under the retention lock."""
+    for stale in LOG_ARCHIVE_DIR.glob("*.tmp"):
+        stale.unlink(missing_ok=True)  # a bundle pass that died midway
+    now = time.time()
+    today = time.strftime("%Y-%m-%d", time.localtime(now))
+    cutoff = time.strftime(
+        "%Y-%m-%d", time.localtime(now - JSONL_MAX_DAYS * 86400)
+    )
+
+    # Tier 1 -> 2: compress aged raw days into monthly bundles
+    by_month = {}
+    for day, path in _log_day_files():
+        if day < cutoff:
+            by_month.setdefault(day[:7], []).append((day, path))
+    for month, day_files in sorted(by_month.items()):
         try:
-            date_str = log_file.stem
-            file_date = datetime.strptime(date_str, "%Y-%m-%d")
-            if file_date < cutoff:
-                log_file.unlink()
+            _bundle_month(month, day_files)
         except Exception:
             continue
 
+    # Tier 2 -> gone: drop bundles past the archive window
+    oldest_kept = _month_shift(today[:7], -LOG_ARCHIVE_MONTHS)
+    for month, path in _log_bundles():
+        if month < oldest_kept:
+            try:
+                path.unlink()
+            except OSError:
+                pass
+
+    # Byte cap: oldest bundles first, then oldest raw days
+    candidates = [p for _, p in _log_bundles()]
+    candidates += [p for day, p in _log_day_files() if day != today]
+    sizes = {}
+    for path in candidates:
+        try:
+            sizes[path] = path.stat().st_size
+        except OSError:
+            sizes[path] = 0
+    total = sum(sizes.values())
+    for path in candidates:
+        if total <= LOG_MAX_BYTES:
+            break
+        try:
+            path.unlink()
+            total -= sizes[path]
+        except OSError:
+            pass
 
-def _purge_stale_sessions(active):
-    """Remove old stopped/crashed sessions beyond last 50."""
+    prune_log_indexes()
+    try:
+        # Index whatever no writer did (older writers, interrupted commits)
+        sys.modules.setdefault("ark_session", sys.modules[__name__])
+        import ark_events
+        ark_events.update_indexes()
+    except Exception:
+        pass
+
+    try:
+        RETENTION_STAMP.touch()
+        os.utime(RETENTION_STAMP, (now, now))
+    except OSError:
+        pass
+
+
+def prune_log_indexes():
+    """
+    Delete postings files whose raw day log no longer exists, and the JSON
+    sidecars of the earlier index format.
+    """
+    removed = 0
+    if not LOG_INDEX_DIR.is_dir():
+        return removed
+    for index_file in LOG_INDEX_DIR.iterdir():
+        if index_file.suffix not in (".idx", ".json"):
+            continue
+        if (index_file.suffix == ".json"
+                or not (LOG_DIR / f"{index_file.name[:10]}.jsonl").exists()):
+            try:
+                index_file.unlink()
+                removed += 1
+            except OSError:
+                pass
+    return removed
+
+
+def _retention_due():
+    try:
+        age = time.time() - os.stat(RETENTION_STAMP).st_mtime
+        return not 0 <= age < RETENTION_INTERVAL_SECONDS
+    except OSError:
+        return True
+
+
+def maybe_run_retention():
+    """
+    Run the storage backend's retention (cleanup_old_logs() for files) at
+    most once per RETENTION_INTERVAL_SECONDS. The common case costs a
+    single stat() of log/.retention.
+    """
+    if not _retention_due():
+        return False
+    storage_backend().maintain()
+    # Stopped/crashed sessions are pruned here rather than on every
+    # detect_crashes(), which no longer loads the whole registry
+    with registry_transaction() as active:
+        _prune_inactive(active)
+    return True
+
+
+def iter_log_files():
+    """
+    All event log files oldest first: gzip monthly bundles, then raw days.
+    Open them with open_log().
+    """
+    return [p for _, p in _log_bundles()] + [p for _, p in _log_day_files()]
+
+
+def open_log(path):
+    """Open a raw (.jsonl) or bundled (.jsonl.gz) log for text reading."""
+    if str(path).endswith(".gz"):
+        import gzip
+        return gzip.open(path, "rt", encoding="utf-8")
+    return open(path, encoding="utf-8")
+
+
+def iter_events():
+    """Yield every logged event (dict), oldest first, across all tiers."""
+    yield from storage_backend().iter_events()
+
+
+def _iter_file_events():
+    """iter_events() over the JSONL log files."""
+    for path in iter_log_files():
+        try:
+            with open_log(path) as f:
+                for line in f:
+                    if line.strip():
+                        try:
+                            yield json.loads(line)
+                        except ValueError:
+                            continue
+        except OSError:
+            continue
+
+
+def _parse_lines(data):
+    """Events (dicts) of the complete JSONL lines in `data` (bytes)."""
+    for raw in data[:data.rfind(b"\n") + 1].splitlines():
+        try:
+            yield json.loads(raw)
+        except ValueError:
+            continue
+
+
+def _file_events_since(cursor):
+    """
+    FileBackend.events_since(): the cursor holds a byte offset per raw day
+    ("days") and the size of each bundle already read ("bundles"). A day
+    bundled before all of it was read is resumed at its offset inside the
+    bundle's member for that day; "bundled" is the newest day taken from
+    a bundle, so older members are skipped. Bundles written before
+    per-day members are read only by a fresh cursor.
+    """
+    if cursor.get("backend") != "file":
+        cursor.clear()
+        cursor.update({"backend": "file", "days": {}, "bundles": {}, "bundled": ""})
+    days, bundles = cursor["days"], cursor["bundles"]
+    raw = dict(_log_day_files())
+    fresh = not days and not bundles
+
+    present = set()
+    for month, bundle in _log_bundles():
+        present.add(month)
+        try:
+            size = bundle.stat().st_size
+            if bundles.get(month) == size:
+                continue
+            members = list(_gzip_members(bundle, keep_data=True))
+        except (OSError, ValueError, EOFError):
+            continue
+        for name, data in members:
+            day = name[:-len(".jsonl")] if name.endswith(".jsonl") else ""
+            if not day:
+                if fresh:
+                    yield from _parse_lines(data)
+                continue
+            if day in raw:
+                continue  # bundling interrupted: still read as a raw day
+            start = days.pop(day, None)
+            if start is None and day <= cursor["bundled"]:
+                continue  # read before
+            yield from _parse_lines(data[start or 0:])
+            cursor["bundled"] = max(cursor["bundled"], day)
+        bundles[month] = size
+    for month in [m for m in bundles if m not in present]:
+        del bundles[month]
+
+    for day, path in raw.items():
+        start = days.get(day, 0)
+        try:
+            size = path.stat().st_size
+            if size == start:
+                continue
+            if size < start:
+                start = 0  # rewritten since the cursor was advanced
+            with open(path, "rb") as f:
+                f.seek(start)
+                data = f.read()
+        except OSError:
+            continue
+        days[day] = start + data.rfind(b"\n") + 1
+        yield from _parse_lines(data)
+    for day in [d for d in days if d not in raw]:
+        del days[day]  # deleted by retention without being bundled
+
+
+def _prune_inactive(active):
+    """
+    Drop old stopped/crashed sessions beyond the last 50 from `active` in
+    place. Returns the number removed; the caller persists the result.
+    """
     inactive = [
         (sid, s) for sid, s in active.items()
         if s.get("status") in ("stopped", "crashed")
@@ -656,13 +3891,67 @@ def _purge_stale_sessions(active):
         )
         for sid, _ in inactive[:-50]:
             del active[sid]
+        return len(inactive) - 50
+    return 0
+
+
+def _purge_stale_sessions(active):
+    """
+    Remove old stopped/crashed sessions beyond last 50 and write the result.
+    Callers holding registry_transaction() should use _prune_inactive().
+    """
+    if _prune_inactive(active):
         _write_active(active)
 
 
+# -- Hook Entry Point -------------------------------------------------------
+#
+# `python -m ark_session hook <event>` (or `python ark_session.py hook
+# <event>`) reads the hook JSON from stdin and calls the matching lifecycle
+# function. Only the HOOK_IMPORTS modules load at import time; everything
+# else is imported by the code path that needs it, so a throttled StatusLine
+# heartbeat loads nothing beyond them (see test_full.py).
+
+HOOK_EVENTS = {
+    "start": "session_start",
+    "SessionStart": "session_start",
+    "stop": "session_stop",
+    "Stop": "session_stop",
+    "heartbeat": "session_heartbeat",
+    "StatusLine": "session_heartbeat",
+    "compact": "session_compact",
+    "PreCompact": "session_compact",
+}
+
+# The module's top-level imports -- keep in step with the import block.
+HOOK_IMPORTS = ("json", "os", "sys", "time", "abc", "contextlib", "functools", "pathlib")
+
+
+def run_hook(event, stream=None):
+    """
+    Dispatch one hook event read from `stream` (default stdin).
+
+    Prints the lifecycle function's result as one JSON line when it returns
+    something. Always returns exit code 0 -- hooks are fail-open.
+    """
+    try:
+        func = globals()[HOOK_EVENTS[event]]
+        raw = (stream or sys.stdin).read()
+        data = json.loads(raw) if raw.strip() else {}
+        result = func(data)
+        if result is not None:
+            print(json.dumps(result, default=str))
+    except Exception:
+        pass
+    return 0
+
+
 # -- Self-Test --------------------------------------------------------------
 
 def _self_test():
     """Run basic self-tests."""
+    from datetime import datetime
+
     print("Ark Session Manager -- Self Test")
     print("=" * 40)
 
@@ -729,8 +4018,68 @@ def _self_test():
 
 
 if __name__ == "__main__":
-    if "--test" in sys.argv:
+    if sys.argv[1:2] == ["hook"] and len(sys.argv) > 2:
+        sys.exit(run_hook(sys.argv[2]))
+    elif "--test" in sys.argv:
         _self_test()
+    elif sys.argv[1:2] == ["serve"]:
+        sys.exit(serve())
+    elif sys.argv[1:2] in (["events"], ["stats"], ["search"], ["ids"], ["demote"],
+                           ["federate"], ["trace"]):
+        # Tool subcommands live in sibling modules that import ark_session;
+        # alias __main__ so they share this module's state
+        sys.modules.setdefault("ark_session", sys.modules[__name__])
+        tool = __import__(f"ark_{sys.argv[1]}")
+        sys.exit(tool.main(sys.argv[2:]))
+    elif sys.argv[1:2] == ["migrate-registry"]:
+        if "--wal" in sys.argv[2:]:
+            migrated = migrate_registry_to_wal()
+            if migrated < 0:
+                print(f"Registry already uses {REGISTRY_WAL} or shards")
+            else:
+                print(f"Migrated {migrated} sessions to {REGISTRY_WAL}")
+            sys.exit(0)
+        migrated = migrate_registry_to_shards()
+        if migrated < 0:
+            print(f"Registry already sharded: {SHARD_DIR}")
+        else:
+            print(f"Migrated {migrated} sessions to {SHARD_DIR}")
+    elif sys.argv[1:2] == ["migrate-storage"]:
+        # Import the JSONL log into the configured (non-file) backend
+        backend = storage_backend()
+        if backend is _FILE_BACKEND:
+            print("Storage backend is 'file' (set storage: sqlite in "
+                  f"{MACHINE_CONFIG}); nothing to migrate")
+            sys.exit(0)
+        imported = backend.import_file_events()
+        if imported < 0:
+            print(f"Events already imported into {backend.name} storage")
+        else:
+            print(f"Imported {imported} events into {backend.name} storage")
+    elif sys.argv[1:2] == ["config"]:
+        # Check machine.local.yaml: prints the parsed config or the error
+        try:
+            config = load_config(sys.argv[2] if len(sys.argv) > 2 else None)
+        except ConfigError as e:
+            print(f"Config error: {e}")
+            sys.exit(1)
+        shown = {k: v for k, v in config.items() if k != "_workspaces"}
+        print(json.dumps(shown, indent=2, default=str))
+    elif sys.argv[1:2] == ["maintain"]:
+        crashes = run_maintenance()
+        print(f"Maintenance done: {len(crashes)} crash(es) queued")
+    elif sys.argv[1:2] == ["migrate-diary"]:
+        status = 0
+        for ws in sys.argv[2:] or [os.getcwd()]:
+            migrated = migrate_diary(ws)
+            if migrated < 0:
+                print(f"{ws}: verification failed, SESSION-LOG.md left unchanged")
+                status = 1
+            elif migrated == 0:
+                print(f"{ws}: nothing to migrate")
+            else:
+                print(f"{ws}: migrated {migrated} entries to monthly files")
+        sys.exit(status)
     else:
         print("Ark Session Manager module. Use --test for self-test.")
         print(f"Sessions dir: {SESSIONS_DIR}")
@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+"""
+Ark Session Manager -- SQLite Storage Backend
+==============================================
+Registry and event log in one SQLite database, selected in
+machine.local.yaml:
+
+    storage: sqlite
+    storage: {backend: sqlite, path: ~/.claude/sessions/ark.db}
+
+The database runs in WAL journal mode, so lock-free readers never block
+the hook that is writing. Registry transactions are BEGIN IMMEDIATE
+transactions: concurrent hooks queue on SQLite's write lock (up to
+LOCK_TIMEOUT_SECONDS) instead of on active.json.lock. Each session is one
+row with its JSON record, plus indexed callsign, workspace and status
+columns. Each event is one row with indexed session_id, callsign,
+workspace, event and ts columns, so queries over months of history are
+index lookups rather than file scans. The row id doubles as the cursor
+for incremental readers (ark_stats, ark_federate export).
+
+A new database adopts the file registry on first open, so live sessions
+survive the switch. `python ark_session.py migrate-storage` also imports
+the JSONL event log.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import ark_session
+
+SCHEMA_VERSION = 1
+DEFAULT_DB = "ark.db"  # in SESSIONS_DIR
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id  TEXT PRIMARY KEY,
+    callsign    TEXT,
+    workspace   TEXT,
+    status      TEXT,
+    record      TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_callsign ON sessions(callsign);
+CREATE INDEX IF NOT EXISTS sessions_workspace ON sessions(workspace);
+CREATE INDEX IF NOT EXISTS sessions_status ON sessions(status);
+
+CREATE TABLE IF NOT EXISTS events (
+    id          INTEGER PRIMARY KEY,
+    ts          TEXT,
+    event       TEXT,
+    session_id  TEXT,
+    callsign    TEXT,
+    workspace   TEXT,
+    machine     TEXT,
+    data        TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_ts ON events(ts);
+CREATE INDEX IF NOT EXISTS events_session ON events(session_id, ts);
+CREATE INDEX IF NOT EXISTS events_callsign ON events(callsign, ts);
+CREATE INDEX IF NOT EXISTS events_workspace ON events(workspace, ts);
+CREATE INDEX IF NOT EXISTS events_event ON events(event, ts);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key         TEXT PRIMARY KEY,
+    value       TEXT
+);
+"""
+
+EVENT_COLUMNS = ("ts", "event", "session_id", "callsign", "workspace", "machine")
+INSERT_SESSION = "INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?, ?)"
+INSERT_EVENT = (f"INSERT INTO events ({', '.join(EVENT_COLUMNS)}, data) "
+                f"VALUES ({', '.join('?' * (len(EVENT_COLUMNS) + 1))})")
+
+
+def _dump(record):
+    return json.dumps(record, separators=(",", ":"), sort_keys=True, default=str)
+
+
+def _session_row(session_id, record):
+    return (session_id, record.get("callsign"), record.get("workspace"),
+            record.get("status"), _dump(record))
+
+
+def _event_row(event):
+    return tuple(
+        None if event.get(col) is None else str(event.get(col))
+        for col in EVENT_COLUMNS
+    ) + (json.dumps(event, default=str),)
+
+
+class SQLiteEventWriter(ark_session.EventWriter):
+    """
+    EventWriter that commits its buffer as one INSERT transaction. Size,
+    age and fsync ("event" commits every append) thresholds work as for
+    the JSONL writer.
+    """
+
+    def __init__(self, backend, **kwargs):
+        super().__init__(**kwargs)
+        self.backend = backend
+
+    def append(self, event):
+        self._buffer.append(event)
+        if self._oldest is None:
+            self._oldest = time.monotonic()
+        if self.fsync == "event" or self.due():
+            self.commit()
+
+    def commit(self):
+        if not self._buffer:
+            return
+        events, self._buffer, self._oldest = self._buffer, [], None
+        try:
+            self.backend.insert_events(events)
+        except Exception:
+            pass  # fail-open: logging must never break a hook
+
+    def close_file(self):
+        pass
+
+
+class SQLiteBackend(ark_session.StorageBackend):
+    """
+    Registry and events in a SQLite database (default SESSIONS_DIR/ark.db).
+
+    Connections are per thread: SQLite serializes writers across threads
+    and processes alike.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path=None):
+        self.path = str(path or ark_session.SESSIONS_DIR / DEFAULT_DB)
+        self._local = threading.local()
+
+    # -- Connection ---------------------------------------------------------
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=ark_session.LOCK_TIMEOUT_SECONDS,
+                                   isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            sync = "FULL" if ark_session.EVENT_FSYNC in ("batch", "event") else "NORMAL"
+            conn.execute(f"PRAGMA synchronous={sync}")
+            if conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+                self._create_schema(conn)
+            self._local.conn = conn
+        return conn
+
+    def _create_schema(self, conn):
+        """Create the tables; a new database adopts the file registry."""
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+                # executescript() would commit the open transaction
+                for statement in SCHEMA.split(";"):
+                    if statement.strip():
+                        conn.execute(statement)
+                registry = ark_session._read_registry_files()
+                conn.executemany(
+                    INSERT_SESSION,
+                    [_session_row(sid, rec) for sid, rec in registry.items()
+                     if isinstance(rec, dict)],
+                )
+                conn.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    @contextmanager
+    def _write(self):
+        """BEGIN IMMEDIATE ... COMMIT; an exception rolls back."""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    # -- Registry -----------------------------------------------------------
+
+    @contextmanager
+    def registry_transaction(self):
+        with self._write() as conn:
+            raw = dict(conn.execute("SELECT session_id, record FROM sessions"))
+            active = {sid: json.loads(text) for sid, text in raw.items()}
+            yield active
+            rows = []
+            for sid, record in active.items():
+                row = _session_row(sid, record)
+                if raw.get(sid) != row[-1]:
+                    rows.append(row)
+            conn.executemany(INSERT_SESSION, rows)
+            conn.executemany("DELETE FROM sessions WHERE session_id = ?",
+                             [(sid,) for sid in raw if sid not in active])
+
+    @contextmanager
+    def session_transaction(self, session_id):
+        with self._write() as conn:
+            row = conn.execute("SELECT record FROM sessions WHERE session_id = ?",
+                               (session_id,)).fetchone()
+            record = json.loads(row[0]) if row else {}
+            yield record
+            if record:
+                new = _session_row(session_id, record)
+                if not row or row[0] != new[-1]:
+                    conn.execute(INSERT_SESSION, new)
+            elif row:  # emptied: drop the row, as the file backend does
+                conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    def read_registry(self):
+        try:
+            rows = self._conn().execute("SELECT session_id, record FROM sessions")
+            return {sid: json.loads(text) for sid, text in rows}
+        except Exception:
+            return {}
+
+    def read_session(self, session_id):
+        try:
+            row = self._conn().execute("SELECT record FROM sessions WHERE session_id = ?",
+                                       (session_id,)).fetchone()
+            return json.loads(row[0]) if row else None
+        except Exception:
+            return None
+
+    def read_active_sessions(self):
+        try:
+            rows = self._conn().execute(
+                "SELECT session_id, record FROM sessions WHERE status = 'active'")
+            return {sid: json.loads(text) for sid, text in rows}
+        except Exception:
+            return {}
+
+    def write_registry(self, data):
+        with self.registry_transaction() as active:
+            active.clear()
+            active.update(data)
+
+    # -- Events -------------------------------------------------------------
+
+    def event_writer(self):
+        return SQLiteEventWriter(self)
+
+    def insert_events(self, events):
+        """Insert events (dicts) in one transaction."""
+        with self._write() as conn:
+            conn.executemany(INSERT_EVENT, [_event_row(ev) for ev in events])
+
+    def _where(self, session, callsign, event, workspace, machine, since, until):
+        from ark_events import parse_since
+
+        clauses, params = [], []
+        for column, value in (("session_id", session), ("callsign", callsign),
+                              ("event", event), ("workspace", workspace),
+                              ("machine", machine)):
+            if value:
+                clauses.append(f"{column} = ?")
+                params.append(str(value))
+        since, until = parse_since(since), parse_since(until)
+        if since:
+            clauses.append("ts >= ?")
+            params.append(since)
+        if until:
+            clauses.append("ts < ?")
+            params.append(until)
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    def query_events(self, session=None, callsign=None, event=None, workspace=None,
+                     since=None, until=None, limit=None, machine=None):
+        """Yield matching events oldest first (see ark_events.query_events)."""
+        where, params = self._where(session, callsign, event, workspace, machine,
+                                    since, until)
+        sql = f"SELECT data FROM events{where} ORDER BY ts, id"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+        for (data,) in self._conn().execute(sql, params):
+            yield json.loads(data)
+
+    def tail_events(self, n, session=None, callsign=None, event=None, workspace=None,
+                    since=None, until=None, machine=None):
+        """The last n matching events, oldest first."""
+        where, params = self._where(session, callsign, event, workspace, machine,
+                                    since, until)
+        rows = self._conn().execute(
+            f"SELECT data FROM events{where} ORDER BY ts DESC, id DESC LIMIT ?",
+            params + [int(n)]).fetchall()
+        return [json.loads(data) for (data,) in reversed(rows)]
+
+    def iter_events(self):
+        """Every event, oldest first."""
+        for (data,) in self._conn().execute("SELECT data FROM events ORDER BY ts, id"):
+            yield json.loads(data)
+
+    def events_since(self, cursor):
+        """
+        Yield events inserted since the cursor, in insertion order. The
+        cursor is the last row id read: rows are only ever appended, and
+        retention deletes the oldest, so ids past it are exactly the new
+        events. If the table was emptied and its ids restarted below the
+        cursor, everything is read again.
+        """
+        if cursor.get("backend") != self.name:
+            cursor.clear()
+            cursor.update({"backend": self.name, "id": 0})
+        conn = self._conn()
+        top = conn.execute("SELECT max(id) FROM events").fetchone()[0] or 0
+        if top < cursor["id"]:
+            cursor["id"] = 0
+        rows = conn.execute("SELECT id, data FROM events WHERE id > ? ORDER BY id",
+                            (cursor["id"],))
+        for row_id, data in rows:
+            cursor["id"] = row_id
+            yield json.loads(data)
+
+    def import_file_events(self):
+        """
+        Copy the JSONL event log into the database, once.
+
+        Returns:
+            number of events imported, or -1 if they were imported before
+        """
+        with self._write() as conn:
+            if conn.execute("SELECT 1 FROM meta WHERE key = 'file_events_imported'").fetchone():
+                return -1
+            count = 0
+            rows = (_event_row(ev) for ev in ark_session._iter_file_events())
+            for row in rows:
+                conn.execute(INSERT_EVENT, row)
+                count += 1
+            conn.execute("INSERT INTO meta VALUES ('file_events_imported', ?)",
+                         (time.strftime("%Y-%m-%dT%H:%M:%S"),))
+        return count
+
+    # -- Upkeep -------------------------------------------------------------
+
+    def maintain(self):
+        """Drop events past the file log's full retention (raw + archive)."""
+        days = ark_session.JSONL_MAX_DAYS + ark_session.LOG_ARCHIVE_MONTHS * 31
+        cutoff = time.strftime("%Y-%m-%dT%H:%M:%S",
+                               time.localtime(time.time() - days * 86400))
+        with self._write() as conn:
+            conn.execute("DELETE FROM events WHERE ts < ?", (cutoff,))
+        self._conn().execute("PRAGMA optimize")
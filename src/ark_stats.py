@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+"""
+Ark Session Manager -- Session Analytics
+=========================================
+Incremental per-workspace / per-model metrics from the JSONL event log.
+
+Sessions are bucketed by (start day, workspace, model). Each bucket is a
+fixed-width array of counters plus a duration histogram, so a year of
+history is a few thousand small integer arrays rather than a list of
+event dicts. Stop, compact and crash events do not carry workspace or
+model; they are joined to their start event by session_id.
+
+Events come from the configured storage backend (JSONL files or SQLite).
+State lives in ~/.claude/sessions/stats.json together with a checkpoint:
+the backend's events_since() cursor and the last event timestamp. Each
+run reads only the events appended since the previous one.
+
+--federated aggregates the merged multi-machine store (ark_federate)
+into its own state file. Merges can still append to an older day there,
+so its checkpoint is a byte offset per day file rather than one position.
+
+CLI:
+    python ark_session.py stats --by workspace --period week --since 2026-09-01
+    python ark_session.py stats --federated
+"""
+
+import json
+import sys
+from array import array
+
+import ark_session
+
+STATE_VERSION = 2
+
+# Duration histogram bin upper bounds (minutes); the last bin is overflow
+DURATION_BINS = (1, 2, 5, 10, 15, 20, 30, 45, 60, 90, 120, 180, 240, 360, 480, 720, 1440)
+
+# Bucket array layout
+STARTED, STOPPED, CRASHED, COMPACTIONS, DURATION_SUM = range(5)
+HIST = 5
+BUCKET_WIDTH = HIST + len(DURATION_BINS) + 1
+
+# Open sessions whose start is older than this are forgotten (never stopped)
+OPEN_SESSION_MAX_DAYS = 30
+
+
+# -- Accumulators -----------------------------------------------------------
+
+def _new_bucket():
+    return array("q", bytes(8 * BUCKET_WIDTH))
+
+
+def _duration_bin(minutes):
+    for i, bound in enumerate(DURATION_BINS):
+        if minutes <= bound:
+            return i
+    return len(DURATION_BINS)
+
+
+class Stats:
+    """
+    In-memory aggregate state.
+
+    Workspace and model names are interned into lists; buckets are keyed
+    by "day|workspace_idx|model_idx". `open` maps a started session to
+    [day, workspace_idx, model_idx, crashed] until its stop event arrives.
+    """
+
+    def __init__(self, state=None):
+        state = state or {}
+        self.workspaces = list(state.get("workspaces", []))
+        self.models = list(state.get("models", []))
+        self._ws_idx = {name: i for i, name in enumerate(self.workspaces)}
+        self._model_idx = {name: i for i, name in enumerate(self.models)}
+        self.buckets = {
+            key: array("q", values) for key, values in state.get("buckets", {}).items()
+            if len(values) == BUCKET_WIDTH
+        }
+        self.open = dict(state.get("open", {}))
+        self.checkpoint = dict(state.get("checkpoint", {}))
+
+    def to_state(self):
+        return {
+            "v": STATE_VERSION,
+            "checkpoint": self.checkpoint,
+            "workspaces": self.workspaces,
+            "models": self.models,
+            "buckets": {key: b.tolist() for key, b in self.buckets.items()},
+            "open": self.open,
+        }
+
+    def _intern(self, names, index, name):
+        name = name or "?"
+        if name not in index:
+            index[name] = len(names)
+            names.append(name)
+        return index[name]
+
+    def _bucket(self, day, ws, model):
+        key = f"{day}|{ws}|{model}"
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = _new_bucket()
+        return bucket
+
+    def _session_bucket(self, sid, event):
+        """Bucket of the session's start, or one keyed by the event itself."""
+        info = self.open.get(sid)
+        if info:
+            return self._bucket(info[0], info[1], info[2]), info
+        ws = self._intern(self.workspaces, self._ws_idx, event.get("workspace"))
+        model = self._intern(self.models, self._model_idx, "?")
+        return self._bucket(str(event["ts"])[:10], ws, model), None
+
+    def add(self, event):
+        """Fold one logged event into the aggregates."""
+        kind = event.get("event")
+        sid = event.get("session_id", "")
+        ts = str(event.get("ts", ""))
+        if not sid or len(ts) < 10:
+            return
+
+        if kind == "start":
+            ws = self._intern(self.workspaces, self._ws_idx, event.get("workspace"))
+            model = self._intern(self.models, self._model_idx, event.get("model"))
+            self._bucket(ts[:10], ws, model)[STARTED] += 1
+            self.open[sid] = [ts[:10], ws, model, 0]
+        elif kind == "stop":
+            bucket, info = self._session_bucket(sid, event)
+            minutes = int(event.get("duration_min") or 0)
+            bucket[STOPPED] += 1
+            bucket[COMPACTIONS] += int(event.get("compact_count") or 0)
+            bucket[DURATION_SUM] += minutes
+            bucket[HIST + _duration_bin(minutes)] += 1
+            self.open.pop(sid, None)
+        elif kind == "crash":
+            bucket, info = self._session_bucket(sid, event)
+            if info is None or not info[3]:
+                bucket[CRASHED] += 1
+            if info is not None:
+                info[3] = 1
+
+    def forget_stale(self, today):
+        """Drop open sessions that started too long ago to still stop."""
+        from datetime import date, timedelta
+
+        cutoff = (date.fromisoformat(today)
+                  - timedelta(days=OPEN_SESSION_MAX_DAYS)).isoformat()
+        for sid in [s for s, info in self.open.items() if info[0] < cutoff]:
+            del self.open[sid]
+
+
+# -- Incremental ingestion --------------------------------------------------
+
+def _load_state():
+    try:
+        state = json.loads(ark_session.STATS_FILE.read_text(encoding="utf-8"))
+        if state.get("v") == STATE_VERSION:
+            return state
+    except Exception:
+        pass
+    return None
+
+
+def _ingest_raw(stats, path, start):
+    """Fold complete lines of a raw log from byte `start`; return end offset."""
+    offset = start
+    with open(path, "rb") as f:
+        f.seek(start)
+        for raw in f:
+            if not raw.endswith(b"\n"):
+                break  # partial line; picked up next run
+            offset += len(raw)
+            try:
+                event = json.loads(raw)
+            except ValueError:
+                continue
+            stats.add(event)
+            stats.checkpoint["ts"] = str(event.get("ts", stats.checkpoint.get("ts", "")))
+    return offset
+
+
+def _update_federated(rebuild=False):
+    """update() over the merged store, resuming each day file separately."""
+    import ark_federate
+
+    state_file = ark_session.FEDERATION_DIR / "stats.json"
+    state_file.parent.mkdir(parents=True, exist_ok=True)
+    with ark_session._file_lock(state_file.with_name(state_file.name + ".lock")):
+        state = None
+        if not rebuild:
+            try:
+                state = json.loads(state_file.read_text(encoding="utf-8"))
+                if state.get("v") != STATE_VERSION:
+                    state = None
+            except Exception:
+                pass
+        stats = Stats(state)
+        offsets = stats.checkpoint.setdefault("offsets", {})
+        for path in ark_federate.combined_log_files():
+            start = offsets.get(path.name, 0)
+            try:
+                if path.stat().st_size == start:
+                    continue
+            except OSError:
+                continue
+            offsets[path.name] = _ingest_raw(stats, path, start)
+        if stats.checkpoint.get("ts"):
+            stats.forget_stale(stats.checkpoint["ts"][:10])
+        ark_session._atomic_write_text(
+            state_file, json.dumps(stats.to_state(), separators=(",", ":"))
+        )
+    return stats
+
+
+def update(rebuild=False, federated=False):
+    """
+    Bring the aggregates up to date with the event log and persist them.
+
+    Reads the events the storage backend has appended since the
+    checkpointed cursor (see StorageBackend.events_since). A checkpoint
+    taken with another backend is discarded, as the cursor would replay
+    events already counted.
+
+    Args:
+        rebuild: discard the checkpoint and re-read everything
+        federated: aggregate the merged multi-machine store instead
+
+    Returns:
+        Stats instance
+    """
+    if federated:
+        return _update_federated(rebuild)
+    ark_session.flush_events()
+    backend = ark_session.storage_backend()
+    lock = ark_session.STATS_FILE.with_name(ark_session.STATS_FILE.name + ".lock")
+    ark_session._ensure_dirs()
+    with ark_session._file_lock(lock):
+        state = None if rebuild else _load_state()
+        checkpoint = (state or {}).get("checkpoint", {})
+        if checkpoint.get("cursor", {}).get("backend") != backend.name:
+            state = None
+        stats = Stats(state)
+        cp = stats.checkpoint
+        cursor = cp.setdefault("cursor", {})
+        for event in backend.events_since(cursor):
+            stats.add(event)
+            cp["ts"] = str(event.get("ts", cp.get("ts", "")))
+
+        if cp.get("ts"):
+            stats.forget_stale(cp["ts"][:10])
+        ark_session._atomic_write_text(
+            ark_session.STATS_FILE, json.dumps(stats.to_state(), separators=(",", ":"))
+        )
+    return stats
+
+
+# -- Reporting --------------------------------------------------------------
+
+def _week(day):
+    from datetime import date
+
+    year, week, _ = date.fromisoformat(day).isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+def _percentile(hist, pct):
+    """Upper bound (minutes) of the histogram bin holding the percentile."""
+    total = sum(hist)
+    if not total:
+        return None
+    rank = max(1, -(-total * pct // 100))
+    seen = 0
+    for i, count in enumerate(hist):
+        seen += count
+        if seen >= rank:
+            return DURATION_BINS[i] if i < len(DURATION_BINS) else None
+    return None
+
+
+def report(stats, by="workspace", period="day", since=None):
+    """
+    Roll buckets up to (period, workspace|model) rows.
+
+    Args:
+        stats: Stats from update()
+        by: "workspace" or "model"
+        period: "day" or "week"
+        since: only buckets on or after this day (YYYY-MM-DD)
+
+    Returns:
+        list of row dicts sorted by period then name
+    """
+    names = stats.workspaces if by == "workspace" else stats.models
+    pos = 1 if by == "workspace" else 2
+    rolled = {}
+    for key, bucket in stats.buckets.items():
+        parts = key.split("|")
+        day = parts[0]
+        if since and day < since:
+            continue
+        label = day if period == "day" else _week(day)
+        group = (label, names[int(parts[pos])])
+        acc = rolled.get(group)
+        if acc is None:
+            rolled[group] = array("q", bucket)
+        else:
+            for i, value in enumerate(bucket):
+                acc[i] += value
+
+    rows = []
+    for (label, name), acc in sorted(rolled.items()):
+        hist = acc[HIST:]
+        rows.append({
+            "period": label,
+            by: name,
+            "sessions": acc[STARTED],
+            "stopped": acc[STOPPED],
+            "crashes": acc[CRASHED],
+            "crash_rate": round(acc[CRASHED] / acc[STARTED], 3) if acc[STARTED] else 0.0,
+            "compaction_rate": round(acc[COMPACTIONS] / acc[STOPPED], 2) if acc[STOPPED] else 0.0,
+            "duration_avg": round(acc[DURATION_SUM] / acc[STOPPED], 1) if acc[STOPPED] else None,
+            "duration_p50": _percentile(hist, 50),
+            "duration_p90": _percentile(hist, 90),
+        })
+    return rows
+
+
+# -- CLI --------------------------------------------------------------------
+
+def main(argv=None):
+    """`ark_session stats` command."""
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog="ark_session stats",
+        description="Session metrics per workspace or model.",
+    )
+    parser.add_argument("--by", choices=("workspace", "model"), default="workspace")
+    parser.add_argument("--period", choices=("day", "week"), default="week")
+    parser.add_argument("--since", help="first day to report (YYYY-MM-DD)")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="discard the checkpoint and re-read all logs")
+    parser.add_argument("--federated", action="store_true",
+                        help="all machines, from the merged federation store")
+    parser.add_argument("--json", action="store_true", help="JSON rows")
+    args = parser.parse_args(argv)
+
+    rows = report(update(rebuild=args.rebuild, federated=args.federated), by=args.by,
+                  period=args.period, since=args.since)
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return 0
+
+    def fmt(value):
+        return "-" if value is None else str(value)
+
+    print(f"{'PERIOD':<11} {args.by.upper():<28} {'SESS':>5} {'CRASH%':>7} "
+          f"{'COMPACT/S':>9} {'AVG':>6} {'P50':>5} {'P90':>5}")
+    for row in rows:
+        print(f"{row['period']:<11} {row[args.by][:28]:<28} {row['sessions']:>5} "
+              f"{row['crash_rate'] * 100:>6.1f}% {row['compaction_rate']:>9} "
+              f"{fmt(row['duration_avg']):>6} {fmt(row['duration_p50']):>5} "
+              f"{fmt(row['duration_p90']):>5}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
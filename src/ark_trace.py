@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Ark Session Manager -- Hook Latency Report
+===========================================
+Percentiles over the trace written when ARK_TRACE is set.
+
+Each line of ~/.claude/sessions/trace.jsonl is one sampled lifecycle call:
+hook name, total wall time and bytes read/written, plus the same figures
+for each internal phase (registry, git, diary, sweep, log, ...). The file
+rolls to trace.jsonl.1 at TRACE_MAX_BYTES; both generations are read.
+
+CLI:
+    ARK_TRACE=1 claude ...                       # record (or ARK_TRACE=0.1)
+    python ark_session.py trace --summary        # p50/p95/p99 per hook and phase
+    python ark_session.py trace --summary --hook stop
+    python ark_session.py trace                  # the last few calls
+"""
+
+import json
+import sys
+
+import ark_session
+
+TOTAL = "(total)"
+
+
+def trace_files():
+    """Trace files, oldest first."""
+    current = ark_session.TRACE_FILE
+    return [p for p in (current.with_name(current.name + ".1"), current)
+            if p.exists()]
+
+
+def iter_records(hook=None):
+    """Yield trace records in file order; unreadable lines are skipped."""
+    for path in trace_files():
+        try:
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    if isinstance(record, dict) and (
+                            hook is None or record.get("hook") == hook):
+                        yield record
+        except OSError:
+            continue
+
+
+def _percentile(sorted_values, pct):
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * pct // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def summarize(records):
+    """
+    Aggregate trace records per hook and phase.
+
+    Args:
+        records: iterable of trace records (see iter_records)
+
+    Returns:
+        list of row dicts (hook, phase, calls, p50, p95, p99, max in ms;
+        read and written as mean bytes per call, None when not recorded),
+        each hook's total first, then its phases by descending p95
+    """
+    samples = {}  # (hook, phase) -> [ms list, read list, written list]
+    for record in records:
+        hook = record.get("hook", "?")
+        entries = [dict(record, name=TOTAL)] + list(record.get("phases", []))
+        for entry in entries:
+            if not isinstance(entry, dict) or "ms" not in entry:
+                continue
+            bucket = samples.setdefault((hook, entry.get("name", "?")), ([], [], []))
+            bucket[0].append(entry["ms"])
+            if "read" in entry:
+                bucket[1].append(entry["read"])
+                bucket[2].append(entry.get("written", 0))
+
+    rows = []
+    for (hook, phase), (ms, read, written) in samples.items():
+        ms.sort()
+        rows.append({
+            "hook": hook,
+            "phase": phase,
+            "calls": len(ms),
+            "p50": _percentile(ms, 50),
+            "p95": _percentile(ms, 95),
+            "p99": _percentile(ms, 99),
+            "max": ms[-1],
+            "read": sum(read) // len(read) if read else None,
+            "written": sum(written) // len(written) if written else None,
+        })
+    rows.sort(key=lambda r: (r["hook"], r["phase"] != TOTAL, -r["p95"], r["phase"]))
+    return rows
+
+
+def _fmt_bytes(n):
+    if n is None:
+        return "-"
+    for unit in ("B", "K", "M"):
+        if n < 1024 or unit == "M":
+            return f"{n:.0f}{unit}" if unit == "B" else f"{n:.1f}{unit}"
+        n /= 1024
+
+
+def main(argv=None):
+    """`ark_session trace` command."""
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog="ark_session trace",
+        description="Hook latency per phase, from the ARK_TRACE trace file.",
+    )
+    parser.add_argument("--summary", action="store_true",
+                        help="p50/p95/p99 per hook and phase")
+    parser.add_argument("--hook", help="only this hook (start, stop, heartbeat, ...)")
+    parser.add_argument("--tail", type=int, default=10, metavar="N",
+                        help="without --summary: show the last N calls (default 10)")
+    parser.add_argument("--clear", action="store_true", help="delete the trace files")
+    parser.add_argument("--json", action="store_true", help="JSON output")
+    args = parser.parse_args(argv)
+
+    if args.clear:
+        for path in trace_files():
+            path.unlink()
+        print(f"Cleared {ark_session.TRACE_FILE}")
+        return 0
+
+    if args.summary:
+        rows = summarize(iter_records(args.hook))
+        if args.json:
+            print(json.dumps(rows, indent=2))
+            return 0
+        if not rows:
+            print(f"No trace records in {ark_session.TRACE_FILE} "
+                  "(set ARK_TRACE=1 to record)")
+            return 0
+        print(f"{'HOOK':<15} {'PHASE':<42} {'CALLS':>6} {'P50':>8} {'P95':>8} "
+              f"{'P99':>8} {'MAX':>8} {'READ':>7} {'WRITTEN':>7}")
+        for row in rows:
+            phase = row["phase"] if row["phase"] == TOTAL else "  " + row["phase"]
+            print(f"{row['hook'][:15]:<15} {phase[:42]:<42} {row['calls']:>6} "
+                  f"{row['p50']:>8.2f} {row['p95']:>8.2f} {row['p99']:>8.2f} "
+                  f"{row['max']:>8.2f} {_fmt_bytes(row['read']):>7} "
+                  f"{_fmt_bytes(row['written']):>7}")
+        print("Times in ms; READ/WRITTEN are mean bytes per call.")
+        return 0
+
+    from collections import deque
+    from datetime import datetime
+
+    recent = deque(iter_records(args.hook), maxlen=max(args.tail, 0))
+    if args.json:
+        print(json.dumps(list(recent), indent=2))
+        return 0
+    for record in recent:
+        when = datetime.fromtimestamp(record.get("ts", 0)).strftime("%Y-%m-%d %H:%M:%S")
+        phases = "  ".join(f"{p.get('name')}={p.get('ms')}"
+                           for p in record.get("phases", []))
+        print(f"{when}  {record.get('hook', '?'):<14} {record.get('ms', 0):>8.2f}ms  {phases}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -12,6 +12,14 @@ from pathlib import Path
 sys.path.insert(0, os.path.expanduser("~/.claude/hooks"))
 import ark_session as ark
 
+# Detached maintenance workers would race the checks below; section 6
+# turns background mode back on to test it.
+ark.MAINTENANCE_MODE = "inline"
+# Short codes of this machine's real workspaces must not collide with the
+# made-up paths below
+_saved_shortcodes = ark.SHORTCODES_FILE
+ark.SHORTCODES_FILE = Path(tempfile.mkdtemp(prefix="ark-shortcodes-")) / "shortcodes.json"
+
 passed = 0
 failed = 0
 
@@ -121,6 +129,53 @@ hb_data = {
 }
 hb = ark.session_heartbeat(hb_data)
 check("Heartbeat returns callsign", hb is not None and "callsign" in hb)
+check("Heartbeat throttled via stamp", hb is not None and hb.get("throttled") is True)
+check("Throttled callsign matches registry", hb is not None and hb.get("callsign") == result["callsign"])
+sub_hb = ark.session_heartbeat({**hb_data, "cwd": os.path.join(fake_cwd, "src")})
+check("Throttled callsign ignores cwd",
+      sub_hb is not None and sub_hb.get("callsign") == result["callsign"], str(sub_hb))
+# A fresh process has no in-memory caches: count every file access it makes
+import subprocess
+cold_hb = subprocess.run([sys.executable, "-c", f"""
+import builtins, io, json, os, sys
+sys.path.insert(0, {str(Path(ark.__file__).parent)!r})
+import ark_session as ark
+from pathlib import Path
+ark.SHORTCODES_FILE = Path({str(ark.SHORTCODES_FILE)!r})
+calls = {{"stat": 0, "open": [], "loads": 0}}
+real = (os.stat, os.fstat, os.open, builtins.open, json.loads)
+def stat(*a, **k):
+    calls["stat"] += 1
+    return real[0](*a, **k)
+def fstat(*a, **k):
+    calls["stat"] += 1
+    return real[1](*a, **k)
+def os_open(path, *a, **k):
+    calls["open"].append(str(path))
+    return real[2](path, *a, **k)
+def py_open(path, *a, **k):
+    calls["open"].append(str(path))
+    return real[3](path, *a, **k)
+def loads(*a, **k):
+    calls["loads"] += 1
+    return real[4](*a, **k)
+os.stat, os.fstat, os.open, json.loads = stat, fstat, os_open, loads
+builtins.open = io.open = py_open
+hb = ark.session_heartbeat({{"session_id": {fake_sid!r}, "cwd": {os.path.join(fake_cwd, "src")!r}}})
+os.stat, os.fstat, os.open, builtins.open, io.open, json.loads = real[:4] + real[3:]
+print(json.dumps({{"hb": hb, **calls}}))
+"""], capture_output=True, text=True, timeout=30)
+try:
+    cold = json.loads(cold_hb.stdout.strip().splitlines()[-1])
+except Exception:
+    cold = {}
+check("Cold throttled heartbeat: one stat, only the stamp opened, no JSON parsed",
+      (cold.get("hb") or {}).get("callsign") == result["callsign"] and cold.get("stat") == 1
+      and cold.get("open") == [str(ark._heartbeat_stamp(fake_sid))] and cold.get("loads") == 0,
+      str(cold) or cold_hb.stderr[-300:])
+shortcodes = json.loads(ark.SHORTCODES_FILE.read_text(encoding="utf-8"))["paths"]
+check("Heartbeat from a subdirectory claims no short code",
+      fake_cwd in shortcodes and os.path.join(fake_cwd, "src") not in shortcodes, str(sorted(shortcodes)))
 
 ark.session_compact(fake_data)
 active = ark._read_active()
@@ -137,6 +192,7 @@ check("session_stop returns intent", stop_result.get("intent") == "Portability t
 
 active = ark._read_active()
 check("Status changed to stopped", active.get(fake_sid, {}).get("status") == "stopped")
+check("Heartbeat stamp removed on stop", not ark._heartbeat_stamp(fake_sid).exists())
 
 # --- 5. JSONL EVENT LOG ---
 print()
@@ -155,37 +211,167 @@ if log_file.exists():
 # --- 6. CRASH DETECTION (cross-platform os.kill) ---
 print()
 print("--- 6. CRASH DETECTION (cross-platform os.kill) ---")
-stale_sid = "crash-test-" + datetime.now().strftime("%H%M%S")
-stale_time = (datetime.now() - timedelta(minutes=30)).isoformat()
-active = ark._read_active()
-active[stale_sid] = {
-    "callsign": "TST-dead",
-    "workspace": "test",
-    "workspace_path": tempfile.gettempdir(),
-    "branch": "main",
-    "model": "test",
-    "pid": 99999,
-    "started": stale_time,
-    "last_heartbeat": stale_time,
-    "context_pct": 0,
-    "compact_count": 0,
-    "intent": "Crash test",
-    "status": "active",
-}
-ark._write_active(active)
+# Temp sessions dir and HOME: the crash checks and the detached maintenance
+# worker must not touch the real registry, crash queue or logs
+crash_home = Path(tempfile.mkdtemp(prefix="ark-crash-home-"))
+_saved_crash = {k: getattr(ark, k) for k in (
+    "SESSIONS_DIR", "LOG_DIR", "ACTIVE_FILE", "LOCK_FILE", "SHARD_DIR", "SHARD_INDEX",
+    "REGISTRY_WAL", "HEARTBEAT_DIR", "LOG_ARCHIVE_DIR", "LOG_INDEX_DIR", "RETENTION_STAMP",
+    "BROKER_SOCKET", "STATS_FILE", "LOCKS_DIR", "MEMORY_INDEX_DIR", "DEADLINES_FILE",
+    "PENDING_CRASHES", "MAINTENANCE_STAMP", "FEDERATION_DIR", "TRACE_FILE")}
+_saved_env = {k: os.environ.get(k) for k in ("HOME", "USERPROFILE")}
+for k, v in _saved_crash.items():
+    setattr(ark, k, crash_home / ".claude" / "sessions" / v.relative_to(_saved_crash["SESSIONS_DIR"]))
+ark.LOG_DIR.mkdir(parents=True, exist_ok=True)
+ark._invalidate_deadlines()
+os.environ["HOME"] = os.environ["USERPROFILE"] = str(crash_home)
+try:
+    stale_sid = "crash-test-" + datetime.now().strftime("%H%M%S")
+    stale_time = (datetime.now() - timedelta(minutes=30)).isoformat()
+    active = ark._read_active()
+    active[stale_sid] = {
+        "callsign": "TST-dead",
+        "workspace": "test",
+        "workspace_path": tempfile.gettempdir(),
+        "branch": "main",
+        "model": "test",
+        "pid": 99999,
+        "started": stale_time,
+        "last_heartbeat": stale_time,
+        "context_pct": 0,
+        "compact_count": 0,
+        "intent": "Crash test",
+        "status": "active",
+    }
+    ark._write_active(active)
 
-crashes = ark.detect_crashes()
-found_ours = [c for c in crashes if c.get("session_id") == stale_sid]
-check("Stale session detected as crash", len(found_ours) == 1)
-if found_ours:
-    check("Crash has intent", found_ours[0].get("intent") == "Crash test")
+    crashes = ark.detect_crashes()
+    found_ours = [c for c in crashes if c.get("session_id") == stale_sid]
+    check("Stale session detected as crash", len(found_ours) == 1)
+    if found_ours:
+        check("Crash has intent", found_ours[0].get("intent") == "Crash test")
 
-active = ark._read_active()
-check("Crash status set", active.get(stale_sid, {}).get("status") == "crashed")
+    active = ark._read_active()
+    check("Crash status set", active.get(stale_sid, {}).get("status") == "crashed")
+
+    import heapq
+    import time
+    crash_ws = tempfile.mkdtemp(prefix="ark-crash-ws-")
+    own_start = ark._process_fingerprint(os.getpid())
+    check("Process fingerprint for a live PID", own_start is None or own_start != "")
+    check("PID reuse detected by start-time mismatch",
+          not ark._process_alive(os.getpid(), "not-" + str(own_start)) or own_start is None)
+    check("Matching fingerprint is alive", ark._process_alive(os.getpid(), own_start))
+
+    reused_sid, alive_sid = stale_sid + "-reused", stale_sid + "-alive"
+    with ark.registry_transaction() as active:
+        for sid, fingerprint in ((reused_sid, "1"), (alive_sid, own_start)):
+            active[sid] = {"callsign": "TST-pid", "pid": os.getpid(), "pid_start": fingerprint,
+                           "last_heartbeat": stale_time, "status": "active"}
+    ark._invalidate_deadlines()
+    crashed = {c["session_id"] for c in ark.detect_crashes()}
+    check("Recycled PID does not keep a dead session alive",
+          reused_sid in crashed and alive_sid not in crashed, str(crashed))
+    heap = ark._load_deadlines()
+    check("Live-but-silent session rescheduled for a recheck",
+          [sid for _, sid in heap].count(alive_sid) == 1
+          and next(d for d, sid in heap if sid == alive_sid) > time.time(), str(heap))
+
+    hb_sid = stale_sid + "-hb"
+    ark.session_start({"session_id": hb_sid, "cwd": crash_ws, "model": "test"})
+    check("session_start schedules a deadline", hb_sid in {sid for _, sid in ark._load_deadlines()})
+    with ark.registry_transaction() as active:
+        active[alive_sid]["status"] = "stopped"
+    _orig_tx = ark.session_transaction
+    visited = []
+    ark.session_transaction = lambda sid: visited.append(sid) or _orig_tx(sid)
+    try:
+        ark.detect_crashes()
+        check("Nothing overdue: no session records read", visited == [], str(visited))
+        for due_sid in (hb_sid, alive_sid):
+            heap = ark._load_deadlines()
+            for entry in heap:
+                if entry[1] == due_sid:
+                    entry[0] = 0
+            heapq.heapify(heap)
+            ark._save_deadlines(heap)
+            check(f"Overdue {due_sid[-5:]} revalidated, not crashed", ark.detect_crashes() == [])
+        check("Only overdue sessions visited", visited == [hb_sid, alive_sid], str(visited))
+    finally:
+        ark.session_transaction = _orig_tx
+    heap_sids = [sid for _, sid in ark._load_deadlines()]
+    check("Revalidated session pushed back, stopped one dropped",
+          heap_sids.count(hb_sid) == 1 and alive_sid not in heap_sids, str(heap_sids))
+    ark.session_stop({"session_id": hb_sid, "cwd": crash_ws})
+
+    maint_sid = stale_sid + "-maint"
+    with ark.registry_transaction() as active:
+        active[maint_sid] = {"callsign": "TST-mnt", "pid": 0, "last_heartbeat": stale_time,
+                             "status": "active"}
+    ark._invalidate_deadlines()
+    ark._take_pending_crashes()
+    for claim in ark.SESSIONS_DIR.glob(ark.MAINTENANCE_STAMP.name + "*"):
+        claim.unlink(missing_ok=True)
+    ark.RETENTION_STAMP.unlink(missing_ok=True)
+    ark.MAINTENANCE_MODE = "background"
+    bg_sids = [f"{stale_sid}-bg{i}" for i in range(3)]
+    try:
+        first = ark.session_start({"session_id": bg_sids[0], "cwd": crash_ws})
+        check("Due crash check runs inside session_start",
+              [c["session_id"] for c in first["crash_info"]] == [maint_sid], str(first["crash_info"]))
+        check("Maintenance gated by stamp", ark.schedule_maintenance() == "skipped")
+        ark.MAINTENANCE_STAMP.unlink()
+        check("Interval already claimed: stale stamp still skipped",
+              ark.schedule_maintenance() == "skipped" and not ark.MAINTENANCE_STAMP.exists())
+        ark.MAINTENANCE_STAMP.touch()
+        worker_deadline = time.time() + 15
+        while time.time() < worker_deadline and not ark.RETENTION_STAMP.exists():
+            time.sleep(0.05)
+        check("Retention handed to a detached worker", ark.RETENTION_STAMP.exists())
+
+        ark._queue_crashes([{"session_id": maint_sid + "-queued"}])
+        second = ark.session_start({"session_id": bg_sids[1], "cwd": crash_ws})
+        third = ark.session_start({"session_id": bg_sids[2], "cwd": crash_ws})
+        reported = [c["session_id"] for r in (first, second, third) for c in r["crash_info"]]
+        check("Queued crashes reported exactly once",
+              reported == [maint_sid, maint_sid + "-queued"], str(reported))
+    finally:
+        ark.MAINTENANCE_MODE = "inline"
+        for sid in bg_sids:
+            ark.session_stop({"session_id": sid, "cwd": crash_ws})
+
+    # Hooks racing on a stale stamp: one of them claims the interval
+    race_home = Path(tempfile.mkdtemp(prefix="ark-maint-race-"))
+    race_env = {**os.environ, "HOME": str(race_home), "USERPROFILE": str(race_home),
+                "ARK_MAINTENANCE": "inline"}
+    race_go = time.time() + 2
+    race_script = (f"import sys, time; sys.path.insert(0, {str(Path(ark.__file__).parent)!r})\n"
+                   "import ark_session as ark\n"
+                   "ark.SESSIONS_DIR.mkdir(parents=True, exist_ok=True)\n"
+                   f"time.sleep(max(0, {race_go!r} - time.time()))\n"
+                   "print(ark.schedule_maintenance())\n")
+    racers = [subprocess.Popen([sys.executable, "-c", race_script], env=race_env,
+                               stdout=subprocess.PIPE, text=True) for _ in range(4)]
+    race_results = sorted(p.communicate(timeout=30)[0].strip() for p in racers)
+    check("Concurrent hooks: one claims the maintenance interval",
+          race_results == ["inline", "skipped", "skipped", "skipped"], str(race_results))
+    shutil.rmtree(race_home, ignore_errors=True)
+finally:
+    for k, v in _saved_crash.items():
+        setattr(ark, k, v)
+    for k, v in _saved_env.items():
+        if v is None:
+            os.environ.pop(k, None)
+        else:
+            os.environ[k] = v
+    ark._invalidate_deadlines()
+    shutil.rmtree(crash_home, ignore_errors=True)
 
 # --- 7. MEMORY BRIDGE (sweep_session) ---
 print()
 print("--- 7. MEMORY BRIDGE (sweep_session) ---")
+import subprocess
+import time
 test_ws = os.path.join(tempfile.gettempdir(), "ark-test-ws")
 daily_dir = os.path.join(test_ws, "memory", "daily")
 os.makedirs(daily_dir, exist_ok=True)
@@ -209,6 +395,39 @@ check("Duration in marker", "25 min" in content)
 check("Intent in marker", "Testing sweep" in content)
 check("Compaction count in marker", "1 compaction" in content)
 
+ark.sweep_session(workspace_path=test_ws, callsign="TST-swp2", duration_min=3)
+content2 = Path(daily_file).read_text(encoding="utf-8")
+check("Notes tail: marker appended, earlier content untouched",
+      content2.startswith(content) and content2.rstrip().endswith("TST-swp2 | 3 min"))
+
+# Notes followed by another section: marker lands at the end of Notes
+with open(daily_file, "w", encoding="utf-8") as f:
+    f.write("# " + today + "\n\n## Notes\n\n- note\n\n## Decisions\n\n- keep\n")
+ark.sweep_session(workspace_path=test_ws, callsign="TST-swp3", duration_min=4)
+content3 = Path(daily_file).read_text(encoding="utf-8")
+check("Marker spliced at end of Notes when not the tail section",
+      content3.index("- note") < content3.index("TST-swp3") < content3.index("## Decisions")
+      and "- keep" in content3)
+
+# N simultaneous stops in one workspace -> exactly N markers
+with open(daily_file, "w", encoding="utf-8") as f:
+    f.write("# " + today + "\n\n## Notes\n")
+SWEEPERS = 8
+go_at = time.time() + 1.0
+sweep_code = (
+    "import os, sys, time; sys.path.insert(0, os.path.expanduser('~/.claude/hooks'));"
+    "import ark_session as ark; n = int(sys.argv[1]);"
+    "time.sleep(max(0, float(sys.argv[2]) - time.time()));"
+    f"ark.sweep_session({test_ws!r}, 'PAR-%04d' % n, n)"
+)
+procs = [subprocess.Popen([sys.executable, "-c", sweep_code, str(n), str(go_at)]) for n in range(SWEEPERS)]
+for p in procs:
+    p.wait(timeout=30)
+content4 = Path(daily_file).read_text(encoding="utf-8")
+markers = sorted(line.split()[2] for line in content4.splitlines() if "[session-end]" in line)
+check(f"{SWEEPERS} concurrent sweeps -> {SWEEPERS} markers",
+      markers == [f"PAR-{n:04d}" for n in range(SWEEPERS)], str(markers))
+
 # No-op when memory dir missing
 ark.sweep_session(
     workspace_path=os.path.join(tempfile.gettempdir(), "nonexistent-ws"),
@@ -217,9 +436,9 @@ ark.sweep_session(
 )
 check("Sweep no-op when no memory dir", True)
 
-# --- 8. DIARY ENTRY (SESSION-LOG.md) ---
+# --- 8. DIARY ENTRY (monthly SESSION-LOG) ---
 print()
-print("--- 8. DIARY ENTRY (SESSION-LOG.md) ---")
+print("--- 8. DIARY ENTRY (monthly SESSION-LOG) ---")
 diary_ws = os.path.join(tempfile.gettempdir(), "ark-test-diary")
 ark.write_diary_entry(
     workspace_path=diary_ws,
@@ -234,8 +453,9 @@ ark.write_diary_entry(
     duration_min=30,
 )
 
-diary_path = Path(diary_ws) / ".claude" / "tracker" / "sessions" / "SESSION-LOG.md"
-check("SESSION-LOG.md created", diary_path.exists())
+diary_dir = Path(diary_ws) / ".claude" / "tracker" / "sessions"
+diary_path = diary_dir / f"SESSION-LOG-{datetime.now().strftime('%Y-%m')}.md"
+check("Monthly SESSION-LOG created", diary_path.exists())
 if diary_path.exists():
     dc = diary_path.read_text(encoding="utf-8")
     check("Callsign in diary", "TST-diry" in dc)
@@ -243,6 +463,39 @@ if diary_path.exists():
     check("Outcome in diary", "All good" in dc)
     check("Key files in diary", "src/test.py" in dc)
     check("Duration in diary", "30 min" in dc)
+    index_text = (diary_dir / "SESSION-LOG.md").read_text(encoding="utf-8")
+    check("Index links the monthly file", f"]({diary_path.name})" in index_text)
+
+    ark.write_diary_entry(diary_ws, "TST-dry2", "diary-test-002", "11:00-11:05", "main", "Opus 4.6")
+    appended = diary_path.read_text(encoding="utf-8")
+    check("Second entry appended after the first, same day header",
+          appended.startswith(dc) and appended.count("\n## ") == 1
+          and appended.index("TST-dry2") > appended.index("TST-diry"))
+
+# Legacy single-file diary: newest day/entry on top -> chronological months
+legacy_ws = Path(tempfile.mkdtemp(prefix="ark-legacy-diary-"))
+legacy_dir = legacy_ws / ".claude" / "tracker" / "sessions"
+legacy_dir.mkdir(parents=True)
+legacy_text = (
+    "# Session Log\n\nHand-written note.\n\n"
+    "## 2026-02-03\n\n### LEG-0003 | 09:00-10:00 | main | Opus\n**Notes**: third\n\n"
+    "### LEG-0002 | 08:00-08:30 | main | Opus\n**Notes**: second\n\n"
+    "## 2026-01-31\n\n### LEG-0001 | 17:00-18:00 | dev | Opus\n**Duration**: 60 min\n"
+)
+(legacy_dir / "SESSION-LOG.md").write_text(legacy_text, encoding="utf-8")
+migrated = ark.migrate_diary(str(legacy_ws))
+jan = (legacy_dir / "SESSION-LOG-2026-01.md").read_text(encoding="utf-8")
+feb = (legacy_dir / "SESSION-LOG-2026-02.md").read_text(encoding="utf-8")
+legacy_index = (legacy_dir / "SESSION-LOG.md").read_text(encoding="utf-8")
+check("Legacy diary migrated", migrated == 3, str(migrated))
+check("Migration keeps every entry verbatim",
+      "### LEG-0001 | 17:00-18:00 | dev | Opus\n**Duration**: 60 min" in jan
+      and "**Notes**: second" in feb and "**Notes**: third" in feb)
+check("Migrated months are chronological", feb.index("LEG-0002") < feb.index("LEG-0003"))
+check("Index keeps hand-written preamble", "Hand-written note." in legacy_index
+      and "SESSION-LOG-2026-02.md" in legacy_index and "LEG-" not in legacy_index)
+check("Migration is idempotent", ark.migrate_diary(str(legacy_ws)) == 0)
+shutil.rmtree(legacy_ws, ignore_errors=True)
 
 # --- 9. LOG CLEANUP ---
 print()
@@ -271,6 +524,1373 @@ ark._purge_stale_sessions(ark._read_active())
 after = len([s for s in ark._read_active().values() if s.get("status") in ("stopped", "crashed")])
 check("Purge keeps max 50 inactive", after <= 50, f"before={before} after={after}")
 
+# --- 11. REGISTRY TRANSACTIONS ---
+print()
+print("--- 11. REGISTRY TRANSACTIONS ---")
+tx_sid = "test-port-tx-" + datetime.now().strftime("%H%M%S")
+with ark.registry_transaction() as active:
+    active[tx_sid] = {"status": "stopped", "n": 0}
+check("Transaction commits", tx_sid in ark._read_active())
+
+try:
+    with ark.registry_transaction() as active:
+        active[tx_sid]["n"] = 99
+        raise RuntimeError("abort")
+except RuntimeError:
+    pass
+check("Exception discards changes", ark._read_active().get(tx_sid, {}).get("n") == 0)
+
+import threading
+
+
+def _bump():
+    for _ in range(10):
+        with ark.registry_transaction() as active:
+            active[tx_sid]["n"] += 1
+
+
+threads = [threading.Thread(target=_bump) for _ in range(8)]
+for t in threads:
+    t.start()
+for t in threads:
+    t.join()
+n = ark._read_active().get(tx_sid, {}).get("n")
+check("No lost updates (8 writers x 10)", n == 80, f"n={n}")
+leftovers = list(ark.SESSIONS_DIR.glob("active.json.*.tmp"))
+check("No temp files left behind", not leftovers)
+
+# A holder that never lets go (stopped hook, stale NFS lock) must not hang us
+held_lock = Path(tempfile.mkdtemp(prefix="ark-lock-")) / "held.lock"
+holder = subprocess.Popen(
+    [sys.executable, "-c",
+     f"import sys; sys.path.insert(0, {str(Path(ark.__file__).parent)!r})\n"
+     "import time, ark_session as ark\n"
+     f"with ark._file_lock(ark.Path({str(held_lock)!r})) as locked:\n"
+     "    print(locked, flush=True)\n"
+     "    time.sleep(30)"],
+    stdout=subprocess.PIPE, text=True)
+try:
+    child_locked = holder.stdout.readline().strip()
+    t0 = time.monotonic()
+    with ark._file_lock(held_lock, timeout=0.3) as got:
+        waited = time.monotonic() - t0
+    check("Held lock times out instead of hanging",
+          child_locked == "True" and got is False and 0.25 <= waited < 2, f"{child_locked} {got} {waited:.2f}s")
+    in_thread = []
+
+    def _try_held():
+        t0 = time.monotonic()
+        with ark._file_lock(held_lock, timeout=0.3) as got:
+            in_thread.append((got, time.monotonic() - t0))
+
+    waiter = threading.Thread(target=_try_held)
+    waiter.start()
+    waiter.join(5)
+    check("Held lock times out in a worker thread too",
+          len(in_thread) == 1 and in_thread[0][0] is False and in_thread[0][1] < 2, str(in_thread))
+finally:
+    holder.kill()
+    holder.wait()
+with ark._file_lock(held_lock, timeout=2) as got:
+    check("Lock free again once its holder is gone", got is True)
+shutil.rmtree(held_lock.parent, ignore_errors=True)
+
+# --- 12. SHARDED REGISTRY (temp sessions dir) ---
+print()
+print("--- 12. SHARDED REGISTRY ---")
+_saved_paths = {k: getattr(ark, k) for k in ("ACTIVE_FILE", "LOCK_FILE", "SHARD_DIR", "SHARD_INDEX", "HEARTBEAT_DIR")}
+shard_root = Path(tempfile.mkdtemp(prefix="ark-shard-"))
+ark.ACTIVE_FILE = shard_root / "active.json"
+ark.LOCK_FILE = shard_root / "active.json.lock"
+ark.SHARD_DIR = shard_root / "active"
+ark.SHARD_INDEX = ark.SHARD_DIR / "_index.json"
+ark.HEARTBEAT_DIR = shard_root / "hb"
+try:
+    seed = {
+        "shard-live": {"status": "active", "callsign": "SHD-live", "intent": ""},
+        "shard-done": {"status": "stopped", "callsign": "SHD-done"},
+    }
+    ark.ACTIVE_FILE.write_text(json.dumps(seed), encoding="utf-8")
+    migrated = ark.migrate_registry_to_shards()
+    check("Migration moves all sessions", migrated == 2, f"migrated={migrated}")
+    check("Old registry kept as .migrated", (shard_root / "active.json.migrated").exists())
+    check("Migration is one-shot", ark.migrate_registry_to_shards() == -1)
+    check("Registry reads back from shards", ark._read_active() == seed)
+
+    live = [s["session_id"] for s in ark.get_active_sessions()]
+    check("get_active_sessions via index", live == ["shard-live"], str(live))
+    check("set_intent on shard", ark.set_intent("shard-live", "Sharded"))
+    check("Intent stored in shard", ark._read_session("shard-live").get("intent") == "Sharded")
+
+    done_before = (ark.SHARD_DIR / "shard-done.json").stat().st_mtime_ns
+    index_before = ark.SHARD_INDEX.stat().st_mtime_ns
+    ark.session_heartbeat({"session_id": "shard-live"})
+    check("Heartbeat leaves other shards alone",
+          (ark.SHARD_DIR / "shard-done.json").stat().st_mtime_ns == done_before)
+    check("Heartbeat leaves index alone", ark.SHARD_INDEX.stat().st_mtime_ns == index_before)
+
+    with ark.registry_transaction() as active:
+        active["odd/id:1"] = {"status": "active", "callsign": "SHD-odd1"}
+    ark.SHARD_INDEX.unlink()
+    check("Rebuilt index keys by stored session_id",
+          ark._read_shard_index().get("odd/id:1") == "active", str(ark._read_shard_index()))
+    check("Unsafe session_id found after rebuild",
+          "odd/id:1" in {s["session_id"] for s in ark.get_active_sessions()})
+finally:
+    for k, v in _saved_paths.items():
+        setattr(ark, k, v)
+    shutil.rmtree(shard_root, ignore_errors=True)
+
+# --- 13. SESSION BROKER (temp HOME) ---
+print()
+print("--- 13. SESSION BROKER ---")
+import socket
+import subprocess
+import time
+
+if not hasattr(socket, "AF_UNIX"):
+    print("  [SKIP] Unix domain sockets not available")
+else:
+    broker_home = Path(tempfile.mkdtemp(prefix="ark-broker-"))
+    broker_sessions = broker_home / ".claude" / "sessions"
+    env = {**os.environ, "HOME": str(broker_home), "USERPROFILE": str(broker_home)}
+    proc = subprocess.Popen(
+        [sys.executable, ark.__file__, "serve"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    saved_socket = ark.BROKER_SOCKET
+    ark.BROKER_SOCKET = broker_sessions / "broker.sock"
+    try:
+        deadline = time.time() + 10
+        while not ark.BROKER_SOCKET.exists() and time.time() < deadline:
+            time.sleep(0.05)
+        check("Broker socket created", ark.BROKER_SOCKET.exists())
+
+        brk_sid = "test-port-broker"
+        brk_data = {"session_id": brk_sid, "cwd": fake_cwd, "model": "test"}
+        started = ark.session_start(brk_data)
+        check("session_start via broker", started.get("session_id") == brk_sid)
+        check("set_intent via broker", ark.set_intent(brk_sid, "Brokered") is True)
+        live = [x for x in ark.get_active_sessions() if x.get("session_id") == brk_sid]
+        check("Broker serves in-memory registry", live and live[0].get("intent") == "Brokered")
+        check("Explicit flush", ark._broker_call("flush", {}) is True)
+        on_disk = json.loads((broker_sessions / "active.json").read_text(encoding="utf-8"))
+        check("Flush persists registry", on_disk.get(brk_sid, {}).get("intent") == "Brokered")
+        ark.session_stop(brk_data)
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+        ark.BROKER_SOCKET = saved_socket
+
+    check("Socket removed on shutdown", not (broker_sessions / "broker.sock").exists())
+    on_disk = json.loads((broker_sessions / "active.json").read_text(encoding="utf-8"))
+    check("Shutdown flushes pending state", on_disk.get(brk_sid, {}).get("status") == "stopped")
+    logged = "".join(p.read_text(encoding="utf-8") for p in (broker_sessions / "log").glob("*.jsonl"))
+    check("Broker events reach the log", '"event": "stop"' in logged and brk_sid in logged)
+    check("Fallback when broker absent", ark._broker_call("ping", {}) is ark._NO_BROKER)
+    shutil.rmtree(broker_home, ignore_errors=True)
+
+# --- 14. HOOK ENTRY POINT + IMPORTED MODULES ---
+print()
+print("--- 14. HOOK ENTRY POINT + IMPORTED MODULES ---")
+import ast
+import subprocess
+
+hook_home = Path(tempfile.mkdtemp(prefix="ark-hook-"))
+# Inline maintenance: no detached worker left running against the temp HOME
+hook_env = {**os.environ, "HOME": str(hook_home), "USERPROFILE": str(hook_home),
+            "ARK_MAINTENANCE": "inline"}
+hook_sid = "hook-entry-0001"
+hook_input = json.dumps({"session_id": hook_sid, "cwd": fake_cwd, "model": "test"})
+
+
+def _run_hook(event):
+    return subprocess.run(
+        [sys.executable, ark.__file__, "hook", event],
+        input=hook_input, env=hook_env, capture_output=True, text=True, timeout=30,
+    )
+
+
+def _new_modules(code):
+    """Modules a fresh interpreter loads while running `code` (reported on stderr)."""
+    script = ("import sys\nbefore = set(sys.modules)\n" + code
+              + "\nprint(repr(sorted(set(sys.modules) - before)), file=sys.stderr)")
+    out = subprocess.run([sys.executable, "-c", script], input=hook_input, env=hook_env,
+                         capture_output=True, text=True, timeout=30)
+    return out, set(ast.literal_eval(out.stderr.strip().splitlines()[-1]))
+
+
+out = _run_hook("SessionStart")
+check("hook SessionStart dispatches", hook_sid[:4] in out.stdout, out.stdout.strip())
+hook_record = json.loads((hook_home / ".claude" / "sessions" / "active.json")
+                         .read_text(encoding="utf-8")).get(hook_sid, {})
+check("Session owned by the hook's parent", hook_record.get("pid") == os.getpid(),
+      str(hook_record.get("pid")))
+# The hook process is gone; its parent (us) is alive, so a silent session is no crash
+out = subprocess.run(
+    [sys.executable, "-c",
+     f"import sys; sys.path.insert(0, {str(Path(ark.__file__).parent)!r})\n"
+     "import ark_session as ark\n"
+     f"with ark.registry_transaction() as active:\n"
+     f"    active[{hook_sid!r}]['last_heartbeat'] = '2000-01-01T00:00:00'\n"
+     "ark._invalidate_deadlines()\n"
+     "print(len(ark.detect_crashes()))"],
+    env=hook_env, capture_output=True, text=True, timeout=30)
+check("Hook exit is not a crash while its parent lives", out.stdout.strip() == "0",
+      out.stdout.strip() + out.stderr[-200:])
+
+top_level = set()
+for node in ast.parse(Path(ark.__file__).read_text(encoding="utf-8")).body:
+    if isinstance(node, ast.Import):
+        top_level.update(alias.name.split(".")[0] for alias in node.names)
+    elif isinstance(node, ast.ImportFrom):
+        top_level.add(node.module.split(".")[0])
+check("HOOK_IMPORTS matches the import block", top_level == set(ark.HOOK_IMPORTS),
+      str(sorted(top_level ^ set(ark.HOOK_IMPORTS))))
+
+_, allowed = _new_modules("import " + ", ".join(ark.HOOK_IMPORTS))
+out, loaded = _new_modules(
+    f"sys.path.insert(0, {str(Path(ark.__file__).parent)!r})\n"
+    "import ark_session\nark_session.run_hook('heartbeat')")
+check("hook heartbeat throttled", '"throttled": true' in out.stdout, out.stdout.strip())
+extra = loaded - allowed - {"ark_session"}
+check("Throttled heartbeat loads only HOOK_IMPORTS", not extra, ", ".join(sorted(extra)))
+
+out = _run_hook("bogus")
+check("Unknown hook event is fail-open", out.returncode == 0 and not out.stdout)
+_run_hook("stop")
+shutil.rmtree(hook_home, ignore_errors=True)
+
+# --- 15. GIT HEAD RESOLUTION (no subprocess) ---
+print()
+print("--- 15. GIT HEAD RESOLUTION ---")
+git_root = Path(tempfile.mkdtemp(prefix="ark-git-"))
+sha_a, sha_b, sha_c = "a" * 40, "b" * 40, "c" * 40
+repo = git_root / "repo"
+(repo / ".git" / "refs" / "heads").mkdir(parents=True)
+(repo / "src" / "deep").mkdir(parents=True)
+(repo / ".git" / "HEAD").write_text("ref: refs/heads/main\n", encoding="utf-8")
+(repo / ".git" / "refs" / "heads" / "main").write_text(sha_a + "\n", encoding="utf-8")
+(repo / ".git" / "packed-refs").write_text(
+    "# pack-refs with: peeled fully-peeled sorted\n"
+    f"{sha_b} refs/heads/release\n^{sha_c}\n", encoding="utf-8")
+
+check("Loose ref", ark._get_git_head(str(repo)) == ("main", sha_a))
+check("Resolves from subdirectory", ark._get_git_head(str(repo / "src" / "deep")) == ("main", sha_a))
+(repo / ".git" / "refs" / "heads" / "main").write_text(sha_c + "\n", encoding="utf-8")
+os.utime(repo / ".git" / "refs" / "heads" / "main", ns=(1, 1))
+check("Cache invalidated by ref change", ark._get_git_head(str(repo)) == ("main", sha_c))
+(repo / ".git" / "HEAD").write_text("ref: refs/heads/release\n", encoding="utf-8")
+os.utime(repo / ".git" / "HEAD", ns=(2, 2))
+check("Packed ref", ark._get_git_head(str(repo)) == ("release", sha_b))
+(repo / ".git" / "refs" / "heads" / "release").write_text(sha_a + "\n", encoding="utf-8")
+check("Loose ref written after pack-refs wins", ark._get_git_head(str(repo)) == ("release", sha_a))
+(repo / ".git" / "HEAD").write_text("ref: refs/heads/fresh\n", encoding="utf-8")
+os.utime(repo / ".git" / "HEAD", ns=(4, 4))
+check("Unborn branch", ark._get_git_head(str(repo)) == ("fresh", ""))
+(repo / ".git" / "refs" / "heads" / "fresh").write_text(sha_b + "\n", encoding="utf-8")
+check("First commit on unborn branch seen", ark._get_git_head(str(repo)) == ("fresh", sha_b))
+(repo / ".git" / "HEAD").write_text(sha_a + "\n", encoding="utf-8")
+os.utime(repo / ".git" / "HEAD", ns=(5, 5))
+check("Detached HEAD", ark._get_git_head(str(repo)) == ("HEAD", sha_a))
+
+wt_gitdir = repo / ".git" / "worktrees" / "wt"
+wt_gitdir.mkdir(parents=True)
+(wt_gitdir / "HEAD").write_text("ref: refs/heads/main\n", encoding="utf-8")
+(wt_gitdir / "commondir").write_text("../..\n", encoding="utf-8")
+worktree = git_root / "wt"
+worktree.mkdir()
+(worktree / ".git").write_text(f"gitdir: {wt_gitdir}\n", encoding="utf-8")
+check("Worktree via gitdir file + commondir", ark._get_git_head(str(worktree)) == ("main", sha_c))
+check("Outside a repository", ark._get_git_head(str(git_root)) == ("-", ""))
+check("_get_git_branch wraps resolver", ark._get_git_branch(str(worktree)) == "main")
+shutil.rmtree(git_root, ignore_errors=True)
+
+# --- 16. BUFFERED EVENT WRITER ---
+print()
+print("--- 16. BUFFERED EVENT WRITER ---")
+ev_dir = Path(tempfile.mkdtemp(prefix="ark-events-"))
+fake_now = [datetime(2026, 3, 1, 23, 59, 58).timestamp()]
+writer = ark.EventWriter(log_dir=ev_dir, max_events=3, max_delay=3600, clock=lambda: fake_now[0])
+writer.append({"event": "a"})
+writer.append({"event": "b"})
+check("Events buffered below threshold", not list(ev_dir.glob("*.jsonl")) and len(writer) == 2)
+fake_now[0] += 4  # crosses midnight
+writer.append({"event": "c"})
+day1 = (ev_dir / "2026-03-01.jsonl").read_text(encoding="utf-8").splitlines()
+day2 = (ev_dir / "2026-03-02.jsonl").read_text(encoding="utf-8").splitlines()
+check("Size threshold commits the group", len(writer) == 0)
+check("Midnight rollover splits by event day", len(day1) == 2 and len(day2) == 1, f"{len(day1)}/{len(day2)}")
+writer.close()
+
+per_event = ark.EventWriter(log_dir=ev_dir, max_events=100, fsync="event", clock=lambda: fake_now[0])
+per_event.append({"event": "d"})
+day2 = (ev_dir / "2026-03-02.jsonl").read_text(encoding="utf-8").splitlines()
+check("fsync=event commits immediately", len(day2) == 2)
+per_event.close()
+shutil.rmtree(ev_dir, ignore_errors=True)
+
+# --- 17. LOG RETENTION ENGINE (temp log dir) ---
+print()
+print("--- 17. LOG RETENTION ENGINE ---")
+_saved_ret = {k: getattr(ark, k) for k in ("LOG_DIR", "LOG_ARCHIVE_DIR", "LOG_INDEX_DIR", "RETENTION_STAMP", "LOG_MAX_BYTES")}
+ret_dir = Path(tempfile.mkdtemp(prefix="ark-retention-"))
+ark.LOG_DIR = ret_dir
+ark.LOG_ARCHIVE_DIR = ret_dir / "archive"
+ark.LOG_INDEX_DIR = ret_dir / "index"
+ark.RETENTION_STAMP = ret_dir / ".retention"
+try:
+    def _day(n):
+        return (datetime.now() - timedelta(days=n)).strftime("%Y-%m-%d")
+
+    aged, ancient, fresh = _day(40), _day(500), _day(0)
+    for day in (aged, ancient, fresh):
+        (ret_dir / f"{day}.jsonl").write_text(json.dumps({"event": "e", "day": day}) + "\n", encoding="utf-8")
+    ark.LOG_ARCHIVE_DIR.mkdir()
+    (ark.LOG_ARCHIVE_DIR / f"{aged[:7]}.jsonl.gz.999999.tmp").write_bytes(b"torn")
+    with ark._file_lock(ark.LOG_ARCHIVE_DIR / ".retention.lock") as held:
+        skipped = ark.cleanup_old_logs()
+    check("Concurrent retention pass skipped while one runs",
+          held and skipped is False and (ret_dir / f"{aged}.jsonl").exists())
+    check("Retention pass runs once the lock is free", ark.cleanup_old_logs() is True
+          and not list(ark.LOG_ARCHIVE_DIR.glob("*.tmp")))
+    bundle = ret_dir / "archive" / f"{aged[:7]}.jsonl.gz"
+    check("Aged raw log folded into monthly bundle", bundle.exists() and not (ret_dir / f"{aged}.jsonl").exists())
+    check("Bundles past archive window deleted", not (ret_dir / "archive" / f"{ancient[:7]}.jsonl.gz").exists())
+    check("Fresh raw log untouched", (ret_dir / f"{fresh}.jsonl").exists())
+    days = [e.get("day") for e in ark.iter_events()]
+    check("Bundles stay readable via iter_events", days == [aged, fresh], str(days))
+    ark.cleanup_old_logs()
+    check("Re-run does not duplicate bundled days", [e.get("day") for e in ark.iter_events()] == [aged, fresh])
+    check("Bundle members name their days", ark._bundle_days(aged[:7]) == {aged})
+    # Crash after the bundle rename but before the raw day was deleted
+    (ret_dir / f"{aged}.jsonl").write_text(json.dumps({"event": "e", "day": aged}) + "\n", encoding="utf-8")
+    ark.cleanup_old_logs()
+    check("Interrupted bundling is not repeated",
+          [e.get("day") for e in ark.iter_events()] == [aged, fresh]
+          and not (ret_dir / f"{aged}.jsonl").exists())
+    try:
+        ark._bundle_month(aged[:7], [(aged, ret_dir / f"{aged}.jsonl")])
+        check("Day already deleted by another pass is tolerated", True)
+    except OSError as e:
+        check("Day already deleted by another pass is tolerated", False, str(e))
+    import gzip
+    legacy_month = _day(70)[:7]
+    with gzip.open(ret_dir / "archive" / f"{legacy_month}.jsonl.gz", "wb") as f:
+        f.write(b"{}\n")
+    (ret_dir / "archive" / "index.json").write_text(json.dumps({legacy_month: [f"{legacy_month}-02"]}))
+    check("Legacy bundles read their days from index.json",
+          ark._bundle_days(legacy_month) == {f"{legacy_month}-02"})
+    check("Retention gated by last-run stamp", ark.maybe_run_retention() is False)
+    ark.LOG_MAX_BYTES = 1
+    ark.cleanup_old_logs()
+    check("Byte cap evicts bundles before today's log",
+          not bundle.exists() and (ret_dir / f"{fresh}.jsonl").exists())
+finally:
+    for k, v in _saved_ret.items():
+        setattr(ark, k, v)
+    shutil.rmtree(ret_dir, ignore_errors=True)
+
+# --- 18. EVENT QUERY ENGINE (temp log dir) ---
+print()
+print("--- 18. EVENT QUERY ENGINE ---")
+import ark_events
+_saved_q = {k: getattr(ark, k) for k in ("LOG_DIR", "LOG_ARCHIVE_DIR", "LOG_INDEX_DIR")}
+q_dir = Path(tempfile.mkdtemp(prefix="ark-query-"))
+ark.LOG_DIR = q_dir
+ark.LOG_ARCHIVE_DIR = q_dir / "archive"
+ark.LOG_INDEX_DIR = q_dir / "index"
+try:
+    today = datetime.now().strftime("%Y-%m-%d")
+    yesterday = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
+    for day in (yesterday, today):
+        with open(q_dir / f"{day}.jsonl", "w", encoding="utf-8") as f:
+            for i in range(300):
+                f.write(json.dumps({
+                    "event": "crash" if i % 50 == 0 else "heartbeat",
+                    "session_id": f"q-{i % 3}", "callsign": f"QRY-{i % 3:04d}",
+                    "workspace": "07-Query-Space", "ts": f"{day}T10:{i // 60:02d}:{i % 60:02d}", "n": i,
+                }) + "\n")
+    hits = list(ark_events.query_events(session="q-1"))
+    check("Query by session returns all matches in order",
+          len(hits) == 200 and hits[0]["ts"] < hits[-1]["ts"], str(len(hits)))
+    check("Queries do not write indexes", not (q_dir / "index").exists())
+    check("Maintenance indexes every raw day", ark_events.update_indexes() == 600
+          and (q_dir / "index" / f"{today}.session_id.idx").exists()
+          and (q_dir / "index" / f"{yesterday}.event.idx").exists())
+    check("Indexed query matches scan", list(ark_events.query_events(session="q-1")) == hits)
+    check("Indexes are up to date", ark_events.update_indexes() == 0)
+    crashes = list(ark_events.query_events(event="crash", workspace="07-Query-Space", since=today))
+    check("Combined filters + since", len(crashes) == 6 and all(e["ts"] >= today for e in crashes), str(len(crashes)))
+    with open(q_dir / f"{today}.jsonl", "a", encoding="utf-8") as f:
+        f.write(json.dumps({"event": "crash", "session_id": "q-new", "ts": f"{today}T23:59:59"}) + "\n")
+    check("Query scans ranges not yet indexed",
+          [e["session_id"] for e in ark_events.query_events(session="q-new")] == ["q-new"])
+    today_log = q_dir / f"{today}.jsonl"
+    ark_events.update_indexes()
+    with open(ark._log_index_path(today_log, "session_id"), "ab") as f:
+        f.write(b'12\t"q-')  # torn append
+    writer = ark.EventWriter(log_dir=q_dir)
+    writer.append({"event": "stop", "session_id": "q-writer", "ts": f"{today}T23:59:59"})
+    writer.close()
+    offsets, ranges = ark_events.read_postings(today_log, "session_id", "q-writer")
+    check("Writer appends postings with each commit",
+          len(offsets) == 1 and ark_events._gaps(ranges, today_log.stat().st_size) == [],
+          str(ranges[-2:]))
+    check("Torn postings append is skipped",
+          not ark_events.read_postings(today_log, "session_id", "q-")[0]
+          and [e["event"] for e in ark_events.query_events(session="q-writer")] == ["stop"])
+    last = ark_events.tail_events(20)
+    check("Tail returns last N oldest-first", len(last) == 20 and last[-1]["session_id"] == "q-writer"
+          and last[0]["n"] == 282, str(last[0].get("n")))
+    tail_crash = ark_events.tail_events(8, event="crash")
+    check("Tail with filter spans daily files",
+          [e.get("n") for e in tail_crash] == [250, 0, 50, 100, 150, 200, 250, None]
+          and tail_crash[0]["ts"].startswith(yesterday))
+    lines = list(ark_events._reverse_lines(q_dir / f"{today}.jsonl", block=97))
+    check("Reverse reader handles lines spanning blocks",
+          len(lines) == 302 and json.loads(lines[-1])["n"] == 0)
+    (q_dir / f"{yesterday}.jsonl").unlink()
+    ark.prune_log_indexes()
+    check("Orphaned postings pruned", not list((q_dir / "index").glob(f"{yesterday}.*"))
+          and (q_dir / "index" / f"{today}.event.idx").exists())
+finally:
+    for k, v in _saved_q.items():
+        setattr(ark, k, v)
+    shutil.rmtree(q_dir, ignore_errors=True)
+
+# --- 19. SESSION ANALYTICS (temp log dir) ---
+print()
+print("--- 19. SESSION ANALYTICS ---")
+import ark_stats
+_saved_st = {k: getattr(ark, k) for k in ("LOG_DIR", "LOG_ARCHIVE_DIR", "LOG_INDEX_DIR", "STATS_FILE")}
+st_dir = Path(tempfile.mkdtemp(prefix="ark-stats-"))
+ark.LOG_DIR = st_dir / "log"
+ark.LOG_ARCHIVE_DIR = st_dir / "log" / "archive"
+ark.LOG_INDEX_DIR = st_dir / "log" / "index"
+ark.STATS_FILE = st_dir / "stats.json"
+ark.LOG_DIR.mkdir(parents=True)
+
+
+def _log(day, *events):
+    with open(ark.LOG_DIR / f"{day}.jsonl", "a", encoding="utf-8") as f:
+        for ev in events:
+            f.write(json.dumps(ev) + "\n")
+
+
+try:
+    d1, d2 = "2026-03-02", "2026-03-03"  # same ISO week
+    _log(d1,
+         {"event": "start", "session_id": "s1", "workspace": "07-Alpha", "model": "Opus", "ts": f"{d1}T09:00:00"},
+         {"event": "start", "session_id": "s2", "workspace": "07-Alpha", "model": "Opus", "ts": f"{d1}T09:05:00"},
+         {"event": "start", "session_id": "s3", "workspace": "08-Beta", "model": "Sonnet", "ts": f"{d1}T09:10:00"},
+         {"event": "stop", "session_id": "s1", "duration_min": 30, "compact_count": 2, "ts": f"{d1}T09:30:00"},
+         {"event": "crash", "session_id": "s2", "workspace": "07-Alpha", "ts": f"{d1}T10:00:00"},
+         {"event": "stop", "session_id": "s3", "duration_min": 4, "compact_count": 0, "ts": f"{d1}T09:14:00"})
+    rows = ark_stats.report(ark_stats.update(), by="workspace", period="day")
+    alpha = next(r for r in rows if r["workspace"] == "07-Alpha")
+    check("Per-workspace counts and crash rate",
+          alpha["sessions"] == 2 and alpha["crashes"] == 1 and alpha["crash_rate"] == 0.5, str(alpha))
+    check("Compaction rate and duration percentile",
+          alpha["compaction_rate"] == 2.0 and alpha["duration_p50"] == 30, str(alpha))
+    cp = json.loads(ark.STATS_FILE.read_text())["checkpoint"]
+    check("Checkpoint records the backend cursor",
+          cp["cursor"]["backend"] == "file"
+          and cp["cursor"]["days"] == {d1: (ark.LOG_DIR / f"{d1}.jsonl").stat().st_size}, str(cp))
+
+    _log(d1, {"event": "start", "session_id": "s4", "workspace": "07-Alpha", "model": "Opus", "ts": f"{d1}T11:00:00"})
+    _log(d2, {"event": "stop", "session_id": "s4", "duration_min": 90, "compact_count": 1, "ts": f"{d2}T00:30:00"},
+         {"event": "start", "session_id": "s5", "workspace": "08-Beta", "model": "Opus", "ts": f"{d2}T08:00:00"})
+    incremental = ark_stats.update()
+    weekly = ark_stats.report(incremental, by="workspace", period="week")
+    alpha_w = next(r for r in weekly if r["workspace"] == "07-Alpha")
+    check("Incremental run adds only new events",
+          alpha_w["sessions"] == 3 and alpha_w["stopped"] == 2 and alpha_w["period"] == "2026-W10", str(alpha_w))
+    check("Stop joined to start across days",
+          next(r for r in ark_stats.report(incremental, period="day") if r["workspace"] == "07-Alpha")["stopped"] == 2)
+    by_model = {r["model"]: r["sessions"] for r in ark_stats.report(incremental, by="model", period="week")}
+    check("Per-model rollup", by_model == {"Opus": 4, "Sonnet": 1}, str(by_model))
+    rebuilt = ark_stats.update(rebuild=True)
+    check("Incremental matches full rebuild",
+          ark_stats.report(rebuilt, period="day") == ark_stats.report(incremental, period="day"))
+
+    # Retention bundles a day after more was appended to it
+    _log(d1, {"event": "start", "session_id": "s6", "workspace": "08-Beta", "model": "Opus", "ts": f"{d1}T12:00:00"})
+    ark._bundle_month(d1[:7], [(d1, ark.LOG_DIR / f"{d1}.jsonl")])
+    bundled = ark_stats.update()
+    beta = next(r for r in ark_stats.report(bundled, period="day") if r["workspace"] == "08-Beta" and r["period"] == d1)
+    cp = json.loads(ark.STATS_FILE.read_text())["checkpoint"]["cursor"]
+    check("Day bundled mid-read resumes inside the bundle",
+          beta["sessions"] == 2 and d1 not in cp["days"] and cp["bundled"] == d1, str(beta))
+    check("Bundled history matches full rebuild",
+          ark_stats.report(ark_stats.update(), period="day")
+          == ark_stats.report(ark_stats.update(rebuild=True), period="day"))
+finally:
+    for k, v in _saved_st.items():
+        setattr(ark, k, v)
+    shutil.rmtree(st_dir, ignore_errors=True)
+
+# --- 20. MEMORY SEARCH (temp workspace) ---
+print()
+print("--- 20. MEMORY SEARCH ---")
+import ark_memory
+import ark_search
+_saved_mi = ark.MEMORY_INDEX_DIR
+mem_ws = Path(tempfile.mkdtemp(prefix="ark-memory-ws-"))
+ark.MEMORY_INDEX_DIR = mem_ws / ".index"
+try:
+    for sub in ("registers", "daily", "archive"):
+        (mem_ws / "memory" / sub).mkdir(parents=True)
+    (mem_ws / "CLAUDE.local.md").write_text(
+        "# Working Memory\n- Use Postgres 16 for the ledger service ^a1b2c3d4\n", encoding="utf-8")
+    (mem_ws / "memory" / "registers" / "decisions.md").write_text(
+        "# Decisions\n<!--\n- **choice**: postgres template example\n-->\n"
+        "## 2026-03-01: Database\n- **choice**: Postgres over MySQL for the ledger ^c3d4e5f6\n"
+        "- MySQL for ledger [superseded: 2026-03-01] ^d4e5f6a7\n", encoding="utf-8")
+    (mem_ws / "memory" / "daily" / "2026-10-17.md").write_text(
+        "# 2026-10-17\n\n## Notes\n- debugged postgres migration timeout\n", encoding="utf-8")
+    (mem_ws / "memory" / "archive" / "2025-q4.md").write_text(
+        "# Archive\n- Ledger ran on MySQL 5.7 until 2025-12\n", encoding="utf-8")
+
+    hits = ark_search.search("postgres ledger", workspace=mem_ws)
+    check("Search ranks lines matching all words first",
+          [h["file"] for h in hits[:2]] == ["CLAUDE.local.md", "memory/registers/decisions.md"], str(hits[:2]))
+    check("Hit carries line, tier, entry ID",
+          hits[0]["line"] == 2 and hits[0]["tier"] == "working" and hits[0]["id"] == "a1b2c3d4")
+    check("Template comments are not indexed", not any("template" in h["text"] for h in hits))
+    mysql_ids = [h["id"] for h in ark_search.search("mysql ledger", workspace=mem_ws)]
+    check("Superseded entries rank below live ones",
+          mysql_ids.index("c3d4e5f6") < mysql_ids.index("d4e5f6a7"), str(mysql_ids))
+    check("Archive line indexed", [h["line"] for h in ark_search.search("until", workspace=mem_ws)] == [2])
+    check("Tier filter", {h["tier"] for h in ark_search.search("ledger", workspace=mem_ws, tier="archive")} == {"archive"})
+    check("Date filter + prefix query",
+          [h["file"] for h in ark_search.search("migr*", workspace=mem_ws, since="2026-10-01")]
+          == ["memory/daily/2026-10-17.md"])
+
+    parsed = []
+    _orig_parse = ark_memory.parse_memory_file
+    ark_memory.parse_memory_file = lambda path, tier: parsed.append(Path(path).name) or _orig_parse(path, tier)
+    try:
+        ark_search.update_index(mem_ws)
+        check("Unchanged files are not re-read", parsed == [], str(parsed))
+        with open(mem_ws / "memory" / "daily" / "2026-10-17.md", "a", encoding="utf-8") as f:
+            f.write("- kafka consumer lag alert\n")
+        (mem_ws / "memory" / "archive" / "2025-q4.md").unlink()
+        ark_search.update_index(mem_ws)
+        check("Only the modified file is re-indexed", parsed == ["2026-10-17.md"], str(parsed))
+    finally:
+        ark_memory.parse_memory_file = _orig_parse
+    check("Appended line searchable", [h["line"] for h in ark_search.search("kafka", workspace=mem_ws)] == [5])
+    check("Deleted file dropped from index", ark_search.search("until", workspace=mem_ws) == [])
+    for n in range(10):
+        (mem_ws / "memory" / "registers" / "decisions.md").write_text(
+            f"# Decisions\n- revision{n} Postgres over MySQL ^c3d4e5f6\n", encoding="utf-8")
+        compacted = ark_search.update_index(mem_ws)
+    check("Tombstones compacted: at most half the stored lines are dead",
+          compacted["dead"] * 2 <= len(compacted["lines"])
+          and compacted["lines"].count(None) == compacted["dead"], str(compacted["dead"]))
+    check("Search correct after compaction",
+          [h["text"][:11] for h in ark_search.search("revision9 revision8", workspace=mem_ws)] == ["- revision9"])
+finally:
+    ark.MEMORY_INDEX_DIR = _saved_mi
+    shutil.rmtree(mem_ws, ignore_errors=True)
+
+# --- 21. ENTRY ID INDEX (temp workspace) ---
+print()
+print("--- 21. ENTRY ID INDEX ---")
+import ark_ids
+_saved_mi = ark.MEMORY_INDEX_DIR
+id_ws = Path(tempfile.mkdtemp(prefix="ark-ids-ws-"))
+ark.MEMORY_INDEX_DIR = id_ws / ".index"
+try:
+    (id_ws / "memory" / "registers").mkdir(parents=True)
+    (id_ws / "memory" / "daily").mkdir(parents=True)
+    (id_ws / "CLAUDE.local.md").write_text(
+        "# Working\n- Use Postgres ^a1b2c3d4\n- Legacy fact ^tr0123456789\n", encoding="utf-8")
+    (id_ws / "memory" / "registers" / "decisions.md").write_text(
+        "# Decisions\n- MySQL [superseded: 2026-03-01] ^c3d4e5f6\n", encoding="utf-8")
+    (id_ws / "memory" / "daily" / "2026-10-17.md").write_text(
+        "# 2026-10-17\n- revisited ^a1b2c3d4\n", encoding="utf-8")
+
+    check("lookup finds ID with line and tier",
+          ark_ids.lookup("^a1b2c3d4", id_ws) == [
+              {"file": "CLAUDE.local.md", "line": 2, "tier": "working", "superseded": False}])
+    check("lookup handles legacy IDs and superseded flag",
+          ark_ids.lookup("tr0123456789", id_ws)[0]["line"] == 3
+          and ark_ids.lookup("c3d4e5f6", id_ws)[0]["superseded"] is True)
+    check("Daily-log mention is not a definition", len(ark_ids.lookup("a1b2c3d4", id_ws)) == 1)
+
+    parsed = []
+    draws = iter(["a1b2c3d4", "c3d4e5f6", "0badf00d", "0badf00d", "1badf00d"])
+    _orig_parse, _orig_token = ark_memory.parse_memory_file, ark_ids.secrets.token_hex
+    ark_memory.parse_memory_file = lambda path, tier: parsed.append(path) or _orig_parse(path, tier)
+    ark_ids.secrets.token_hex = lambda n: next(draws)
+    try:
+        first = ark_ids.new_id(id_ws)
+        second = ark_ids.new_id(id_ws)
+    finally:
+        ark_memory.parse_memory_file, ark_ids.secrets.token_hex = _orig_parse, _orig_token
+    check("new_id skips IDs already in use", first == "0badf00d", first)
+    check("new_id never repeats a reserved ID", second == "1badf00d", second)
+    check("new_id reads no memory files when nothing changed", parsed == [], str(parsed))
+
+    with open(id_ws / "CLAUDE.local.md", "a", encoding="utf-8") as f:
+        f.write(f"- New fact ^{first}\n")
+    check("Incremental update picks up newly written ID",
+          [loc["line"] for loc in ark_ids.lookup(first, id_ws)] == [4])
+    reserved = (ark_ids.ark_memory.index_dir(id_ws) / "ids.reserved").read_text()
+    check("Written ID drops out of reservations", first not in reserved and second in reserved)
+    check("Clean workspace passes integrity check",
+          ark_ids.check_integrity(id_ws) == {"duplicates": {}, "dangling": []})
+
+    with open(id_ws / "memory" / "registers" / "decisions.md", "a", encoding="utf-8") as f:
+        f.write("- Copied fact ^a1b2c3d4\n- Replaces ^deadbeef (old claim)\n")
+    report = ark_ids.check_integrity(id_ws)
+    check("Integrity check reports duplicates",
+          [loc["file"] for loc in report["duplicates"].get("a1b2c3d4", [])]
+          == ["CLAUDE.local.md", "memory/registers/decisions.md"], str(report))
+    check("Integrity check reports dangling mentions",
+          [(d["id"], d["line"]) for d in report["dangling"]] == [("deadbeef", 4)], str(report["dangling"]))
+    ids = ark_ids.new_id(id_ws, count=500)
+    check("Bulk new_id: unique and unused", len(set(ids)) == 500
+          and not {"a1b2c3d4", "c3d4e5f6", first, second} & set(ids))
+finally:
+    ark.MEMORY_INDEX_DIR = _saved_mi
+    shutil.rmtree(id_ws, ignore_errors=True)
+
+# --- 22. DEMOTION SCORING (temp workspace) ---
+print()
+print("--- 22. DEMOTION SCORING ---")
+import ark_demote
+_saved_mi = ark.MEMORY_INDEX_DIR
+dm_ws = Path(tempfile.mkdtemp(prefix="ark-demote-ws-"))
+ark.MEMORY_INDEX_DIR = dm_ws / ".index"
+try:
+    (dm_ws / "memory" / "daily").mkdir(parents=True)
+    (dm_ws / "CLAUDE.local.md").write_text(
+        "# Working Memory\n\n## Pinned\n- Never push to main directly\n\n"
+        "## Current\n"
+        "- Ledger service runs Postgres 16 with pgbouncer pooling ^a1b2c3d4\n"
+        "- **claim**: Invoices export as CSV for finance\n"
+        "  **confidence**: high | **last_verified**: 2026-10-10\n"
+        "- Kubernetes staging cluster uses spot nodes\n"
+        "- Old deploy script lives in tools/deploy.sh [superseded: 2026-09-01]\n"
+        "- Grafana dashboards owned by platform team [pinned]\n"
+        "- Quarterly audit due 2026-11-30\n", encoding="utf-8")
+    (dm_ws / "memory" / "daily" / "2026-10-15.md").write_text(
+        "# 2026-10-15\n- checked ^a1b2c3d4 after the upgrade\n", encoding="utf-8")
+    (dm_ws / "memory" / "daily" / "2026-09-20.md").write_text(
+        "# 2026-09-20\n- staging spot nodes got evicted twice\n", encoding="utf-8")
+
+    total, entries = ark_demote.parse_entries(dm_ws / "CLAUDE.local.md")
+    check("Entries group continuation lines",
+          [e["line"] for e in entries] == [4, 7, 8, 10, 11, 12, 13], str([e["line"] for e in entries]))
+    check("Word cost excludes entry IDs",
+          entries[1]["words"] == 8 and total == sum(e["words"] for e in entries) + 4, str(total))
+    check("last_verified and pin markers parsed",
+          entries[2]["dated"] == "2026-10-10" and entries[0]["pinned"] and entries[5]["pinned"])
+
+    report = ark_demote.score_workspace(dm_ws, today="2026-10-18", limit=1000)
+    by_line = {c["line"]: c for c in report["candidates"]}
+    check("Within budget: only stale and superseded entries", sorted(by_line) == [10, 11], str(sorted(by_line)))
+    check("Superseded entry ranked first as archive",
+          report["candidates"][0]["line"] == 11 and report["candidates"][0]["action"] == "archive")
+    check("Term co-occurrence in daily log dates an entry",
+          by_line[10]["last_seen"] == "2026-09-20" and by_line[10]["stale_days"] == 28, str(by_line[10]))
+
+    pressured = ark_demote.score_workspace(dm_ws, today="2026-10-18", limit=20)
+    lines = [c["line"] for c in pressured["candidates"]]
+    check("Over budget: fresher entries fill the excess, pinned never",
+          pressured["over"] == total - 20 and 4 not in lines and 12 not in lines
+          and pressured["candidates"][-1]["freed"] >= pressured["over"], str(lines))
+    fresh = {c["line"]: c for c in ark_demote.score_workspace(dm_ws, today="2026-10-18", limit=0)["candidates"]}
+    check("ID mention in daily log keeps entry fresh",
+          fresh[7]["last_seen"] == "2026-10-15" and fresh[7]["stale_days"] == 3, str(fresh[7]))
+    check("Future deadline keeps entry fresh", fresh[13]["stale_days"] == 0, str(fresh[13]))
+
+    parsed = []
+    _orig_parse = ark_memory.parse_memory_file
+    ark_memory.parse_memory_file = lambda path, tier: parsed.append(Path(path).name) or _orig_parse(path, tier)
+    try:
+        again = ark_demote.score_workspace(dm_ws, today="2026-10-18", limit=1000)
+        check("Unchanged workspace scored from cache", parsed == [] and again == report, str(parsed))
+        with open(dm_ws / "memory" / "daily" / "2026-09-20.md", "a", encoding="utf-8") as f:
+            f.write("- kubernetes staging upgrade on 2026-10-16\n")
+        os.utime(dm_ws / "memory" / "daily" / "2026-09-20.md", None)
+        updated = ark_demote.score_workspace(dm_ws, today="2026-10-18", limit=1000)
+        check("Changed daily log re-matched without re-parsing working memory",
+              "CLAUDE.local.md" not in parsed and [c["line"] for c in updated["candidates"]] == [11],
+              str(parsed))
+    finally:
+        ark_memory.parse_memory_file = _orig_parse
+    check("Workspace without CLAUDE.local.md", ark_demote.score_workspace(dm_ws / "memory") is None)
+finally:
+    ark.MEMORY_INDEX_DIR = _saved_mi
+    shutil.rmtree(dm_ws, ignore_errors=True)
+
+# --- 23. BULK INSTALLER (temp workspace root) ---
+print()
+print("--- 23. BULK INSTALLER ---")
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import install_all
+_saved_tpl = (install_all.TEMPLATE_DIR, install_all.RULES_SRC, install_all.TEMPLATE_MAP)
+inst_root = Path(tempfile.mkdtemp(prefix="ark-install-"))
+try:
+    tpl = inst_root / ".templates"
+    (tpl / "registers").mkdir(parents=True)
+    (tpl / "SCHEMA.md").write_text("# Schema v1\n", encoding="utf-8")
+    (tpl / "registers" / "people.md").write_text("# People\n", encoding="utf-8")
+    install_all.TEMPLATE_DIR = tpl
+    install_all.RULES_SRC = tpl / "rules.md"  # missing: reported, not fatal
+    install_all.TEMPLATE_MAP = {"SCHEMA.md": "memory/SCHEMA.md",
+                                "registers/people.md": "memory/registers/people.md"}
+    for name in ("alpha", "beta", "gamma"):
+        (inst_root / name / ".git").mkdir(parents=True)
+    (inst_root / "not-a-workspace").mkdir()
+
+    workspaces = install_all.discover_workspaces(inst_root)
+    check("Workspaces discovered by marker", [p.name for p in workspaces] == ["alpha", "beta", "gamma"],
+          str([p.name for p in workspaces]))
+
+    results, missing = install_all.install_all(workspaces, jobs=3)
+    alpha = inst_root / "alpha"
+    check("Parallel first install creates templates and manifest",
+          all(sorted(r["created"])[:2] == [".gitignore (updated)", "memory/SCHEMA.md"] for r in results)
+          and (alpha / install_all.MANIFEST).exists() and missing == [str(tpl / "rules.md")],
+          str(results[0]["created"]))
+    check("Manifest ignored by git",
+          install_all.MANIFEST in (alpha / ".gitignore").read_text(encoding="utf-8").splitlines())
+
+    reads = []
+    _orig_read = Path.read_bytes
+    Path.read_bytes = lambda self: reads.append(self.name) or _orig_read(self)
+    try:
+        rerun, _ = install_all.install_all(workspaces, jobs=3)
+    finally:
+        Path.read_bytes = _orig_read
+    check("Re-run skips unchanged files without reading them",
+          all(not r["created"] and not r["updated"] for r in rerun)
+          and sorted(reads) == ["SCHEMA.md", "people.md", "rules.md"], str(reads))
+
+    (alpha / "memory" / "registers" / "people.md").write_text("# People\n- Ana, finance\n", encoding="utf-8")
+    (tpl / "SCHEMA.md").write_text("# Schema v2\n", encoding="utf-8")
+    (tpl / "registers" / "people.md").write_text("# People (v2)\n", encoding="utf-8")
+    before = (alpha / "memory" / "SCHEMA.md").read_text(encoding="utf-8")
+    dry = install_all.install_workspace(alpha, install_all.load_templates()[0], update=True, dry_run=True)
+    check("Dry run diffs stale templates and writes nothing",
+          "+# Schema v2" in dry["diffs"].get("memory/SCHEMA.md", "")
+          and (alpha / "memory" / "SCHEMA.md").read_text(encoding="utf-8") == before,
+          str(dry["diffs"]))
+    stale = install_all.install_workspace(alpha, install_all.load_templates()[0])
+    check("Changed template reported stale, edited copy a conflict",
+          stale["stale"] == ["memory/SCHEMA.md"] and stale["conflicts"] == ["memory/registers/people.md"],
+          f"{stale['stale']} {stale['conflicts']}")
+    updated = install_all.install_workspace(alpha, install_all.load_templates()[0], update=True)
+    check("--update replaces stale copies, never edited ones",
+          updated["updated"] == ["memory/SCHEMA.md"]
+          and (alpha / "memory" / "SCHEMA.md").read_text(encoding="utf-8") == "# Schema v2\n"
+          and "Ana" in (alpha / "memory" / "registers" / "people.md").read_text(encoding="utf-8"), str(updated))
+
+    (inst_root / "delta" / "memory" / "registers").mkdir(parents=True)
+    (inst_root / "delta" / "memory" / "registers" / "people.md").write_text("# Mine\n", encoding="utf-8")
+    legacy = install_all.install_workspace(inst_root / "delta", install_all.load_templates()[0], update=True)
+    check("Pre-manifest edited file left alone",
+          "memory/registers/people.md" in legacy["skipped"]
+          and (inst_root / "delta" / "memory" / "registers" / "people.md").read_text(encoding="utf-8") == "# Mine\n")
+finally:
+    install_all.TEMPLATE_DIR, install_all.RULES_SRC, install_all.TEMPLATE_MAP = _saved_tpl
+    shutil.rmtree(inst_root, ignore_errors=True)
+
+# --- 24. FEDERATION (two simulated machines) ---
+print()
+print("--- 24. FEDERATION ---")
+import ark_federate
+_saved_fed = {k: getattr(ark, k) for k in ("LOG_DIR", "LOG_ARCHIVE_DIR", "LOG_INDEX_DIR", "FEDERATION_DIR",
+                                           "get_machine_id", "_read_active")}
+fed_root = Path(tempfile.mkdtemp(prefix="ark-federate-"))
+fed_shared = fed_root / "shared"
+fed_registry = {
+    "alpha": {"fa-1": {"status": "stopped", "callsign": "FED-fa1"}},
+    "beta": {"fb-1": {"status": "crashed", "callsign": "FED-fb1"}},
+}
+
+
+def as_machine(name):
+    ark.LOG_DIR = fed_root / name / "log"
+    ark.LOG_ARCHIVE_DIR = ark.LOG_DIR / "archive"
+    ark.LOG_INDEX_DIR = ark.LOG_DIR / "index"
+    ark.FEDERATION_DIR = fed_root / name / "federation"
+    ark.get_machine_id = lambda: name
+    ark._read_active = lambda: dict(fed_registry[name])
+
+
+def fed_log(name, *events):
+    (fed_root / name / "log").mkdir(parents=True, exist_ok=True)
+    with open(fed_root / name / "log" / "2026-10-17.jsonl", "a", encoding="utf-8") as f:
+        for ev in events:
+            f.write(json.dumps(ev) + "\n")
+
+
+try:
+    fed_log("alpha",
+            {"event": "start", "session_id": "fa-1", "workspace": "07-Hub", "ts": "2026-10-17T09:00:00"},
+            {"event": "stop", "session_id": "fa-1", "duration_min": 30, "ts": "2026-10-17T09:30:00"})
+    fed_log("beta",
+            {"event": "start", "session_id": "fb-1", "workspace": "07-Hub", "ts": "2026-10-17T10:00:00"},
+            {"event": "crash", "session_id": "fb-1", "ts": "2026-10-17T10:20:00"})
+    as_machine("beta")
+    ark_federate.export(fed_shared)
+    as_machine("alpha")
+    exported = ark_federate.export(fed_shared)
+    merged = ark_federate.merge(fed_shared)
+    check("Export tags machine and ships deltas",
+          exported == {"machine": "alpha", "events": 2, "sessions": 1}, str(exported))
+    combined = ark_federate.combined_log_files()
+    check("Merge combines every machine",
+          merged["machines"] == ["alpha", "beta"] and merged["events"] == 4
+          and len(combined) == 1, str(merged))
+    crashes = list(ark_events.query_events(event="crash", log_files=combined))
+    check("Query tool reads merged events by machine",
+          [e["session_id"] for e in crashes] == ["fb-1"] and crashes[0]["machine"] == "beta"
+          and len(list(ark_events.query_events(machine="alpha", log_files=combined))) == 2)
+    check("Merged registry keyed by machine",
+          [(r["machine"], r["session_id"]) for r in ark_federate.federated_sessions()]
+          == [("alpha", "fa-1"), ("beta", "fb-1")])
+
+    again = ark_federate.sync(fed_shared)
+    check("Sync with nothing new ships and merges nothing",
+          again["export"]["events"] == 0 and again["export"]["sessions"] == 0
+          and again["merge"]["events"] == 0, str(again))
+
+    fed_log("alpha", {"event": "start", "session_id": "fa-2", "workspace": "07-Hub",
+                      "ts": "2026-10-17T11:00:00"})
+    fed_registry["alpha"] = {"fa-2": {"status": "active", "callsign": "FED-fa2"}}
+    inc = ark_federate.sync(fed_shared)
+    check("Incremental sync ships only new lines and registry changes",
+          inc["export"]["events"] == 1 and inc["export"]["sessions"] == 2
+          and inc["merge"]["events"] == 1, str(inc))
+    check("Removed session tombstoned in merged registry",
+          [r["session_id"] for r in ark_federate.federated_sessions(machine="alpha")] == ["fa-2"])
+
+    (ark.FEDERATION_DIR / "export.json").unlink()
+    resent = ark_federate.sync(fed_shared)
+    check("Re-sent events deduplicated",
+          resent["export"]["events"] == 3 and resent["merge"]["events"] == 0
+          and resent["merge"]["duplicates"] == 3
+          and sum(1 for _ in open(combined[0], encoding="utf-8")) == 5, str(resent))
+    check("Registry snapshot after state loss replaces old records",
+          [r["session_id"] for r in ark_federate.federated_sessions(machine="alpha")] == ["fa-2"])
+
+    rows = ark_stats.report(ark_stats.update(federated=True), period="day")
+    check("Stats tool aggregates every machine",
+          rows == [r for r in rows if r["workspace"] == "07-Hub"]
+          and rows[0]["sessions"] == 3 and rows[0]["crashes"] == 1, str(rows))
+
+    ark.get_machine_id = lambda: "unknown"
+    try:
+        ark_federate.export(fed_shared)
+        check("Export refuses an unconfigured machine id", False)
+    except ValueError:
+        check("Export refuses an unconfigured machine id", True)
+finally:
+    for key, value in _saved_fed.items():
+        setattr(ark, key, value)
+    shutil.rmtree(fed_root, ignore_errors=True)
+
+# --- 25. MACHINE CONFIG (temp config file) ---
+print()
+print("--- 25. MACHINE CONFIG ---")
+import io
+_saved_cfg = ark.MACHINE_CONFIG
+cfg_dir = Path(tempfile.mkdtemp(prefix="ark-config-"))
+ark.MACHINE_CONFIG = cfg_dir / "machine.local.yaml"
+ark._config_cache = None
+try:
+    ark.MACHINE_CONFIG.write_text(
+        "# build host\n"
+        "machine:\n"
+        "  id: \"buildbox-2\"   # quoted\n"
+        "  tags: [ci, linux]\n"
+        "workspace_root: D:/My-Applications\n"
+        "retention_days: 14\n"
+        "workspaces:\n"
+        "  07-Carbon-Meth-Hub:\n"
+        "    short: CARB\n"
+        "    aliases:\n"
+        "      - Carbon-Hub\n"
+        "    memory: " + str(cfg_dir / "carbon-memory") + "\n"
+        "  Side-Project: {short: SIDE, aliases: [sp]}\n"
+        "mounts:\n"
+        "- name: share\n"
+        "  path: 'C:\\Team''s'\n"
+        "- plain item\n", encoding="utf-8")
+    config = ark.load_config()
+    check("Nested mappings, lists and flow collections parsed",
+          config["machine"] == {"id": "buildbox-2", "tags": ["ci", "linux"]}
+          and config["retention_days"] == 14
+          and config["workspaces"]["Side-Project"] == {"short": "SIDE", "aliases": ["sp"]}
+          and config["mounts"] == [{"name": "share", "path": "C:\\Team's"}, "plain item"],
+          str(config))
+    check("Machine id read from machine: block only",
+          config["machine_id"] == "buildbox-2" and ark.get_machine_id() == "buildbox-2"
+          and config["workspace_root"] == "D:/My-Applications")
+
+    parses = []
+    _orig_parse_config = ark.parse_config
+    ark.parse_config = lambda text, path=None: parses.append(path) or _orig_parse_config(text, path)
+    try:
+        for _ in range(100):
+            ark.get_machine_id()
+        check("Repeated loads served from the mtime cache", parses == [], str(len(parses)))
+        ark.MACHINE_CONFIG.write_text("machine:\n  id: buildbox-3\n", encoding="utf-8")
+        os.utime(ark.MACHINE_CONFIG, ns=(1, 10 ** 18))
+        check("Edited config re-parsed once", ark.get_machine_id() == "buildbox-3"
+              and ark.get_machine_id() == "buildbox-3" and len(parses) == 1, str(len(parses)))
+    finally:
+        ark.parse_config = _orig_parse_config
+
+    errors = {
+        "machine:\n  id: a\n   extra: b\n": 3,
+        "machine:\n\tid: a\n": 2,
+        "a: 1\na: 2\n": 2,
+        "key: \"open\n": 1,
+        "just a string\n": 1,
+        "text: |\n  block\n": 1,
+    }
+    located = []
+    for text, line in errors.items():
+        try:
+            ark.parse_config(text, "cfg.yaml")
+            located.append(None)
+        except ark.ConfigError as e:
+            located.append(e.line)
+    check("Parse errors raised with their line", located == list(errors.values()), str(located))
+
+    ark.MACHINE_CONFIG.write_text("machine:\n  id: a\n    bad: indent\n", encoding="utf-8")
+    os.utime(ark.MACHINE_CONFIG, ns=(2, 2 * 10 ** 18))
+    _stderr, sys.stderr = sys.stderr, io.StringIO()
+    try:
+        hook_view = [ark._load_machine_config(), ark.get_machine_id(), ark.get_machine_id()]
+        warned = sys.stderr.getvalue()
+    finally:
+        sys.stderr = _stderr
+    check("Broken config reported once, hooks fail open",
+          hook_view == [None, "unknown", "unknown"] and warned.count("machine.local.yaml:3") == 1, warned)
+
+    ark.MACHINE_CONFIG.write_text(
+        "workspaces:\n  07-Carbon-Meth-Hub:\n    short: CARB\n    aliases: [Carbon-Hub]\n"
+        "    memory: " + str(cfg_dir / "carbon-memory") + "\n", encoding="utf-8")
+    os.utime(ark.MACHINE_CONFIG, ns=(3, 3 * 10 ** 18))
+    carbon = cfg_dir / "07-Carbon-Meth-Hub"
+    check("Short code override and alias",
+          ark._resolve_workspace_short(str(carbon)) == "CARB"
+          and ark._resolve_workspace_short(str(cfg_dir / "Carbon-Hub")) == "CARB"
+          and ark._resolve_workspace_short(str(cfg_dir / "07-Other-Hub")) == "OH")
+    (cfg_dir / "carbon-memory" / "daily").mkdir(parents=True)
+    (cfg_dir / "carbon-memory" / "daily" / "2026-10-17.md").write_text("# 2026-10-17\n", encoding="utf-8")
+    carbon.mkdir()
+    ark.sweep_session(str(carbon), "CARB-0001", 5)
+    check("Memory path override used by tools and the memory bridge",
+          [rel for rel, _, _ in ark_memory.memory_files(carbon)] == ["memory/daily/2026-10-17.md"]
+          and not (carbon / "memory").exists()
+          and len(list((cfg_dir / "carbon-memory" / "daily").glob("*.md"))) >= 1)
+finally:
+    ark.MACHINE_CONFIG = _saved_cfg
+    ark._config_cache = None
+    ark._ws_short_cache.clear()
+    shutil.rmtree(cfg_dir, ignore_errors=True)
+
+# --- 26. SHORT CODE TABLE (temp table + workspaces) ---
+print()
+print("--- 26. SHORT CODE TABLE ---")
+sc_root = Path(tempfile.mkdtemp(prefix="ark-shortcodes-ws-"))
+_saved_sc = (ark.SHORTCODES_FILE, ark.MACHINE_CONFIG)
+ark.SHORTCODES_FILE = sc_root / "shortcodes.json"
+ark.MACHINE_CONFIG = sc_root / "machine.local.yaml"
+ark._config_cache = None
+ark._ws_short_cache.clear()
+try:
+    carbon, cloud, cool = (str(sc_root / n) for n in ("07-Carbon-Meth-Hub", "12-Cloud-Mgmt-Hub", "Cool-Mint-Hub"))
+    for ws in (carbon, cloud, cool):
+        os.mkdir(ws)
+    codes = [ark._resolve_workspace_short(ws) for ws in (carbon, cloud, cool)]
+    check("Collisions extended with the next letter", codes == ["CMH", "CMHU", "CMHUB"], str(codes))
+    table = json.loads(ark.SHORTCODES_FILE.read_text())
+    check("Table records path, code and mtime",
+          table["paths"][carbon]["code"] == "CMH" and table["paths"][carbon]["mtime"] == os.stat(carbon).st_mtime_ns
+          and table["codes"]["CMHU"] == cloud)
+
+    ark._ws_short_cache.clear()
+    derived = []
+    _orig_derive = ark._derive_short_code
+    ark._derive_short_code = lambda name: derived.append(name) or _orig_derive(name)
+    try:
+        again = [ark._resolve_workspace_short(ws) for ws in (cool, carbon, cloud)]
+    finally:
+        ark._derive_short_code = _orig_derive
+    check("New process reuses stored codes without deriving", again == ["CMHUB", "CMH", "CMHU"] and derived == [],
+          str(derived))
+
+    ark._ws_short_cache.clear()
+    unclaimed = str(sc_root / "Cool-Mint-Hub" / "src")
+    before = ark.SHORTCODES_FILE.read_text()
+    check("Lookup without assign leaves the table alone",
+          ark._resolve_workspace_short(unclaimed, assign=False) == "SRC"
+          and ark.SHORTCODES_FILE.read_text() == before and unclaimed not in ark._ws_short_cache)
+
+    os.rmdir(carbon)
+    ark._ws_short_cache.clear()
+    clash = str(sc_root / "Crisp-Mango-Hub")
+    os.mkdir(clash)
+    check("Code of a removed workspace is released", ark._resolve_workspace_short(clash) == "CMH")
+    check("Home directory keeps CMD",
+          ark._resolve_workspace_short(os.path.expanduser("~")) == "CMD"
+          and ark._resolve_workspace_short(str(sc_root / "Code-Mgmt-Dash")) != "CMD")
+
+    ark.MACHINE_CONFIG.write_text("workspaces:\n  Cool-Mint-Hub: {short: MINT}\n  Other: {short: CMHU}\n",
+                                  encoding="utf-8")
+    ark._ws_short_cache.clear()
+    after = [ark._resolve_workspace_short(ws) for ws in (clash, cloud, cool)]
+    check("Config change keeps unaffected codes, overrides win",
+          after == ["CMH", "CMHUB", "MINT"], str(after))
+    ark.MACHINE_CONFIG.write_text("workspaces: {}\n", encoding="utf-8")
+    ark._ws_short_cache.clear()
+    check("Removed override falls back to a derived code",
+          ark._resolve_workspace_short(cool) == "CMHU"
+          and ark._resolve_workspace_short(clash) == "CMH")
+
+    os.rmdir(clash)
+    ark._ws_short_cache.clear()
+    successors = [str(sc_root / n) for n in ("Calm-Moss-Hub", "Crimson-Maple-Hub")]
+    for ws in successors:
+        os.mkdir(ws)
+    taken = [ark._resolve_workspace_short(ws) for ws in successors]
+    table = json.loads(ark.SHORTCODES_FILE.read_text())
+    check("Released code goes to one successor only",
+          taken[0] == "CMH" and taken[1] not in ("CMH", "CMHU") and table["codes"]["CMH"] == successors[0],
+          f"{taken} {table['codes'].get('CMH')}")
+finally:
+    ark.SHORTCODES_FILE, ark.MACHINE_CONFIG = _saved_sc
+    ark._config_cache = None
+    ark._ws_short_cache.clear()
+    shutil.rmtree(sc_root, ignore_errors=True)
+
+# --- 27. HOOK TRACING (temp trace file) ---
+print()
+print("--- 27. HOOK TRACING ---")
+import ark_trace
+tr_root = Path(tempfile.mkdtemp(prefix="ark-trace-"))
+_saved_trace = (ark.TRACE_FILE, ark.TRACE_SAMPLE, ark.TRACE_MAX_BYTES)
+ark.TRACE_FILE = tr_root / "trace.jsonl"
+try:
+    tr_ws = tr_root / "ws"
+    tr_ws.mkdir()
+    tr_sid = "test-port-trace-" + datetime.now().strftime("%H%M%S")
+    ark.TRACE_SAMPLE = ""
+    ark.session_start({"session_id": tr_sid, "cwd": str(tr_ws)})
+    check("Tracing off: no trace file, no-op spans",
+          not ark.TRACE_FILE.exists() and ark._span("x") is ark._NO_SPAN)
+    check("Sample rates parsed",
+          [ark._trace_rate() for ark.TRACE_SAMPLE in ("0", "off", "0.25", "7", "on")]
+          == [0.0, 0.0, 0.25, 1.0, 1.0])
+
+    ark.TRACE_SAMPLE = "1"
+    ark.session_compact({"session_id": tr_sid})
+    ark.session_stop({"session_id": tr_sid, "cwd": str(tr_ws)})
+    records = list(ark_trace.iter_records())
+    check("One record per traced call", [r["hook"] for r in records] == ["compact", "stop"],
+          str([r.get("hook") for r in records]))
+    stop_rec = records[-1]
+    phases = [p["name"] for p in stop_rec["phases"]]
+    check("Stop phases: registry, git, diary, sweep, log",
+          phases == ["registry", "git", "diary", "sweep", "log"], str(phases))
+    check("Phase times within the call's total",
+          all(0 <= p["ms"] <= stop_rec["ms"] for p in stop_rec["phases"]))
+    if "read" in stop_rec:
+        by_name = {p["name"]: p for p in stop_rec["phases"]}
+        check("Diary phase records bytes written",
+              by_name["diary"]["written"] > 0 and by_name["git"]["written"] == 0,
+              f"diary={by_name['diary']['written']} git={by_name['git']['written']}")
+
+    ark._trace = {"phases": [], "stack": []}
+    try:
+        with ark._span("outer"):
+            with ark._span("inner"):
+                pass
+        nested = [p["name"] for p in ark._trace["phases"]]
+    finally:
+        ark._trace = None
+    check("Nested spans named by path", nested == ["outer/inner", "outer"], str(nested))
+
+    rows = ark_trace.summarize([
+        {"hook": "stop", "ms": ms, "phases": [{"name": "diary", "ms": ms / 2, "read": 100, "written": 10}]}
+        for ms in range(1, 101)
+    ])
+    total = rows[0]
+    check("Summary percentiles per hook and phase",
+          (total["phase"], total["calls"], total["p50"], total["p95"], total["p99"]) == ("(total)", 100, 50, 95, 99)
+          and rows[1]["phase"] == "diary" and rows[1]["p95"] == 47.5 and rows[1]["read"] == 100
+          and total["read"] is None, str(rows[:2]))
+
+    ark.TRACE_MAX_BYTES = 1
+    ark.session_compact({"session_id": tr_sid})
+    check("Trace file rolls past TRACE_MAX_BYTES",
+          (tr_root / "trace.jsonl.1").exists() and len(list(ark_trace.iter_records())) == 3)
+
+    ark.TRACE_FILE = tr_root / "missing" / "dir" / "blocked"
+    (tr_root / "missing").write_text("not a directory")
+    check("Unwritable trace file does not break the hook",
+          ark.session_compact({"session_id": tr_sid}) is None)
+finally:
+    ark.TRACE_FILE, ark.TRACE_SAMPLE, ark.TRACE_MAX_BYTES = _saved_trace
+    shutil.rmtree(tr_root, ignore_errors=True)
+
+# --- 28. WAL REGISTRY (temp sessions dir) ---
+print()
+print("--- 28. WAL REGISTRY ---")
+_saved_wal = {k: getattr(ark, k) for k in ("ACTIVE_FILE", "LOCK_FILE", "SHARD_DIR", "SHARD_INDEX", "HEARTBEAT_DIR",
+                                           "REGISTRY_WAL", "WAL_SNAPSHOT_RECORDS", "WAL_COMPACT_BYTES")}
+wal_root = Path(tempfile.mkdtemp(prefix="ark-wal-"))
+ark.ACTIVE_FILE = wal_root / "active.json"
+ark.LOCK_FILE = wal_root / "active.json.lock"
+ark.SHARD_DIR = wal_root / "active"
+ark.SHARD_INDEX = ark.SHARD_DIR / "_index.json"
+ark.HEARTBEAT_DIR = wal_root / "hb"
+ark.REGISTRY_WAL = wal_root / "active.wal"
+try:
+    seed = {
+        "wal-live": {"status": "active", "callsign": "WAL-live", "intent": "",
+                     "last_heartbeat": "2000-01-01T00:00:00", "context_pct": 0},
+        "wal-done": {"status": "stopped", "callsign": "WAL-done"},
+    }
+    ark.ACTIVE_FILE.write_text(json.dumps(seed), encoding="utf-8")
+    check("Migration to WAL moves all sessions", ark.migrate_registry_to_wal() == 2)
+    check("Migration to WAL is one-shot", ark.migrate_registry_to_wal() == -1)
+    check("Registry reads back from snapshot + WAL", ark._read_active() == seed)
+
+    snapshot_before = ark.ACTIVE_FILE.read_text(encoding="utf-8")
+    wal_before = ark.REGISTRY_WAL.stat().st_size
+    ark.session_heartbeat({"session_id": "wal-live", "context_window": {
+        "context_window_size": 100, "current_usage": {"input_tokens": 40}}})
+    tail = ark.REGISTRY_WAL.read_text(encoding="utf-8").splitlines()[-1]
+    check("Heartbeat appends only the changed fields",
+          json.loads(tail).get("set", {}).keys() == {"last_heartbeat", "context_pct"}
+          and ark.REGISTRY_WAL.stat().st_size - wal_before < 200, tail)
+    check("Snapshot untouched between checkpoints",
+          ark.ACTIVE_FILE.read_text(encoding="utf-8") == snapshot_before)
+    check("set_intent replayed from the WAL tail",
+          ark.set_intent("wal-live", "Logged") and ark._read_session("wal-live")["intent"] == "Logged"
+          and ark._read_session("wal-live")["context_pct"] == 40)
+
+    with ark.registry_transaction() as active:
+        active["wal-tx"] = {"status": "stopped", "n": 0}
+        del active["wal-done"]
+
+    def _wal_bump():
+        for _ in range(10):
+            with ark.registry_transaction() as active:
+                active["wal-tx"]["n"] += 1
+
+    ark.WAL_SNAPSHOT_RECORDS = 16
+    threads = [threading.Thread(target=_wal_bump) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    state = ark._read_active()
+    check("No lost WAL updates (8 writers x 10)",
+          state["wal-tx"]["n"] == 80 and "wal-done" not in state, str(state.get("wal-tx")))
+    mark = json.loads(ark.ACTIVE_FILE.read_text(encoding="utf-8"))["wal"]
+    replayed = ark._wal_load()[1]
+    check("Snapshot refreshed every WAL_SNAPSHOT_RECORDS",
+          mark["seq"] > 80 and replayed["tail"] < 16 and replayed["snapshot"],
+          f"snapshot seq={mark['seq']} tail={replayed['tail']}")
+
+    ark.ACTIVE_FILE.write_text("{corrupt", encoding="utf-8")
+    check("Corrupt snapshot rebuilt losslessly from the WAL", ark._read_active() == state)
+    ark.ACTIVE_FILE.unlink()
+    check("Missing snapshot rebuilt from the WAL", ark._read_active() == state)
+    with ark.registry_transaction():
+        pass
+    check("Next transaction writes a fresh snapshot",
+          json.loads(ark.ACTIVE_FILE.read_text(encoding="utf-8"))["sessions"] == state)
+
+    with open(ark.REGISTRY_WAL, "a", encoding="utf-8") as f:
+        f.write('{"seq": 999999, "op": "set", "sid": "wal-live", "set": {"intent": "tor')
+    check("Torn final record ignored", ark._read_active() == state)
+    ark.set_intent("wal-live", "Recovered")
+    check("Next append truncates the torn record",
+          ark._read_session("wal-live")["intent"] == "Recovered"
+          and '"tor' not in ark.REGISTRY_WAL.read_text(encoding="utf-8"))
+
+    ark.WAL_SNAPSHOT_RECORDS = 1
+    ark.WAL_COMPACT_BYTES = 1
+    gen_before = ark._wal_read()[0]["gen"]
+    ark.set_intent("wal-live", "Compacted")
+    header, records, _ = ark._wal_read()
+    check("Compaction starts a new generation of puts",
+          header["gen"] != gen_before and {r["op"] for r in records} == {"put"}
+          and len(records) == len(ark._read_active()))
+    check("Registry intact after compaction", ark._read_session("wal-live")["intent"] == "Compacted")
+
+    expected = ark._read_active()
+    check("WAL registry migrates to shards",
+          ark.migrate_registry_to_shards() == len(expected) and ark._read_active() == expected
+          and not ark.REGISTRY_WAL.exists())
+finally:
+    for k, v in _saved_wal.items():
+        setattr(ark, k, v)
+    shutil.rmtree(wal_root, ignore_errors=True)
+
+# --- 29. STORAGE BACKENDS (temp SQLite database) ---
+print()
+print("--- 29. STORAGE BACKENDS ---")
+try:
+    import sqlite3  # noqa: F401 -- some Python builds lack it
+except ImportError:
+    sqlite3 = None
+if sqlite3 is None:
+    print("  [SKIP] sqlite3 not available")
+else:
+    import ark_sqlite
+    sq_root = Path(tempfile.mkdtemp(prefix="ark-sqlite-"))
+    ark.flush_events()
+    _saved_sq = {k: getattr(ark, k) for k in ("ACTIVE_FILE", "LOCK_FILE", "SHARD_DIR", "REGISTRY_WAL",
+                                              "MACHINE_CONFIG", "STATS_FILE", "FEDERATION_DIR",
+                                              "get_machine_id", "_storage_backend", "_event_writer")}
+    ark.ACTIVE_FILE = sq_root / "active.json"
+    ark.LOCK_FILE = sq_root / "active.json.lock"
+    ark.SHARD_DIR = sq_root / "active"
+    ark.REGISTRY_WAL = sq_root / "active.wal"
+    ark.MACHINE_CONFIG = sq_root / "machine.local.yaml"
+    ark._config_cache = None
+    try:
+        class _PartialBackend(ark.StorageBackend):
+            def read_registry(self):
+                return {}
+
+        try:
+            _PartialBackend()
+            check("Incomplete backend fails at instantiation", False)
+        except TypeError as e:
+            check("Incomplete backend fails at instantiation", "events_since" in str(e), str(e))
+        check("File backend by default", ark._configured_backend() is ark._FILE_BACKEND)
+        ark.MACHINE_CONFIG.write_text(f"storage: {{backend: sqlite, path: {sq_root / 'ark.db'}}}\n",
+                                      encoding="utf-8")
+        ark._config_cache = None
+        backend = ark._configured_backend()
+        check("Config selects the SQLite backend",
+              backend.name == "sqlite" and backend.path == str(sq_root / "ark.db"))
+        ark.MACHINE_CONFIG.write_text("storage: tape\n", encoding="utf-8")
+        ark._config_cache = None
+        check("Unknown backend falls back to files", ark._configured_backend() is ark._FILE_BACKEND)
+
+        ark.ACTIVE_FILE.write_text(json.dumps({"sq-old": {"status": "active", "callsign": "SQL-old"}}),
+                                   encoding="utf-8")
+        ark._storage_backend, ark._event_writer = backend, None
+        check("New database adopts the file registry", ark._read_session("sq-old") == {
+            "status": "active", "callsign": "SQL-old"})
+        conn = backend._conn()
+        indexes = {row[1] for table in ("sessions", "events")
+                   for row in conn.execute(f"PRAGMA index_list({table})")}
+        check("WAL journal mode and indexes",
+              conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+              and {"sessions_callsign", "sessions_workspace", "sessions_status", "events_ts",
+                   "events_session", "events_callsign", "events_workspace"} <= indexes, str(sorted(indexes)))
+
+        sq_ws = sq_root / "07-Sql-Work-Space"
+        sq_ws.mkdir()
+        sq_data = {"session_id": "sq-live-0001", "cwd": str(sq_ws), "model": "test"}
+        callsign = ark.session_start(sq_data)["callsign"]
+        ark.set_intent("sq-live-0001", "Stored in SQLite")
+        ark.session_compact(sq_data)
+        live = {x["session_id"] for x in ark.get_active_sessions()}
+        check("Lifecycle round trip through SQLite",
+              live == {"sq-old", "sq-live-0001"}
+              and ark._read_session("sq-live-0001")["intent"] == "Stored in SQLite"
+              and not ark.ACTIVE_FILE.read_text(encoding="utf-8").count("sq-live"))
+        ark.session_stop(sq_data)
+        events = [e["event"] for e in backend.query_events(session="sq-live-0001")]
+        check("Events appended and queried by session", events == ["start", "compact", "stop"], str(events))
+        check("Query by callsign, tail", [e["event"] for e in backend.query_events(callsign=callsign)]
+              == ["start", "stop"] and [e["event"] for e in backend.tail_events(1)] == ["stop"])
+        plan = " ".join(str(r) for r in conn.execute(
+            "EXPLAIN QUERY PLAN SELECT data FROM events WHERE workspace = ? ORDER BY ts", ("x",)))
+        check("Workspace query uses an index", "events_workspace" in plan, plan)
+
+        ark.STATS_FILE = sq_root / "stats.json"
+        sq_rows = [r for r in ark_stats.report(ark_stats.update(), period="day")
+                   if r["workspace"] == sq_ws.name]
+        check("Stats read SQLite events", [(r["sessions"], r["stopped"]) for r in sq_rows] == [(1, 1)],
+              str(sq_rows))
+        sq_next = dict(sq_data, session_id="sq-live-0002")
+        ark.session_start(sq_next)
+        ark.session_stop(sq_next)
+        sq_rows = [r for r in ark_stats.report(ark_stats.update(), period="day")
+                   if r["workspace"] == sq_ws.name]
+        cursor = json.loads(ark.STATS_FILE.read_text())["checkpoint"]["cursor"]
+        check("Stats resume from the row id cursor",
+              [(r["sessions"], r["stopped"]) for r in sq_rows] == [(2, 2)]
+              and cursor == {"backend": "sqlite",
+                             "id": conn.execute("SELECT max(id) FROM events").fetchone()[0]},
+              f"{sq_rows} {cursor}")
+
+        ark.FEDERATION_DIR = sq_root / "federation"
+        ark.get_machine_id = lambda: "sqlbox"
+        sq_shared = sq_root / "shared"
+        sq_export = ark_federate.export(sq_shared)
+        ark_federate.merge(sq_shared)
+        sq_merged = [e["event"] for e in ark_events.query_events(
+            session="sq-live-0002", log_files=ark_federate.combined_log_files())]
+        check("Federation exports SQLite events",
+              sq_export["events"] == conn.execute("SELECT count(*) FROM events").fetchone()[0]
+              and sq_merged == ["start", "stop"], f"{sq_export} {sq_merged}")
+        check("Nothing new, nothing exported", ark_federate.export(sq_shared)["events"] == 0)
+
+        try:
+            with ark.registry_transaction() as active:
+                active["sq-old"]["status"] = "changed"
+                raise RuntimeError("abort")
+        except RuntimeError:
+            pass
+        check("Exception rolls the transaction back", ark._read_session("sq-old")["status"] == "active")
+        with ark.session_transaction("sq-old") as record:
+            record.clear()
+        check("Emptied record deletes the SQLite row", ark._read_session("sq-old") is None
+              and "sq-old" not in ark._read_active())
+
+        def _sq_bump():
+            for _ in range(10):
+                with ark.registry_transaction() as active:
+                    active.setdefault("sq-tx", {"status": "stopped", "n": 0})["n"] += 1
+
+        threads = [threading.Thread(target=_sq_bump) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        n = ark._read_session("sq-tx")["n"]
+        check("No lost SQLite updates (8 writers x 10)", n == 80, f"n={n}")
+
+        file_events = sum(1 for _ in ark._iter_file_events())
+        check("JSONL log imported once",
+              backend.import_file_events() == file_events and backend.import_file_events() == -1)
+        backend.insert_events([{"event": "start", "session_id": "sq-ancient", "ts": "2001-01-01T00:00:00"}])
+        backend.maintain()
+        check("Retention drops events past the log's lifetime",
+              not list(backend.query_events(session="sq-ancient"))
+              and list(backend.query_events(session="sq-live-0001")))
+    finally:
+        ark.flush_events()
+        for k, v in _saved_sq.items():
+            setattr(ark, k, v)
+        ark._config_cache = None
+        try:
+            backend.close()
+        except Exception:
+            pass
+        shutil.rmtree(sq_root, ignore_errors=True)
+
 # --- CLEANUP ---
 print()
 print("--- CLEANUP ---")
@@ -281,12 +1901,14 @@ for key in list(active.keys()):
 ark._write_active(active)
 check("Test sessions removed from registry", True)
 
-for d in [test_ws, diary_ws]:
+for d in [test_ws, diary_ws, crash_ws]:
     try:
         shutil.rmtree(d)
     except Exception:
         pass
 check("Temp directories removed", True)
+shutil.rmtree(ark.SHORTCODES_FILE.parent, ignore_errors=True)
+ark.SHORTCODES_FILE = _saved_shortcodes
 
 # --- RESULTS ---
 print()